@@ -1,17 +1,19 @@
 #!/bin/bash
 
 # バックアップスクリプト
-BACKUP_DIR="/home/ec2-user/minecraft-backups"
-WORLD_DIR="/home/ec2-user/minecraft-server/world"
-DATE=$(date +%Y%m%d_%H%M%S)
-BACKUP_FILE="$BACKUP_DIR/minecraft-backup-$DATE.tar.gz"
+# チャンク単位の差分バックアップ（tools/world_backup.py）
+# 変更されたチャンク・ファイルだけをS3に送るため、所要時間と転送量はワールドの大きさではなく変更量に比例する
+WORLD_DIR="${WORLD_DIR:-/minecraft/server/world}"
+BACKUP_STORE="${WORLD_BACKUP_STORE:-s3://minecraft-server-mods-temp/world-backups}"
+KEEP_SNAPSHOTS="${KEEP_SNAPSHOTS:-7}"
+BACKUP_TOOL="/minecraft/tools/world_backup.py"
 
-mkdir -p $BACKUP_DIR
+set -e
 
 # ワールドデータをバックアップ
-tar -czf $BACKUP_FILE $WORLD_DIR
+python3 $BACKUP_TOOL --store "$BACKUP_STORE" backup --world "$WORLD_DIR"
 
-# 7日以上前のバックアップを削除
-find $BACKUP_DIR -name "minecraft-backup-*.tar.gz" -mtime +7 -delete
+# 古いスナップショットと、どこからも参照されなくなったデータを削除
+python3 $BACKUP_TOOL --store "$BACKUP_STORE" prune --keep $KEEP_SNAPSHOTS
 
-echo "Backup completed: $BACKUP_FILE"
+echo "Backup completed: $BACKUP_STORE"
@@ -4,31 +4,56 @@ Write-Host "=== Lambda関数のビルド ===" -ForegroundColor Green
 
 $currentDir = Get-Location
 
-# start_server.zip作成
-Write-Host "start_server.zip を作成中..." -ForegroundColor Cyan
-Compress-Archive -Path "$currentDir\start_server.py" -DestinationPath "$currentDir\start_server.zip" -Force
-Rename-Item -Path "$currentDir\start_server.zip" -NewName "start_server_temp.zip" -Force
-New-Item -ItemType Directory -Path "$currentDir\temp_start" -Force | Out-Null
-Expand-Archive -Path "$currentDir\start_server_temp.zip" -DestinationPath "$currentDir\temp_start" -Force
-Rename-Item -Path "$currentDir\temp_start\start_server.py" -NewName "index.py" -Force
-Compress-Archive -Path "$currentDir\temp_start\index.py" -DestinationPath "$currentDir\start_server.zip" -Force
-Remove-Item -Path "$currentDir\temp_start" -Recurse -Force
-Remove-Item -Path "$currentDir\start_server_temp.zip" -Force
+# 各Lambda関数に同梱する共通モジュール
+# （terraform/lambda.tf の handler は "<ファイル名>.lambda_handler" なのでファイル名はそのまま）
+$sharedModules = @(
+    "$currentDir\common.py",
+    "$currentDir\discord_notify.py",
+    "$currentDir\instance_cache.py",
+    "$currentDir\metrics.py",
+    "$currentDir\minecraft_ping.py",
+    "$currentDir\mod_upload.py",
+    "$currentDir\..\tools\mod_manifest.py",
+    "$currentDir\..\tools\pending_config.py",
+    "$currentDir\..\tools\server_properties.py",
+    "$currentDir\prewarm.py",
+    "$currentDir\rcon.py",
+    "$currentDir\ssm_runner.py",
+    "$currentDir\start_orchestrator.py",
+    "$currentDir\state_store.py"
+)
+$functions = @(
+    "start_server",
+    "stop_server",
+    "stop_server_improved",
+    "status_server",
+    "check_minecraft_ready",
+    "update_config",
+    "upload_mods",
+    "get_logs",
+    "send_notification",
+    "notify_discord",
+    "prewarm"
+)
 
-# stop_server.zip作成
-Write-Host "stop_server.zip を作成中..." -ForegroundColor Cyan
-Compress-Archive -Path "$currentDir\stop_server.py" -DestinationPath "$currentDir\stop_server.zip" -Force
-Rename-Item -Path "$currentDir\stop_server.zip" -NewName "stop_server_temp.zip" -Force
-New-Item -ItemType Directory -Path "$currentDir\temp_stop" -Force | Out-Null
-Expand-Archive -Path "$currentDir\stop_server_temp.zip" -DestinationPath "$currentDir\temp_stop" -Force
-Rename-Item -Path "$currentDir\temp_stop\stop_server.py" -NewName "index.py" -Force
-Compress-Archive -Path "$currentDir\temp_stop\index.py" -DestinationPath "$currentDir\stop_server.zip" -Force
-Remove-Item -Path "$currentDir\temp_stop" -Recurse -Force
-Remove-Item -Path "$currentDir\stop_server_temp.zip" -Force
+foreach ($name in $functions) {
+    Write-Host "$name.zip を作成中..." -ForegroundColor Cyan
+    # 共通モジュール自体が関数の場合（prewarm）は重複させない
+    $modules = $sharedModules | Where-Object { $_ -ne "$currentDir\$name.py" }
+    Compress-Archive -Path (@("$currentDir\$name.py") + $modules) -DestinationPath "$currentDir\$name.zip" -Force
+}
+
+# API Gateway の全パスを受ける router.zip（各ハンドラは初回の呼び出し時に読み込む）
+$routerHandlers = @("start_server", "stop_server", "status_server", "get_logs", "update_config", "notify_discord", "check_minecraft_ready")
+Write-Host "router.zip を作成中..." -ForegroundColor Cyan
+$routerFiles = @("$currentDir\router.py") + ($routerHandlers | ForEach-Object { "$currentDir\$_.py" }) + $sharedModules
+Compress-Archive -Path $routerFiles -DestinationPath "$currentDir\router.zip" -Force
 
 Write-Host ""
 Write-Host "=== ビルド完了 ===" -ForegroundColor Green
 Write-Host "作成されたファイル:" -ForegroundColor Cyan
-Write-Host "  - start_server.zip"
-Write-Host "  - stop_server.zip"
+foreach ($name in $functions) {
+    Write-Host "  - $name.zip"
+}
+Write-Host "  - router.zip"
 Write-Host ""
@@ -1,134 +1,117 @@
-import boto3
 import os
 import json
-import time
+import minecraft_ping
+import common
+import instance_cache
+import ssm_runner
+import metrics
 
+PING_TIMEOUT = float(os.environ.get('PING_TIMEOUT', '2.0'))
+# tools/ready_watcher.py が書き出す起動状態
+READY_STATUS_FILE = '/minecraft/status/ready.json'
+# SSMでの取得を待つ上限（秒）
+SSM_TIMEOUT = 10
+
+@metrics.instrument('check_minecraft_ready')
 def lambda_handler(event, context):
     instance_id = os.environ['INSTANCE_ID']
     
-    ec2 = boto3.client('ec2')
-    ssm = boto3.client('ssm')
+    ssm = common.get_client('ssm')
     
     try:
         # EC2の状態を確認
-        response = ec2.describe_instances(InstanceIds=[instance_id])
-        state = response['Reservations'][0]['Instances'][0]['State']['Name']
-        public_ip = response['Reservations'][0]['Instances'][0].get('PublicIpAddress', 'N/A')
+        instance_state = instance_cache.get_instance_state(instance_id)
+        state = instance_state['state']
+        public_ip = instance_state['public_ip']
         
         if state != 'running':
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'ready': False,
-                    'state': state,
+            return common.json_response(200, {
+                'ready': False,
+                'state': state,
+                'public_ip': public_ip,
+                'message': f'EC2 is {state}'
+            })
+        
+        # SLPに応答すればワールド読み込みまで完了している
+        if public_ip != 'N/A':
+            try:
+                ping_result = minecraft_ping.ping(public_ip, timeout=PING_TIMEOUT)
+                return common.json_response(200, {
+                    'ready': True,
+                    'state': 'running',
                     'public_ip': public_ip,
-                    'message': f'EC2 is {state}'
+                    'minecraft_status': 'ready',
+                    'player_count': ping_result['online'],
+                    'max_players': ping_result['max'],
+                    'version': ping_result['version'],
+                    'message': 'Minecraft server is ready'
                 })
-            }
+            except minecraft_ping.PingError as e:
+                print(f'SLP check failed, falling back to SSM: {e}')
         
-        # SSM経由でMinecraftログをチェック
+        # SSM経由で起動監視エージェント（ready_watcher）の状態ファイルを読む
         try:
-            ssm_response = ssm.send_command(
-                InstanceIds=[instance_id],
-                DocumentName='AWS-RunShellScript',
-                Parameters={
-                    'commands': [
-                        # Minecraftが起動完了したかチェック（"Done ("メッセージを探す）
-                        'if [ -f /minecraft/server/logs/latest.log ]; then',
-                        '  if grep -q "Done (" /minecraft/server/logs/latest.log; then',
-                        '    echo "MINECRAFT_READY"',
-                        '  else',
-                        '    echo "MINECRAFT_STARTING"',
-                        '  fi',
-                        'else',
-                        '  echo "MINECRAFT_NOT_STARTED"',
-                        'fi'
-                    ]
-                }
+            result = ssm_runner.SsmRunner(instance_id, ssm).run(
+                f'cat {READY_STATUS_FILE} 2>/dev/null || echo "{{}}"',
+                timeout=SSM_TIMEOUT,
+                deadline=ssm_runner.deadline_from(context)
             )
             
-            command_id = ssm_response['Command']['CommandId']
-            
-            # コマンド実行完了を待つ（最大10秒）
-            for i in range(10):
-                time.sleep(1)
-                try:
-                    result = ssm.get_command_invocation(
-                        CommandId=command_id,
-                        InstanceId=instance_id
-                    )
-                    
-                    if result['Status'] in ['Success', 'Failed']:
-                        output = result.get('StandardOutputContent', '').strip()
-                        
-                        if 'MINECRAFT_READY' in output:
-                            return {
-                                'statusCode': 200,
-                                'body': json.dumps({
-                                    'ready': True,
-                                    'state': 'running',
-                                    'public_ip': public_ip,
-                                    'minecraft_status': 'ready',
-                                    'message': 'Minecraft server is ready'
-                                })
-                            }
-                        elif 'MINECRAFT_STARTING' in output:
-                            return {
-                                'statusCode': 200,
-                                'body': json.dumps({
-                                    'ready': False,
-                                    'state': 'running',
-                                    'public_ip': public_ip,
-                                    'minecraft_status': 'starting',
-                                    'message': 'Minecraft server is starting'
-                                })
-                            }
-                        else:
-                            return {
-                                'statusCode': 200,
-                                'body': json.dumps({
-                                    'ready': False,
-                                    'state': 'running',
-                                    'public_ip': public_ip,
-                                    'minecraft_status': 'not_started',
-                                    'message': 'Minecraft server not started yet'
-                                })
-                            }
-                        break
-                except ssm.exceptions.InvocationDoesNotExist:
-                    continue
-            
-            # タイムアウト
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
+            if result.status == ssm_runner.DEADLINE_EXCEEDED:
+                # タイムアウト
+                return common.json_response(200, {
                     'ready': False,
                     'state': 'running',
                     'public_ip': public_ip,
                     'minecraft_status': 'unknown',
                     'message': 'Could not determine Minecraft status'
                 })
-            }
             
-        except Exception as ssm_error:
-            # SSMが使えない場合はEC2の状態のみ返す
-            print(f'SSM check failed: {ssm_error}')
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
+            try:
+                ready_status = json.loads(result.stdout.strip() or '{}')
+            except ValueError:
+                ready_status = {}
+            
+            if ready_status.get('ready'):
+                return common.json_response(200, {
+                    'ready': True,
+                    'state': 'running',
+                    'public_ip': public_ip,
+                    'minecraft_status': 'ready',
+                    'boot_seconds': ready_status.get('boot_seconds'),
+                    'message': 'Minecraft server is ready'
+                })
+            elif ready_status.get('phase'):
+                return common.json_response(200, {
                     'ready': False,
-                    'state': state,
+                    'state': 'running',
                     'public_ip': public_ip,
-                    'minecraft_status': 'unknown',
-                    'message': 'SSM check failed, EC2 is running but Minecraft status unknown'
+                    'minecraft_status': 'starting',
+                    'phase': ready_status['phase'],
+                    'message': 'Minecraft server is starting'
                 })
-            }
-        
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
+            else:
+                return common.json_response(200, {
+                    'ready': False,
+                    'state': 'running',
+                    'public_ip': public_ip,
+                    'minecraft_status': 'not_started',
+                    'message': 'Minecraft server not started yet'
+                })
+            
+        except Exception as ssm_error:
+            # SSMが使えない場合はEC2の状態のみ返す
+            print(f'SSM check failed: {ssm_error}')
+            return common.json_response(200, {
                 'ready': False,
-                'error': str(e)
+                'state': state,
+                'public_ip': public_ip,
+                'minecraft_status': 'unknown',
+                'message': 'SSM check failed, EC2 is running but Minecraft status unknown'
             })
-        }
+        
+    except Exception as e:
+        return common.json_response(500, {
+            'ready': False,
+            'error': str(e)
+        })
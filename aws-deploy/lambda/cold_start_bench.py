@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+# 関数ごとに分かれた構成と router.py（1関数）の比較
+#
+# local: 新しい Python プロセスでハンドラモジュールを import するまでの時間（コールドスタートのうち
+#        コードの初期化にあたる部分）を比べる。デプロイ時と同じく ../tools のモジュールも読めるようにする。
+#        boto3 はハンドラの初回の AWS 呼び出しで読み込まれるので import 時間には含まれない
+#        （入っていれば import boto3 の時間を別に出す。無くても計測できる。AWSへの通信はしない）
+# aws:   デプロイ済みの関数を呼び出し、REPORT 行の Init Duration / Duration を集計する。
+#        環境変数に BENCH_NONCE を足して実行環境を入れ替え、毎回コールドスタートさせる（終わったら元に戻す）。
+#        呼び出すのは状態を変えない /status と /config（GET）だけ
+#
+# 使い方（aws-deploy/lambda で）:
+#   python3 cold_start_bench.py local --repeat 10
+#   python3 cold_start_bench.py aws --cold 5 --warm 20
+
+# ルート → 分割構成の (関数名, モジュール)
+SPLIT_FUNCTIONS = {
+    'status': ('minecraft-status-server', 'status_server'),
+    'config': ('minecraft-update-config', 'update_config'),
+}
+ROUTER_FUNCTION = 'minecraft-api'
+REPORT = re.compile(r'REPORT .*?Duration: ([\d.]+) ms.*?(?:Init Duration: ([\d.]+) ms)?\s*$', re.MULTILINE)
+
+
+def _event(route):
+    return {'httpMethod': 'GET', 'path': f'/{route}', 'resource': f'/{route}', 'queryStringParameters': None}
+
+
+def _median(values):
+    return round(statistics.median(values), 1) if values else None
+
+
+LAMBDA_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOLS_DIR = os.path.join(os.path.dirname(LAMBDA_DIR), 'tools')
+
+
+def _import_ms(statement):
+    """新しいプロセスで statement を実行するのにかかった時間（ミリ秒）"""
+    code = f'import time; t = time.perf_counter(); {statement}; print((time.perf_counter() - t) * 1000)'
+    # Lambda のパッケージでは tools のモジュール（pending_config など）も同じ階層に入る
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([LAMBDA_DIR, TOOLS_DIR])}
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True,
+                            cwd=LAMBDA_DIR, env=env)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def _boto3_available():
+    return subprocess.run([sys.executable, '-c', 'import boto3'], capture_output=True).returncode == 0
+
+
+def bench_local(repeat):
+    results = []
+    for route, (_, module) in SPLIT_FUNCTIONS.items():
+        split = [_import_ms(f'import {module}') for _ in range(repeat)]
+        router = [_import_ms(f'import router; router.load({route!r})') for _ in range(repeat)]
+        # 2つ目のルートは、同じコンテナで別のルートを先に読み込んだ後の追加分
+        other = next(name for name in SPLIT_FUNCTIONS if name != route)
+        second = [_import_ms(f'import router; router.load({other!r}); t = time.perf_counter(); router.load({route!r})')
+                  for _ in range(repeat)]
+        results.append({
+            'route': route,
+            'split_import_ms': _median(split),
+            'router_import_ms': _median(router),
+            'router_after_other_route_ms': _median(second),
+        })
+    # ハンドラの初回の AWS 呼び出しで読み込まれる分（どちらの構成でも同じだけかかる）
+    boto3_ms = _median([_import_ms('import boto3') for _ in range(repeat)]) if _boto3_available() else None
+    return {'python': sys.version.split()[0], 'boto3_import_ms': boto3_ms, 'routes': results}
+
+
+def _invoke(client, function_name, payload):
+    response = client.invoke(FunctionName=function_name, Payload=json.dumps(payload).encode('utf-8'),
+                             LogType='Tail')
+    log = base64.b64decode(response['LogResult']).decode('utf-8', errors='replace')
+    match = REPORT.search(log)
+    if match is None:
+        return None, None
+    return float(match.group(1)), float(match.group(2)) if match.group(2) else None
+
+
+def _force_cold(client, function_name, variables):
+    """環境変数を変えて既存の実行環境を使わせない"""
+    client.update_function_configuration(
+        FunctionName=function_name,
+        Environment={'Variables': {**variables, 'BENCH_NONCE': uuid.uuid4().hex}}
+    )
+    client.get_waiter('function_updated_v2').wait(FunctionName=function_name)
+
+
+def _measure(client, function_name, payload, cold, warm):
+    original = client.get_function_configuration(FunctionName=function_name)
+    variables = original.get('Environment', {}).get('Variables', {})
+    cold_init, cold_total, warm_total = [], [], []
+    try:
+        for _ in range(cold):
+            _force_cold(client, function_name, variables)
+            duration, init = _invoke(client, function_name, payload)
+            if duration is not None:
+                cold_init.append(init or 0.0)
+                cold_total.append(duration + (init or 0.0))
+        for _ in range(warm):
+            duration, _ = _invoke(client, function_name, payload)
+            if duration is not None:
+                warm_total.append(duration)
+            time.sleep(0.2)
+    finally:
+        client.update_function_configuration(FunctionName=function_name, Environment={'Variables': variables})
+        client.get_waiter('function_updated_v2').wait(FunctionName=function_name)
+    return {
+        'cold_init_ms': _median(cold_init),
+        'cold_total_ms': _median(cold_total),
+        'warm_ms': _median(warm_total),
+    }
+
+
+def bench_aws(cold, warm, router_function=ROUTER_FUNCTION):
+    import boto3
+
+    client = boto3.client('lambda')
+    results = []
+    for route, (function_name, _) in SPLIT_FUNCTIONS.items():
+        results.append({
+            'route': route,
+            'split': _measure(client, function_name, _event(route), cold, warm),
+            'router': _measure(client, router_function, _event(route), cold, warm),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='分割構成と router.py のコールドスタート・ウォーム時の比較')
+    sub = parser.add_subparsers(dest='command', required=True)
+    local = sub.add_parser('local', help='ハンドラモジュールの import 時間')
+    local.add_argument('--repeat', type=int, default=10)
+    aws = sub.add_parser('aws', help='デプロイ済みの関数を呼び出して計測')
+    aws.add_argument('--cold', type=int, default=5)
+    aws.add_argument('--warm', type=int, default=20)
+    aws.add_argument('--router-function', default=ROUTER_FUNCTION)
+    args = parser.parse_args(argv)
+
+    if args.command == 'local':
+        results = bench_local(args.repeat)
+    else:
+        results = bench_aws(args.cold, args.warm, args.router_function)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
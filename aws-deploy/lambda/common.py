@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import metrics
+
+# Lambda関数共通のサポートモジュール
+# - boto3クライアントはモジュールスコープで遅延生成し、ウォームスタート時は再利用する
+# - describe_instances の解析とレスポンス生成を1か所にまとめる
+# - 生成したクライアントの API 呼び出し回数・リトライ回数を metrics に記録する
+
+REGION = os.environ.get('AWS_REGION', 'ap-northeast-1')
+INSTANCE_ID = os.environ.get('INSTANCE_ID', 'i-0e71ec8304bf61354')
+
+_clients = {}
+_clients_lock = threading.Lock()
+_client_config = None
+
+
+def client_config():
+    """接続プール・キープアライブ・リトライを調整したbotocore設定"""
+    global _client_config
+    if _client_config is None:
+        from botocore.config import Config
+
+        _client_config = Config(
+            region_name=REGION,
+            max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '10')),
+            connect_timeout=int(os.environ.get('AWS_CONNECT_TIMEOUT', '3')),
+            read_timeout=int(os.environ.get('AWS_READ_TIMEOUT', '10')),
+            tcp_keepalive=True,
+            retries={
+                'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', '3')),
+                'mode': 'adaptive'
+            }
+        )
+    return _client_config
+
+
+def get_client(service_name):
+    """サービスごとに1つだけboto3クライアントを生成して使い回す"""
+    client = _clients.get(service_name)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(service_name)
+        if client is None:
+            import boto3
+
+            client = metrics.register_client(boto3.client(service_name, config=client_config()))
+            _clients[service_name] = client
+        return client
+
+
+def describe_instance(instance_id=INSTANCE_ID):
+    """インスタンス1台分の describe_instances 結果を返す"""
+    ec2 = get_client('ec2')
+    with metrics.phase('describe'):
+        response = ec2.describe_instances(InstanceIds=[instance_id])
+    return response['Reservations'][0]['Instances'][0]
+
+
+def instance_summary(instance):
+    """describe_instances の結果から状態・IP・起動時刻だけを取り出す"""
+    launch_time = instance.get('LaunchTime')
+    return {
+        'state': instance['State']['Name'],
+        'public_ip': instance.get('PublicIpAddress', 'N/A'),
+        'launch_time': launch_time.isoformat() if hasattr(launch_time, 'isoformat') else launch_time
+    }
+
+
+def get_instance_state(instance_id=INSTANCE_ID):
+    return instance_summary(describe_instance(instance_id))
+
+
+def json_response(status_code, body):
+    """API Gateway / Function URL 形式のレスポンスを生成"""
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body)
+    }
+
+
+def get_query_params(event):
+    return event.get('queryStringParameters') or {}
+
+
+def send_discord_message(webhook_url, message, key=None):
+    """Discordへの通知（送信はバックグラウンド。ハンドラの最後に discord_notify.flush() を呼ぶ）"""
+    import discord_notify
+
+    discord_notify.notify(webhook_url, message, key)
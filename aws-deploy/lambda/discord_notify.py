@@ -0,0 +1,297 @@
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+import metrics
+
+# Discord への通知をまとめて送るモジュール
+# - 送信はバックグラウンドのスレッドで行い、呼び出し側（ハンドラ）は待たない
+# - 同じ宛先への短時間の連続した通知は1件の投稿にまとめる。key 付きの通知（起動の進捗など）は
+#   最新のものだけを残し、同じ key で投稿済みのメッセージがあればそれを編集する
+# - ホストごとにキープアライブ接続を1本保持し、接続・読み込みとも短いタイムアウトで打ち切る
+# - 429 の Retry-After と X-RateLimit-* ヘッダー（バケット単位）に従って待つ
+# - 1回の HTTP リクエストを metrics の discord_post 区間として計測する
+#
+# Lambda はハンドラが戻るとコンテナを凍結するので、ハンドラの最後に flush() を呼んで
+# FLUSH_TIMEOUT 秒までは送信を待つ。間に合わなかった分はキューに残り、次の呼び出しで送られる。
+
+CONNECT_TIMEOUT = float(os.environ.get('DISCORD_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('DISCORD_READ_TIMEOUT', '3'))
+FLUSH_TIMEOUT = float(os.environ.get('DISCORD_FLUSH_TIMEOUT', '2'))
+# 通知をまとめるために待つ秒数
+COALESCE_DELAY = 0.2
+# これより長い Retry-After は待たずに諦める
+MAX_RETRY_AFTER = 10
+MAX_ATTEMPTS = 3
+# key 付きメッセージを編集で更新する期間（これより古ければ新しく投稿する）
+EDIT_WINDOW = 3600
+MAX_CONTENT = 2000
+
+
+class HttpClient:
+    """ホストごとにキープアライブ接続を1本保持するHTTPクライアント"""
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, scheme, netloc):
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(netloc, timeout=self.connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        return connection
+
+    def request(self, method, url, payload=None):
+        """(ステータス, ヘッダー（小文字）, 本文) を返す"""
+        with metrics.phase('discord_post'):
+            return self._request(method, url, payload)
+
+    def _request(self, method, url, payload):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json', 'User-Agent': 'minecraft-aws-notify'}
+        key = (parts.scheme, parts.netloc)
+
+        with self._lock:
+            connection = self._connections.pop(key, None)
+            reused = connection is not None
+            try:
+                if connection is None:
+                    connection = self._connect(*key)
+                try:
+                    connection.request(method, path, body=body, headers=headers)
+                    response = connection.getresponse()
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    # 保持していた接続がサーバー側で閉じられていた場合だけ張り直して1回やり直す
+                    connection.close()
+                    if not reused:
+                        raise
+                    connection = self._connect(*key)
+                    connection.request(method, path, body=body, headers=headers)
+                    response = connection.getresponse()
+                data = response.read()
+            except Exception:
+                if connection is not None:
+                    connection.close()
+                raise
+            if not response.will_close:
+                self._connections[key] = connection
+            else:
+                connection.close()
+        return response.status, {name.lower(): value for name, value in response.getheaders()}, data
+
+
+class RateLimits:
+    """Discord のレート制限（ルート → バケット → 解除時刻）"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.route_buckets = {}
+        self.blocked_until = {}
+        self.global_until = 0
+
+    def wait_time(self, route):
+        bucket = self.route_buckets.get(route, route)
+        return max(0, self.blocked_until.get(bucket, 0) - self.clock(), self.global_until - self.clock())
+
+    def update(self, route, status, headers, data):
+        """応答ヘッダーを反映し、429 なら待つべき秒数を返す"""
+        now = self.clock()
+        bucket = headers.get('x-ratelimit-bucket')
+        if bucket:
+            self.route_buckets[route] = bucket
+        bucket = self.route_buckets.get(route, route)
+        if headers.get('x-ratelimit-remaining') == '0' and headers.get('x-ratelimit-reset-after'):
+            self.blocked_until[bucket] = now + float(headers['x-ratelimit-reset-after'])
+        if status != 429:
+            return None
+        retry_after = headers.get('retry-after')
+        try:
+            retry_after = float(json.loads(data).get('retry_after', retry_after))
+        except (ValueError, AttributeError, TypeError):
+            pass
+        retry_after = float(retry_after or 1)
+        if headers.get('x-ratelimit-global') == 'true' or headers.get('x-ratelimit-scope') == 'global':
+            self.global_until = now + retry_after
+        else:
+            self.blocked_until[bucket] = now + retry_after
+        return retry_after
+
+
+def _split_content(lines):
+    """行をまとめて MAX_CONTENT 文字以内の本文に分ける"""
+    chunks = []
+    for line in lines:
+        line = line[:MAX_CONTENT]
+        if chunks and len(chunks[-1]) + 1 + len(line) <= MAX_CONTENT:
+            chunks[-1] += '\n' + line
+        else:
+            chunks.append(line)
+    return chunks
+
+
+class Dispatcher:
+    """通知のキューと送信スレッド"""
+
+    def __init__(self, client=None, clock=time.monotonic, sleep=time.sleep, coalesce_delay=COALESCE_DELAY):
+        self.client = client or HttpClient()
+        self.clock = clock
+        self.sleep = sleep
+        self.coalesce_delay = coalesce_delay
+        self.rate_limits = RateLimits(clock)
+        # (webhook_url, key) → 本文の行（key が None なら到着順に連結、key 付きは最新の1行）
+        self._pending = {}
+        self._busy = False
+        self._flushing = False
+        self._cond = threading.Condition()
+        self._thread = None
+        # (webhook_url, key) → (メッセージID, 投稿時刻)
+        self._posted = {}
+        self.sent = 0
+        self.dropped = 0
+
+    def notify(self, webhook_url, message, key=None):
+        if not webhook_url or not message:
+            return
+        with self._cond:
+            lines = self._pending.setdefault((webhook_url, key), [])
+            if key is None:
+                lines.append(message)
+            else:
+                lines[:] = [message]
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='discord-notify', daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """送信待ちがなくなるまで最大 timeout 秒待つ。すべて送れたら True"""
+        deadline = self.clock() + timeout
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            try:
+                while self._pending or self._busy:
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flushing = False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # 続けて届く通知を少しだけ待ってまとめる（flush 中は待たない）
+                deadline = self.clock() + self.coalesce_delay
+                while not self._flushing and self.clock() < deadline:
+                    self._cond.wait(deadline - self.clock())
+                batch, self._pending = self._pending, {}
+                self._busy = True
+            try:
+                for (webhook_url, key), lines in batch.items():
+                    self._deliver(webhook_url, key, lines)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _deliver(self, webhook_url, key, lines):
+        for content in _split_content(lines):
+            previous = self._posted.get((webhook_url, key)) if key is not None else None
+            if previous is not None and self.clock() - previous[1] < EDIT_WINDOW:
+                message_id, posted_at = previous
+                url = f'{webhook_url}/messages/{message_id}'
+                if self._send('PATCH', url, webhook_url, content) is not None:
+                    continue
+                # 削除済みなどで編集できなければ新しく投稿する
+                self._posted.pop((webhook_url, key), None)
+            url = webhook_url + ('?wait=true' if key is not None else '')
+            response = self._send('POST', url, webhook_url, content)
+            if key is not None and response:
+                try:
+                    self._posted[(webhook_url, key)] = (json.loads(response)['id'], self.clock())
+                except (ValueError, KeyError, TypeError):
+                    pass
+
+    def _send(self, method, url, route, content):
+        """送れたら応答本文、諦めたら None"""
+        route = f'{method} {route}'
+        for _ in range(MAX_ATTEMPTS):
+            wait = self.rate_limits.wait_time(route)
+            if wait > MAX_RETRY_AFTER:
+                break
+            if wait > 0:
+                self.sleep(wait)
+            try:
+                status, headers, data = self.client.request(method, url, {'content': content})
+            except Exception as e:
+                print(f'Failed to send Discord message: {e}')
+                continue
+            retry_after = self.rate_limits.update(route, status, headers, data)
+            if retry_after is not None:
+                print(f'Discord rate limited: retry after {retry_after}s')
+                metrics.count('discord_retries')
+                continue
+            if 200 <= status < 300:
+                self.sent += 1
+                return data or b'{}'
+            print(f'Failed to send Discord message: HTTP {status} {data[:200]!r}')
+            if status < 500:
+                break
+        self.dropped += 1
+        return None
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def dispatcher():
+    """プロセスで1つの Dispatcher（ウォームスタート時は接続ごと再利用する）"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = Dispatcher()
+    return _dispatcher
+
+
+def notify(webhook_url, message, key=None):
+    """通知をキューに入れてすぐに戻る"""
+    dispatcher().notify(webhook_url, message, key)
+
+
+def flush(timeout=FLUSH_TIMEOUT):
+    if _dispatcher is None:
+        return True
+    return _dispatcher.flush(timeout)
+
+
+_client = None
+
+
+def post_json(url, payload):
+    """同期的にJSONをPOSTする（Botの /notify など応答が必要な場合）。(ステータス, 本文) を返す"""
+    global _client
+    if _client is None:
+        _client = HttpClient()
+    status, headers, data = _client.request('POST', url, payload)
+    if status == 429:
+        retry_after = float(headers.get('retry-after') or 1)
+        if retry_after <= MAX_RETRY_AFTER:
+            time.sleep(retry_after)
+            status, headers, data = _client.request('POST', url, payload)
+    return status, data
@@ -1,89 +1,263 @@
 import json
-import boto3
 import os
-
-ssm = boto3.client('ssm', region_name='ap-northeast-1')
-ec2 = boto3.client('ec2', region_name='ap-northeast-1')
+import shlex
+import common
+import instance_cache
+import ssm_runner
+import metrics
 
 INSTANCE_ID = os.environ.get('INSTANCE_ID', 'i-0e71ec8304bf61354')
 
+LOG_FILE = '/minecraft/server/logs/latest.log'
+# インスタンス側のカーソル読み出しツール（aws-deploy/tools/log_cursor.py）
+LOG_CURSOR_TOOL = '/minecraft/tools/log_cursor.py'
+# ローテーション済みログの検索ツール（aws-deploy/tools/log_search.py）
+LOG_SEARCH_TOOL = '/minecraft/tools/log_search.py'
+# プレイ履歴の集計ツール（aws-deploy/tools/session_history.py）
+SESSION_TOOL = '/minecraft/tools/session_history.py'
+SESSION_QUERIES = ('playtime', 'concurrent', 'peak-hours')
+# クラッシュレポートの索引ツール（aws-deploy/tools/crash_index.py）
+CRASH_TOOL = '/minecraft/tools/crash_index.py'
+# SSMの標準出力は約24KBで切り捨てられるため、それより小さく収める
+MAX_OUTPUT = 20000
+# ツールの実行を待つ上限（秒）
+RUN_TIMEOUT = 10
+
+def build_command(lines, cursor=None, level=None, pattern=None, compact=False):
+    """
+    ログ取得用のシェルコマンドを組み立てる
+    ツールが未配置の古いインスタンスでは従来どおり tail にフォールバックする
+    """
+    args = ['python3', LOG_CURSOR_TOOL, '--lines', str(lines), '--max-output', str(MAX_OUTPUT)]
+    if cursor:
+        args += ['--cursor', cursor]
+    if level:
+        args += ['--level', level]
+    if pattern:
+        args += ['--grep', pattern]
+    if compact:
+        args.append('--compact')
+    tool_command = ' '.join(shlex.quote(arg) for arg in args)
+    return (
+        f'if [ -f {LOG_CURSOR_TOOL} ]; then {tool_command}; '
+        f'else tail -n {int(lines)} {LOG_FILE}; fi'
+    )
+
+def build_search_command(since=None, until=None, level=None, player=None, pattern=None, limit=200):
+    """過去ログ（logs/*.log.gz）の検索コマンドを組み立てる"""
+    args = ['python3', LOG_SEARCH_TOOL, '--max-output', str(MAX_OUTPUT), '--limit', str(limit)]
+    for option, value in (('--since', since), ('--until', until), ('--level', level),
+                          ('--player', player), ('--grep', pattern)):
+        if value:
+            args += [option, value]
+    return ' '.join(shlex.quote(arg) for arg in args)
+
+def build_sessions_command(query, days=7, since=None, until=None, step=None):
+    """プレイ履歴の集計コマンドを組み立てる（未取り込みの過去ログを先に取り込む）"""
+    args = ['python3', SESSION_TOOL, '--ingest', query, '--days', str(days)]
+    for option, value in (('--since', since), ('--until', until)):
+        if value:
+            args += [option, value]
+    if step and query == 'concurrent':
+        args += ['--step', str(step)]
+    return ' '.join(shlex.quote(arg) for arg in args)
+
+def build_crashes_command(only_new=False, ack=None, restart=False):
+    """
+    クラッシュの一覧（ack 指定時は確認済みにしてから一覧、restart なら止まっているサーバーを起動）
+    ack の結果（JSON 1行）は一覧の前に出力する。ack に失敗した場合は起動も一覧も行わない
+    """
+    commands = []
+    if ack:
+        commands.append(f'python3 {CRASH_TOOL} ack {shlex.quote(ack)}')
+        if restart:
+            commands.append('{ systemctl reset-failed minecraft.service; '
+                            'systemctl is-active --quiet minecraft.service || systemctl start minecraft.service; }')
+    args = ['python3', CRASH_TOOL, 'summary']
+    if only_new:
+        args.append('--new')
+    commands.append(' '.join(shlex.quote(arg) for arg in args))
+    return ' && '.join(commands)
+
+def run_command(command, deadline=None):
+    """SSMでコマンドを実行し、ssm_runner.CommandResult を返す（待ち時間切れは status=DeadlineExceeded）"""
+    return ssm_runner.SsmRunner(INSTANCE_ID).run(command, timeout=RUN_TIMEOUT, deadline=deadline)
+
+def search_response(output):
+    """検索結果を応答にする（各行は ファイル名 時刻 [スレッド/レベル] メッセージ）"""
+    if not output.ok:
+        return common.json_response(200, {
+            'success': False,
+            'message': 'ログの検索に失敗しました',
+            'logs': [],
+            'error': output.stderr or output.status
+        })
+    
+    result = json.loads(output.stdout)
+    matches = result['matches']
+    return common.json_response(200, {
+        'success': True,
+        'message': f'{len(matches)}件見つかりました（{result["files_scanned"]}ファイルを検索、{result["files_skipped"]}ファイルは索引で除外）',
+        'logs': [
+            f"{item['file']} {item['time']} [{item['thread']}/{item['level']}] {item['message']}"
+            for item in matches
+        ],
+        'matches': matches,
+        'truncated': result['truncated']
+    })
+
+def sessions_response(query, output):
+    """プレイ履歴の集計結果を応答にする"""
+    if not output.ok:
+        return common.json_response(200, {
+            'success': False,
+            'message': 'プレイ履歴の集計に失敗しました',
+            'error': output.stderr or output.status
+        })
+    
+    result = json.loads(output.stdout)
+    return common.json_response(200, {
+        'success': True,
+        'message': f'{result["since"]} 〜 {result["until"]} のプレイ履歴',
+        'query': query,
+        **result
+    })
+
+def crashes_response(output, ack=None, restart=False):
+    """クラッシュの一覧を応答にする（シグネチャごと、新しい順）。ack 指定時は先頭行の ack の結果も返す"""
+    lines = output.stdout.strip().splitlines()
+    acknowledgement = None
+    if ack and lines:
+        try:
+            acknowledgement = json.loads(lines[0])
+        except ValueError:
+            acknowledgement = None
+    if acknowledgement is not None and 'error' in acknowledgement:
+        return common.json_response(200, {
+            'success': False,
+            'message': 'クラッシュを確認済みにできませんでした' + ('（サーバーは起動し直していません）' if restart else ''),
+            'error': acknowledgement['error']
+        })
+    acknowledged = (acknowledgement or {}).get('acknowledged')
+    if not output.ok:
+        return common.json_response(200, {
+            'success': False,
+            'message': 'クラッシュレポートの取得に失敗しました' + ('（サーバーの起動に失敗した可能性があります）' if acknowledged and restart else ''),
+            'acknowledged': acknowledged,
+            'error': output.stderr or output.status
+        })
+    
+    result = json.loads(lines[-1])
+    message = f'{result["signatures"]}種類のクラッシュ（レポート{result["reports"]}件、未確認{result["new"]}種類）'
+    if result['crash_loop']:
+        message = f'⚠️ クラッシュループのため起動を停止しています（{", ".join(result["crash_loop"]["suspected_mods"]) or "原因不明"}）。' + message
+    if acknowledged is not None:
+        message = f'{len(acknowledged)}種類を確認済みにしました' + ('（サーバーを起動し直しました）' if restart else '') + '。' + message
+        result['acknowledged'] = acknowledged
+    return common.json_response(200, {'success': True, 'message': message, **result})
+
+def parse_output(content):
+    """ツールのJSON出力を解釈する。tailの出力（JSONでない）は行リストとして扱う"""
+    try:
+        result = json.loads(content)
+    except ValueError:
+        log_lines = content.strip().split('\n') if content else []
+        return {'lines': log_lines, 'cursor': None, 'next_cursor': None, 'rotated': False, 'more': False}
+    if not isinstance(result, dict):
+        raise ValueError('unexpected log tool output')
+    return result
+
+@metrics.instrument('get_logs')
 def lambda_handler(event, context):
     try:
-        # クエリパラメータから行数を取得（デフォルト50行）
-        lines = 50
-        if event.get('queryStringParameters'):
-            lines = int(event['queryStringParameters'].get('lines', 50))
+        # クエリパラメータ
+        #   lines: カーソル未指定時に返す末尾の行数（デフォルト50行）
+        #   cursor: 前回の応答の next_cursor。指定するとそれ以降の新しい行だけを返す
+        #   level: この重要度以上の行のみ（INFO / WARN / ERROR など）
+        #   grep: 行に対する正規表現
+        #   format: compact なら [時刻, レベル, メッセージ] 形式
+        #   mode: search なら過去ログ（logs/*.log.gz）を検索する（since / until / player / grep / level / limit）
+        #         sessions ならプレイ履歴を集計する（query: playtime / concurrent / peak-hours、days / since / until / step）
+        #         crashes ならクラッシュレポートの一覧（new=true で未確認のみ、ack=<シグネチャ|all> で確認済みに、
+        #         restart=true ならクラッシュループで止めたサーバーを起動し直す）
+        params = common.get_query_params(event)
+        lines = int(params.get('lines', 50))
+        cursor = params.get('cursor')
+        level = params.get('level')
+        pattern = params.get('grep')
+        compact = params.get('format') == 'compact'
+        deadline = ssm_runner.deadline_from(context)
         
         # インスタンスの状態を確認
-        response = ec2.describe_instances(InstanceIds=[INSTANCE_ID])
-        state = response['Reservations'][0]['Instances'][0]['State']['Name']
+        state = instance_cache.get_instance_state(INSTANCE_ID)['state']
         
         if state != 'running':
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'success': False,
-                    'message': f'サーバーが起動していません（状態: {state}）',
-                    'logs': []
-                })
-            }
-        
-        # SSM経由でログを取得
-        command = f'tail -n {lines} /minecraft/server/logs/latest.log'
+            return common.json_response(200, {
+                'success': False,
+                'message': f'サーバーが起動していません（状態: {state}）',
+                'logs': [],
+                'cursor': cursor,
+                'next_cursor': cursor
+            })
         
-        ssm_response = ssm.send_command(
-            InstanceIds=[INSTANCE_ID],
-            DocumentName='AWS-RunShellScript',
-            Parameters={'commands': [command]},
-            TimeoutSeconds=30
-        )
+        if params.get('mode') == 'search':
+            command = build_search_command(
+                params.get('since'), params.get('until'), level,
+                params.get('player'), pattern, int(params.get('limit', 200))
+            )
+            return search_response(run_command(command, deadline))
         
-        command_id = ssm_response['Command']['CommandId']
+        if params.get('mode') == 'crashes':
+            ack = params.get('ack')
+            restart = params.get('restart') == 'true'
+            command = build_crashes_command(params.get('new') == 'true', ack, restart)
+            return crashes_response(run_command(command, deadline), ack, restart and bool(ack))
         
-        # コマンド実行完了を待つ
-        import time
-        max_attempts = 10
-        for attempt in range(max_attempts):
-            time.sleep(1)
-            
-            output = ssm.get_command_invocation(
-                CommandId=command_id,
-                InstanceId=INSTANCE_ID
+        if params.get('mode') == 'sessions':
+            query = params.get('query', 'playtime')
+            if query not in SESSION_QUERIES:
+                return common.json_response(400, {
+                    'success': False,
+                    'message': f'query は {" / ".join(SESSION_QUERIES)} のいずれかを指定してください'
+                })
+            command = build_sessions_command(
+                query, int(params.get('days', 7)), params.get('since'), params.get('until'), params.get('step')
             )
-            
-            if output['Status'] in ['Success', 'Failed']:
-                break
+            return sessions_response(query, run_command(command, deadline))
         
-        if output['Status'] == 'Success':
-            log_content = output['StandardOutputContent']
-            log_lines = log_content.strip().split('\n') if log_content else []
+        # SSM経由でログを取得（カーソル以降の差分のみ）
+        output = run_command(build_command(lines, cursor, level, pattern, compact), deadline)
+        
+        if output.ok:
+            result = parse_output(output.stdout)
+            log_lines = result['lines']
             
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'success': True,
-                    'message': f'最新{len(log_lines)}行のログを取得しました',
-                    'logs': log_lines
-                })
-            }
+            if cursor and not result.get('rotated'):
+                message = f'新しいログ{len(log_lines)}行を取得しました'
+            else:
+                message = f'最新{len(log_lines)}行のログを取得しました'
+            
+            return common.json_response(200, {
+                'success': True,
+                'message': message,
+                'logs': log_lines,
+                'cursor': cursor,
+                'next_cursor': result.get('next_cursor'),
+                'rotated': result.get('rotated', False),
+                'more': result.get('more', False)
+            })
         else:
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'success': False,
-                    'message': 'ログの取得に失敗しました',
-                    'logs': [],
-                    'error': output.get('StandardErrorContent', 'Unknown error')
-                })
-            }
+            return common.json_response(200, {
+                'success': False,
+                'message': 'ログの取得に失敗しました',
+                'logs': [],
+                'error': output.stderr or output.status
+            })
             
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'success': False,
-                'message': f'エラーが発生しました: {str(e)}',
-                'logs': []
-            })
-        }
+        return common.json_response(500, {
+            'success': False,
+            'message': f'エラーが発生しました: {str(e)}',
+            'logs': []
+        })
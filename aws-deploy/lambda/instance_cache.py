@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+import common
+import state_store
+
+# EC2インスタンス状態（state / public_ip / launch_time）の短期キャッシュ
+# - ウォームコンテナ内ではプロセス内の辞書を使う
+# - INSTANCE_STATE_STORE=s3 の場合はS3を共有ストアとして複数のLambda間でも共有する
+# - 自分で start/stop を呼んだ後は invalidate() で即座に破棄する
+
+CACHE_TTL = float(os.environ.get('INSTANCE_STATE_TTL', '5'))
+STORE_TYPE = os.environ.get('INSTANCE_STATE_STORE', '')
+
+_local = {}
+_local_lock = threading.Lock()
+_default_store = None
+
+
+def default_store():
+    """環境変数で指定された共有ストアを返す（未指定ならNone = プロセス内のみ）"""
+    global _default_store
+    if _default_store is None:
+        _default_store = state_store.create_store(STORE_TYPE, prefix='cache/')
+    return _default_store
+
+
+def _cache_key(instance_id):
+    return f'{instance_id}/instance_state'
+
+
+def _is_fresh(entry, ttl, now):
+    return entry is not None and now - entry.get('fetched_at', 0) < ttl
+
+
+def get_instance_state(instance_id=common.INSTANCE_ID, ttl=None, store=None):
+    """
+    インスタンス状態を返す。TTL以内ならキャッシュを使い describe_instances を呼ばない
+    戻り値は common.instance_summary と同じ形式に 'cached' と 'age' を加えたもの
+    """
+    ttl = CACHE_TTL if ttl is None else ttl
+    store = store if store is not None else default_store()
+    key = _cache_key(instance_id)
+    now = time.time()
+
+    entry = _local.get(key)
+    if not _is_fresh(entry, ttl, now) and store is not None:
+        try:
+            entry = store.get(key)
+        except Exception as e:
+            print(f'Instance state cache read failed: {e}')
+            entry = None
+        if _is_fresh(entry, ttl, now):
+            with _local_lock:
+                _local[key] = entry
+
+    if _is_fresh(entry, ttl, now):
+        return dict(entry['value'], cached=True, age=round(now - entry['fetched_at'], 3))
+
+    value = common.get_instance_state(instance_id)
+    entry = {'value': value, 'fetched_at': time.time()}
+    with _local_lock:
+        _local[key] = entry
+    if store is not None:
+        try:
+            store.put(key, entry)
+        except Exception as e:
+            print(f'Instance state cache write failed: {e}')
+    return dict(value, cached=False, age=0.0)
+
+
+def invalidate(instance_id=common.INSTANCE_ID, store=None):
+    """start/stop などで状態が変わることが分かっている場合にキャッシュを破棄"""
+    store = store if store is not None else default_store()
+    key = _cache_key(instance_id)
+    with _local_lock:
+        _local.pop(key, None)
+    if store is not None:
+        try:
+            store.delete(key)
+        except Exception as e:
+            print(f'Instance state cache invalidation failed: {e}')
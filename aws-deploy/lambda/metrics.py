@@ -0,0 +1,202 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# 呼び出しごとの計測（CloudWatch Embedded Metric Format）
+# - @instrument('start_server') を付けたハンドラの1回の呼び出しごとに Recorder を作り、
+#   終了時に EMF の JSON を1行出力する（CloudWatch Logs がメトリクスとして取り込む）
+# - with phase('describe'): で名前付きの区間の時間を足し込む（同じ名前は合計と回数）
+# - AWS API の呼び出し回数・リトライ回数は common.get_client が botocore のイベントで数える
+# - put() で任意の値（起動までの秒数など）を追加する
+# - ハンドラの外（計測中でないとき）の phase / count / put は何もしない
+# - set_sink(MemorySink()) で出力先をローカルのリストに差し替えられる（検証用）
+#
+# ルーター経由の呼び出しでは外側の Recorder をそのまま使い、Function には内側のハンドラ名を入れる。
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'Minecraft/ControlPlane')
+ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+# 区間の名前 → 値のキー（phase_<名前>）
+PHASE_PREFIX = 'phase_'
+
+
+class StdoutSink:
+    """標準出力に1行ずつ書く（Lambda では CloudWatch Logs に届く）"""
+
+    def emit(self, document):
+        print(json.dumps(document, ensure_ascii=False), flush=True)
+
+
+class MemorySink:
+    """出力をリストに溜めるローカル代替"""
+
+    def __init__(self):
+        self.documents = []
+
+    def emit(self, document):
+        self.documents.append(document)
+
+
+class Recorder:
+    """1回の呼び出し分の計測値"""
+
+    def __init__(self, function, clock=time.perf_counter):
+        self.function = function
+        self.clock = clock
+        self.started = clock()
+        self.phases = {}
+        self.counters = {}
+        self.values = {}
+        self.properties = {}
+        self._lock = threading.Lock()
+
+    def add_phase(self, name, milliseconds):
+        with self._lock:
+            total, count = self.phases.get(name, (0.0, 0))
+            self.phases[name] = (total + milliseconds, count + 1)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def put(self, name, value, unit='None'):
+        with self._lock:
+            self.values[name] = (value, unit)
+
+    def document(self, timestamp=None):
+        """EMF のドキュメントを作る"""
+        metrics = [{'Name': 'duration', 'Unit': 'Milliseconds'}]
+        document = {
+            'Function': self.function,
+            'duration': round((self.clock() - self.started) * 1000, 1),
+        }
+        with self._lock:
+            for name, (total, count) in sorted(self.phases.items()):
+                key = PHASE_PREFIX + name
+                metrics.append({'Name': key, 'Unit': 'Milliseconds'})
+                document[key] = round(total, 1)
+                document[f'{key}_count'] = count
+            for name, amount in sorted(self.counters.items()):
+                metrics.append({'Name': name, 'Unit': 'Count'})
+                document[name] = amount
+            for name, (value, unit) in sorted(self.values.items()):
+                metrics.append({'Name': name, 'Unit': unit})
+                document[name] = value
+            document.update(self.properties)
+        document['_aws'] = {
+            'Timestamp': int((timestamp if timestamp is not None else time.time()) * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Function']],
+                'Metrics': metrics,
+            }],
+        }
+        return document
+
+
+_sink = StdoutSink()
+_current = None
+_current_lock = threading.Lock()
+
+
+def set_sink(sink):
+    """出力先を差し替えて、元の出力先を返す"""
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+
+def current():
+    """計測中の Recorder（無ければ None）。送信スレッドからも同じものを参照する"""
+    return _current
+
+
+@contextlib.contextmanager
+def phase(name):
+    """区間の時間を計測中の Recorder に足し込む"""
+    recorder = _current
+    if recorder is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_phase(name, (time.perf_counter() - started) * 1000)
+
+
+def count(name, amount=1):
+    recorder = _current
+    if recorder is not None:
+        recorder.count(name, amount)
+
+
+def put(name, value, unit='None'):
+    recorder = _current
+    if recorder is not None:
+        recorder.put(name, value, unit)
+
+
+def set_property(name, value):
+    """メトリクスにはしない検索用の値（route, phase など）"""
+    recorder = _current
+    if recorder is not None:
+        recorder.properties[name] = value
+
+
+def instrument(function):
+    """ハンドラを計測するデコレータ。呼び出しごとに EMF を1行出力する"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _current
+            if not ENABLED:
+                return handler(event, context)
+            with _current_lock:
+                outer = _current
+                if outer is None:
+                    _current = Recorder(function)
+            if outer is not None:
+                # ルーターから呼ばれた場合は外側の計測に含める
+                outer.function = function
+                return handler(event, context)
+            recorder = _current
+            try:
+                response = handler(event, context)
+                if isinstance(response, dict) and 'statusCode' in response:
+                    recorder.properties['status_code'] = response['statusCode']
+                return response
+            except Exception:
+                recorder.count('errors')
+                raise
+            finally:
+                with _current_lock:
+                    _current = None
+                try:
+                    _sink.emit(recorder.document())
+                except Exception as e:
+                    print(f'Failed to emit metrics: {e}')
+        return wrapper
+    return decorator
+
+
+def register_client(client):
+    """boto3 クライアントの API 呼び出し回数とリトライ回数を数える"""
+    # botocore のイベント名はサービス ID（ハイフン区切り）を使う
+    service = client.meta.service_model.service_id.hyphenize()
+
+    def before_call(model, **kwargs):
+        count('aws_calls')
+        count(f'aws_{service}_{model.name}')
+
+    def after_call(parsed, **kwargs):
+        attempts = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if attempts:
+            count('aws_retries', attempts)
+
+    client.meta.events.register(f'before-call.{service}', before_call)
+    client.meta.events.register(f'after-call.{service}', after_call)
+    return client
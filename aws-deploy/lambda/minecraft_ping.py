@@ -0,0 +1,176 @@
+import json
+import socket
+import struct
+import time
+
+# Minecraft Server List Ping (SLP) クライアント
+# https://wiki.vg/Server_List_Ping
+# ハンドシェイク + ステータス要求を1往復で送り、JSONレスポンスを受け取る
+
+DEFAULT_PORT = 25565
+DEFAULT_TIMEOUT = 2.0
+# -1 は「バージョン確認用」としてどのサーバーも受け付けるプロトコル番号
+PROTOCOL_VERSION = -1
+# ステータスJSONの上限（異常なサーバーから巨大な応答を受け取らないため）
+MAX_RESPONSE_LENGTH = 1024 * 1024
+
+
+class PingError(Exception):
+    """SLPの通信・応答解析に失敗した場合の例外"""
+
+
+def encode_varint(value):
+    """int を VarInt（7bitずつ、上位ビットが継続フラグ）にエンコード"""
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data, offset=0):
+    """bytes から VarInt を読み取り (値, 次のオフセット) を返す"""
+    result = 0
+    for i in range(5):
+        if offset >= len(data):
+            raise PingError('VarIntの途中でデータが終了しました')
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            if result & 0x80000000:
+                result -= 1 << 32
+            return result, offset
+    raise PingError('VarIntが長すぎます')
+
+
+def encode_string(text):
+    raw = text.encode('utf-8')
+    return encode_varint(len(raw)) + raw
+
+
+def build_packet(packet_id, payload=b''):
+    body = encode_varint(packet_id) + payload
+    return encode_varint(len(body)) + body
+
+
+def build_handshake(host, port, protocol_version=PROTOCOL_VERSION):
+    payload = (
+        encode_varint(protocol_version)
+        + encode_string(host)
+        + struct.pack('>H', port)
+        + encode_varint(1)  # next state: status
+    )
+    return build_packet(0x00, payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            raise PingError('サーバーが接続を閉じました')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_varint(sock):
+    result = 0
+    for i in range(5):
+        byte = _recv_exact(sock, 1)[0]
+        result |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return result
+    raise PingError('VarIntが長すぎます')
+
+
+def read_packet(sock):
+    """1パケット読み取り (packet_id, payload) を返す"""
+    length = _recv_varint(sock)
+    if length <= 0 or length > MAX_RESPONSE_LENGTH:
+        raise PingError(f'不正なパケット長です: {length}')
+    data = _recv_exact(sock, length)
+    packet_id, offset = decode_varint(data)
+    return packet_id, data[offset:]
+
+
+def flatten_motd(description):
+    """チャットコンポーネント形式のMOTDをプレーンテキストに変換"""
+    if description is None:
+        return ''
+    if isinstance(description, str):
+        return description
+    if isinstance(description, list):
+        return ''.join(flatten_motd(part) for part in description)
+    if isinstance(description, dict):
+        text = description.get('text', '')
+        for extra in description.get('extra', []):
+            text += flatten_motd(extra)
+        return text
+    return str(description)
+
+
+def parse_status(status):
+    """ステータスJSONから必要な項目だけを取り出す"""
+    players = status.get('players', {}) or {}
+    version = status.get('version', {}) or {}
+    sample = players.get('sample', []) or []
+    return {
+        'online': int(players.get('online', 0)),
+        'max': int(players.get('max', 0)),
+        'players': [p.get('name') for p in sample if p.get('name')],
+        'version': version.get('name', ''),
+        'protocol': version.get('protocol'),
+        'motd': flatten_motd(status.get('description')),
+    }
+
+
+def ping(host, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT):
+    """
+    サーバーにSLPを送り、プレイヤー数・バージョン・MOTDを返す
+    timeout は接続から応答受信までの合計秒数（厳密な上限）
+    """
+    deadline = time.monotonic() + timeout
+    started = time.monotonic()
+
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.settimeout(max(deadline - time.monotonic(), 0.001))
+            sock.sendall(build_handshake(host, port) + build_packet(0x00))
+
+            packet_id, payload = read_packet(sock)
+            if packet_id != 0x00:
+                raise PingError(f'想定外のパケットIDです: {packet_id}')
+
+            length, offset = decode_varint(payload)
+            raw = payload[offset:offset + length]
+            if len(raw) != length:
+                raise PingError('ステータスJSONが途中で切れています')
+    except socket.timeout as e:
+        raise PingError(f'SLPがタイムアウトしました（{timeout}秒）') from e
+    except OSError as e:
+        raise PingError(f'SLP接続に失敗しました: {e}') from e
+
+    try:
+        status = json.loads(raw.decode('utf-8'))
+    except ValueError as e:
+        raise PingError(f'ステータスJSONの解析に失敗しました: {e}') from e
+
+    result = parse_status(status)
+    result['latency_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return result
+
+
+if __name__ == '__main__':
+    import sys
+
+    target = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+    target_port = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT
+    print(json.dumps(ping(target, target_port), ensure_ascii=False, indent=2))
@@ -0,0 +1,517 @@
+import hashlib
+import json
+import os
+import re
+import uuid
+import common
+import mod_manifest
+
+# 署名付きURLによるMODのマルチパートアップロード
+#
+# 1. init:     ファイルごとにマルチパートアップロードを開始し、パートごとの署名付きPUT URLを返す
+#              jar は内容アドレス方式（mods/objects/<sha256>.jar）で保存するため、既にあるものは送らなくてよい
+#              アップロード先はセッションごとの一時キー（mods/uploads/<session_id>/<sha256>.jar）
+# 2. (client): 各パートを並列に PUT し、応答の ETag を控える
+# 3. complete: 報告されたパート（番号・ETag）が揃っていることを list_parts で確認してから結合し、
+#              結合したオブジェクトを読み直して SHA-256 を検証する。一致したものだけを内容アドレスのキーに
+#              コピーするので、申告と違う内容が mods/objects/ に入ることはない。
+#              その後 MODマニフェストの新しいバージョンを作ってサーバーに差分同期（tools/mod_sync.py）を指示する
+#
+# ファイル本体は Lambda / API Gateway を通らないため、ペイロード上限やBase64の膨張を気にしなくてよい。
+
+S3_BUCKET = os.environ.get('S3_BUCKET', 'minecraft-server-mods-temp')
+MOD_SYNC_TOOL = '/minecraft/tools/mod_sync.py'
+TOOLS_SYNC = '/usr/local/bin/minecraft-tools-sync.sh'
+
+PART_SIZE = int(os.environ.get('MOD_UPLOAD_PART_SIZE', str(8 * 1024 * 1024)))
+URL_EXPIRES = int(os.environ.get('MOD_UPLOAD_URL_EXPIRES', '3600'))
+# complete で内容を読み直して SHA-256 を検証するため、Lambda の実行時間内に読める大きさに制限する
+MAX_FILE_SIZE = 1024 * 1024 * 1024
+# S3 の制約: 最後以外のパートは5MiB以上、パート数は10000まで
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+SAFE_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._+\-\[\]() ]*\.jar$')
+SHA256 = re.compile(r'^[0-9a-f]{64}$')
+SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+UPLOADS_PREFIX = 'mods/uploads/'
+
+
+class UploadError(Exception):
+    """リクエストの内容が不正（400で返す）"""
+
+
+def validate_file(file_info):
+    """{name, size, sha256} を検証して正規化した dict を返す"""
+    name = file_info.get('name') or ''
+    if not SAFE_NAME.match(name):
+        raise UploadError(f'ファイル名が不正です: {name!r}')
+    try:
+        size = int(file_info.get('size'))
+    except (TypeError, ValueError):
+        raise UploadError(f'{name}: size が必要です')
+    if size <= 0 or size > MAX_FILE_SIZE:
+        raise UploadError(f'{name}: size が範囲外です ({size})')
+    sha256 = (file_info.get('sha256') or '').lower()
+    if not SHA256.match(sha256):
+        raise UploadError(f'{name}: sha256 (16進64文字) が必要です')
+    return {'name': name, 'size': size, 'sha256': sha256}
+
+
+def part_size_for(size, part_size=PART_SIZE):
+    """パート数が上限を超えないようにパートサイズを決める"""
+    part_size = max(part_size, MIN_PART_SIZE)
+    while (size + part_size - 1) // part_size > MAX_PARTS:
+        part_size *= 2
+    return part_size
+
+
+def plan_parts(size, part_size):
+    """[(パート番号, 開始位置, 長さ), ...]"""
+    parts = []
+    offset = 0
+    number = 1
+    while offset < size:
+        length = min(part_size, size - offset)
+        parts.append((number, offset, length))
+        offset += length
+        number += 1
+    return parts
+
+
+class S3RangeReader:
+    """
+    S3オブジェクトをシーク可能なファイルとして読む（Rangeリクエスト）
+    zipfile は末尾の central directory と必要なエントリしか読まないため、jar 全体を取得せずに済む
+    """
+
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, s3, bucket, key, size):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+        self._buffer_start = 0
+        self._buffer = b''
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.position = offset
+        elif whence == 1:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size - self.position
+        n = min(n, self.size - self.position)
+        if n <= 0:
+            return b''
+        end = self.position + n
+        buffer_end = self._buffer_start + len(self._buffer)
+        if not (self._buffer_start <= self.position and end <= buffer_end):
+            fetch_end = min(self.size, max(end, self.position + self.BLOCK_SIZE))
+            response = self.s3.get_object(
+                Bucket=self.bucket, Key=self.key, Range=f'bytes={self.position}-{fetch_end - 1}'
+            )
+            self._buffer = response['Body'].read()
+            self._buffer_start = self.position
+        start = self.position - self._buffer_start
+        data = self._buffer[start:start + n]
+        self.position += len(data)
+        return data
+
+
+def object_key(sha256):
+    return mod_manifest.object_key(sha256)
+
+
+def staging_key(session_id, sha256):
+    """検証前のアップロード先（検証が済むまで mods/objects/ には置かない）"""
+    return f'{UPLOADS_PREFIX}{session_id}/{sha256}.jar'
+
+
+def validate_session(session_id):
+    session_id = (session_id or '').lower()
+    if not SESSION_ID.match(session_id):
+        raise UploadError('session_id が必要です（step=init の応答の値）')
+    return session_id
+
+
+def object_exists(s3, key, bucket=S3_BUCKET):
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+
+def init_uploads(s3, files, bucket=S3_BUCKET, part_size=PART_SIZE, expires=URL_EXPIRES):
+    """
+    ファイルごとにマルチパートアップロードを開始し、パートごとの署名付きURLを返す
+    申告された SHA-256 はメタデータに入れておき、complete で実際の内容と照合する
+    """
+    if not files:
+        raise UploadError('files パラメータが必要です')
+    files = [validate_file(file_info) for file_info in files]
+    session_id = uuid.uuid4().hex
+
+    uploads = []
+    try:
+        for file_info in files:
+            key = object_key(file_info['sha256'])
+            if object_exists(s3, key, bucket):
+                # 同じ内容の jar は既にある（名前が違っても共有される）
+                uploads.append({
+                    'name': file_info['name'],
+                    'key': key,
+                    'size': file_info['size'],
+                    'sha256': file_info['sha256'],
+                    'upload_id': None,
+                    'exists': True,
+                    'parts': []
+                })
+                continue
+            upload_key = staging_key(session_id, file_info['sha256'])
+            response = s3.create_multipart_upload(
+                Bucket=bucket,
+                Key=upload_key,
+                ContentType='application/java-archive',
+                Metadata={'sha256': file_info['sha256'], 'upload-session': session_id}
+            )
+            upload_id = response['UploadId']
+            size = part_size_for(file_info['size'], part_size)
+            uploads.append({
+                'name': file_info['name'],
+                'key': key,
+                'size': file_info['size'],
+                'sha256': file_info['sha256'],
+                'upload_id': upload_id,
+                'upload_key': upload_key,
+                'exists': False,
+                'part_size': size,
+                'parts': [
+                    {
+                        'part_number': number,
+                        'offset': offset,
+                        'length': length,
+                        'url': s3.generate_presigned_url(
+                            'upload_part',
+                            Params={'Bucket': bucket, 'Key': upload_key, 'UploadId': upload_id, 'PartNumber': number},
+                            ExpiresIn=expires
+                        )
+                    }
+                    for number, offset, length in plan_parts(file_info['size'], size)
+                ]
+            })
+    except Exception:
+        # 途中で失敗したら開始済みのアップロードを破棄（放置すると課金対象のパートが残る）
+        abort_uploads(s3, session_id, uploads, bucket)
+        raise
+
+    return {'session_id': session_id, 'expires_in': expires, 'uploads': uploads}
+
+
+def _normalize_etag(etag):
+    return (etag or '').strip().strip('"').lower()
+
+
+def verify_parts(s3, upload, bucket=S3_BUCKET):
+    """
+    クライアントが報告したパート（番号とETag）が S3 に揃っていることを確認し、結合用のパート一覧を返す
+    クライアントの報告と S3 の記録を突き合わせるだけなので、内容の検証にはならない
+    （内容は complete_uploads で結合後に SHA-256 を計算して確かめる）
+    """
+    reported = {int(part['part_number']): _normalize_etag(part.get('etag')) for part in upload.get('parts', [])}
+    if not reported:
+        raise UploadError(f"{upload.get('name')}: parts が必要です")
+
+    stored = {}
+    kwargs = {'Bucket': bucket, 'Key': upload['upload_key'], 'UploadId': upload['upload_id']}
+    while True:
+        response = s3.list_parts(**kwargs)
+        for part in response.get('Parts', []):
+            stored[part['PartNumber']] = (_normalize_etag(part['ETag']), part['Size'])
+        if not response.get('IsTruncated'):
+            break
+        kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    missing = sorted(number for number in reported if number not in stored)
+    if missing:
+        raise UploadError(f"{upload['name']}: パート {missing} がアップロードされていません")
+    mismatched = sorted(number for number, etag in reported.items() if etag != stored[number][0])
+    if mismatched:
+        raise UploadError(f"{upload['name']}: パート {mismatched} の ETag が S3 の記録と一致しません")
+    if 'size' in upload:
+        total = sum(stored[number][1] for number in reported)
+        if total != int(upload['size']):
+            raise UploadError(f"{upload['name']}: サイズが一致しません（{total} != {upload['size']}）")
+
+    return [{'PartNumber': number, 'ETag': f'"{stored[number][0]}"'} for number in sorted(reported)]
+
+
+def object_sha256(s3, key, bucket=S3_BUCKET, chunk_size=1024 * 1024):
+    """S3 オブジェクトを読みながら SHA-256 を計算する"""
+    digest = hashlib.sha256()
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    for chunk in iter(lambda: body.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _delete_quietly(s3, key, bucket):
+    try:
+        s3.delete_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        print(f"Delete failed for {key}: {str(e)}")
+
+
+def complete_uploads(s3, session_id, uploads, bucket=S3_BUCKET):
+    """
+    全ファイルのパートを確認してから結合し、内容の SHA-256 を検証してからマニフェストのエントリを返す
+    1つでも不正なら何も mods/objects/ に置かない（結合済みの一時オブジェクトは削除する）
+    """
+    session_id = validate_session(session_id)
+    if not uploads:
+        raise UploadError('uploads パラメータが必要です')
+    files = []
+    for upload in uploads:
+        file_info = validate_file(upload)
+        upload['key'] = object_key(file_info['sha256'])
+        upload['upload_key'] = staging_key(session_id, file_info['sha256'])
+        if not upload.get('upload_id') and not object_exists(s3, upload['key'], bucket):
+            raise UploadError(f"{upload['name']}: upload_id が必要です")
+        files.append(file_info)
+
+    verified = [
+        (upload, verify_parts(s3, upload, bucket) if upload.get('upload_id') else None)
+        for upload in uploads
+    ]
+
+    staged = []
+    try:
+        for upload, parts in verified:
+            if parts is None:
+                continue
+            s3.complete_multipart_upload(
+                Bucket=bucket,
+                Key=upload['upload_key'],
+                UploadId=upload['upload_id'],
+                MultipartUpload={'Parts': parts}
+            )
+            staged.append(upload)
+            actual = object_sha256(s3, upload['upload_key'], bucket)
+            if actual != upload['sha256'].lower():
+                raise UploadError(f"{upload['name']}: 内容の SHA-256 が一致しません（{actual}）")
+        # 検証が済んだものだけを内容アドレスのキーに置く
+        for upload in staged:
+            s3.copy_object(
+                Bucket=bucket,
+                Key=upload['key'],
+                CopySource={'Bucket': bucket, 'Key': upload['upload_key']},
+                ContentType='application/java-archive',
+                Metadata={'sha256': upload['sha256'].lower()},
+                MetadataDirective='REPLACE'
+            )
+    finally:
+        for upload in staged:
+            _delete_quietly(s3, upload['upload_key'], bucket)
+
+    return [
+        mod_manifest.build_entry(
+            file_info['name'], file_info['sha256'], file_info['size'],
+            mod_manifest.read_mod_info(S3RangeReader(s3, bucket, object_key(file_info['sha256']), file_info['size']))
+        )
+        for file_info in files
+    ]
+
+
+def abort_uploads(s3, session_id, uploads, bucket=S3_BUCKET):
+    aborted = []
+    session_id = validate_session(session_id)
+    for upload in uploads:
+        if not upload.get('upload_id') or not SHA256.match((upload.get('sha256') or '').lower()):
+            continue
+        key = staging_key(session_id, upload['sha256'].lower())
+        try:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload['upload_id'])
+            aborted.append(upload.get('name'))
+        except Exception as e:
+            print(f"Abort failed for {key}: {str(e)}")
+    return aborted
+
+
+def load_manifest(s3, version=None, bucket=S3_BUCKET):
+    """現在（または指定バージョン）のマニフェスト。まだなければ None"""
+    key = mod_manifest.manifest_version_key(version) if version else mod_manifest.MANIFEST_KEY
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        return None
+
+
+def publish_manifest(s3, manifest, bucket=S3_BUCKET):
+    """バージョン付きで保存してから現在のマニフェストとして公開する"""
+    body = json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+    s3.put_object(Bucket=bucket, Key=mod_manifest.manifest_version_key(manifest['version']),
+                  Body=body, ContentType='application/json')
+    s3.put_object(Bucket=bucket, Key=mod_manifest.MANIFEST_KEY, Body=body, ContentType='application/json')
+
+
+def list_manifest_versions(s3, limit=20, bucket=S3_BUCKET):
+    versions = []
+    kwargs = {'Bucket': bucket, 'Prefix': mod_manifest.MANIFESTS_PREFIX}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        versions.extend(
+            item['Key'][len(mod_manifest.MANIFESTS_PREFIX):-len('.json')] for item in response.get('Contents', [])
+        )
+        if not response.get('IsTruncated'):
+            break
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+    return sorted(versions, reverse=True)[:limit]
+
+
+def build_sync_command(bucket=S3_BUCKET):
+    """
+    サーバー側でMODを差分同期するコマンド
+    変わった jar だけを取得・検証し、サーバーに影響する変更があるときだけ再起動する
+    """
+    return f"{TOOLS_SYNC} && python3 {MOD_SYNC_TOOL} --bucket {bucket} --prune"
+
+
+def send_sync(ssm, instance_id):
+    response = ssm.send_command(
+        InstanceIds=[instance_id],
+        DocumentName='AWS-RunShellScript',
+        Parameters={'commands': [build_sync_command()]}
+    )
+    return response['Command']['CommandId']
+
+
+def handle_request(s3, ssm, instance_id, step, body):
+    """
+    upload_mods / update_config(action=upload_mods) 共通の処理
+    step: init / complete / abort / manifest / rollback / remove
+    """
+    if body.get('mod_files'):
+        return common.json_response(400, {
+            'success': False,
+            'message': 'Base64でのアップロード（mod_files）は廃止されました。step=init で署名付きURLを取得してください'
+        })
+
+    try:
+        if step == 'init':
+            result = init_uploads(s3, body.get('files', []))
+            return common.json_response(200, {
+                'success': True,
+                'message': f"{len(result['uploads'])}個のMODファイルのアップロードURLを発行しました",
+                **result
+            })
+
+        if step == 'abort':
+            aborted = abort_uploads(s3, body.get('session_id'), body.get('uploads', []))
+            return common.json_response(200, {
+                'success': True,
+                'message': f'{len(aborted)}個のアップロードを中止しました',
+                'aborted': aborted
+            })
+
+        if step == 'complete':
+            entries = complete_uploads(s3, body.get('session_id'), body.get('uploads', []))
+            current = load_manifest(s3)
+            manifest = mod_manifest.merge_entries(current, entries)
+            changes = mod_manifest.summarize_diff(mod_manifest.diff(current, manifest))
+            if current is not None and not (changes['added'] or changes['removed'] or changes['changed']):
+                return common.json_response(200, {
+                    'success': True,
+                    'message': 'MODファイルに変更はありません',
+                    'uploaded_files': [entry['name'] for entry in entries],
+                    'manifest_version': current['version'],
+                    'changes': changes
+                })
+            publish_manifest(s3, manifest)
+            message = f'{len(entries)}個のMODファイルをアップロードしました。サーバーに反映しています...'
+            if current is None:
+                # 初回の同期では、サーバーにある既存のMODを mod_sync.py がマニフェストに取り込む（削除はしない）
+                message += '（サーバーにある既存のMODは初回の同期でマニフェストに取り込まれます）'
+            return common.json_response(200, {
+                'success': True,
+                'message': message,
+                'uploaded_files': [entry['name'] for entry in entries],
+                'manifest_version': manifest['version'],
+                'changes': changes,
+                'command_id': send_sync(ssm, instance_id)
+            })
+
+        if step == 'manifest':
+            return common.json_response(200, {
+                'success': True,
+                'manifest': load_manifest(s3, body.get('version')),
+                'versions': list_manifest_versions(s3)
+            })
+
+        if step == 'remove':
+            current = load_manifest(s3)
+            names = body.get('names') or []
+            if isinstance(names, str):
+                names = [name for name in names.split(',') if name]
+            if current is None or not names:
+                raise UploadError('names パラメータが必要です')
+            manifest = mod_manifest.remove_entries(current, names)
+            publish_manifest(s3, manifest)
+            return common.json_response(200, {
+                'success': True,
+                'message': f'{len(names)}個のMODファイルを削除しました。サーバーに反映しています...',
+                'manifest_version': manifest['version'],
+                'changes': mod_manifest.summarize_diff(mod_manifest.diff(current, manifest)),
+                'command_id': send_sync(ssm, instance_id)
+            })
+
+        if step == 'rollback':
+            # 過去のマニフェストを現在のものとして公開し直す（jar はインスタンスのキャッシュにあれば再取得しない）
+            current = load_manifest(s3)
+            version = body.get('version') or (current or {}).get('previous')
+            target = load_manifest(s3, version) if version else None
+            if target is None:
+                raise UploadError(f'マニフェストが見つかりません: {version}')
+            s3.put_object(Bucket=S3_BUCKET, Key=mod_manifest.MANIFEST_KEY,
+                          Body=json.dumps(target, ensure_ascii=False, indent=2).encode('utf-8'),
+                          ContentType='application/json')
+            return common.json_response(200, {
+                'success': True,
+                'message': f'MODを {version} に戻しています...',
+                'manifest_version': version,
+                'changes': mod_manifest.summarize_diff(mod_manifest.diff(current, target)),
+                'command_id': send_sync(ssm, instance_id)
+            })
+    except UploadError as e:
+        return common.json_response(400, {'success': False, 'message': str(e)})
+
+    return common.json_response(400, {
+        'success': False,
+        'message': 'step には init / complete / abort / manifest / rollback / remove のいずれかを指定してください'
+    })
+
+
+def parse_body(event):
+    """API Gateway経由ならボディのJSON、直接呼び出しならイベントそのもの。クエリパラメータも取り込む"""
+    if event.get('body'):
+        body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+    elif 'httpMethod' in event:
+        body = {}
+    else:
+        body = event
+    return {**common.get_query_params(event), **body}
@@ -1,8 +1,10 @@
 import json
 import os
-import urllib.request
 import urllib.parse
+import discord_notify
+import metrics
 
+@metrics.instrument('notify_discord')
 def lambda_handler(event, context):
     """
     Discord通知を送信するLambda関数
@@ -41,29 +43,29 @@ def lambda_handler(event, context):
     
     # Discord Botに通知を送信
     try:
-        data = json.dumps({
+        status, response_data = discord_notify.post_json(f'{bot_url}/notify', {
             'message': message,
             'channel': channel
-        }).encode('utf-8')
+        })
+        print(f'Discord notification sent: HTTP {status} {response_data.decode("utf-8")}')
         
-        req = urllib.request.Request(
-            f'{bot_url}/notify',
-            data=data,
-            headers={'Content-Type': 'application/json'}
-        )
-        
-        with urllib.request.urlopen(req, timeout=10) as response:
-            response_data = response.read().decode('utf-8')
-            print(f'Discord notification sent: {response_data}')
-            
+        if status >= 300:
             return {
-                'statusCode': 200,
+                'statusCode': 502,
                 'body': json.dumps({
-                    'success': True,
-                    'message': 'Notification sent to Discord',
-                    'channel': channel
+                    'success': False,
+                    'message': f'Bot rejected the notification (HTTP {status})'
                 })
             }
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'success': True,
+                'message': 'Notification sent to Discord',
+                'channel': channel
+            })
+        }
     
     except Exception as e:
         print(f'Error sending Discord notification: {str(e)}')
@@ -0,0 +1,443 @@
+import json
+import os
+import time
+import uuid
+import common
+import discord_notify
+import instance_cache
+import minecraft_ping
+import start_orchestrator
+import state_store
+import metrics
+
+# 過去の起動要求・プレイヤー接続から需要を予測し、遊びに来る前にサーバーを起動しておく（予測起動）
+#
+# 需要は1週間の時間帯（曜日×時 = 168区分、JST）ごとに「その時間帯に需要があった週の割合」で表す。
+# 古い週ほど重みを下げ（半減期 PREWARM_HALF_LIFE_WEEKS 週）、1つの区分は1週に1回だけ数える。
+# EventBridge から15分ごとに tick し、
+#   - サーバーが動いていてプレイヤーがいれば、今の区分に需要があったと記録する
+#   - 停止中で、起動にかかる時間だけ先の区分の確率がしきい値以上かつ月の予算が残っていれば起動する
+# 予測起動したときは /minecraft/<instance-id>/hold_until に区分の終わりを書き、
+# 自動停止（auto_shutdown.py）はその時刻まではプレイヤー不在でも停止しない。
+# 予測起動は費用がかかるので既定では無効（PREWARM_ENABLED=true で有効。無効でも需要の学習は続ける）。
+#
+# /start の起動要求は状態を読み書きせず、<instance-id>/prewarm-demand/ に1件ずつ追記するだけにする
+# （起動の応答を遅らせず、tick との読み込み→書き込みの競合で更新が失われないようにする）。
+# tick が追記された起動要求を状態に取り込んでから消す（同じ起動要求を2回取り込んでも同じ結果になる）。
+
+HOURS_PER_WEEK = 168
+# 1970-01-01 は木曜日。月曜0時を週の始まりにするためのずれ（時間）
+EPOCH_WEEKDAY_HOURS = 72
+
+UTC_OFFSET = float(os.environ.get('PREWARM_UTC_OFFSET', '9'))
+THRESHOLD = float(os.environ.get('PREWARM_THRESHOLD', '0.6'))
+HALF_LIFE_WEEKS = float(os.environ.get('PREWARM_HALF_LIFE_WEEKS', '4'))
+# 観測した週数（重み付き）がこれ未満の間は予測起動しない
+MIN_WEEKS = float(os.environ.get('PREWARM_MIN_WEEKS', '2'))
+# 予測起動に使ってよい月あたりの費用（USD）と、インスタンスの時間単価（t3a.medium 東京）
+MONTHLY_BUDGET = float(os.environ.get('PREWARM_MONTHLY_BUDGET', '3'))
+HOURLY_COST = float(os.environ.get('INSTANCE_HOURLY_COST', '0.0608'))
+# 起動要求から接続できるまでの時間の初期値（実際の起動記録から学習する）
+DEFAULT_COLD_START = 300
+IDLE_TIME = 900
+# tick の間隔（EventBridge のスケジュールと合わせる）。次の tick を待つと間に合わない分だけ早めに起動する
+TICK_INTERVAL = int(os.environ.get('PREWARM_TICK_INTERVAL', '900'))
+ENABLED = os.environ.get('PREWARM_ENABLED', 'false') == 'true'
+STORE_TYPE = os.environ.get('PREWARM_STATE_STORE', 's3')
+
+
+def _local_hours(now, utc_offset=UTC_OFFSET):
+    return int((now + utc_offset * 3600) // 3600) + EPOCH_WEEKDAY_HOURS
+
+
+def hour_of_week(now, utc_offset=UTC_OFFSET):
+    """月曜0時（JST）を0とした週内の時間帯"""
+    return _local_hours(now, utc_offset) % HOURS_PER_WEEK
+
+
+def week_number(now, utc_offset=UTC_OFFSET):
+    return _local_hours(now, utc_offset) // HOURS_PER_WEEK
+
+
+def slot_end(now, utc_offset=UTC_OFFSET):
+    """now を含む時間帯の終わり（エポック秒）"""
+    return (_local_hours(now, utc_offset) + 1 - EPOCH_WEEKDAY_HOURS) * 3600 - utc_offset * 3600
+
+
+def new_state():
+    return {
+        'demand': [0.0] * HOURS_PER_WEEK,
+        'last_week': [None] * HOURS_PER_WEEK,
+        'weeks': 0.0,
+        'week': None,
+        'cold_start': DEFAULT_COLD_START,
+        'learned_start': None,
+        'budget': {'month': None, 'spent': 0.0},
+        'active': None,
+        'stats': {'prewarms': 0, 'hits': 0},
+    }
+
+
+class DemandModel:
+    """時間帯ごとの需要の確率（減衰付きの週単位ヒストグラム）"""
+
+    def __init__(self, state, half_life_weeks=HALF_LIFE_WEEKS, utc_offset=UTC_OFFSET):
+        self.state = state
+        self.decay = 0.5 ** (1 / half_life_weeks)
+        self.utc_offset = utc_offset
+
+    def advance(self, now):
+        """now の週まで重みを減衰させる（今の週の重みは1）"""
+        state = self.state
+        week = week_number(now, self.utc_offset)
+        if state['week'] is None:
+            state['week'] = week
+            state['weeks'] = 1.0
+            return
+        elapsed = week - state['week']
+        if elapsed <= 0:
+            return
+        factor = self.decay ** elapsed
+        state['demand'] = [value * factor for value in state['demand']]
+        state['weeks'] = state['weeks'] * factor + sum(self.decay ** i for i in range(elapsed))
+        state['week'] = week
+
+    def observe(self, now):
+        """
+        now の時間帯に需要があったことを記録する（同じ週の同じ時間帯は1回だけ）。新しく数えたら True
+        その時間帯を数えた週より前の記録（遅れて取り込んだ起動要求）は数えない
+        """
+        self.advance(now)
+        slot = hour_of_week(now, self.utc_offset)
+        week = week_number(now, self.utc_offset)
+        last_week = self.state['last_week'][slot]
+        if last_week is not None and week <= last_week:
+            return False
+        self.state['demand'][slot] += 1
+        self.state['last_week'][slot] = week
+        return True
+
+    def probability(self, at, now):
+        """
+        時刻 at の時間帯に需要がある確率
+        今週まだ来ていない時間帯は、今週を分母に含めない
+        """
+        self.advance(now)
+        slot = hour_of_week(at, self.utc_offset)
+        weeks = self.state['weeks']
+        if self.state['last_week'][slot] != week_number(at, self.utc_offset):
+            weeks -= 1
+        if weeks < MIN_WEEKS:
+            return 0.0
+        return min(1.0, self.state['demand'][slot] / weeks)
+
+    def forecast(self, now):
+        """今後24時間の時間帯ごとの確率（表示用）"""
+        return [
+            {'hour_of_week': hour_of_week(now + hour * 3600, self.utc_offset),
+             'at': now + hour * 3600,
+             'probability': round(self.probability(now + hour * 3600, now), 3)}
+            for hour in range(24)
+        ]
+
+
+class Scheduler:
+    """予測起動の判断（時刻と観測値だけを受け取り、AWSには触らない）"""
+
+    def __init__(self, state=None, threshold=THRESHOLD, monthly_budget=MONTHLY_BUDGET, hourly_cost=HOURLY_COST,
+                 idle_time=IDLE_TIME, tick_interval=TICK_INTERVAL, half_life_weeks=HALF_LIFE_WEEKS,
+                 utc_offset=UTC_OFFSET):
+        self.state = state if state is not None else new_state()
+        self.model = DemandModel(self.state, half_life_weeks, utc_offset)
+        self.threshold = threshold
+        self.monthly_budget = monthly_budget
+        self.hourly_cost = hourly_cost
+        self.idle_time = idle_time
+        self.tick_interval = tick_interval
+        self.utc_offset = utc_offset
+
+    def _budget(self, now):
+        month = time.strftime('%Y-%m', time.gmtime(now + self.utc_offset * 3600))
+        budget = self.state['budget']
+        if budget['month'] != month:
+            budget['month'] = month
+            budget['spent'] = 0.0
+        return budget
+
+    def learn_cold_start(self, requested_at, seconds):
+        """起動要求から接続できるまでの時間（指数移動平均）"""
+        if self.state['learned_start'] is not None and requested_at <= self.state['learned_start']:
+            return
+        self.state['learned_start'] = requested_at
+        self.state['cold_start'] = round(0.7 * self.state['cold_start'] + 0.3 * seconds, 1)
+
+    def record_start_request(self, now):
+        """プレイヤーからの起動要求。予測起動で既に動いていれば的中として数える"""
+        self.model.observe(now)
+        self._hit(now)
+
+    def record_players(self, now, online):
+        if online:
+            self.model.observe(now)
+            self._hit(now)
+
+    def _hit(self, now):
+        """予測起動が使われた。予算は空振りした予測起動の費用だけに使うので、差し引いた分を戻す"""
+        active = self.state['active']
+        if active is None or active.get('hit') or now > active['hold_until'] + self.idle_time:
+            return
+        active['hit'] = True
+        self.state['stats']['hits'] += 1
+        budget = self._budget(now)
+        budget['spent'] = max(0.0, budget['spent'] - active['charge'])
+
+    def decide(self, now, running):
+        """
+        予測起動するか判断する
+        戻り値: {'start': bool, 'reason': ..., 'probability': ..., 'hold_until': ...}
+        """
+        target = now + self.state['cold_start'] + self.tick_interval
+        probability = self.model.probability(target, now)
+        decision = {'start': False, 'probability': round(probability, 3), 'target': target,
+                    'hour_of_week': hour_of_week(target, self.utc_offset)}
+        if running:
+            decision['reason'] = 'running'
+            return decision
+        if probability < self.threshold:
+            decision['reason'] = 'below_threshold'
+            return decision
+        hold_until = slot_end(target, self.utc_offset)
+        # 起動してから区分の終わりまで + 自動停止までの時間が、誰も来なかった場合の費用
+        charge = round((hold_until - now + self.idle_time) / 3600 * self.hourly_cost, 4)
+        budget = self._budget(now)
+        if budget['spent'] + charge > self.monthly_budget:
+            decision['reason'] = 'over_budget'
+            return decision
+        active = self.state['active']
+        if active is not None and active['hold_until'] >= hold_until:
+            # 同じ区分で一度起動して止まった（誰も来なかった）なら繰り返さない
+            decision['reason'] = 'already_prewarmed'
+            return decision
+        budget['spent'] = round(budget['spent'] + charge, 4)
+        self.state['active'] = {'started_at': now, 'hold_until': hold_until, 'charge': charge, 'hit': False}
+        self.state['stats']['prewarms'] += 1
+        decision.update(start=True, reason='predicted', hold_until=hold_until, charge=charge)
+        return decision
+
+
+def simulate(events, step=900, cold_start=DEFAULT_COLD_START, **options):
+    """
+    記録されたタイムラインで予測起動を再生する（オフライン検証用）
+    events: [{'time': エポック秒, 'type': 'start' | 'join', 'end': 退出時刻（join のみ、省略可）}]
+    サーバーは最後の活動（退出・起動要求）と hold_until のうち遅い方から idle_time 後に止まるものとする
+    戻り値: 予測起動なし（毎回コールドスタート）と比べた接続までの待ち時間と費用
+    """
+    events = sorted(events, key=lambda event: event['time'])
+    if not events:
+        return {'requests': 0}
+    scheduler = Scheduler(tick_interval=step, **options)
+    scheduler.state['cold_start'] = cold_start
+    idle_time = scheduler.idle_time
+    started_at = None
+    busy_until = None
+    hold_until = 0
+    running_seconds = 0.0
+    waits = []
+    warm = 0
+    index = 0
+    now = events[0]['time'] - events[0]['time'] % step
+    last = events[-1]['time'] + step
+
+    while now <= last:
+        # この刻みまでのイベントを処理する
+        while index < len(events) and events[index]['time'] < now + step:
+            event = events[index]
+            index += 1
+            t = event['time']
+            if started_at is not None and t > max(busy_until, hold_until) + idle_time:
+                running_seconds += max(busy_until, hold_until) + idle_time - started_at
+                started_at = None
+            if started_at is None:
+                started_at = t
+                busy_until = t
+            if event['type'] == 'start':
+                wait = max(0.0, started_at + cold_start - t)
+                waits.append(wait)
+                if wait == 0:
+                    warm += 1
+                scheduler.record_start_request(t)
+            else:
+                scheduler.record_players(t, True)
+            busy_until = max(busy_until, event.get('end', t), t)
+        now += step
+        if started_at is not None and now > max(busy_until, hold_until) + idle_time:
+            running_seconds += max(busy_until, hold_until) + idle_time - started_at
+            started_at = None
+        decision = scheduler.decide(now, started_at is not None)
+        if decision['start']:
+            started_at = busy_until = now
+            hold_until = decision['hold_until']
+    if started_at is not None:
+        running_seconds += max(busy_until, hold_until) + idle_time - started_at
+
+    requests = len(waits)
+    stats = scheduler.state['stats']
+    return {
+        'requests': requests,
+        'warm_starts': warm,
+        'average_wait': round(sum(waits) / requests, 1) if requests else 0.0,
+        'baseline_average_wait': float(cold_start) if requests else 0.0,
+        'prewarms': stats['prewarms'],
+        'prewarm_hits': stats['hits'],
+        'running_hours': round(running_seconds / 3600, 2),
+        'budget': scheduler.state['budget'],
+    }
+
+
+def timeline_from_sessions(sessions, gap=None):
+    """
+    session_history.py sessions の出力をタイムラインにする
+    サーバーが止まっていた後の最初の参加は起動要求として扱う（gap 秒以上誰もいなかった後）
+    """
+    gap = IDLE_TIME if gap is None else gap
+    events = []
+    busy_until = None
+    for session in sorted(sessions, key=lambda session: session['start']):
+        if busy_until is None or session['start'] > busy_until + gap:
+            events.append({'time': session['start'], 'type': 'start'})
+        events.append({'time': session['start'], 'type': 'join', 'end': session['end']})
+        busy_until = max(busy_until or 0, session['end'])
+    return events
+
+
+class PrewarmService:
+    """保存された状態を使って tick と起動要求の記録を行う"""
+
+    def __init__(self, instance_id, store=None, executor=None):
+        self.instance_id = instance_id
+        self.store = store if store is not None else state_store.create_store(STORE_TYPE)
+        if self.store is None:
+            self.store = state_store.MemoryStore()
+        self.executor = executor
+        self.key = f'{instance_id}/prewarm'
+        self.demand_prefix = f'{instance_id}/prewarm-demand/'
+
+    def load(self):
+        state = self.store.get(self.key)
+        return Scheduler(state if state is not None else new_state(), idle_time=self._idle_time())
+
+    def _idle_time(self):
+        try:
+            response = common.get_client('ssm').get_parameter(Name=f'/minecraft/{self.instance_id}/idle_time')
+            return int(response['Parameter']['Value'])
+        except Exception:
+            return IDLE_TIME
+
+    def save(self, scheduler):
+        self.store.put(self.key, scheduler.state)
+
+    def record_start_request(self, now=None):
+        """起動要求を追記する（状態は読まない。次の tick で取り込む）"""
+        now = time.time() if now is None else now
+        self.store.put(f'{self.demand_prefix}{int(now * 1000):013d}-{uuid.uuid4().hex[:8]}', {'time': now})
+
+    def _fold_demand(self, scheduler):
+        """追記された起動要求を状態に取り込み、取り込んだキーを返す（保存した後に消す）"""
+        keys = self.store.list(self.demand_prefix)
+        for key in keys:
+            event = self.store.get(key)
+            if event is not None:
+                scheduler.record_start_request(event['time'])
+        return keys
+
+    def tick(self, now=None):
+        now = time.time() if now is None else now
+        scheduler = self.load()
+        folded = self._fold_demand(scheduler)
+        orchestrator = start_orchestrator.StartOrchestrator(
+            self.instance_id, self.executor or start_orchestrator.AwsExecutor(self.instance_id)
+        )
+
+        # 最後の起動が完了していれば、接続できるまでの時間を学習する
+        record = orchestrator.load()
+        if record is not None and record['phase'] == start_orchestrator.ANNOUNCED:
+            scheduler.learn_cold_start(record['requested_at'], record['updated_at'] - record['requested_at'])
+
+        instance = instance_cache.get_instance_state(self.instance_id)
+        running = instance['state'] != 'stopped'
+        if instance['state'] == 'running' and instance.get('public_ip') not in (None, 'N/A'):
+            try:
+                status = minecraft_ping.ping(instance['public_ip'])
+            except minecraft_ping.PingError:
+                status = None
+            if status is not None:
+                scheduler.record_players(now, status.get('online', 0) > 0)
+
+        decision = scheduler.decide(now, running) if ENABLED else {'start': False, 'reason': 'disabled'}
+        if decision['start']:
+            self._set_hold_until(decision['hold_until'])
+            orchestrator.executor.announce(
+                f'🔮 よく遊ばれる時間帯のため、サーバーを先に起動します（確率 {decision["probability"]:.0%}）'
+            )
+            orchestrator.request_start(now)
+        self.save(scheduler)
+        for key in folded:
+            self.store.delete(key)
+        decision['cold_start'] = scheduler.state['cold_start']
+        decision['budget'] = scheduler.state['budget']
+        return decision
+
+    def _set_hold_until(self, hold_until):
+        common.get_client('ssm').put_parameter(
+            Name=f'/minecraft/{self.instance_id}/hold_until',
+            Value=str(int(hold_until)),
+            Type='String',
+            Overwrite=True,
+            Description='Minecraft auto-shutdown hold (epoch seconds) set by prewarm'
+        )
+
+
+@metrics.instrument('prewarm')
+def lambda_handler(event, context):
+    instance_id = os.environ['INSTANCE_ID']
+    service = PrewarmService(instance_id, executor=start_orchestrator.AwsExecutor(
+        instance_id, os.environ.get('WEBHOOK_URL', '')
+    ))
+    params = common.get_query_params(event)
+    action = params.get('action') or event.get('action') or 'tick'
+
+    try:
+        if action == 'forecast':
+            scheduler = service.load()
+            now = time.time()
+            return common.json_response(200, {
+                'threshold': scheduler.threshold,
+                'cold_start': scheduler.state['cold_start'],
+                'budget': scheduler.state['budget'],
+                'stats': scheduler.state['stats'],
+                'forecast': scheduler.model.forecast(now),
+            })
+        return common.json_response(200, service.tick())
+    except Exception as e:
+        print(f'Prewarm failed: {e}')
+        return common.json_response(500, {'error': str(e)})
+    finally:
+        discord_notify.flush()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='予測起動をタイムラインで再生する')
+    parser.add_argument('timeline', help='{"events": [...]} または session_history.py sessions の出力（JSON）')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--budget', type=float, default=MONTHLY_BUDGET, help='月あたりの予算（USD）')
+    parser.add_argument('--cold-start', type=int, default=DEFAULT_COLD_START)
+    parser.add_argument('--idle-time', type=int, default=IDLE_TIME)
+    args = parser.parse_args()
+
+    with open(args.timeline, encoding='utf-8') as f:
+        timeline = json.load(f)
+    events = timeline['events'] if 'events' in timeline else timeline_from_sessions(timeline['sessions'], args.idle_time)
+    print(json.dumps(simulate(events, cold_start=args.cold_start, threshold=args.threshold,
+                              monthly_budget=args.budget, idle_time=args.idle_time), indent=2))
@@ -0,0 +1,318 @@
+import os
+import re
+import secrets
+import socket
+import struct
+import threading
+
+# Minecraft RCON クライアント
+# https://wiki.vg/RCON
+# パケット: int32長 + int32リクエストID + int32種別 + 本文(ASCII/UTF-8) + 0x00 0x00（すべてリトルエンディアン）
+
+DEFAULT_PORT = 25575
+DEFAULT_TIMEOUT = 3.0
+
+SERVERDATA_AUTH = 3
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_RESPONSE_VALUE = 0
+
+# サーバー→クライアントの1パケットの本文上限は4096バイト、送信側は1446バイト
+MAX_COMMAND_LENGTH = 1446
+MAX_RESPONSE_BODY = 4096
+MAX_PACKET_LENGTH = MAX_RESPONSE_BODY + 10
+
+PASSWORD_PARAMETER = '/minecraft/{instance_id}/rcon_password'
+# セキュリティグループで25575番を開けていない環境では接続タイムアウトを待たないよう無効にしておく
+ENABLED = os.environ.get('RCON_ENABLED', 'false').lower() == 'true'
+
+
+class RconError(Exception):
+    """RCONの通信に失敗した場合の例外"""
+
+
+class RconAuthError(RconError):
+    """RCONパスワードが拒否された場合の例外"""
+
+
+def encode_packet(request_id, packet_type, body):
+    payload = struct.pack('<ii', request_id, packet_type) + body.encode('utf-8') + b'\x00\x00'
+    return struct.pack('<i', len(payload)) + payload
+
+
+def decode_packet(data):
+    """長さプレフィックスを除いたパケットを (request_id, type, body) に分解"""
+    if len(data) < 10:
+        raise RconError(f'パケットが短すぎます: {len(data)}バイト')
+    request_id, packet_type = struct.unpack_from('<ii', data)
+    body = data[8:-2].decode('utf-8', errors='replace')
+    return request_id, packet_type, body
+
+
+def _as_rcon_error(error):
+    if isinstance(error, RconError):
+        return error
+    return RconError(f'RCONコマンドに失敗しました: {error}')
+
+
+class RconClient:
+    """
+    1本のTCP接続を保持するRCONクライアント
+    バニラ/Forge のサーバーは1回の read を1パケットとして扱い、2パケットが1回で届くと切断するため、
+    パケットは1つずつ送る。応答が上限（4096バイト）ちょうどで分割されている可能性がある場合だけ、
+    最初の応答を受け取った後に番兵パケットを送り、その応答が届くまで結合する
+    """
+
+    def __init__(self, host, password, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self._sock = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def connect(self):
+        if self._sock is not None:
+            return
+        try:
+            self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self._sock.settimeout(self.timeout)
+            self._authenticate()
+        except RconError:
+            self.close()
+            raise
+        except OSError as e:
+            self.close()
+            raise RconError(f'RCON接続に失敗しました: {e}') from e
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _new_id(self):
+        # -1 は認証失敗を表すため使わない
+        self._next_id = (self._next_id % 0x7FFFFFFF) + 1
+        return self._next_id
+
+    def _recv_exact(self, size):
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            chunk = self._sock.recv(remaining)
+            if not chunk:
+                raise RconError('サーバーが接続を閉じました')
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    def _read_packet(self):
+        (length,) = struct.unpack('<i', self._recv_exact(4))
+        if length < 10 or length > MAX_PACKET_LENGTH:
+            raise RconError(f'不正なパケット長です: {length}')
+        return decode_packet(self._recv_exact(length))
+
+    def _authenticate(self):
+        request_id = self._new_id()
+        self._sock.sendall(encode_packet(request_id, SERVERDATA_AUTH, self.password))
+        while True:
+            response_id, packet_type, _ = self._read_packet()
+            # 実装によっては認証応答の前に空のRESPONSE_VALUEが返る
+            if packet_type != SERVERDATA_AUTH_RESPONSE:
+                continue
+            if response_id == -1:
+                raise RconAuthError('RCONパスワードが拒否されました')
+            if response_id == request_id:
+                return
+
+    def _read_response(self, request_id):
+        while True:
+            response_id, _, body = self._read_packet()
+            if response_id == request_id:
+                return body
+
+    def _execute(self, command):
+        request_id = self._new_id()
+        self._sock.sendall(encode_packet(request_id, SERVERDATA_EXECCOMMAND, command))
+        body = self._read_response(request_id)
+        if len(body.encode('utf-8')) < MAX_RESPONSE_BODY:
+            return body
+        # 上限いっぱいの応答は続きがあるかもしれない。番兵への応答が届くまでを1つの応答とする
+        sentinel_id = self._new_id()
+        self._sock.sendall(encode_packet(sentinel_id, SERVERDATA_RESPONSE_VALUE, ''))
+        parts = [body]
+        while True:
+            response_id, _, body = self._read_packet()
+            if response_id == sentinel_id:
+                return ''.join(parts)
+            if response_id == request_id:
+                parts.append(body)
+
+    def command(self, command, retry=True):
+        """コマンドを実行して応答本文を返す。切断されていた場合は1回だけ再接続する（retry=False なら再送しない）"""
+        if len(command.encode('utf-8')) > MAX_COMMAND_LENGTH:
+            raise RconError(f'コマンドが長すぎます（最大{MAX_COMMAND_LENGTH}バイト）')
+        with self._lock:
+            pooled = self._sock is not None
+            try:
+                self.connect()
+                return self._execute(command)
+            except (OSError, RconError) as e:
+                self.close()
+                if not pooled or not retry or isinstance(e, RconAuthError):
+                    raise _as_rcon_error(e)
+            # プール済み接続がサーバー側で切れていた場合のみ張り直す
+            try:
+                self.connect()
+                return self._execute(command)
+            except (OSError, RconError) as e:
+                self.close()
+                raise _as_rcon_error(e)
+
+    def list_players(self):
+        return parse_list(self.command('list'))
+
+    def save_all(self):
+        return self.command('save-all flush')
+
+    def stop(self):
+        """
+        サーバーを停止する。停止中に接続が切れるのは正常なので応答が無くても成功とみなす
+        （切断を検知して再接続すると stop を二重に送ってしまうので再送しない）
+        """
+        try:
+            return self.command('stop', retry=False)
+        except RconError:
+            return ''
+        finally:
+            self.close()
+
+    def tps(self):
+        return parse_forge_tps(self.command('forge tps'))
+
+
+_LIST_PATTERN = re.compile(r'There are (\d+) of a max(?: of)? (\d+) players online:?\s*(.*)', re.DOTALL)
+_TPS_PATTERN = re.compile(
+    r'(Overall|Dim\s+.+?\s*\(.+?\)|.+?):\s*Mean tick time:\s*([\d.]+)\s*ms\.?\s*Mean TPS:\s*([\d.]+)'
+)
+
+
+def parse_list(response):
+    """`list` の応答を {'online', 'max', 'players'} に変換"""
+    match = _LIST_PATTERN.search(response)
+    if not match:
+        raise RconError(f'list の応答を解析できません: {response!r}')
+    names = [name.strip() for name in match.group(3).split(',') if name.strip()]
+    return {'online': int(match.group(1)), 'max': int(match.group(2)), 'players': names}
+
+
+def parse_forge_tps(response):
+    """`forge tps` の応答を {ディメンション名: {'tick_ms', 'tps'}} に変換"""
+    result = {}
+    for match in _TPS_PATTERN.finditer(response):
+        result[match.group(1).strip()] = {
+            'tick_ms': float(match.group(2)),
+            'tps': float(match.group(3)),
+        }
+    return result
+
+
+# ウォームスタート間で接続を使い回すためのプール
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def get_client(host, password, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT):
+    """(host, port) ごとにRconClientを1つだけ保持して返す"""
+    key = (host, port)
+    with _pool_lock:
+        client = _pool.get(key)
+        if client is None or client.password != password:
+            if client is not None:
+                client.close()
+            client = RconClient(host, password, port=port, timeout=timeout)
+            _pool[key] = client
+        return client
+
+
+def save_and_stop(ssm, instance_id, host):
+    """RCONでワールドを保存（save-all flush）してからMinecraftを停止"""
+    client = connect_for_instance(ssm, instance_id, host)
+    client.save_all()
+    client.stop()
+
+
+def close_all():
+    with _pool_lock:
+        for client in _pool.values():
+            client.close()
+        _pool.clear()
+
+
+_password_cache = {}
+
+
+def get_password(ssm, instance_id):
+    """RCONパスワードを環境変数またはSSM Parameter Store（SecureString）から取得"""
+    if os.environ.get('RCON_PASSWORD'):
+        return os.environ['RCON_PASSWORD']
+    if instance_id not in _password_cache:
+        response = ssm.get_parameter(
+            Name=PASSWORD_PARAMETER.format(instance_id=instance_id),
+            WithDecryption=True
+        )
+        _password_cache[instance_id] = response['Parameter']['Value']
+    return _password_cache[instance_id]
+
+
+def ensure_password(ssm, instance_id):
+    """RCONパスワードが未登録なら生成してParameter Storeに保存し、そのパスワードを返す"""
+    name = PASSWORD_PARAMETER.format(instance_id=instance_id)
+    try:
+        return ssm.get_parameter(Name=name, WithDecryption=True)['Parameter']['Value']
+    except ssm.exceptions.ParameterNotFound:
+        password = secrets.token_urlsafe(24)
+        ssm.put_parameter(
+            Name=name,
+            Value=password,
+            Type='SecureString',
+            Overwrite=False,
+            Description='Minecraft server RCON password'
+        )
+        _password_cache[instance_id] = password
+        return password
+
+
+def connect_for_instance(ssm, instance_id, host, port=None, timeout=DEFAULT_TIMEOUT):
+    """インスタンスのRCONパスワードでプール済みクライアントを返す"""
+    if not ENABLED:
+        raise RconError('RCONは無効です（RCON_ENABLED=true で有効化）')
+    port = port or int(os.environ.get('RCON_PORT', DEFAULT_PORT))
+    return get_client(host, get_password(ssm, instance_id), port=port, timeout=timeout)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 3:
+        print('Usage: python rcon.py <host> <command...>  (RCON_PASSWORD 環境変数が必要)')
+        sys.exit(1)
+    client = RconClient(sys.argv[1], os.environ.get('RCON_PASSWORD', ''),
+                        port=int(os.environ.get('RCON_PORT', DEFAULT_PORT)))
+    with client:
+        print(client.command(' '.join(sys.argv[2:])))
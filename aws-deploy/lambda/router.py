@@ -0,0 +1,80 @@
+import importlib
+import json
+import time
+import common
+import metrics
+
+_INIT_STARTED = time.perf_counter()
+
+# API Gateway の全パスを1つの関数で受けるエントリポイント
+# - パス（/start, /stop, /status, /logs, /config, /notify, /ready）から処理するモジュールを決める
+# - モジュールは初めてそのパスが呼ばれたときに読み込む（boto3 クライアントの生成もそのとき）。
+#   どのパスの呼び出しも同じコンテナを温めるので、1分ごとの起動処理の進行（EventBridge）があれば
+#   Discord からの /status や /logs もほぼウォームスタートになる
+# - EventBridge や直接呼び出しは {"route": "start", "action": "advance"} のように route で指定する
+#
+# 呼び出しごとに ROUTER_METRICS 行（route / cold / import_ms / handler_ms）を出力する。
+# 分割構成との比較は cold_start_bench.py で行う。
+# metrics の EMF 行には route と cold を付け、Function は処理したハンドラの名前になる。
+
+ROUTES = {
+    'start': 'start_server',
+    'stop': 'stop_server',
+    'status': 'status_server',
+    'logs': 'get_logs',
+    'config': 'update_config',
+    'notify': 'notify_discord',
+    'ready': 'check_minecraft_ready',
+}
+
+_modules = {}
+_cold = True
+
+
+def route_of(event):
+    """イベントからルート名を取り出す（API Gateway / Function URL / 直接呼び出し）"""
+    if event.get('route'):
+        return event['route']
+    path = event.get('resource') or event.get('path') or event.get('rawPath') or ''
+    segments = [segment for segment in path.split('/') if segment]
+    return segments[-1] if segments else None
+
+
+def load(route):
+    """ルートのモジュールを返す（初回だけ import する）。(モジュール, import にかかったミリ秒)"""
+    module = _modules.get(route)
+    if module is not None:
+        return module, 0.0
+    started = time.perf_counter()
+    module = importlib.import_module(ROUTES[route])
+    _modules[route] = module
+    return module, round((time.perf_counter() - started) * 1000, 1)
+
+
+@metrics.instrument('router')
+def lambda_handler(event, context):
+    global _cold
+    cold, _cold = _cold, False
+    route = route_of(event)
+    if route not in ROUTES:
+        return common.json_response(404, {
+            'success': False,
+            'message': f'不明なパスです: {route}'
+        })
+
+    module, import_ms = load(route)
+    metrics.set_property('route', route)
+    metrics.set_property('cold', cold)
+    if import_ms:
+        metrics.put('import_ms', import_ms, 'Milliseconds')
+    started = time.perf_counter()
+    try:
+        return module.lambda_handler(event, context)
+    finally:
+        print('ROUTER_METRICS ' + json.dumps({
+            'route': route,
+            'cold': cold,
+            'init_ms': round((started - _INIT_STARTED) * 1000, 1) if cold else None,
+            'import_ms': import_ms,
+            'handler_ms': round((time.perf_counter() - started) * 1000, 1),
+        }))
@@ -1,70 +1,57 @@
 import json
-import boto3
 import os
-import urllib.request
 import urllib.parse
+import common
+import discord_notify
+import metrics
 
-ssm = boto3.client('ssm', region_name='ap-northeast-1')
 INSTANCE_ID = os.environ.get('INSTANCE_ID', 'i-0e71ec8304bf61354')
 DISCORD_BOT_URL = os.environ.get('DISCORD_BOT_URL', '')
 
+@metrics.instrument('send_notification')
 def lambda_handler(event, context):
     try:
         # クエリパラメータからメッセージを取得
         params = event.get('queryStringParameters', {})
         
         if not params or 'message' not in params:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({
-                    'success': False,
-                    'message': 'メッセージが指定されていません'
-                })
-            }
+            return common.json_response(400, {
+                'success': False,
+                'message': 'メッセージが指定されていません'
+            })
         
         message = urllib.parse.unquote(params['message'])
         channel = params.get('channel', 'status')  # デフォルトはstatus
         
         # Discord Botに通知を送信
         if not DISCORD_BOT_URL:
-            return {
-                'statusCode': 500,
-                'body': json.dumps({
-                    'success': False,
-                    'message': 'DISCORD_BOT_URLが設定されていません'
-                })
-            }
+            return common.json_response(500, {
+                'success': False,
+                'message': 'DISCORD_BOT_URLが設定されていません'
+            })
         
         notification_data = {
             'message': message,
             'channel': channel
         }
         
-        req = urllib.request.Request(
-            f'{DISCORD_BOT_URL}/notify',
-            data=json.dumps(notification_data).encode('utf-8'),
-            headers={'Content-Type': 'application/json'},
-            method='POST'
-        )
+        # キープアライブ接続を再利用し、429 は Retry-After だけ待って1回やり直す
+        status, data = discord_notify.post_json(f'{DISCORD_BOT_URL}/notify', notification_data)
+        if status >= 300:
+            return common.json_response(502, {
+                'success': False,
+                'message': f'Botが通知を受け付けませんでした（HTTP {status}）'
+            })
         
-        with urllib.request.urlopen(req, timeout=10) as response:
-            response_data = json.loads(response.read().decode('utf-8'))
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'success': True,
-                    'message': '通知を送信しました',
-                    'bot_response': response_data
-                })
-            }
+        return common.json_response(200, {
+            'success': True,
+            'message': '通知を送信しました',
+            'bot_response': json.loads(data.decode('utf-8'))
+        })
         
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'success': False,
-                'message': f'エラーが発生しました: {str(e)}'
-            })
-        }
+        return common.json_response(500, {
+            'success': False,
+            'message': f'エラーが発生しました: {str(e)}'
+        })
@@ -0,0 +1,181 @@
+import json
+import time
+import uuid
+from collections import namedtuple
+import common
+import metrics
+
+# SSM Run Command の実行と結果待ちをまとめたモジュール
+# - send() はコマンドを送って待たずに戻る（結果は poll() / wait() で取得。別の呼び出しで poll してもよい）
+# - wait() は最初は短い間隔で、以降は倍々に間隔を延ばして get_command_invocation を呼ぶ
+#   （ツールの実行は数百ミリ秒で終わることが多いので、固定の1秒待ちより早く返せる）
+# - 期限（deadline、Lambda の残り時間から決める）を過ぎたら cancel_command して打ち切る
+# - 計測は send が ssm_send、poll / wait（待ち時間を含む）が ssm_poll の区間
+# - run_sections() は複数のコマンドを1回の send_command にまとめ、区切り行で出力を分けて返す
+#   （StandardOutputContent は24000文字で切り詰められるので、大きな出力をまとめすぎないこと）
+
+DOCUMENT = 'AWS-RunShellScript'
+FIRST_POLL = 0.25
+MAX_POLL = 2.0
+BACKOFF = 2.0
+DEFAULT_TIMEOUT = 10.0
+# Lambda の残り時間からこれだけ残して打ち切る（応答を返す時間）
+DEADLINE_MARGIN = 1.5
+
+PENDING_STATUSES = ('Pending', 'InProgress', 'Delayed')
+# 期限切れで打ち切った場合の status（SSM の status には無い値）
+DEADLINE_EXCEEDED = 'DeadlineExceeded'
+
+SECTION_START = '@@SECTION'
+SECTION_END = '@@END'
+
+
+class CommandResult(namedtuple('CommandResult', ['command_id', 'status', 'stdout', 'stderr', 'exit_code', 'elapsed'])):
+    """コマンド1回分の結果"""
+
+    @property
+    def ok(self):
+        return self.status == 'Success'
+
+    def json(self):
+        return json.loads(self.stdout)
+
+
+class SectionResult(namedtuple('SectionResult', ['stdout', 'exit_code'])):
+    """run_sections() の区間ごとの結果（出力が切り詰められて終わりが無い場合 exit_code は None）"""
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+    def json(self):
+        return json.loads(self.stdout)
+
+
+def deadline_from(context, margin=DEADLINE_MARGIN, clock=time.monotonic):
+    """Lambda の context から wait() に渡す期限を決める（context が無ければ None）"""
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    return clock() + context.get_remaining_time_in_millis() / 1000 - margin
+
+
+def build_sections(sections):
+    """{名前: コマンド} を区切り行付きの1つのシェルスクリプトにする。(スクリプト, 区切りのトークン)"""
+    token = uuid.uuid4().hex[:12]
+    lines = []
+    for name, command in sections.items():
+        lines.append(f"echo '{SECTION_START} {token} {name}'")
+        lines.append(f'( {command} ) 2>&1')
+        lines.append(f"echo \"{SECTION_END} {token} {name} $?\"")
+    return '\n'.join(lines), token
+
+
+def parse_sections(stdout, token):
+    """run_sections() の出力を {名前: SectionResult} に分ける"""
+    results = {}
+    name = None
+    buffer = []
+    for line in stdout.splitlines():
+        parts = line.split(' ')
+        if len(parts) >= 3 and parts[0] == SECTION_START and parts[1] == token:
+            name, buffer = parts[2], []
+            continue
+        if len(parts) >= 4 and parts[0] == SECTION_END and parts[1] == token and parts[2] == name:
+            results[name] = SectionResult('\n'.join(buffer), int(parts[3]) if parts[3].isdigit() else None)
+            name = None
+            continue
+        if name is not None:
+            buffer.append(line)
+    if name is not None:
+        results[name] = SectionResult('\n'.join(buffer), None)
+    return results
+
+
+class PendingCommand(namedtuple('PendingCommand', ['command_id', 'sent_at'])):
+    """send() の戻り値"""
+
+
+class SsmRunner:
+    """インスタンス1台に対してコマンドを実行する"""
+
+    def __init__(self, instance_id, ssm=None, clock=time.monotonic, sleep=time.sleep):
+        self.instance_id = instance_id
+        self.ssm = ssm or common.get_client('ssm')
+        self.clock = clock
+        self.sleep = sleep
+
+    def send(self, commands, timeout=30):
+        """コマンド（文字列またはそのリスト）を送る。待たずに PendingCommand を返す"""
+        if isinstance(commands, str):
+            commands = [commands]
+        with metrics.phase('ssm_send'):
+            response = self.ssm.send_command(
+                InstanceIds=[self.instance_id],
+                DocumentName=DOCUMENT,
+                Parameters={'commands': list(commands)},
+                TimeoutSeconds=max(30, int(timeout))
+            )
+        return PendingCommand(response['Command']['CommandId'], self.clock())
+
+    def poll(self, pending):
+        """終わっていれば CommandResult、まだなら None"""
+        with metrics.phase('ssm_poll'):
+            return self._poll(pending)
+
+    def _poll(self, pending):
+        command_id = pending.command_id if isinstance(pending, PendingCommand) else pending
+        try:
+            result = self.ssm.get_command_invocation(CommandId=command_id, InstanceId=self.instance_id)
+        except self.ssm.exceptions.InvocationDoesNotExist:
+            # send_command の直後は呼び出しがまだ登録されていないことがある
+            return None
+        if result['Status'] in PENDING_STATUSES:
+            return None
+        sent_at = pending.sent_at if isinstance(pending, PendingCommand) else None
+        return CommandResult(
+            command_id,
+            result['Status'],
+            result.get('StandardOutputContent', ''),
+            result.get('StandardErrorContent', ''),
+            result.get('ResponseCode'),
+            round(self.clock() - sent_at, 3) if sent_at is not None else None,
+        )
+
+    def wait(self, pending, timeout=DEFAULT_TIMEOUT, deadline=None):
+        """終わるまで待つ。timeout 秒（または deadline）を過ぎたら打ち切って status=DeadlineExceeded"""
+        with metrics.phase('ssm_poll'):
+            return self._wait(pending, timeout, deadline)
+
+    def _wait(self, pending, timeout, deadline):
+        limit = pending.sent_at + timeout
+        if deadline is not None:
+            limit = min(limit, deadline)
+        interval = FIRST_POLL
+        while True:
+            remaining = limit - self.clock()
+            if remaining <= 0:
+                break
+            self.sleep(min(interval, remaining))
+            result = self._poll(pending)
+            if result is not None:
+                return result
+            interval = min(interval * BACKOFF, MAX_POLL)
+        try:
+            self.ssm.cancel_command(CommandId=pending.command_id, InstanceIds=[self.instance_id])
+        except Exception as e:
+            print(f'Failed to cancel SSM command {pending.command_id}: {e}')
+        return CommandResult(pending.command_id, DEADLINE_EXCEEDED, '', 'コマンドが時間内に終わりませんでした', None,
+                             round(self.clock() - pending.sent_at, 3))
+
+    def run(self, commands, timeout=DEFAULT_TIMEOUT, deadline=None):
+        """送って終わるまで待つ"""
+        return self.wait(self.send(commands, timeout), timeout, deadline)
+
+    def run_sections(self, sections, timeout=DEFAULT_TIMEOUT, deadline=None):
+        """
+        {名前: コマンド} を1回の send_command で実行する。
+        (CommandResult, {名前: SectionResult}) を返す（区間ごとの終了コードで成否を判定する）
+        """
+        script, token = build_sections(sections)
+        result = self.run(script, timeout, deadline)
+        return result, parse_sections(result.stdout, token)
@@ -0,0 +1,343 @@
+import os
+import time
+import common
+import instance_cache
+import metrics
+import minecraft_ping
+import ssm_runner
+import state_store
+
+# サーバー起動のステートマシン
+# requested → ec2_running → service_active → minecraft_ready → announced（失敗時は failed）
+# 停止処理中に起動要求があった場合は stopping から始め、停止しきったところで start_instances を呼ぶ
+#
+# 1回の呼び出しでは「待たずに判定できるところまで」だけ進め、進捗はストアに保存する。
+# 残りはEventBridgeの定期実行（または /start?action=status の呼び出し）で再開する。
+# 起動が終わった呼び出しで、要求から接続できるまでの秒数（TimeToPlayable）と各フェーズの所要時間を
+# metrics に出力する（判定した時刻で記録するので、定期実行の間隔分の誤差を含む）。
+
+STOPPING = 'stopping'
+REQUESTED = 'requested'
+EC2_RUNNING = 'ec2_running'
+SERVICE_ACTIVE = 'service_active'
+MINECRAFT_READY = 'minecraft_ready'
+ANNOUNCED = 'announced'
+FAILED = 'failed'
+
+PHASES = [STOPPING, REQUESTED, EC2_RUNNING, SERVICE_ACTIVE, MINECRAFT_READY, ANNOUNCED]
+TERMINAL_PHASES = (ANNOUNCED, FAILED)
+
+# フェーズごとの上限時間（秒）。超えたら failed にする
+PHASE_TIMEOUTS = {
+    STOPPING: int(os.environ.get('START_TIMEOUT_STOPPING', '300')),
+    REQUESTED: int(os.environ.get('START_TIMEOUT_EC2', '300')),
+    EC2_RUNNING: int(os.environ.get('START_TIMEOUT_SERVICE', '300')),
+    SERVICE_ACTIVE: int(os.environ.get('START_TIMEOUT_MINECRAFT', '600')),
+    MINECRAFT_READY: 60,
+}
+
+STORE_TYPE = os.environ.get('START_STATE_STORE', 's3')
+
+# 途中経過の通知は同じメッセージを編集して更新する（完了・失敗は新しく投稿して通知が鳴るようにする）
+PROGRESS_KEY = 'start-progress'
+
+PHASE_MESSAGES = {
+    STOPPING: 'サーバーの停止処理が終わるのを待っています（終わり次第起動します）...',
+    REQUESTED: 'EC2インスタンスを起動しています...',
+    EC2_RUNNING: 'EC2が起動しました。Minecraftサービスの起動を待っています...',
+    SERVICE_ACTIVE: 'Minecraftサービスが起動しました。ワールドを読み込んでいます...',
+    MINECRAFT_READY: 'Minecraftサーバーの準備ができました',
+    ANNOUNCED: 'Minecraftサーバーが起動しました',
+    FAILED: 'サーバーの起動に失敗しました',
+}
+
+
+class StartRejected(Exception):
+    """インスタンスの状態が起動できないものだった場合の例外（terminated など）"""
+
+
+class AwsExecutor:
+    """実際のAWS / Minecraftに対して各フェーズの判定を行う"""
+
+    def __init__(self, instance_id, webhook_url=''):
+        self.instance_id = instance_id
+        self.webhook_url = webhook_url
+
+    def get_instance_state(self):
+        return instance_cache.get_instance_state(self.instance_id)
+
+    def start_instance(self):
+        common.get_client('ec2').start_instances(InstanceIds=[self.instance_id])
+        instance_cache.invalidate(self.instance_id)
+
+    def send_service_check(self):
+        return ssm_runner.SsmRunner(self.instance_id).send('systemctl is-active minecraft.service').command_id
+
+    def get_service_check(self, command_id):
+        """True: active / False: inactive / None: まだ結果が出ていない"""
+        result = ssm_runner.SsmRunner(self.instance_id).poll(command_id)
+        if result is None:
+            return None
+        return result.stdout.strip() == 'active'
+
+    def ping(self, public_ip):
+        try:
+            with metrics.phase('ping'):
+                return minecraft_ping.ping(public_ip)
+        except minecraft_ping.PingError:
+            return None
+
+    def announce(self, message, key=None):
+        common.send_discord_message(self.webhook_url, message, key)
+
+
+class StubExecutor:
+    """
+    ローカル検証用の実行器
+    各判定は与えられたリストを先頭から順に返し、最後の値はその後も返し続ける
+    """
+
+    def __init__(self, states=('stopped', 'pending', 'running'), service=(True,), pings=(None, {'online': 0}),
+                 public_ip='127.0.0.1'):
+        self._states = list(states)
+        self._service = list(service)
+        self._pings = list(pings)
+        self.public_ip = public_ip
+        self.calls = []
+        self.announcements = []
+
+    @staticmethod
+    def _next(values):
+        return values.pop(0) if len(values) > 1 else values[0]
+
+    def get_instance_state(self):
+        self.calls.append('get_instance_state')
+        return {'state': self._next(self._states), 'public_ip': self.public_ip, 'launch_time': None}
+
+    def start_instance(self):
+        self.calls.append('start_instance')
+
+    def send_service_check(self):
+        self.calls.append('send_service_check')
+        return f'stub-command-{len(self.calls)}'
+
+    def get_service_check(self, command_id):
+        self.calls.append('get_service_check')
+        return self._next(self._service)
+
+    def ping(self, public_ip):
+        self.calls.append('ping')
+        return self._next(self._pings)
+
+    def announce(self, message, key=None):
+        self.announcements.append(message)
+
+
+def _record_key(instance_id):
+    return f'{instance_id}/start'
+
+
+def _transition(record, phase, now, **fields):
+    record['phase'] = phase
+    record['phase_started_at'] = now
+    record['updated_at'] = now
+    record['history'].append({'phase': phase, 'at': now})
+    record.update(fields)
+
+
+def record_metrics(record):
+    """終わった起動の所要時間を metrics に出力する"""
+    history = record['history']
+    for current, following in zip(history, history[1:]):
+        metrics.put(f'start_{current["phase"]}', round(following['at'] - current['at'], 1), 'Seconds')
+    ready_at = next((entry['at'] for entry in history if entry['phase'] == MINECRAFT_READY), None)
+    if ready_at is not None:
+        metrics.put('TimeToPlayable', round(ready_at - record['requested_at'], 1), 'Seconds')
+    metrics.count('start_failed' if record['phase'] == FAILED else 'start_succeeded')
+
+
+def new_record(instance_id, now, phase=REQUESTED):
+    record = {
+        'instance_id': instance_id,
+        'requested_at': now,
+        'public_ip': None,
+        'command_id': None,
+        'error': None,
+        'history': [],
+    }
+    _transition(record, phase, now)
+    return record
+
+
+def advance(record, executor, now=None):
+    """待たずに判定できるところまでレコードを進め、同じレコードを返す"""
+    now = time.time() if now is None else now
+
+    for _ in range(len(PHASES)):
+        phase = record['phase']
+        if phase in TERMINAL_PHASES:
+            return record
+
+        timeout = PHASE_TIMEOUTS.get(phase)
+        if timeout is not None and now - record['phase_started_at'] > timeout:
+            _transition(record, FAILED, now, error=f'{phase} が{timeout}秒以内に完了しませんでした')
+            executor.announce(f'❌ {PHASE_MESSAGES[FAILED]}: {record["error"]}')
+            record_metrics(record)
+            return record
+
+        if not _step(record, executor, now):
+            record['updated_at'] = now
+            return record
+    return record
+
+
+def _step(record, executor, now):
+    """1フェーズ分の判定を行い、遷移した場合のみ True を返す"""
+    phase = record['phase']
+
+    if phase == STOPPING:
+        instance_state = executor.get_instance_state()
+        if instance_state['state'] == 'stopping':
+            return False
+        if instance_state['state'] == 'stopped':
+            executor.start_instance()
+        elif instance_state['state'] not in ('pending', 'running'):
+            _transition(record, FAILED, now, error=f'インスタンスが {instance_state["state"]} 状態のため起動できません')
+            executor.announce(f'❌ {PHASE_MESSAGES[FAILED]}: {record["error"]}')
+            record_metrics(record)
+            return True
+        _transition(record, REQUESTED, now)
+        executor.announce(f'🟡 {PHASE_MESSAGES[REQUESTED]}', key=PROGRESS_KEY)
+        return True
+
+    if phase == REQUESTED:
+        instance_state = executor.get_instance_state()
+        if instance_state['state'] != 'running':
+            return False
+        _transition(record, EC2_RUNNING, now, public_ip=instance_state['public_ip'])
+        executor.announce(f'🟡 {PHASE_MESSAGES[EC2_RUNNING]}', key=PROGRESS_KEY)
+        return True
+
+    if phase == EC2_RUNNING:
+        # SLPに応答すればサービス確認は不要
+        if record['public_ip'] and executor.ping(record['public_ip']) is not None:
+            _transition(record, MINECRAFT_READY, now)
+            return True
+        if record['command_id']:
+            try:
+                active = executor.get_service_check(record['command_id'])
+            except Exception as e:
+                # 結果を取得できないコマンド（不明なID・エージェント未登録など）は送り直す
+                print(f'SSM service check result failed: {e}')
+                active = False
+            if active is None:
+                # まだ結果が出ていない。同じコマンドの結果を次回も待つ
+                return False
+            record['command_id'] = None
+            if active:
+                _transition(record, SERVICE_ACTIVE, now)
+                return True
+        try:
+            # 結果は次回の呼び出しで確認する（SSMエージェント起動前は失敗するので再試行）
+            record['command_id'] = executor.send_service_check()
+        except Exception as e:
+            print(f'SSM service check failed: {e}')
+        return False
+
+    if phase == SERVICE_ACTIVE:
+        if record['public_ip'] and executor.ping(record['public_ip']) is not None:
+            _transition(record, MINECRAFT_READY, now)
+            return True
+        return False
+
+    if phase == MINECRAFT_READY:
+        executor.announce(
+            f'✅ Minecraftサーバーが起動しました！\n\n**サーバーアドレス**: `{record["public_ip"]}:25565`\n\nサーバーに接続できます。'
+        )
+        _transition(record, ANNOUNCED, now)
+        record_metrics(record)
+        return True
+
+    return False
+
+
+def summarize(record):
+    """APIレスポンス用の要約"""
+    if record is None:
+        return {'phase': None, 'in_progress': False}
+    return {
+        'phase': record['phase'],
+        'in_progress': record['phase'] not in TERMINAL_PHASES,
+        'message': PHASE_MESSAGES.get(record['phase'], record['phase']),
+        'public_ip': record['public_ip'],
+        'error': record['error'],
+        'elapsed': round(record['updated_at'] - record['requested_at'], 1),
+        'history': record['history'],
+    }
+
+
+class StartOrchestrator:
+    """ストアへの保存と呼び出し単位の進行をまとめたもの"""
+
+    def __init__(self, instance_id, executor, store=None):
+        self.instance_id = instance_id
+        self.executor = executor
+        self.store = store if store is not None else state_store.create_store(STORE_TYPE)
+        if self.store is None:
+            self.store = state_store.MemoryStore()
+        self.key = _record_key(instance_id)
+
+    def load(self):
+        return self.store.get(self.key)
+
+    def save(self, record):
+        self.store.put(self.key, record)
+
+    def request_start(self, now=None):
+        """
+        起動要求。進行中の起動があればそれを進めるだけで、二重に start_instances は呼ばない
+        停止処理中（stopping）なら要求を記録し、停止しきったところで定期実行が起動する
+        戻り値: (record, already_running)。起動できない状態（terminated など）なら StartRejected
+        """
+        now = time.time() if now is None else now
+        record = self.load()
+        if record is not None and record['phase'] not in TERMINAL_PHASES:
+            return self.tick(now), False
+
+        instance_state = self.executor.get_instance_state()
+        state = instance_state['state']
+        if state == 'running':
+            if self.executor.ping(instance_state['public_ip']) is not None:
+                return None, True
+            # EC2は起動済みだがMinecraftが準備中（別経路で起動された場合など）
+            record = new_record(self.instance_id, now, phase=EC2_RUNNING)
+            record['public_ip'] = instance_state['public_ip']
+        elif state == 'pending':
+            # 別経路で起動中。start_instances は呼ばずに running を待つ
+            record = new_record(self.instance_id, now)
+            self.executor.announce(f'🟡 {PHASE_MESSAGES[REQUESTED]}', key=PROGRESS_KEY)
+        elif state == 'stopping':
+            # 停止中に start_instances を呼ぶと IncorrectInstanceState になるので停止を待つ
+            record = new_record(self.instance_id, now, phase=STOPPING)
+            self.executor.announce(f'🟡 {PHASE_MESSAGES[STOPPING]}', key=PROGRESS_KEY)
+        elif state != 'stopped':
+            raise StartRejected(f'インスタンスが {state} 状態のため起動できません')
+        else:
+            self.executor.start_instance()
+            record = new_record(self.instance_id, now)
+            self.executor.announce(f'🟡 {PHASE_MESSAGES[REQUESTED]}', key=PROGRESS_KEY)
+
+        advance(record, self.executor, now)
+        self.save(record)
+        return record, False
+
+    def tick(self, now=None):
+        """定期実行用。進行中のレコードがあれば1回分進めて保存する"""
+        record = self.load()
+        if record is None or record['phase'] in TERMINAL_PHASES:
+            return record
+        before = (record['phase'], record['command_id'])
+        advance(record, self.executor, now)
+        if (record['phase'], record['command_id']) != before or record['phase'] in TERMINAL_PHASES:
+            self.save(record)
+        return record
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+import common
+
+# Lambda間で共有する小さなJSON状態の保存先
+# - S3Store: S3オブジェクト1つにJSONを保存（本番用）
+# - MemoryStore: 同じインターフェースのローカル代替（テスト・ローカル実行用）
+
+S3_BUCKET = os.environ.get('S3_BUCKET', 'minecraft-server-mods-temp')
+
+
+class MemoryStore:
+    """共有ストアのローカル代替"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            return json.loads(json.dumps(value)) if value is not None else None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = json.loads(json.dumps(value))
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def list(self, prefix):
+        with self._lock:
+            return sorted(key for key in self._data if key.startswith(prefix))
+
+
+class S3Store:
+    """S3オブジェクト1つにエントリをJSONで保存する共有ストア"""
+
+    def __init__(self, bucket=S3_BUCKET, prefix='state/'):
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f'{self.prefix}{key}.json'
+
+    def get(self, key):
+        s3 = common.get_client('s3')
+        try:
+            response = s3.get_object(Bucket=self.bucket, Key=self._key(key))
+        except s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read().decode('utf-8'))
+
+    def put(self, key, value):
+        common.get_client('s3').put_object(
+            Bucket=self.bucket,
+            Key=self._key(key),
+            Body=json.dumps(value),
+            ContentType='application/json'
+        )
+
+    def delete(self, key):
+        common.get_client('s3').delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix):
+        """prefix で始まるキー（get / put に渡す形）を名前順に返す"""
+        keys = []
+        paginator = common.get_client('s3').get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f'{self.prefix}{prefix}'):
+            for item in page.get('Contents', []):
+                if item['Key'].endswith('.json'):
+                    keys.append(item['Key'][len(self.prefix):-len('.json')])
+        return sorted(keys)
+
+
+def create_store(store_type, prefix='state/'):
+    """環境変数などで指定されたストア種別からストアを生成（'s3' / 'memory' / それ以外はNone）"""
+    if store_type == 's3':
+        return S3Store(prefix=prefix)
+    if store_type == 'memory':
+        return MemoryStore()
+    return None
@@ -1,93 +1,119 @@
-import boto3
 import os
-import json
-import time
+import minecraft_ping
+import rcon
+import common
+import instance_cache
+import ssm_runner
+import metrics
 
+PING_TIMEOUT = float(os.environ.get('PING_TIMEOUT', '2.0'))
+WORLD_INFO_TOOL = '/minecraft/tools/world_info.py'
+HEALTH_TOOL = '/minecraft/tools/server_health.py'
+# 自動停止の監視（tools/auto_shutdown.py）が書き出す接続中のプレイヤー
+AUTOSHUTDOWN_STATUS_FILE = '/minecraft/status/autoshutdown.json'
+# SSMでの取得を待つ上限（秒）
+SSM_TIMEOUT = 8
+# SSMの標準出力は約24KBで切り捨てられるため、health の区間はそれより小さく収める
+MAX_OUTPUT = 20000
+# health の1分ごとの値を返す範囲（分）。1分あたり最大で約220文字なので、上限でも MAX_OUTPUT に収まる
+DEFAULT_HEALTH_MINUTES = 60
+MAX_HEALTH_MINUTES = 60
+
+
+def parse_minutes(value):
+    """?minutes= を解釈する（不正な値は None、上限を超える値は上限にする）"""
+    if value is None:
+        return DEFAULT_HEALTH_MINUTES
+    try:
+        minutes = int(value)
+    except (TypeError, ValueError):
+        return None
+    if minutes < 1:
+        return None
+    return min(minutes, MAX_HEALTH_MINUTES)
+
+@metrics.instrument('status_server')
 def lambda_handler(event, context):
     instance_id = os.environ['INSTANCE_ID']
-    region = os.environ.get('AWS_REGION', 'ap-northeast-1')
+    params = event.get('queryStringParameters') or {}
+    minutes = parse_minutes(params.get('minutes'))
+    if minutes is None:
+        return common.json_response(400, {'error': 'minutes は1以上の整数を指定してください'})
     
-    ec2 = boto3.client('ec2', region_name=region)
-    ssm = boto3.client('ssm', region_name=region)
+    ssm = common.get_client('ssm')
     
     try:
         # インスタンスの状態を確認
-        response = ec2.describe_instances(InstanceIds=[instance_id])
-        instance = response['Reservations'][0]['Instances'][0]
+        instance_state = instance_cache.get_instance_state(instance_id)
         
-        state = instance['State']['Name']
-        public_ip = instance.get('PublicIpAddress', 'N/A')
+        state = instance_state['state']
+        public_ip = instance_state['public_ip']
         
         # プレイヤー数を取得（サーバーが起動中の場合のみ）
         player_count = None
         max_players = 20
+        player_names = []
+        version = None
+        motd = None
         
         if state == 'running':
-            try:
-                # SSM経由でMinecraftサーバーの/listコマンドを実行してプレイヤー数を取得
-                ssm_response = ssm.send_command(
-                    InstanceIds=[instance_id],
-                    DocumentName='AWS-RunShellScript',
-                    Parameters={
-                        'commands': [
-                            # RCONまたはログから現在のプレイヤー数を取得
-                            '''
-                            LOG_FILE="/home/ec2-user/minecraft/logs/latest.log"
-                            if [ -f "$LOG_FILE" ]; then
-                                # 最新のログから現在オンラインのプレイヤーを特定
-                                # 各プレイヤーの最後のイベント（join/leave）を確認
-                                tail -n 500 "$LOG_FILE" | grep -E "joined the game|left the game" | awk '{
-                                    # Extract player name (before "joined" or "left")
-                                    for(i=1; i<=NF; i++) {
-                                        if($i == "joined" || $i == "left") {
-                                            player = $(i-1)
-                                            action = $i
-                                            players[player] = action
-                                        }
-                                    }
-                                }
-                                END {
-                                    count = 0
-                                    for(p in players) {
-                                        if(players[p] == "joined") count++
-                                    }
-                                    print count
-                                }'
-                            else
-                                echo 0
-                            fi
-                            '''
-                        ]
-                    },
-                    TimeoutSeconds=30
-                )
-                
-                command_id = ssm_response['Command']['CommandId']
-                
-                # コマンド実行完了を待つ（最大5秒）
-                for _ in range(5):
-                    time.sleep(1)
-                    output_response = ssm.get_command_invocation(
-                        CommandId=command_id,
-                        InstanceId=instance_id
-                    )
-                    
-                    if output_response['Status'] in ['Success', 'Failed']:
-                        if output_response['Status'] == 'Success':
-                            output = output_response['StandardOutputContent'].strip()
-                            if output and output.isdigit():
-                                player_count = int(output)
-                        break
-            except Exception as e:
-                print(f"プレイヤー数取得エラー: {e}")
-                # エラーが発生してもステータスは返す
+            # まずSLPで直接問い合わせ（1往復・厳密なタイムアウト）
+            if public_ip != 'N/A':
+                try:
+                    ping_result = minecraft_ping.ping(public_ip, timeout=PING_TIMEOUT)
+                    player_count = ping_result['online']
+                    max_players = ping_result['max'] or max_players
+                    player_names = ping_result['players']
+                    version = ping_result['version']
+                    motd = ping_result['motd']
+                except minecraft_ping.PingError as e:
+                    print(f"SLP失敗、SSMにフォールバックします: {e}")
+            
+            # SLPが失敗した場合はRCONの list を試す
+            if player_count is None and public_ip != 'N/A' and rcon.ENABLED:
+                try:
+                    list_result = rcon.connect_for_instance(ssm, instance_id, public_ip).list_players()
+                    player_count = list_result['online']
+                    max_players = list_result['max'] or max_players
+                    player_names = list_result['players']
+                except Exception as e:
+                    print(f"RCON失敗、SSMにフォールバックします: {e}")
+            
+        # SLPもRCONも使えない場合のプレイヤー数と、?detail=world / ?detail=health の情報はSSMでまとめて1回で取得する
+        #   world: ワールド（時刻・スポーン地点）とプレイヤー（位置・体力）の情報
+        #   health: ログから集計したラグ（tick遅延・GC停止・起動時間）と設定ごとの比較
+        world = None
+        health = None
+        if state == 'running':
+            sections = {}
+            if player_count is None:
+                sections['players'] = f'cat {AUTOSHUTDOWN_STATUS_FILE}'
+            if params.get('detail') == 'world':
+                sections['world'] = f'python3 {WORLD_INFO_TOOL}'
+            if params.get('detail') == 'health':
+                sections['health'] = f'python3 {HEALTH_TOOL} summary --minutes {minutes} --max-output {MAX_OUTPUT}'
+            if sections:
+                try:
+                    results = query_via_ssm(instance_id, sections, ssm_runner.deadline_from(context))
+                except Exception as e:
+                    # エラーが発生してもステータスは返す
+                    print(f"SSM取得エラー: {e}")
+                    results = {}
+                if 'players' in results:
+                    player_count = results['players'].get('player_count')
+                    player_names = results['players'].get('players', [])
+                world = results.get('world')
+                health = results.get('health')
         
         # 状態に応じたメッセージを作成
         if state == 'running':
             status_emoji = '🟢'
             status_text = '起動中'
             if player_count is not None:
-                message = f'{status_emoji} **サーバー状態**: {status_text}\n\n**サーバーアドレス**: `{public_ip}:25565`\n**プレイヤー**: {player_count}/{max_players}\n\nサーバーに接続できます。'
+                players_line = f'**プレイヤー**: {player_count}/{max_players}'
+                if player_names:
+                    players_line += f' ({", ".join(player_names)})'
+                message = f'{status_emoji} **サーバー状態**: {status_text}\n\n**サーバーアドレス**: `{public_ip}:25565`\n{players_line}\n\nサーバーに接続できます。'
             else:
                 message = f'{status_emoji} **サーバー状態**: {status_text}\n\n**サーバーアドレス**: `{public_ip}:25565`\n\nサーバーに接続できます。'
         elif state == 'stopped':
@@ -107,19 +133,38 @@ def lambda_handler(event, context):
             status_text = state
             message = f'{status_emoji} **サーバー状態**: {status_text}'
         
-        return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': message,
-                'state': state,
-                'public_ip': public_ip,
-                'player_count': player_count,
-                'max_players': max_players
-            })
-        }
+        return common.json_response(200, {
+            'message': message,
+            'state': state,
+            'public_ip': public_ip,
+            'player_count': player_count,
+            'max_players': max_players,
+            'players': player_names,
+            'version': version,
+            'motd': motd,
+            'world': world,
+            'health': health
+        })
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'body': json.dumps({'error': str(e)})
-        }
+        return common.json_response(500, {'error': str(e)})
+
+
+def query_via_ssm(instance_id, sections, deadline=None):
+    """
+    必要な情報をまとめて1回の send_command で取得する（ssm_runner.run_sections）
+    sections: {名前: コマンド}。戻り値は {名前: 出力のJSON}（失敗した区間は含めない）
+    """
+    result, outputs = ssm_runner.SsmRunner(instance_id).run_sections(sections, timeout=SSM_TIMEOUT, deadline=deadline)
+    if not outputs:
+        print(f"SSM実行エラー: {result.status} {result.stderr}")
+    parsed = {}
+    for name, output in outputs.items():
+        if not output.ok:
+            print(f"{name} の取得に失敗しました: {output.stdout[-500:]}")
+            continue
+        try:
+            parsed[name] = output.json()
+        except ValueError:
+            print(f"{name} の出力を解釈できません: {output.stdout[:200]}")
+    return parsed
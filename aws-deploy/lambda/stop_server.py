@@ -1,33 +1,43 @@
-import boto3
 import os
-import json
-import urllib.request
+import rcon
+import common
+import instance_cache
+import metrics
 
+@metrics.instrument('stop_server')
 def lambda_handler(event, context):
     instance_id = os.environ['INSTANCE_ID']
     webhook_url = os.environ.get('WEBHOOK_URL', '')
     
-    ec2 = boto3.client('ec2')
-    ssm = boto3.client('ssm')
+    ec2 = common.get_client('ec2')
+    ssm = common.get_client('ssm')
     
     try:
         # インスタンスの状態を確認
-        response = ec2.describe_instances(InstanceIds=[instance_id])
-        state = response['Reservations'][0]['Instances'][0]['State']['Name']
+        instance_state = instance_cache.get_instance_state(instance_id)
+        state = instance_state['state']
+        public_ip = instance_state['public_ip']
         
         if state == 'stopped':
             message = 'サーバーは既に停止しています'
-            return {
-                'statusCode': 200,
-                'body': json.dumps({'message': message})
-            }
+            return common.json_response(200, {'message': message})
         
         if state != 'running':
             message = f'サーバーは現在 {state} 状態です'
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'message': message})
-            }
+            return common.json_response(400, {'message': message})
+        
+        # RCONで保存・停止できればSSMを経由せずにEC2を停止
+        if public_ip != 'N/A':
+            try:
+                rcon.save_and_stop(ssm, instance_id, public_ip)
+                ec2.stop_instances(InstanceIds=[instance_id])
+                instance_cache.invalidate(instance_id)
+                return common.json_response(200, {
+                    'message': 'Server saved and stop command sent successfully',
+                    'state': 'stopping'
+                })
+            except Exception as rcon_error:
+                print(f'RCON stop failed, falling back to SSM: {rcon_error}')
         
         # SSM経由で安全にMinecraftサーバーを停止（非同期）
         try:
@@ -43,31 +53,25 @@ def lambda_handler(event, context):
                 }
             )
             
+            instance_cache.invalidate(instance_id)
+            
             # 即座に応答を返す（停止処理は裏で継続）
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'Server stop command sent successfully',
-                    'state': 'stopping'
-                })
-            }
+            return common.json_response(200, {
+                'message': 'Server stop command sent successfully',
+                'state': 'stopping'
+            })
             
         except Exception as ssm_error:
             # SSMが使えない場合は直接停止
             print(f'SSM failed, using direct stop: {ssm_error}')
             ec2.stop_instances(InstanceIds=[instance_id])
+            instance_cache.invalidate(instance_id)
             
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'Server stop command sent successfully',
-                    'state': 'stopping'
-                })
-            }
+            return common.json_response(200, {
+                'message': 'Server stop command sent successfully',
+                'state': 'stopping'
+            })
         
     except Exception as e:
         error_message = f'❌ エラーが発生しました: {str(e)}'
-        return {
-            'statusCode': 500,
-            'body': json.dumps({'error': str(e)})
-        }
+        return common.json_response(500, {'error': str(e)})
@@ -1,30 +1,92 @@
 import json
-import boto3
 import os
-import base64
+import shlex
+import rcon
+import mod_upload
+import pending_config
+import server_properties
+import common
+import instance_cache
+import metrics
 
-ssm = boto3.client('ssm', region_name='ap-northeast-1')
-s3 = boto3.client('s3', region_name='ap-northeast-1')
-ec2 = boto3.client('ec2', region_name='ap-northeast-1')
 INSTANCE_ID = os.environ.get('INSTANCE_ID', 'i-0e71ec8304bf61354')
 S3_BUCKET = os.environ.get('S3_BUCKET', 'minecraft-server-mods-temp')
+# server.properties の一括更新ツール（aws-deploy/tools/server_properties.py）
+PROPERTIES_TOOL = '/minecraft/tools/server_properties.py'
 
-def is_instance_running():
-    """EC2インスタンスが起動中かチェック"""
+def get_instance_state():
+    """EC2インスタンスの状態（取得できなければ None）"""
     try:
-        response = ec2.describe_instances(InstanceIds=[INSTANCE_ID])
-        state = response['Reservations'][0]['Instances'][0]['State']['Name']
-        return state == 'running'
+        return instance_cache.get_instance_state(INSTANCE_ID)
     except Exception as e:
         print(f"Error checking instance state: {str(e)}")
-        return False
+        return None
+
+def is_instance_running():
+    """EC2インスタンスが起動中かチェック"""
+    instance_state = get_instance_state()
+    return instance_state is not None and instance_state['state'] == 'running'
+
+def pending_changes():
+    """停止中に受け付けた server.properties の変更ログ（tools/pending_config.py）"""
+    return pending_config.ChangeLog(pending_config.BotoObjectStore(common.get_client('s3'), S3_BUCKET), INSTANCE_ID)
+
+def requested_properties(event, params):
+    """リクエストから {名前: 値} を取り出す（server.properties の更新でなければ None）"""
+    if 'server_property' in params and 'value' in params:
+        return {params['server_property']: params['value']}
+    properties = params.get('properties')
+    if properties is None and event.get('body'):
+        properties = mod_upload.parse_body(event).get('properties')
+    if properties is None:
+        return None
+    if isinstance(properties, str):
+        try:
+            properties = json.loads(properties)
+        except ValueError:
+            raise server_properties.PropertyError('properties はJSONのオブジェクトで指定してください')
+    return properties
+
+def apply_properties_running(updates, public_ip):
+    """
+    起動中のサーバーに反映する。すべてRCONで反映できるプロパティならコマンドで変更して再起動しない。
+    それ以外はまとめて書き込み、変更があった場合だけ1回再起動する
+    """
+    ssm = common.get_client('ssm')
+    runtime = False
+    commands = server_properties.runtime_commands(updates)
+    if commands is not None and public_ip != 'N/A':
+        try:
+            client = rcon.connect_for_instance(ssm, INSTANCE_ID, public_ip)
+            for command in commands:
+                client.command(command)
+            runtime = True
+        except rcon.RconError as e:
+            print(f'RCON apply failed, falling back to restart: {e}')
+    
+    # server.properties にも書いておく（次回起動時も同じ値になるように）
+    args = ['python3', PROPERTIES_TOOL, 'apply', '--updates', json.dumps(updates)]
+    if not runtime:
+        args.append('--restart')
+    response = ssm.send_command(
+        InstanceIds=[INSTANCE_ID],
+        DocumentName='AWS-RunShellScript',
+        Parameters={'commands': [' '.join(shlex.quote(arg) for arg in args)]}
+    )
+    return {
+        'applied': 'runtime' if runtime else 'immediate',
+        'command_id': response['Command']['CommandId']
+    }
 
+@metrics.instrument('update_config')
 def lambda_handler(event, context):
+    ssm = common.get_client('ssm')
+    
     try:
         # クエリパラメータから設定を取得
-        params = event.get('queryStringParameters', {})
+        params = event.get('queryStringParameters') or {}
         
-        if not params:
+        if not params and not event.get('body'):
             # 現在の設定を取得
             try:
                 idle_time_param = ssm.get_parameter(Name=f'/minecraft/{INSTANCE_ID}/idle_time')
@@ -32,175 +94,81 @@ def lambda_handler(event, context):
             except ssm.exceptions.ParameterNotFound:
                 idle_time = 900  # デフォルト15分
             
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'success': True,
-                    'config': {
-                        'idle_time': idle_time,
-                        'idle_time_minutes': idle_time // 60
-                    }
-                })
-            }
+            return common.json_response(200, {
+                'success': True,
+                'config': {
+                    'idle_time': idle_time,
+                    'idle_time_minutes': idle_time // 60
+                }
+            })
         
-        # MODファイルのアップロード
+        # MODファイルのアップロードとマニフェスト操作（step=init / complete / abort / manifest / rollback / remove）
         if 'action' in params and params['action'] == 'upload_mods':
-            # POSTリクエストのボディからMODファイル情報を取得
-            if event.get('body'):
-                body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-                mod_files = body.get('mod_files', [])
-                
-                if not mod_files:
-                    return {
-                        'statusCode': 400,
-                        'body': json.dumps({
-                            'success': False,
-                            'message': 'mod_files パラメータが必要です'
-                        })
-                    }
-                
-                # S3にMODファイルをアップロード
-                uploaded_files = []
-                for mod_file in mod_files:
-                    file_name = mod_file.get('name')
-                    file_content_base64 = mod_file.get('content')
-                    
-                    if not file_name or not file_content_base64:
-                        continue
-                    
-                    # Base64デコード
-                    file_content = base64.b64decode(file_content_base64)
-                    
-                    # S3にアップロード
-                    s3.put_object(
-                        Bucket=S3_BUCKET,
-                        Key=f'mods/{file_name}',
-                        Body=file_content
-                    )
-                    
-                    uploaded_files.append(file_name)
-                
-                if not uploaded_files:
-                    return {
-                        'statusCode': 400,
-                        'body': json.dumps({
-                            'success': False,
-                            'message': 'アップロードするファイルがありません'
-                        })
-                    }
-                
-                # EC2でMODファイルをダウンロード
-                download_command = f"""
-cd /home/ubuntu/minecraft
-sudo systemctl stop minecraft
-mkdir -p mods_backup
-if [ -d mods ] && [ "$(ls -A mods 2>/dev/null)" ]; then
-    mv mods/*.jar mods_backup/ 2>/dev/null || true
-fi
-aws s3 sync s3://{S3_BUCKET}/mods/ mods/ --region ap-northeast-1
-sudo chown -R ubuntu:ubuntu mods
-sudo systemctl start minecraft
-echo "MOD files updated: {', '.join(uploaded_files)}"
-"""
-                
-                response = ssm.send_command(
-                    InstanceIds=[INSTANCE_ID],
-                    DocumentName='AWS-RunShellScript',
-                    Parameters={'commands': [download_command]}
-                )
-                
-                return {
-                    'statusCode': 200,
-                    'body': json.dumps({
-                        'success': True,
-                        'message': f'{len(uploaded_files)}個のMODファイルをアップロードしました。サーバーを再起動しています...',
-                        'uploaded_files': uploaded_files,
-                        'command_id': response['Command']['CommandId']
-                    })
-                }
+            body = mod_upload.parse_body(event)
+            return mod_upload.handle_request(common.get_client('s3'), ssm, INSTANCE_ID, body.get('step') or 'init', body)
         
-        # server.propertiesの設定を更新
-        if 'server_property' in params and 'value' in params:
-            property_name = params['server_property']
-            property_value = params['value']
-            
-            # 許可されたプロパティのみ更新可能
-            allowed_properties = [
-                'enable-command-block',
-                'difficulty',
-                'gamemode',
-                'max-players',
-                'pvp',
-                'view-distance',
-                'simulation-distance'
-            ]
-            
-            if property_name not in allowed_properties:
-                return {
-                    'statusCode': 400,
-                    'body': json.dumps({
-                        'success': False,
-                        'message': f'プロパティ {property_name} は更新できません'
-                    })
-                }
+        # RCONパスワードを発行（次回のMinecraft起動時に server.properties へ反映される）
+        if 'action' in params and params['action'] == 'enable_rcon':
+            rcon.ensure_password(ssm, INSTANCE_ID)
             
-            # インスタンスの状態をチェック
-            instance_running = is_instance_running()
-            
-            if instance_running:
-                # 起動中の場合: SSM Run Commandで直接更新
-                command = f"""
-                cd /home/ubuntu/minecraft
-                sed -i 's/^{property_name}=.*/{property_name}={property_value}/' server.properties
-                sudo systemctl restart minecraft
-                """
-                
+            if is_instance_running():
+                # ExecStartPre の minecraft-rcon-setup.sh で反映させるため再起動
                 response = ssm.send_command(
                     InstanceIds=[INSTANCE_ID],
                     DocumentName='AWS-RunShellScript',
-                    Parameters={'commands': [command]}
+                    Parameters={'commands': ['sudo systemctl restart minecraft']}
                 )
-                
-                return {
-                    'statusCode': 200,
-                    'body': json.dumps({
-                        'success': True,
-                        'message': f'{property_name}を{property_value}に設定しました。サーバーを再起動しています...',
-                        'command_id': response['Command']['CommandId'],
-                        'applied': 'immediate'
-                    })
-                }
+                return common.json_response(200, {
+                    'success': True,
+                    'message': 'RCONを有効化しました。サーバーを再起動しています...',
+                    'command_id': response['Command']['CommandId'],
+                    'applied': 'immediate'
+                })
+            
+            return common.json_response(200, {
+                'success': True,
+                'message': 'RCONを有効化しました。次回サーバー起動時に反映されます。',
+                'applied': 'next_startup'
+            })
+        
+        # server.propertiesの設定を更新（properties={"名前": "値", ...} でまとめて、または server_property と value で1件）
+        try:
+            updates = requested_properties(event, params)
+            if updates is not None:
+                updates = server_properties.validate(updates)
+        except server_properties.PropertyError as e:
+            return common.json_response(400, {
+                'success': False,
+                'message': str(e)
+            })
+        
+        if updates is not None:
+            summary = '、'.join(f'{name}={value}' for name, value in updates.items())
+            instance_state = get_instance_state()
+            
+            if instance_state is not None and instance_state['state'] == 'running':
+                applied = apply_properties_running(updates, instance_state['public_ip'])
+                if applied['applied'] == 'runtime':
+                    message = f'{summary} を設定しました（再起動せずに反映しました）'
+                else:
+                    message = f'{summary} を設定しました。サーバーを再起動しています...'
+                return common.json_response(200, {
+                    'success': True,
+                    'message': message,
+                    'properties': updates,
+                    **applied
+                })
             else:
-                # 停止中の場合: S3に設定を保存し、次回起動時に反映
-                config_key = f'config/{INSTANCE_ID}/server.properties.updates'
+                # 停止中の場合: 変更ログに追記し、次回起動時にまとめて反映（同時に変更しても消えない）
+                version = pending_changes().append(updates, author=params.get('user'))
                 
-                # 既存の更新設定を取得
-                try:
-                    existing_config = s3.get_object(Bucket=S3_BUCKET, Key=config_key)
-                    updates = json.loads(existing_config['Body'].read().decode('utf-8'))
-                except s3.exceptions.NoSuchKey:
-                    updates = {}
-                
-                # 新しい設定を追加
-                updates[property_name] = property_value
-                
-                # S3に保存
-                s3.put_object(
-                    Bucket=S3_BUCKET,
-                    Key=config_key,
-                    Body=json.dumps(updates),
-                    ContentType='application/json'
-                )
-                
-                return {
-                    'statusCode': 200,
-                    'body': json.dumps({
-                        'success': True,
-                        'message': f'{property_name}を{property_value}に設定しました。次回サーバー起動時に反映されます。',
-                        'applied': 'next_startup',
-                        'pending_updates': updates
-                    })
-                }
+                return common.json_response(200, {
+                    'success': True,
+                    'message': f'{summary} を設定しました。次回サーバー起動時に反映されます。',
+                    'applied': 'next_startup',
+                    'properties': updates,
+                    'pending_version': version
+                })
         
         # 自動停止時間の設定を更新
         if 'idle_time' in params:
@@ -208,13 +176,10 @@ echo "MOD files updated: {', '.join(uploaded_files)}"
             
             # 範囲チェック（1分〜60分）
             if idle_time < 60 or idle_time > 3600:
-                return {
-                    'statusCode': 400,
-                    'body': json.dumps({
-                        'success': False,
-                        'message': 'idle_timeは60〜3600秒（1〜60分）の範囲で指定してください'
-                    })
-                }
+                return common.json_response(400, {
+                    'success': False,
+                    'message': 'idle_timeは60〜3600秒（1〜60分）の範囲で指定してください'
+                })
             
             # SSM Parameter Storeに保存
             ssm.put_parameter(
@@ -225,32 +190,23 @@ echo "MOD files updated: {', '.join(uploaded_files)}"
                 Description='Minecraft server auto-shutdown idle time (seconds)'
             )
             
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'success': True,
-                    'message': f'自動停止時間を{idle_time // 60}分に設定しました',
-                    'config': {
-                        'idle_time': idle_time,
-                        'idle_time_minutes': idle_time // 60
-                    }
-                })
-            }
-        
-        return {
-            'statusCode': 400,
-            'body': json.dumps({
-                'success': False,
-                'message': 'パラメータが不正です'
+            return common.json_response(200, {
+                'success': True,
+                'message': f'自動停止時間を{idle_time // 60}分に設定しました',
+                'config': {
+                    'idle_time': idle_time,
+                    'idle_time_minutes': idle_time // 60
+                }
             })
-        }
+        
+        return common.json_response(400, {
+            'success': False,
+            'message': 'パラメータが不正です'
+        })
         
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'success': False,
-                'message': f'エラーが発生しました: {str(e)}'
-            })
-        }
+        return common.json_response(500, {
+            'success': False,
+            'message': f'エラーが発生しました: {str(e)}'
+        })
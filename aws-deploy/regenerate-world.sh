@@ -14,10 +14,9 @@ sleep 5
 
 # Backup old world to S3
 echo "Backing up old world to S3..."
-BACKUP_DATE=$(date +%Y%m%d_%H%M%S)
-tar -czf world_backup_${BACKUP_DATE}.tar.gz world/
-aws s3 cp world_backup_${BACKUP_DATE}.tar.gz s3://minecraft-server-mods-temp/backups/ --region ap-northeast-1
-echo "Backup saved to s3://minecraft-server-mods-temp/backups/world_backup_${BACKUP_DATE}.tar.gz"
+# 前回のスナップショットとの差分（変更されたチャンク）だけを送る
+python3 /minecraft/tools/world_backup.py --store s3://minecraft-server-mods-temp/world-backups backup --world "$(pwd)/world"
+echo "Backup saved to s3://minecraft-server-mods-temp/world-backups/"
 
 # Remove old world
 echo "Removing old world data..."
@@ -0,0 +1,50 @@
+#!/bin/bash
+
+# RCON設定スクリプト
+# minecraft.service の ExecStartPre から実行し、
+# SSM Parameter Store の /minecraft/<instance-id>/rcon_password を server.properties に反映する
+# パラメータが未登録の場合は何もしない（RCON無効のまま起動）
+
+SERVER_DIR="/minecraft/server"
+PROPERTIES="$SERVER_DIR/server.properties"
+RCON_PORT=25575
+
+if [ ! -f "$PROPERTIES" ]; then
+    exit 0
+fi
+
+INSTANCE_ID=$(ec2-metadata --instance-id | cut -d " " -f 2)
+REGION=$(ec2-metadata --availability-zone | cut -d " " -f 2 | sed 's/[a-z]$//')
+
+PASSWORD=$(aws ssm get-parameter \
+    --name "/minecraft/$INSTANCE_ID/rcon_password" \
+    --with-decryption \
+    --query 'Parameter.Value' \
+    --output text \
+    --region "$REGION" 2>/dev/null)
+
+if [ -z "$PASSWORD" ] || [ "$PASSWORD" = "None" ]; then
+    echo "RCONパスワードが未登録のため、RCONは無効のままです"
+    exit 0
+fi
+
+# 既存のキーを書き換え、無ければ追記する
+set_property() {
+    local key="$1"
+    local value="$2"
+    if grep -q "^${key}=" "$PROPERTIES"; then
+        # パスワードに / や & が含まれても壊れないよう区切り文字に | を使う
+        local escaped
+        escaped=$(printf '%s' "$value" | sed -e 's/[|&\\]/\\&/g')
+        sed -i "s|^${key}=.*|${key}=${escaped}|" "$PROPERTIES"
+    else
+        echo "${key}=${value}" >> "$PROPERTIES"
+    fi
+}
+
+set_property "enable-rcon" "true"
+set_property "rcon.port" "$RCON_PORT"
+set_property "rcon.password" "$PASSWORD"
+set_property "broadcast-rcon-to-ops" "false"
+
+echo "RCONを有効化しました（ポート: $RCON_PORT）"
@@ -86,6 +86,14 @@ resource "aws_api_gateway_method" "config_get" {
   authorization = "NONE"
 }
 
+# POST /config メソッド（MODアップロードの step=init / complete / abort）
+resource "aws_api_gateway_method" "config_post" {
+  rest_api_id   = aws_api_gateway_rest_api.minecraft.id
+  resource_id   = aws_api_gateway_resource.config.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
 # GET /notify メソッド
 resource "aws_api_gateway_method" "notify_get" {
   rest_api_id   = aws_api_gateway_rest_api.minecraft.id
@@ -101,7 +109,7 @@ resource "aws_api_gateway_integration" "start_lambda" {
   http_method             = aws_api_gateway_method.start_get.http_method
   integration_http_method = "POST"
   type                    = "AWS_PROXY"
-  uri                     = aws_lambda_function.start_minecraft.invoke_arn
+  uri                     = aws_lambda_function.router_minecraft.invoke_arn
 }
 
 # Lambda統合 - stop
@@ -111,7 +119,7 @@ resource "aws_api_gateway_integration" "stop_lambda" {
   http_method             = aws_api_gateway_method.stop_get.http_method
   integration_http_method = "POST"
   type                    = "AWS_PROXY"
-  uri                     = aws_lambda_function.stop_minecraft.invoke_arn
+  uri                     = aws_lambda_function.router_minecraft.invoke_arn
 }
 
 # Lambda統合 - status
@@ -121,7 +129,7 @@ resource "aws_api_gateway_integration" "status_lambda" {
   http_method             = aws_api_gateway_method.status_get.http_method
   integration_http_method = "POST"
   type                    = "AWS_PROXY"
-  uri                     = aws_lambda_function.status_minecraft.invoke_arn
+  uri                     = aws_lambda_function.router_minecraft.invoke_arn
 }
 
 # Lambda統合 - logs
@@ -131,7 +139,7 @@ resource "aws_api_gateway_integration" "logs_lambda" {
   http_method             = aws_api_gateway_method.logs_get.http_method
   integration_http_method = "POST"
   type                    = "AWS_PROXY"
-  uri                     = aws_lambda_function.get_logs_minecraft.invoke_arn
+  uri                     = aws_lambda_function.router_minecraft.invoke_arn
 }
 
 # Lambda統合 - config
@@ -141,7 +149,17 @@ resource "aws_api_gateway_integration" "config_lambda" {
   http_method             = aws_api_gateway_method.config_get.http_method
   integration_http_method = "POST"
   type                    = "AWS_PROXY"
-  uri                     = aws_lambda_function.update_config_minecraft.invoke_arn
+  uri                     = aws_lambda_function.router_minecraft.invoke_arn
+}
+
+# Lambda統合 - config (POST)
+resource "aws_api_gateway_integration" "config_post_lambda" {
+  rest_api_id             = aws_api_gateway_rest_api.minecraft.id
+  resource_id             = aws_api_gateway_resource.config.id
+  http_method             = aws_api_gateway_method.config_post.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.router_minecraft.invoke_arn
 }
 
 # Lambda統合 - notify
@@ -151,54 +169,14 @@ resource "aws_api_gateway_integration" "notify_lambda" {
   http_method             = aws_api_gateway_method.notify_get.http_method
   integration_http_method = "POST"
   type                    = "AWS_PROXY"
-  uri                     = aws_lambda_function.notify_discord.invoke_arn
+  uri                     = aws_lambda_function.router_minecraft.invoke_arn
 }
 
-# Lambda権限 - API Gateway
-resource "aws_lambda_permission" "apigw_start" {
+# Lambda権限 - API Gateway（全パスをルーターが受ける）
+resource "aws_lambda_permission" "apigw_router" {
   statement_id  = "AllowAPIGatewayInvoke"
   action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.start_minecraft.function_name
-  principal     = "apigateway.amazonaws.com"
-  source_arn    = "${aws_api_gateway_rest_api.minecraft.execution_arn}/*/*"
-}
-
-resource "aws_lambda_permission" "apigw_stop" {
-  statement_id  = "AllowAPIGatewayInvoke"
-  action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.stop_minecraft.function_name
-  principal     = "apigateway.amazonaws.com"
-  source_arn    = "${aws_api_gateway_rest_api.minecraft.execution_arn}/*/*"
-}
-
-resource "aws_lambda_permission" "apigw_status" {
-  statement_id  = "AllowAPIGatewayInvokeStatus"
-  action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.status_minecraft.function_name
-  principal     = "apigateway.amazonaws.com"
-  source_arn    = "${aws_api_gateway_rest_api.minecraft.execution_arn}/*/*"
-}
-
-resource "aws_lambda_permission" "apigw_logs" {
-  statement_id  = "AllowAPIGatewayInvokeLogs"
-  action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.get_logs_minecraft.function_name
-  principal     = "apigateway.amazonaws.com"
-  source_arn    = "${aws_api_gateway_rest_api.minecraft.execution_arn}/*/*"
-}
-
-resource "aws_lambda_permission" "apigw_config" {
-  statement_id  = "AllowAPIGatewayInvokeConfig"
-  action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.update_config_minecraft.function_name
-  principal     = "apigateway.amazonaws.com"
-  source_arn    = "${aws_api_gateway_rest_api.minecraft.execution_arn}/*/*"
-}
-
-resource "aws_lambda_permission" "apigw_notify" {
-  statement_id  = "AllowAPIGatewayInvokeNotify"
-  action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.notify_discord.function_name
+  function_name = aws_lambda_function.router_minecraft.function_name
   principal     = "apigateway.amazonaws.com"
   source_arn    = "${aws_api_gateway_rest_api.minecraft.execution_arn}/*/*"
 }
@@ -224,6 +202,8 @@ resource "aws_api_gateway_deployment" "minecraft" {
       aws_api_gateway_resource.config.id,
       aws_api_gateway_method.config_get.id,
       aws_api_gateway_integration.config_lambda.id,
+      aws_api_gateway_method.config_post.id,
+      aws_api_gateway_integration.config_post_lambda.id,
       aws_api_gateway_resource.notify.id,
       aws_api_gateway_method.notify_get.id,
       aws_api_gateway_integration.notify_lambda.id,
@@ -240,6 +220,7 @@ resource "aws_api_gateway_deployment" "minecraft" {
     aws_api_gateway_integration.status_lambda,
     aws_api_gateway_integration.logs_lambda,
     aws_api_gateway_integration.config_lambda,
+    aws_api_gateway_integration.config_post_lambda,
     aws_api_gateway_integration.notify_lambda
   ]
 }
@@ -303,13 +284,5 @@ resource "aws_api_gateway_integration" "ready_lambda" {
 
   integration_http_method = "POST"
   type                    = "AWS_PROXY"
-  uri                     = aws_lambda_function.check_minecraft_ready.invoke_arn
-}
-
-resource "aws_lambda_permission" "apigw_ready" {
-  statement_id  = "AllowAPIGatewayInvokeReady"
-  action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.check_minecraft_ready.function_name
-  principal     = "apigateway.amazonaws.com"
-  source_arn    = "${aws_api_gateway_rest_api.minecraft.execution_arn}/*/*"
+  uri                     = aws_lambda_function.router_minecraft.invoke_arn
 }
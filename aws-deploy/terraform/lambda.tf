@@ -36,6 +36,7 @@ resource "aws_iam_role_policy" "lambda_minecraft_policy" {
         Effect = "Allow"
         Action = [
           "ssm:SendCommand",
+          "ssm:CancelCommand",
           "ssm:GetCommandInvocation",
           "ssm:ListCommandInvocations",
           "ssm:GetParameter",
@@ -43,6 +44,23 @@ resource "aws_iam_role_policy" "lambda_minecraft_policy" {
         ]
         Resource = "*"
       },
+      {
+        # MODアップロード・保留中の設定・状態キャッシュ用
+        # （マルチパートアップロードのパート確認・中止を含む）
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject",
+          "s3:ListBucket",
+          "s3:ListMultipartUploadParts",
+          "s3:AbortMultipartUpload"
+        ]
+        Resource = [
+          "arn:aws:s3:::minecraft-server-mods-temp",
+          "arn:aws:s3:::minecraft-server-mods-temp/*"
+        ]
+      },
       {
         Effect = "Allow"
         Action = [
@@ -63,7 +81,7 @@ resource "aws_lambda_function" "start_minecraft" {
   role          = aws_iam_role.lambda_minecraft.arn
   handler       = "start_server.lambda_handler"
   runtime       = "python3.11"
-  timeout       = 600
+  timeout       = 30
   source_code_hash = filebase64sha256("${path.module}/../lambda/start_server.zip")
 
   environment {
@@ -88,8 +106,9 @@ resource "aws_lambda_function" "stop_minecraft" {
 
   environment {
     variables = {
-      INSTANCE_ID = aws_instance.minecraft.id
-      WEBHOOK_URL = var.discord_webhook_url
+      INSTANCE_ID  = aws_instance.minecraft.id
+      RCON_ENABLED = length(var.rcon_allowed_cidrs) > 0 ? "true" : "false"
+      WEBHOOK_URL  = var.discord_webhook_url
     }
   }
 
@@ -108,7 +127,31 @@ resource "aws_lambda_function" "status_minecraft" {
 
   environment {
     variables = {
-      INSTANCE_ID = aws_instance.minecraft.id
+      INSTANCE_ID  = aws_instance.minecraft.id
+      RCON_ENABLED = length(var.rcon_allowed_cidrs) > 0 ? "true" : "false"
+    }
+  }
+
+  depends_on = [aws_iam_role_policy.lambda_minecraft_policy]
+}
+
+# Lambda関数: API Gateway の全パス（/start /stop /status /logs /config /notify /ready）を受けるルーター
+# 各ハンドラは初回の呼び出し時に読み込む。すべてのパスと定期実行が同じ実行環境を温める
+resource "aws_lambda_function" "router_minecraft" {
+  filename      = "${path.module}/../lambda/router.zip"
+  function_name = "minecraft-api"
+  role          = aws_iam_role.lambda_minecraft.arn
+  handler       = "router.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = 360
+  source_code_hash = filebase64sha256("${path.module}/../lambda/router.zip")
+
+  environment {
+    variables = {
+      INSTANCE_ID     = aws_instance.minecraft.id
+      RCON_ENABLED    = length(var.rcon_allowed_cidrs) > 0 ? "true" : "false"
+      WEBHOOK_URL     = var.discord_webhook_url
+      DISCORD_BOT_URL = var.discord_bot_url
     }
   }
 
@@ -174,6 +217,29 @@ resource "aws_lambda_permission" "allow_function_url_status" {
   function_url_auth_type = "NONE"
 }
 
+# EventBridge: 起動処理の進行（1分ごとにルーター経由で start_server を呼び、進行中の起動があれば次のフェーズへ進める）
+# （ルーターの実行環境を温めておく役割も兼ねる）
+resource "aws_cloudwatch_event_rule" "advance_start" {
+  name                = "minecraft-advance-start"
+  description         = "Advance the Minecraft start state machine"
+  schedule_expression = "rate(1 minute)"
+}
+
+resource "aws_cloudwatch_event_target" "advance_start" {
+  rule      = aws_cloudwatch_event_rule.advance_start.name
+  target_id = "AdvanceMinecraftStart"
+  arn       = aws_lambda_function.router_minecraft.arn
+  input     = jsonencode({ route = "start", action = "advance" })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_advance_start" {
+  statement_id  = "AllowExecutionFromEventBridgeAdvance"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.router_minecraft.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.advance_start.arn
+}
+
 # EventBridge: 深夜3時に自動停止
 resource "aws_cloudwatch_event_rule" "stop_at_3am" {
   name                = "minecraft-stop-at-3am"
@@ -184,17 +250,64 @@ resource "aws_cloudwatch_event_rule" "stop_at_3am" {
 resource "aws_cloudwatch_event_target" "stop_at_3am" {
   rule      = aws_cloudwatch_event_rule.stop_at_3am.name
   target_id = "StopMinecraftInstance"
-  arn       = aws_lambda_function.stop_minecraft.arn
+  arn       = aws_lambda_function.router_minecraft.arn
+  input     = jsonencode({ route = "stop" })
 }
 
 resource "aws_lambda_permission" "allow_eventbridge_stop" {
   statement_id  = "AllowExecutionFromEventBridge"
   action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.stop_minecraft.function_name
+  function_name = aws_lambda_function.router_minecraft.function_name
   principal     = "events.amazonaws.com"
   source_arn    = aws_cloudwatch_event_rule.stop_at_3am.arn
 }
 
+# Lambda関数: 予測起動（過去の起動要求・接続から需要の多い時間帯を学習し、先に起動しておく）
+resource "aws_lambda_function" "prewarm_minecraft" {
+  filename      = "${path.module}/../lambda/prewarm.zip"
+  function_name = "minecraft-prewarm"
+  role          = aws_iam_role.lambda_minecraft.arn
+  handler       = "prewarm.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = 30
+  source_code_hash = filebase64sha256("${path.module}/../lambda/prewarm.zip")
+
+  environment {
+    variables = {
+      INSTANCE_ID            = aws_instance.minecraft.id
+      WEBHOOK_URL            = var.discord_webhook_url
+      PREWARM_ENABLED        = var.prewarm_enabled ? "true" : "false"
+      PREWARM_THRESHOLD      = tostring(var.prewarm_threshold)
+      PREWARM_MONTHLY_BUDGET = tostring(var.prewarm_monthly_budget)
+      PREWARM_TICK_INTERVAL  = "900"
+    }
+  }
+
+  depends_on = [aws_iam_role_policy.lambda_minecraft_policy]
+}
+
+# EventBridge: 予測起動の判定（15分ごと。PREWARM_TICK_INTERVAL と合わせる）
+resource "aws_cloudwatch_event_rule" "prewarm" {
+  name                = "minecraft-prewarm"
+  description         = "Start Minecraft server ahead of predicted demand"
+  schedule_expression = "rate(15 minutes)"
+}
+
+resource "aws_cloudwatch_event_target" "prewarm" {
+  rule      = aws_cloudwatch_event_rule.prewarm.name
+  target_id = "PrewarmMinecraft"
+  arn       = aws_lambda_function.prewarm_minecraft.arn
+  input     = jsonencode({ action = "tick" })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_prewarm" {
+  statement_id  = "AllowExecutionFromEventBridgePrewarm"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.prewarm_minecraft.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.prewarm.arn
+}
+
 # 出力
 output "lambda_start_url" {
   value       = aws_lambda_function_url.start_minecraft.function_url
@@ -247,7 +360,8 @@ resource "aws_lambda_function" "update_config_minecraft" {
 
   environment {
     variables = {
-      INSTANCE_ID = aws_instance.minecraft.id
+      INSTANCE_ID  = aws_instance.minecraft.id
+      RCON_ENABLED = length(var.rcon_allowed_cidrs) > 0 ? "true" : "false"
     }
   }
 
@@ -32,6 +32,20 @@ resource "aws_security_group" "minecraft" {
     cidr_blocks = ["0.0.0.0/0"]
   }
 
+  # RCON（Lambdaからの保存・停止・list用）。rcon_allowed_cidrs が空なら開けない
+  # Lambda は VPC 外で送信元IPが固定されないため、Lambda から届かせるには実質 0.0.0.0/0 が必要になる。
+  # RCON は平文・パスワードのみでサーバーコンソールを操作できるので、/0 を指定する場合は
+  # rcon_allow_public = true で明示的に許可する（未指定なら plan が失敗する）
+  dynamic "ingress" {
+    for_each = length(var.rcon_allowed_cidrs) > 0 ? [1] : []
+    content {
+      from_port   = 25575
+      to_port     = 25575
+      protocol    = "tcp"
+      cidr_blocks = var.rcon_allowed_cidrs
+    }
+  }
+
   egress {
     from_port   = 0
     to_port     = 0
@@ -39,6 +53,13 @@ resource "aws_security_group" "minecraft" {
     cidr_blocks = ["0.0.0.0/0"]
   }
 
+  lifecycle {
+    precondition {
+      condition     = var.rcon_allow_public || alltrue([for cidr in var.rcon_allowed_cidrs : !endswith(cidr, "/0")])
+      error_message = "rcon_allowed_cidrs に /0 が含まれています。RCON がインターネットに公開されるため、意図している場合は rcon_allow_public = true を指定してください。"
+    }
+  }
+
   tags = {
     Name = "minecraft-server-sg"
   }
@@ -76,6 +97,50 @@ resource "aws_iam_role_policy" "minecraft_instance_policy" {
         ]
         Resource = "*"
       },
+      {
+        # インスタンス上のツール（s3://minecraft-server-mods-temp/tools/）の同期用
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:ListBucket"
+        ]
+        Resource = [
+          "arn:aws:s3:::minecraft-server-mods-temp",
+          "arn:aws:s3:::minecraft-server-mods-temp/*"
+        ]
+      },
+      {
+        # ワールドのバックアップ（tools/world_backup.py）
+        # 失敗したパックのマルチパートアップロードを中止する（放置するとパートが課金され続ける）
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload"
+        ]
+        Resource = "arn:aws:s3:::minecraft-server-mods-temp/world-backups/*"
+      },
+      {
+        # 初回のMOD同期で既存の jar とベースのマニフェストを取り込む（tools/mod_sync.py）
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject"
+        ]
+        Resource = [
+          "arn:aws:s3:::minecraft-server-mods-temp/mods/objects/*",
+          "arn:aws:s3:::minecraft-server-mods-temp/mods/manifests/*",
+          "arn:aws:s3:::minecraft-server-mods-temp/mods/manifest.json"
+        ]
+      },
+      {
+        # 停止中に受け付けた設定変更の反映（tools/pending_config.py）
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:DeleteObject"
+        ]
+        Resource = "arn:aws:s3:::minecraft-server-mods-temp/config/*"
+      },
       {
         Effect = "Allow"
         Action = [
@@ -120,6 +185,7 @@ resource "aws_instance" "minecraft" {
   user_data = base64encode(templatefile("${path.module}/../user-data.sh", {
     minecraft_memory = var.minecraft_memory
     auto_shutdown_script = file("${path.module}/../auto-shutdown.sh")
+    rcon_setup_script = file("${path.module}/../setup-rcon.sh")
     discord_webhook_url = var.discord_webhook_url
     s3_bucket = "minecraft-server-mods-temp"
   }))
@@ -164,3 +230,11 @@ output "instance_id" {
 output "api_ready_url" {
   value = "${aws_api_gateway_stage.prod.invoke_url}/ready"
 }
+
+# 起動監視エージェント（tools/ready_watcher.py）が起動完了時に叩くURL
+# 定期実行を待たずに起動ステートマシンを進める
+resource "aws_ssm_parameter" "ready_callback_url" {
+  name  = "/minecraft/${aws_instance.minecraft.id}/ready_callback_url"
+  type  = "String"
+  value = "${aws_api_gateway_stage.prod.invoke_url}/start?action=advance"
+}
@@ -45,3 +45,39 @@ variable "discord_bot_url" {
   type        = string
   default     = ""
 }
+
+variable "rcon_allowed_cidrs" {
+  description = <<-EOT
+    CIDR blocks allowed to reach RCON (25575). Empty disables RCON access from Lambda.
+    The Lambda functions run outside a VPC and have no fixed egress IPs, so in practice reaching RCON from
+    Lambda requires 0.0.0.0/0. RCON is plaintext and protected only by its password, and it gives full
+    server console access; opening it to the internet must be acknowledged with rcon_allow_public = true.
+    Without RCON the functions fall back to SSM (slower but not exposed).
+  EOT
+  type        = list(string)
+  default     = []
+}
+
+variable "rcon_allow_public" {
+  description = "Acknowledge that rcon_allowed_cidrs contains an internet-wide range (/0) and RCON is exposed publicly"
+  type        = bool
+  default     = false
+}
+
+variable "prewarm_enabled" {
+  description = "Start the server ahead of predicted demand (learned from past start requests and joins). Opt-in: pre-warm starts are billed EC2 time"
+  type        = bool
+  default     = false
+}
+
+variable "prewarm_threshold" {
+  description = "Minimum probability of demand in an hour-of-week slot before pre-warming"
+  type        = number
+  default     = 0.6
+}
+
+variable "prewarm_monthly_budget" {
+  description = "Monthly budget (USD) for pre-warm starts that nobody used"
+  type        = number
+  default     = 3
+}
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Lambda のモジュールとインスタンス側のツールはパッケージではなくフラットなファイルなので、
+# ビルド後の zip / /minecraft/tools と同じように直接 import できるようにする
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('lambda', 'tools'):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
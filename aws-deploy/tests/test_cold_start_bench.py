@@ -0,0 +1,10 @@
+import cold_start_bench
+
+
+def test_local_bench_imports_every_route():
+    # ../tools のモジュールを import するハンドラも新しいプロセスで読み込めること（boto3 は不要）
+    result = cold_start_bench.bench_local(1)
+    assert [row['route'] for row in result['routes']] == list(cold_start_bench.SPLIT_FUNCTIONS)
+    for row in result['routes']:
+        assert row['split_import_ms'] > 0
+        assert row['router_import_ms'] > 0
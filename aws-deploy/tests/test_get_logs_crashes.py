@@ -0,0 +1,58 @@
+import json
+import os
+import stat
+import subprocess
+
+import pytest
+
+import get_logs
+import ssm_runner
+
+SUMMARY = {'signatures': 1, 'reports': 2, 'new': 0, 'crash_loop': None, 'items': []}
+
+
+@pytest.fixture
+def instance(tmp_path, monkeypatch):
+    """crash_index.py と systemctl の代わりに、呼ばれたことを記録するだけのスクリプトを置く"""
+    calls = tmp_path / 'calls'
+    tool = tmp_path / 'crash_index.py'
+    tool.write_text(
+        'import json, sys\n'
+        f'open({str(calls)!r}, "a").write(" ".join(["crash_index"] + sys.argv[1:]) + "\\n")\n'
+        'if sys.argv[1] == "ack":\n'
+        '    if sys.argv[2] != "known":\n'
+        '        print(json.dumps({"error": "unknown signature: " + sys.argv[2]}))\n'
+        '        sys.exit(1)\n'
+        '    print(json.dumps({"acknowledged": ["known"]}))\n'
+        'else:\n'
+        f'    print(json.dumps({SUMMARY!r}))\n'
+    )
+    systemctl = tmp_path / 'systemctl'
+    systemctl.write_text(f'#!/bin/sh\necho "systemctl $*" >> {calls}\n[ "$1" != is-active ]\n')
+    systemctl.chmod(systemctl.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(get_logs, 'CRASH_TOOL', str(tool))
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+
+    def run(ack, restart):
+        command = get_logs.build_crashes_command(False, ack, restart)
+        process = subprocess.run(['bash', '-c', command], capture_output=True, text=True)
+        output = ssm_runner.CommandResult('cmd', 'Success' if process.returncode == 0 else 'Failed',
+                                          process.stdout, process.stderr, process.returncode, 0.0)
+        log = calls.read_text().splitlines() if calls.exists() else []
+        return json.loads(get_logs.crashes_response(output, ack, restart)['body']), log
+    return run
+
+
+def test_failed_ack_does_not_restart(instance):
+    body, log = instance('typo', True)
+    assert body['success'] is False
+    assert body['error'] == 'unknown signature: typo'
+    assert not any(line.startswith('systemctl') for line in log)
+
+
+def test_ack_then_restart(instance):
+    body, log = instance('known', True)
+    assert body['success'] is True
+    assert body['acknowledged'] == ['known']
+    assert 'systemctl start minecraft.service' in log
+    assert log[-1] == 'crash_index summary'
@@ -0,0 +1,79 @@
+import threading
+
+import pending_config
+
+INSTANCE_ID = 'i-test'
+
+
+def no_sleep(seconds):
+    pass
+
+
+def test_concurrent_writers_lose_no_updates():
+    store = pending_config.MemoryObjectStore()
+    writers, per_writer = 8, 10
+    applied = {}
+    applied_lock = threading.Lock()
+    done = threading.Event()
+
+    def apply(properties):
+        with applied_lock:
+            applied.update(properties)
+
+    def writer(number):
+        log = pending_config.ChangeLog(store, INSTANCE_ID, sleep=no_sleep)
+        for i in range(per_writer):
+            log.append({f'writer{number}-{i}': str(i)}, author=f'writer{number}')
+
+    def compactor():
+        log = pending_config.ChangeLog(store, INSTANCE_ID, sleep=no_sleep)
+        while not done.is_set():
+            log.compact(apply=apply)
+
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(writers)]
+    background = threading.Thread(target=compactor)
+    background.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    background.join()
+    pending_config.ChangeLog(store, INSTANCE_ID).compact(apply=apply)
+
+    expected = {f'writer{number}-{i}': str(i) for number in range(writers) for i in range(per_writer)}
+    assert applied == expected
+    assert pending_config.ChangeLog(store, INSTANCE_ID).pending()['entries'] == 0
+
+
+def test_later_change_wins():
+    log = pending_config.ChangeLog(pending_config.MemoryObjectStore(), INSTANCE_ID, sleep=no_sleep)
+    log.append({'difficulty': 'easy', 'pvp': 'false'})
+    log.append({'difficulty': 'hard'})
+    assert log.pending()['properties'] == {'difficulty': 'hard', 'pvp': 'false'}
+
+
+class CompactBeforeBaseRead(pending_config.MemoryObjectStore):
+    """一覧を返した直後、最初の base.json の読み込みの前に別の起動処理がまとめを行う"""
+
+    def __init__(self):
+        super().__init__()
+        self.armed = False
+
+    def get(self, key):
+        if self.armed and key.endswith('base.json'):
+            self.armed = False
+            pending_config.ChangeLog(self, INSTANCE_ID, sleep=no_sleep).compact(apply=lambda properties: None)
+        return super().get(key)
+
+
+def test_append_after_stale_listing_is_not_lost():
+    store = CompactBeforeBaseRead()
+    log = pending_config.ChangeLog(store, INSTANCE_ID, sleep=no_sleep)
+    log.append({'motd': 'first'})
+    log.append({'motd': 'second'})
+    # 一覧（version 1, 2）を見た後にまとめが base を 2 に進め、version 1 を消す
+    store.armed = True
+    version = log.append({'pvp': 'true'})
+    assert version > 2
+    assert log.pending()['properties'] == {'pvp': 'true'}
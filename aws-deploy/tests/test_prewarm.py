@@ -0,0 +1,48 @@
+import threading
+
+import prewarm
+import state_store
+
+# 2026-01-05 は月曜日
+MONDAY_20_JST = 1767610800
+
+
+class CountingStore(state_store.MemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.gets = 0
+
+    def get(self, key):
+        self.gets += 1
+        return super().get(key)
+
+
+def test_disabled_by_default():
+    assert prewarm.ENABLED is False
+
+
+def test_start_requests_are_appended_without_reading_state():
+    store = CountingStore()
+    service = prewarm.PrewarmService('i-test', store=store)
+    threads = [threading.Thread(target=service.record_start_request, args=(MONDAY_20_JST + i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.gets == 0
+    assert len(store.list(service.demand_prefix)) == 20
+
+
+def test_tick_folds_appended_requests():
+    store = state_store.MemoryStore()
+    service = prewarm.PrewarmService('i-test', store=store)
+    service.record_start_request(MONDAY_20_JST)
+    service.record_start_request(MONDAY_20_JST + 7 * 86400)
+    scheduler = prewarm.Scheduler()
+    folded = service._fold_demand(scheduler)
+    assert len(folded) == 2
+    slot = prewarm.hour_of_week(MONDAY_20_JST)
+    assert scheduler.state['demand'][slot] == 1 + scheduler.model.decay
+    # 取り込み済みのキーをもう一度取り込んでも週ごとに1回しか数えない
+    service._fold_demand(scheduler)
+    assert scheduler.state['demand'][slot] == 1 + scheduler.model.decay
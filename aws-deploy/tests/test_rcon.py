@@ -0,0 +1,143 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+import rcon
+
+PASSWORD = 'secret'
+
+
+class FakeRconServer:
+    """
+    RCON プロトコルを話すだけのローカルサーバー
+    - 応答は MAX_CHUNK バイトごとに複数パケットへ分割する（実サーバーと同じ）
+    - バニラと同じく1回の recv を1パケットとして扱い、長さが合わなければ（2パケットが1回で届いた場合も）切断する
+    - 認証応答の前に空の RESPONSE_VALUE を返す（実装によってはこうなる）
+    """
+
+    MAX_CHUNK = 4096
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.commands = []
+        self.connections = 0
+        self.rejected = 0
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen()
+        self.port = self._listener.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._listener.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    READ_SIZE = 1460
+
+    def _recv_packet(self, conn):
+        data = conn.recv(self.READ_SIZE)
+        if len(data) < 14:
+            return None
+        (length,) = struct.unpack_from('<i', data)
+        if length != len(data) - 4:
+            self.rejected += 1
+            return None
+        return rcon.decode_packet(data[4:])
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                packet = self._recv_packet(conn)
+                if packet is None:
+                    return
+                request_id, packet_type, body = packet
+                if packet_type == rcon.SERVERDATA_AUTH:
+                    conn.sendall(rcon.encode_packet(request_id, rcon.SERVERDATA_RESPONSE_VALUE, ''))
+                    ok = body == PASSWORD
+                    conn.sendall(rcon.encode_packet(request_id if ok else -1, rcon.SERVERDATA_AUTH_RESPONSE, ''))
+                    if not ok:
+                        return
+                    continue
+                if packet_type == rcon.SERVERDATA_EXECCOMMAND:
+                    self.commands.append(body)
+                    response = self.responses.get(body, f'Unknown command: {body}')
+                    if body == 'stop':
+                        return
+                    for start in range(0, max(len(response), 1), self.MAX_CHUNK):
+                        chunk = response[start:start + self.MAX_CHUNK]
+                        conn.sendall(rcon.encode_packet(request_id, rcon.SERVERDATA_RESPONSE_VALUE, chunk))
+                    continue
+                # 番兵パケットにはそのまま応答する
+                conn.sendall(rcon.encode_packet(request_id, rcon.SERVERDATA_RESPONSE_VALUE, ''))
+
+
+@pytest.fixture
+def server():
+    server = FakeRconServer({
+        'list': 'There are 2 of a max of 20 players online: Alex, Steve',
+        'save-all flush': 'Saved the game',
+        'long': 'x' * 10000,
+    })
+    yield server
+    server.close()
+
+
+def test_list_players(server):
+    with rcon.RconClient('127.0.0.1', PASSWORD, port=server.port) as client:
+        assert client.list_players() == {'online': 2, 'max': 20, 'players': ['Alex', 'Steve']}
+
+
+def test_multi_packet_response_is_joined(server):
+    with rcon.RconClient('127.0.0.1', PASSWORD, port=server.port) as client:
+        assert client.command('long') == 'x' * 10000
+
+
+def test_connection_is_reused(server):
+    with rcon.RconClient('127.0.0.1', PASSWORD, port=server.port) as client:
+        client.command('list')
+        client.command('save-all flush')
+    assert server.connections == 1
+    assert server.commands == ['list', 'save-all flush']
+
+
+def test_wrong_password(server):
+    client = rcon.RconClient('127.0.0.1', 'wrong', port=server.port)
+    with pytest.raises(rcon.RconAuthError):
+        client.command('list')
+    assert not client.connected
+
+
+def test_stop_tolerates_disconnect(server):
+    client = rcon.RconClient('127.0.0.1', PASSWORD, port=server.port)
+    client.save_all()
+    assert client.stop() == ''
+    assert server.commands == ['save-all flush', 'stop']
+    assert not client.connected
+
+
+def test_connection_refused():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    with pytest.raises(rcon.RconError):
+        rcon.RconClient('127.0.0.1', PASSWORD, port=port, timeout=1).command('list')
+
+
+def test_packets_are_sent_one_at_a_time(server):
+    with rcon.RconClient('127.0.0.1', PASSWORD, port=server.port) as client:
+        for _ in range(5):
+            assert client.command('save-all flush') == 'Saved the game'
+        assert client.command('long') == 'x' * 10000
+    assert server.rejected == 0
+    assert server.connections == 1
@@ -0,0 +1,46 @@
+import start_orchestrator
+import state_store
+
+
+class FailingResultExecutor(start_orchestrator.StubExecutor):
+    """最初の結果取得だけ失敗する（エージェント未登録など）"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = 1
+
+    def get_service_check(self, command_id):
+        if self.failures:
+            self.failures -= 1
+            self.calls.append('get_service_check')
+            raise RuntimeError('InvocationDoesNotExist')
+        return super().get_service_check(command_id)
+
+
+def _orchestrator(executor):
+    return start_orchestrator.StartOrchestrator('i-test', executor, store=state_store.MemoryStore())
+
+
+def _run_until_service_active(orchestrator, ticks=10):
+    orchestrator.request_start(now=0)
+    for tick in range(1, ticks):
+        record = orchestrator.tick(now=tick)
+        if record['phase'] == start_orchestrator.SERVICE_ACTIVE:
+            return record
+    return orchestrator.load()
+
+
+def test_pending_service_check_is_not_resent():
+    executor = start_orchestrator.StubExecutor(states=('stopped', 'running'), service=(None, None, True),
+                                               pings=(None,))
+    record = _run_until_service_active(_orchestrator(executor))
+    assert record['phase'] == start_orchestrator.SERVICE_ACTIVE
+    assert executor.calls.count('send_service_check') == 1
+    assert executor.calls.count('get_service_check') == 3
+
+
+def test_service_check_error_resends_command():
+    executor = FailingResultExecutor(states=('stopped', 'running'), service=(True,), pings=(None,))
+    record = _run_until_service_active(_orchestrator(executor))
+    assert record['phase'] == start_orchestrator.SERVICE_ACTIVE
+    assert executor.calls.count('send_service_check') == 2
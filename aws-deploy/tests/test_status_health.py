@@ -0,0 +1,44 @@
+import json
+
+import server_health
+import status_server
+
+
+def test_parse_minutes():
+    assert status_server.parse_minutes(None) == status_server.DEFAULT_HEALTH_MINUTES
+    assert status_server.parse_minutes('15') == 15
+    assert status_server.parse_minutes('100000') == status_server.MAX_HEALTH_MINUTES
+    assert status_server.parse_minutes('abc') is None
+    assert status_server.parse_minutes('0') is None
+
+
+def test_invalid_minutes_is_rejected(monkeypatch):
+    monkeypatch.setenv('INSTANCE_ID', 'i-test')
+    response = status_server.lambda_handler({'queryStringParameters': {'detail': 'health', 'minutes': 'abc'}}, None)
+    assert response['statusCode'] == 400
+
+
+def _busy_history(minutes, now):
+    history = server_health.History('/nonexistent/health.json')
+    for minute in range(minutes):
+        values = history.bucket(now - (minute + 1) * 60)
+        for index in range(len(values)):
+            values[index] = 12345
+    return history
+
+
+def test_max_minutes_fit_in_output():
+    now = 1767610800
+    history = _busy_history(status_server.MAX_HEALTH_MINUTES, now)
+    result = server_health.summary(history, status_server.MAX_HEALTH_MINUTES, now=now)
+    assert len(result['series']) == status_server.MAX_HEALTH_MINUTES
+    assert len(json.dumps(result, ensure_ascii=False)) < status_server.MAX_OUTPUT
+
+
+def test_summary_drops_oldest_series_over_max_output():
+    now = 1767610800
+    history = _busy_history(120, now)
+    result = server_health.summary(history, 120, now=now, max_output=5000)
+    assert result['series_truncated'] is True
+    assert len(json.dumps(result, ensure_ascii=False)) <= 5000
+    assert result['series'][-1]['time'] == server_health.series(history, now - 60, now)[-1]['time']
@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+import tempfile
+import urllib.request
+
+# インスタンス上で動くツール共通のヘルパー
+# boto3 はインスタンスに入っていないため、AWS操作は aws CLI（AL2023に同梱）を使う
+
+METADATA_URL = 'http://169.254.169.254/latest'
+SERVER_DIR = os.environ.get('MINECRAFT_DIR', '/minecraft/server')
+STATUS_DIR = os.environ.get('MINECRAFT_STATUS_DIR', '/minecraft/status')
+
+_metadata_cache = {}
+
+
+def _metadata_token():
+    req = urllib.request.Request(
+        f'{METADATA_URL}/api/token',
+        method='PUT',
+        headers={'X-aws-ec2-metadata-token-ttl-seconds': '300'}
+    )
+    with urllib.request.urlopen(req, timeout=2) as response:
+        return response.read().decode('utf-8')
+
+
+def metadata(path):
+    """IMDSv2でインスタンスメタデータを取得（結果はプロセス内でキャッシュ）"""
+    if path not in _metadata_cache:
+        req = urllib.request.Request(
+            f'{METADATA_URL}/meta-data/{path}',
+            headers={'X-aws-ec2-metadata-token': _metadata_token()}
+        )
+        with urllib.request.urlopen(req, timeout=2) as response:
+            _metadata_cache[path] = response.read().decode('utf-8')
+    return _metadata_cache[path]
+
+
+def instance_id():
+    return os.environ.get('INSTANCE_ID') or metadata('instance-id')
+
+
+def region():
+    return os.environ.get('AWS_REGION') or metadata('placement/region')
+
+
+def aws_cli(args, input_data=None, timeout=30, binary=False):
+    """aws CLI を実行して標準出力を返す（binary=True ならバイト列のまま）。失敗時は RuntimeError"""
+    result = subprocess.run(
+        ['aws'] + list(args) + ['--region', region()],
+        input=input_data,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=timeout
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode('utf-8', errors='replace').strip())
+    return result.stdout if binary else result.stdout.decode('utf-8')
+
+
+def get_parameter(name, default=None):
+    """SSM Parameter Store の値を取得。存在しない・取得できない場合は default"""
+    try:
+        value = aws_cli([
+            'ssm', 'get-parameter', '--name', name,
+            '--query', 'Parameter.Value', '--output', 'text'
+        ]).strip()
+    except (RuntimeError, OSError, subprocess.TimeoutExpired) as e:
+        print(f'Parameter {name} not available: {e}')
+        return default
+    return value if value and value != 'None' else default
+
+
+def atomic_write_json(path, data):
+    """一時ファイルに書いてからrenameすることで、読み手が書きかけのJSONを見ないようにする"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def http_get(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.status
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import agent_common
+import mclog
+import session_history
+
+# プレイヤー不在時の自動停止（auto-shutdown.sh の置き換え）
+#
+# latest.log を差分だけ読み進め（mclog.LogFollower）、join/left をその場で反映するため
+# チェックの間に何行流れてもイベントを取りこぼさない。サーバーの再起動（ログのローテーション）や
+# 停止メッセージではプレイヤーを全員退出扱いにする。
+# 停止までの時間は /minecraft/<instance-id>/idle_time（update_config が書き込む）から読み、
+# CONFIG_REFRESH 秒ごとに読み直す。停止は最後のプレイヤーが抜けた時刻から秒単位で判定する。
+# 予測起動（lambda/prewarm.py）が /minecraft/<instance-id>/hold_until に書いた時刻までは停止しない。
+# 終わったセッションは session_history.py の履歴に追記する。
+
+LOG_FILE = os.path.join(agent_common.SERVER_DIR, 'logs', 'latest.log')
+MONITOR_LOG = '/var/log/minecraft-autoshutdown.log'
+STATUS_FILE = os.path.join(agent_common.STATUS_DIR, 'autoshutdown.json')
+DEFAULT_IDLE_TIME = 900
+CONFIG_REFRESH = 60
+POLL_INTERVAL = 1.0
+# これより古い latest.log は前回起動時のもの（プレイヤーの状態を引き継がない）
+STALE_LOG_SLACK = 5
+
+
+def log_message(message):
+    line = f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}"
+    print(line, flush=True)
+    try:
+        with open(MONITOR_LOG, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError:
+        pass
+
+
+class Sessions:
+    """接続中のプレイヤー（名前 → 参加時刻）と、終わったセッション（名前, 参加時刻, 退出時刻）"""
+
+    def __init__(self):
+        self.players = {}
+        self.finished = []
+        self.last_timestamp = None
+
+    def feed(self, record):
+        """状態が変わった場合のみ (イベント, プレイヤー名) を返す"""
+        timestamp = record.timestamp or datetime.datetime.now()
+        self.last_timestamp = timestamp
+        match = mclog.JOINED.match(record.message)
+        if match:
+            name = match.group(1)
+            if name in self.players:
+                return None
+            self.players[name] = timestamp
+            return ('joined', name)
+        match = mclog.LEFT.match(record.message)
+        if match:
+            name = match.group(1)
+            joined = self.players.pop(name, None)
+            if joined is None:
+                return None
+            self.finished.append((name, joined, timestamp))
+            return ('left', name)
+        if mclog.STOPPING.match(record.message) and self.players:
+            self.clear()
+            return ('stopping', None)
+        return None
+
+    def clear(self):
+        """全員を最後に見た時刻で退出させる"""
+        ended = self.last_timestamp or datetime.datetime.now()
+        self.finished.extend((name, joined, ended) for name, joined in self.players.items())
+        self.players = {}
+
+    def take_finished(self):
+        finished, self.finished = self.finished, []
+        return finished
+
+    def names(self):
+        return sorted(self.players)
+
+
+class IdleTime:
+    """SSM Parameter Store の idle_time（refresh 秒ごとに読み直す）"""
+
+    def __init__(self, name, refresh=CONFIG_REFRESH, fetch=agent_common.get_parameter):
+        self.name = name
+        self.refresh = refresh
+        self.fetch = fetch
+        self.value = None
+        self.checked_at = None
+
+    def get(self, now):
+        """(現在の値, 変更前の値)。変わっていなければ変更前の値は None"""
+        if self.checked_at is not None and now - self.checked_at < self.refresh:
+            return self.value, None
+        self.checked_at = now
+        raw = self.fetch(self.name, None)
+        try:
+            value = int(raw)
+        except (TypeError, ValueError):
+            value = None
+        if value is None or value <= 0:
+            value = self.value or DEFAULT_IDLE_TIME
+        previous, self.value = self.value, value
+        return value, (previous if previous is not None and previous != value else None)
+
+
+class HoldUntil:
+    """停止を保留する期限（エポック秒）。予測起動が書き込む。refresh 秒ごとに読み直す"""
+
+    def __init__(self, name, refresh=CONFIG_REFRESH, fetch=agent_common.get_parameter):
+        self.name = name
+        self.refresh = refresh
+        self.fetch = fetch
+        self.value = 0
+        self.checked_at = None
+
+    def get(self, now):
+        if self.checked_at is not None and now - self.checked_at < self.refresh:
+            return self.value
+        self.checked_at = now
+        try:
+            self.value = int(self.fetch(self.name, None) or 0)
+        except (TypeError, ValueError):
+            self.value = 0
+        return self.value
+
+
+class Monitor:
+    def __init__(self, log_file, idle_time, shutdown, status_file=STATUS_FILE, poll_interval=POLL_INTERVAL,
+                 clock=time.monotonic, sleep=time.sleep, history=None, hold=None):
+        started = time.time()
+        self.follower = mclog.LogFollower(log_file, from_start=not _log_is_stale(log_file, started))
+        self.sessions = Sessions()
+        self.idle_time = idle_time
+        self.shutdown = shutdown
+        self.status_file = status_file
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.idle_since = None
+        self.idle_since_wall = None
+        self.history = history
+        self.hold = hold
+        self.held_until = None
+
+    def _read_log(self):
+        lines = self.follower.read_lines()
+        if self.follower.rotated and self.sessions.players:
+            log_message(f'Log rotated (server restarted). Clearing players: {", ".join(self.sessions.names())}')
+            self.sessions.clear()
+        changed = False
+        for line in lines:
+            record = mclog.parse_line(line)
+            if record is None:
+                continue
+            event = self.sessions.feed(record)
+            if event is None:
+                continue
+            changed = True
+            kind, name = event
+            if kind == 'stopping':
+                log_message('Server stopping. All players treated as left')
+            else:
+                log_message(f'Player {kind}: {name} (current: {", ".join(self.sessions.names()) or "none"})')
+        self._record_sessions()
+        return changed
+
+    def _record_sessions(self):
+        finished = self.sessions.take_finished()
+        if not finished or self.history is None:
+            return
+        try:
+            self.history.append([
+                (name, session_history.epoch(joined), session_history.epoch(left))
+                for name, joined, left in finished
+            ])
+        except Exception as e:
+            # 履歴が書けなくても自動停止は続ける
+            log_message(f'Failed to record sessions: {e}')
+
+    def _write_status(self, idle_time):
+        remaining = None
+        if self.idle_since is not None:
+            remaining = max(0.0, round(self.idle_since + idle_time - self.clock(), 1))
+        agent_common.atomic_write_json(self.status_file, {
+            'players': self.sessions.names(),
+            'player_count': len(self.sessions.players),
+            'idle_time': idle_time,
+            'idle_since': self.idle_since_wall,
+            'shutdown_in': remaining,
+            'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        })
+
+    def step(self):
+        """1回分の処理。停止すべき時刻を過ぎていれば True"""
+        now = self.clock()
+        idle_time, previous = self.idle_time.get(now)
+        changed = self._read_log()
+
+        if previous is not None:
+            log_message(f'Config change detected: IDLE_TIME changed from {previous}s to {idle_time}s')
+            if self.idle_since is not None and now - self.idle_since >= idle_time:
+                # 短くした直後に即停止しないよう、不在時間を数え直す
+                log_message('New IDLE_TIME is shorter than current idle time. Resetting idle counter.')
+                self.idle_since = now
+                self.idle_since_wall = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            changed = True
+
+        if self.sessions.players:
+            if self.idle_since is not None:
+                log_message(f'Players online. Resetting idle timer (players: {", ".join(self.sessions.names())})')
+                self.idle_since = None
+                self.idle_since_wall = None
+        elif self.idle_since is None:
+            self.idle_since = now
+            self.idle_since_wall = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            log_message(f'No players. Stopping in {idle_time}s unless someone joins')
+            changed = True
+
+        if changed:
+            self._write_status(idle_time)
+        if self.idle_since is None or now - self.idle_since < idle_time:
+            return False
+        return not self._held(now)
+
+    def _held(self, now):
+        """予測起動の保留期限内なら True（期限が来るまで停止しない）"""
+        if self.hold is None:
+            return False
+        hold_until = self.hold.get(now)
+        if time.time() >= hold_until:
+            return False
+        if self.held_until != hold_until:
+            self.held_until = hold_until
+            until = datetime.datetime.fromtimestamp(hold_until).strftime('%Y-%m-%d %H:%M:%S')
+            log_message(f'Shutdown held until {until} (prewarm)')
+        return True
+
+    def run(self):
+        idle_time, _ = self.idle_time.get(self.clock())
+        log_message('=========================================')
+        log_message(f'Auto-shutdown monitor started (log follower). IDLE_TIME={idle_time}s')
+        log_message('=========================================')
+        while True:
+            if self.step():
+                idle_time = self.idle_time.value
+                log_message(f'Stopping server after {idle_time} seconds of no players')
+                self.shutdown(idle_time)
+                return
+            # 停止予定時刻が近ければそこまでだけ眠る（秒単位の精度）
+            # （保留中で停止予定時刻を過ぎている場合は通常の間隔で確認する）
+            wait = self.poll_interval
+            if self.idle_since is not None:
+                remaining = self.idle_since + self.idle_time.value - self.clock()
+                if remaining > 0:
+                    wait = min(wait, remaining)
+            self.sleep(wait)
+
+
+def _log_is_stale(path, started_at):
+    try:
+        return os.stat(path).st_mtime < started_at - STALE_LOG_SLACK
+    except FileNotFoundError:
+        return False
+
+
+def notify_discord(instance_id, idle_time):
+    webhook_url = os.environ.get('DISCORD_WEBHOOK_URL') or agent_common.get_parameter(
+        f'/minecraft/{instance_id}/discord_webhook'
+    )
+    if not webhook_url:
+        log_message('Discord Webhook URL not configured. Skipping notification')
+        return
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    body = json.dumps({
+        'content': f'🛑 Server auto-stopped\n\nReason: No players for {idle_time // 60} minutes\nTime: {now}'
+    }).encode('utf-8')
+    request = urllib.request.Request(webhook_url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            log_message(f'Discord notification sent - HTTP Code: {response.status}')
+    except Exception as e:
+        log_message(f'Failed to send Discord notification: {e}')
+
+
+def stop_instance(idle_time):
+    instance_id = agent_common.instance_id()
+    notify_discord(instance_id, idle_time)
+    subprocess.run(['systemctl', 'stop', 'minecraft.service'])
+    log_message(f'Stopping EC2 instance: {instance_id}')
+    agent_common.aws_cli(['ec2', 'stop-instances', '--instance-ids', instance_id])
+    log_message('Server stop command executed')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='プレイヤー不在時の自動停止')
+    parser.add_argument('--log', default=LOG_FILE)
+    parser.add_argument('--status-file', default=STATUS_FILE)
+    parser.add_argument('--idle-time', type=int, help='停止までの秒数（指定するとParameter Storeを見ない）')
+    parser.add_argument('--dry-run', action='store_true', help='停止せずにログだけ出して終了')
+    args = parser.parse_args(argv)
+
+    hold = None
+    if args.idle_time:
+        idle_time = IdleTime(None, fetch=lambda name, default: args.idle_time)
+    else:
+        instance_id = agent_common.instance_id()
+        idle_time = IdleTime(f'/minecraft/{instance_id}/idle_time')
+        hold = HoldUntil(f'/minecraft/{instance_id}/hold_until')
+    shutdown = (lambda seconds: log_message('Dry run: not stopping')) if args.dry_run else stop_instance
+    Monitor(args.log, idle_time, shutdown, args.status_file, history=session_history.SessionStore(),
+            hold=hold).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
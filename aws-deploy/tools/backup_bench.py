@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import world_backup
+
+# バックアップ方式のベンチマーク
+# 従来の tar -czf（1スレッド）と world_backup.py（ブロック並列圧縮）を同じワールドで比べる。
+# 保存先はローカルディレクトリなので、アップロード時間は含まない（圧縮とディスクI/Oのみ）。
+#
+# 使い方（リポジトリのルートで）:
+#   python3 aws-deploy/tools/backup_bench.py world
+#   python3 aws-deploy/tools/backup_bench.py world --workers 1 --workers 4 --repeat 5
+
+
+def _best(repeat, func):
+    """repeat 回実行して最短の所要時間と、最後の結果を返す"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3), result
+
+
+def _world_size(world_dir):
+    total = 0
+    for root, _, files in os.walk(world_dir):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def _largest_region(world_dir):
+    regions = os.path.join(world_dir, 'region')
+    names = [name for name in os.listdir(regions) if name.endswith('.mca')] if os.path.isdir(regions) else []
+    if not names:
+        return None
+    return 'region/' + max(names, key=lambda name: os.path.getsize(os.path.join(regions, name)))
+
+
+def bench_tar(world_dir, tmp, repeat, member):
+    archive = os.path.join(tmp, 'world.tar.gz')
+    parent, name = os.path.split(os.path.abspath(world_dir))
+    seconds, _ = _best(repeat, lambda: subprocess.run(['tar', '-czf', archive, '-C', parent, name], check=True))
+    result = {'backup_seconds': seconds, 'stored_bytes': os.path.getsize(archive)}
+    if member:
+        dest = os.path.join(tmp, 'tar-restore')
+        os.makedirs(dest, exist_ok=True)
+        # gzip はシークできないため、1ファイルの取り出しでもアーカイブ全体を読む
+        seconds, _ = _best(repeat, lambda: subprocess.run(
+            ['tar', '-xzf', archive, '-C', dest, f'{name}/{member}'], check=True
+        ))
+        result['restore_one_seconds'] = seconds
+        result['restore_one_bytes_read'] = result['stored_bytes']
+    return result
+
+
+def bench_world_backup(world_dir, tmp, repeat, workers, level, member):
+    root = os.path.join(tmp, f'store-{workers}')
+    store = world_backup.open_store(root)
+    state_file = os.path.join(tmp, f'state-{workers}.json.gz')
+    seconds, manifest = _best(repeat, lambda: world_backup.backup(
+        store, world_dir, state_file, full=True, workers=workers, level=level
+    ))
+    result = {
+        'workers': workers,
+        'backup_seconds': seconds,
+        'stored_bytes': manifest['stats']['bytes_uploaded'],
+    }
+    # 変更がない状態での差分バックアップ
+    seconds, _ = _best(repeat, lambda: world_backup.backup(
+        store, world_dir, state_file, workers=workers, level=level
+    ))
+    result['incremental_seconds'] = seconds
+    if member:
+        dest = os.path.join(tmp, f'restore-{workers}')
+        seconds, restored = _best(repeat, lambda: world_backup.restore(store, manifest['id'], dest, [member]))
+        result['restore_one_seconds'] = seconds
+        result['restore_one_bytes_read'] = restored['bytes_fetched']
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='tar -czf と world_backup.py のバックアップ速度の比較')
+    parser.add_argument('world', help='ワールドディレクトリ（例: リポジトリの world/）')
+    parser.add_argument('--workers', type=int, action='append',
+                        help='world_backup の圧縮スレッド数（複数指定可、既定: 1 と CPUコア数）')
+    parser.add_argument('--level', type=int, default=world_backup.blockpack.COMPRESS_LEVEL)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    workers = args.workers or sorted({1, os.cpu_count() or 1})
+    member = _largest_region(args.world)
+    results = {
+        'world': os.path.abspath(args.world),
+        'world_bytes': _world_size(args.world),
+        'cpu_count': os.cpu_count(),
+        'restore_one': member,
+    }
+    with tempfile.TemporaryDirectory(prefix='backup-bench-') as tmp:
+        results['tar'] = bench_tar(args.world, tmp, args.repeat, member)
+        results['world_backup'] = [
+            bench_world_backup(args.world, tmp, args.repeat, count, args.level, member) for count in workers
+        ]
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import collections
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# ブロック圧縮パック（world_backup.py のパック形式）
+#
+# データを固定長（既定 1MiB）のブロックに区切り、ブロックごとに独立して zlib 圧縮して連結する。
+# ブロック表（各ブロックの圧縮後のオフセットと長さ）があれば、任意の範囲を
+# 該当するブロックだけの Range 取得で読めるため、リージョンファイル1つの復元でパック全体を取得しなくてよい。
+#
+# 書き込みはストリーミング:
+#   add() → ブロックがたまるごとに圧縮スレッドへ（zlib は圧縮中にGILを解放するので複数コアを使える）
+#   → 圧縮済みブロックを順番どおりにパートへ → パートがたまるごとにアップロードスレッドへ
+# 圧縮待ちのブロック数・アップロード中のパート数に上限があるため、メモリ使用量は
+# おおよそ (workers × 2) × block_size + (upload_parallel + 1) × part_size で頭打ちになる。
+
+BLOCK_SIZE = 1024 * 1024
+PART_SIZE = 8 * 1024 * 1024
+COMPRESS_LEVEL = 6
+UPLOAD_PARALLEL = 4
+FETCH_SIZE = 8 * 1024 * 1024
+CACHE_BLOCKS = 16
+
+
+class BlockPackWriter:
+    """
+    upload: パートを受け取るオブジェクト（put_part(number, offset, data) / complete() / abort()）
+    close() 後の table() をマニフェストに保存しておけば BlockPackReader で読める
+    """
+
+    def __init__(self, upload, block_size=BLOCK_SIZE, part_size=PART_SIZE, workers=1,
+                 level=COMPRESS_LEVEL, upload_parallel=UPLOAD_PARALLEL):
+        self.upload = upload
+        self.block_size = block_size
+        self.part_size = part_size
+        self.level = level
+        self.offset = 0
+        self.stored_bytes = 0
+        self.blocks = []
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        self._max_pending = max(1, workers) * 2
+        self._compressor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._uploader = ThreadPoolExecutor(max_workers=max(1, upload_parallel))
+        self._upload_slots = threading.BoundedSemaphore(max(1, upload_parallel))
+        self._uploads = []
+        self._part = bytearray()
+        self._part_number = 0
+        self._part_offset = 0
+        self._closed = False
+
+    def add(self, data):
+        """データを追加し、パック内（圧縮前）のオフセットを返す"""
+        offset = self.offset
+        self._buffer += data
+        self.offset += len(data)
+        while len(self._buffer) >= self.block_size:
+            self._submit_block(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+        return offset
+
+    def _submit_block(self, block):
+        self._pending.append(self._compressor.submit(zlib.compress, block, self.level))
+        # 先頭から順に、圧縮が終わったものをパートへ。上限を超えたら先頭の完了を待つ
+        while self._pending and (self._pending[0].done() or len(self._pending) > self._max_pending):
+            self._append_compressed(self._pending.popleft().result())
+
+    def _append_compressed(self, compressed):
+        self.blocks.append([self.stored_bytes, len(compressed)])
+        self.stored_bytes += len(compressed)
+        self._part += compressed
+        if len(self._part) >= self.part_size:
+            self._submit_part()
+
+    def _submit_part(self):
+        self._check_uploads()
+        self._upload_slots.acquire()
+        self._part_number += 1
+        data = bytes(self._part)
+        future = self._uploader.submit(self.upload.put_part, self._part_number, self._part_offset, data)
+        future.add_done_callback(lambda _: self._upload_slots.release())
+        self._uploads.append(future)
+        self._part_offset += len(data)
+        self._part = bytearray()
+
+    def _check_uploads(self):
+        """失敗したパートがあれば早めに例外にする"""
+        for future in self._uploads:
+            if future.done():
+                future.result()
+
+    def close(self):
+        """残りを圧縮・アップロードして完了させる。データがなければアップロードを中止して False"""
+        if self._buffer:
+            self._submit_block(bytes(self._buffer))
+            self._buffer = bytearray()
+        while self._pending:
+            self._append_compressed(self._pending.popleft().result())
+        if self._part:
+            self._submit_part()
+        for future in self._uploads:
+            future.result()
+        self._shutdown()
+        self._closed = True
+        if not self.offset:
+            self.upload.abort()
+            return False
+        self.upload.complete()
+        return True
+
+    def abort(self):
+        if self._closed:
+            return
+        self._closed = True
+        for future in self._pending:
+            future.cancel()
+        self._shutdown()
+        self.upload.abort()
+
+    def _shutdown(self):
+        self._compressor.shutdown(wait=True)
+        self._uploader.shutdown(wait=True)
+
+    def table(self):
+        return {'compression': 'zlib', 'block_size': self.block_size, 'size': self.offset, 'blocks': self.blocks}
+
+
+class BlockPackReader:
+    """
+    fetch(start, end): パックの圧縮後のバイト範囲 [start, end) を返す関数（S3 の Range 取得など）
+    table: BlockPackWriter.table() の内容。None なら無圧縮のパック（ブロックなし）として読む
+    """
+
+    def __init__(self, fetch, table=None, fetch_size=FETCH_SIZE, cache_blocks=CACHE_BLOCKS):
+        self.fetch = fetch
+        self.table = table
+        self.fetch_size = fetch_size
+        self.cache_blocks = cache_blocks
+        self.cache = collections.OrderedDict()
+        self.fetched_bytes = 0
+        self.requests = 0
+
+    def read(self, offset, length):
+        if self.table is None:
+            return self._fetch(offset, offset + length)
+        block_size = self.table['block_size']
+        first = offset // block_size
+        last = (offset + length - 1) // block_size if length else first
+        blocks = []
+        index = first
+        while index <= last:
+            if index in self.cache:
+                self.cache.move_to_end(index)
+                blocks.append(self.cache[index])
+                index += 1
+                continue
+            loaded = self._load(index, self._fetch_end(index, last))
+            blocks.extend(loaded[:last - index + 1])
+            index += len(loaded)
+        data = b''.join(blocks)
+        start = offset - first * block_size
+        return data[start:start + length]
+
+    def _fetch(self, start, end):
+        self.requests += 1
+        data = self.fetch(start, end)
+        self.fetched_bytes += len(data)
+        return data
+
+    def _fetch_end(self, index, last):
+        """
+        1回の取得に含める最後のブロック。必要な範囲（last まで）に加えて、
+        fetch_size に収まる分だけ後続のブロックも先読みする（順に読む復元ではリクエスト数が減る）
+        """
+        blocks = self.table['blocks']
+        end = index
+        while end + 1 < len(blocks) and end + 1 not in self.cache:
+            span = blocks[end + 1][0] + blocks[end + 1][1] - blocks[index][0]
+            if end + 1 > last and span > self.fetch_size:
+                break
+            end += 1
+        return end
+
+    def _load(self, first, last):
+        blocks = self.table['blocks']
+        start = blocks[first][0]
+        data = self._fetch(start, blocks[last][0] + blocks[last][1])
+        loaded = []
+        for index in range(first, last + 1):
+            offset, length = blocks[index]
+            loaded.append(zlib.decompress(data[offset - start:offset - start + length]))
+            self.cache[index] = loaded[-1]
+            self.cache.move_to_end(index)
+        while len(self.cache) > self.cache_blocks:
+            self.cache.popitem(last=False)
+        return loaded
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import agent_common
+
+# クラッシュレポート（crash-reports/crash-*.txt）の索引と、クラッシュループの検出
+#
+# レポートから見出し（時刻・説明）、例外、スタックの先頭、疑わしいMOD（MODの失敗セクション・
+# Mod List の状態・スタックに出てくるjar）、JVM/メモリの情報を取り出し、
+# 「例外の型 + 行番号を除いたスタックの先頭 + MODの失敗内容」のハッシュ（シグネチャ）でまとめる。
+# 索引は /minecraft/status/crash-index.json。新しいファイルだけを読む。
+#
+# minecraft.service は Restart=on-failure のため、壊れたMODがあると起動→クラッシュを繰り返す。
+# launch.sh は起動前に guard を実行し、同じシグネチャのクラッシュが LOOP_WINDOW 秒以内に LOOP_THRESHOLD 回起き、
+# その間 MOD・server.properties が変わっていなければ起動をやめる（終了コード GUARD_EXIT_CODE、
+# systemd の RestartPreventExitStatus で再起動させない）。MODを直すか ack すれば次の起動から通常どおり。
+
+CRASH_DIR = os.path.join(agent_common.SERVER_DIR, 'crash-reports')
+MODS_DIR = os.path.join(agent_common.SERVER_DIR, 'mods')
+PROPERTIES_FILE = os.path.join(agent_common.SERVER_DIR, 'server.properties')
+INDEX_FILE = os.path.join(agent_common.STATUS_DIR, 'crash-index.json')
+LOOP_FILE = os.path.join(agent_common.STATUS_DIR, 'crashloop.json')
+INDEX_VERSION = 1
+LOOP_THRESHOLD = int(os.environ.get('CRASH_LOOP_THRESHOLD', '3'))
+LOOP_WINDOW = int(os.environ.get('CRASH_LOOP_WINDOW', '900'))
+# EX_CONFIG。minecraft.service の RestartPreventExitStatus と合わせる
+GUARD_EXIT_CODE = 78
+TOP_FRAMES = 8
+# シグネチャに使うスタックの段数
+SIGNATURE_FRAMES = 5
+
+CRASH_FILE = re.compile(r'^crash-.*\.txt$')
+FRAME = re.compile(r'^\s*at ([\w$.<>/]+)\(([^)]*)\)(?: ~?\[([^\]]*)\])?')
+EXCEPTION = re.compile(r'^([\w$.]+(?:Exception|Error|Throwable)[\w$]*)(?:: (.*))?$')
+SECTION = re.compile(r'^-- (.+) --$')
+MOD_SECTION = re.compile(r'^MOD (\S+)$')
+DETAIL = re.compile(r'^\t(\S[^:]*): ?(.*)$')
+MEMORY = re.compile(r'(\d+) bytes \(\d+ MiB\) / (\d+) bytes \(\d+ MiB\) up to (\d+) bytes')
+# Mod List の1行: ファイル |名前 |modid |バージョン |状態 |Manifest
+MOD_LIST_ROW = re.compile(r'^\t\t(\S+)\s*\|([^|]*)\|([^|]*)\|([^|]*)\|([^|]*)\|')
+# 疑わしいMODの判定から除くjar（本体・ローダー・JDK）
+CORE_JARS = re.compile(r'^(server-|forge-|fmlloader-|fmlcore-|javafmllanguage-|modlauncher-|bootstraplauncher-|'
+                       r'eventbus-|securejarhandler-|mixin-|\?)')
+CORE_MODS = ('minecraft', 'forge')
+
+
+def _frame_jar(location):
+    """'forge-1.20.1-47.4.10-universal.jar%23118!/:?' → 'forge-1.20.1-47.4.10-universal.jar'"""
+    return location.split('%', 1)[0].split('!', 1)[0] if location else None
+
+
+def parse(text, name=None):
+    """クラッシュレポート1件を辞書にする"""
+    lines = text.splitlines()
+    report = {
+        'file': name,
+        'time': None,
+        'description': None,
+        'exception': None,
+        'message': None,
+        'frames': [],
+        'thread': None,
+        'suspected_mods': [],
+        'mod_failures': [],
+        'system': {},
+    }
+    details = {}
+    mod_rows = []
+    section = None
+    mod_section = None
+    in_first_stack = None
+    in_mod_list = False
+
+    for line in lines:
+        if line.startswith('Time: ') and report['time'] is None:
+            report['time'] = line[6:].strip()
+            continue
+        if line.startswith('Description: ') and report['description'] is None:
+            report['description'] = line[13:].strip()
+            in_first_stack = False
+            continue
+        # 説明の直後が例外とスタックトレース
+        if in_first_stack is False and line.strip():
+            match = EXCEPTION.match(line.strip())
+            if match:
+                report['exception'] = match.group(1)
+                report['message'] = match.group(2)
+                in_first_stack = True
+                continue
+        if in_first_stack:
+            match = FRAME.match(line)
+            if match:
+                if len(report['frames']) < TOP_FRAMES:
+                    report['frames'].append({'method': match.group(1), 'source': match.group(2),
+                                             'jar': _frame_jar(match.group(3))})
+                continue
+            if line.strip().startswith(('Caused by:', '...')) or not line.strip():
+                in_first_stack = None if not line.strip() else True
+                continue
+            in_first_stack = None
+
+        match = SECTION.match(line)
+        if match:
+            section = match.group(1)
+            mod_match = MOD_SECTION.match(section)
+            mod_section = {'modid': mod_match.group(1)} if mod_match else None
+            if mod_section is not None:
+                report['mod_failures'].append(mod_section)
+            in_mod_list = False
+            continue
+        if section == 'Head' and line.startswith('Thread: '):
+            report['thread'] = line[8:].strip()
+            continue
+        if section == 'Head' and line.startswith('Suspected Mods: '):
+            for part in line[16:].split(','):
+                modid = part.strip().split(' ', 1)[0]
+                if modid and modid != 'NONE':
+                    report['suspected_mods'].append(modid)
+            continue
+        if in_mod_list:
+            match = MOD_LIST_ROW.match(line)
+            if match:
+                mod_rows.append([part.strip() for part in match.groups()])
+                continue
+            in_mod_list = False
+        match = DETAIL.match(line)
+        if not match:
+            continue
+        key, value = match.group(1), match.group(2).strip()
+        if mod_section is not None:
+            if key == 'Failure message':
+                mod_section['failure'] = value
+            elif key in ('Mod File', 'Mod Version'):
+                mod_section[key.lower().replace(' ', '_')] = value
+        elif section == 'System Details':
+            details[key] = value
+            if key == 'Mod List':
+                in_mod_list = True
+
+    system = report['system']
+    for key in ('Minecraft Version', 'Java Version', 'Java VM Version', 'Operating System', 'JVM Flags', 'CPUs'):
+        if key in details:
+            system[key.lower().replace(' ', '_')] = details[key]
+    match = MEMORY.search(details.get('Memory', ''))
+    if match:
+        free, total, maximum = (int(value) for value in match.groups())
+        system['memory_mib'] = {'used': (total - free) >> 20, 'total': total >> 20, 'max': maximum >> 20}
+
+    jar_to_mod = {row[0]: row[2] for row in mod_rows}
+    mods = list(report['suspected_mods'])
+    mods += [failure['modid'] for failure in report['mod_failures'] if 'failure' in failure]
+    mods += [row[2] for row in mod_rows if row[4] == 'ERROR']
+    for frame in report['frames']:
+        jar = frame['jar']
+        if jar and not CORE_JARS.match(jar) and jar_to_mod.get(jar, jar) not in CORE_MODS:
+            mods.append(jar_to_mod.get(jar, jar))
+            break
+    report['suspected_mods'] = list(dict.fromkeys(mods))
+    report['mods_loaded'] = len(mod_rows)
+    report['signature'] = signature(report)
+    return report
+
+
+def signature(report):
+    """同じ原因のクラッシュをまとめるためのハッシュ（行番号・jarのビルド番号は含めない）"""
+    parts = [report['exception'] or report['description'] or '']
+    parts += [frame['method'] for frame in report['frames'][:SIGNATURE_FRAMES]]
+    parts += sorted(f'{failure["modid"]}:{failure.get("failure", "")}' for failure in report['mod_failures'])
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+def config_fingerprint(mods_dir=MODS_DIR, properties_file=PROPERTIES_FILE):
+    """MOD（名前とサイズ）と server.properties の更新時刻。変われば「直した」とみなす"""
+    entries = []
+    try:
+        for name in sorted(os.listdir(mods_dir)):
+            if name.endswith('.jar'):
+                entries.append(f'{name}:{os.path.getsize(os.path.join(mods_dir, name))}')
+    except FileNotFoundError:
+        pass
+    try:
+        entries.append(f'server.properties:{int(os.path.getmtime(properties_file))}')
+    except OSError:
+        pass
+    return hashlib.sha1('\n'.join(entries).encode('utf-8')).hexdigest()[:12]
+
+
+def _report_time(report, path):
+    """レポートの Time（ローカル時刻）をエポック秒に。読めなければファイルの更新時刻"""
+    try:
+        moment = datetime.datetime.strptime(report['time'], '%Y-%m-%d %H:%M:%S')
+        return time.mktime(moment.timetuple())
+    except (TypeError, ValueError):
+        return os.path.getmtime(path)
+
+
+class CrashIndex:
+    def __init__(self, crash_dir=CRASH_DIR, index_path=INDEX_FILE):
+        self.crash_dir = crash_dir
+        self.index_path = index_path
+        self.files = {}
+        self.signatures = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION:
+            self.files = data.get('files', {})
+            self.signatures = data.get('signatures', {})
+
+    def save(self):
+        agent_common.atomic_write_json(self.index_path, {
+            'version': INDEX_VERSION, 'files': self.files, 'signatures': self.signatures
+        })
+
+    def refresh(self, fingerprint=None):
+        """新しいレポートだけを読んで索引に加える。加えたシグネチャの一覧を返す"""
+        try:
+            names = sorted(name for name in os.listdir(self.crash_dir) if CRASH_FILE.match(name))
+        except FileNotFoundError:
+            return []
+        fingerprint = config_fingerprint() if fingerprint is None else fingerprint
+        added = []
+        for name in names:
+            path = os.path.join(self.crash_dir, name)
+            st = os.stat(path)
+            if name in self.files and self.files[name]['size'] == st.st_size:
+                continue
+            with open(path, encoding='utf-8', errors='replace') as f:
+                report = parse(f.read(), name)
+            at = _report_time(report, path)
+            self.files[name] = {'size': st.st_size, 'signature': report['signature'], 'at': at,
+                                'fingerprint': fingerprint}
+            entry = self.signatures.get(report['signature'])
+            if entry is None:
+                entry = self.signatures[report['signature']] = {
+                    'exception': report['exception'],
+                    'message': report['message'],
+                    'description': report['description'],
+                    'frames': [frame['method'] for frame in report['frames']],
+                    'suspected_mods': report['suspected_mods'],
+                    'mod_failures': report['mod_failures'],
+                    'system': report['system'],
+                    'first_seen': at,
+                    'last_seen': at,
+                    'count': 0,
+                    'example': name,
+                    'acknowledged_at': None,
+                }
+            entry['count'] += 1
+            entry['first_seen'] = min(entry['first_seen'], at)
+            entry['last_seen'] = max(entry['last_seen'], at)
+            added.append(report['signature'])
+        if added:
+            self.save()
+        return added
+
+    def new_signatures(self):
+        """確認（ack）されていない、または確認後に再発したシグネチャ"""
+        return {
+            digest: entry for digest, entry in self.signatures.items()
+            if entry['acknowledged_at'] is None or entry['last_seen'] > entry['acknowledged_at']
+        }
+
+    def acknowledge(self, digest, now=None):
+        targets = list(self.signatures) if digest == 'all' else [digest]
+        for target in targets:
+            if target not in self.signatures:
+                raise KeyError(target)
+            self.signatures[target]['acknowledged_at'] = time.time() if now is None else now
+        self.save()
+        return targets
+
+    def crash_loop(self, fingerprint, now=None, threshold=LOOP_THRESHOLD, window=LOOP_WINDOW):
+        """
+        クラッシュループなら {signature, count, ...}、そうでなければ None
+        直近 window 秒に同じシグネチャ・同じ設定（fingerprint）のクラッシュが threshold 回以上（ack 以前は数えない）
+        """
+        now = time.time() if now is None else now
+        counts = {}
+        for entry in self.files.values():
+            signature_entry = self.signatures.get(entry['signature'])
+            acknowledged = (signature_entry or {}).get('acknowledged_at') or 0
+            if entry['at'] >= now - window and entry['at'] > acknowledged and entry['fingerprint'] == fingerprint:
+                counts[entry['signature']] = counts.get(entry['signature'], 0) + 1
+        for digest, count in sorted(counts.items(), key=lambda item: -item[1]):
+            if count >= threshold:
+                entry = self.signatures[digest]
+                return {'signature': digest, 'count': count, 'window': window, 'exception': entry['exception'],
+                        'suspected_mods': entry['suspected_mods'], 'fingerprint': fingerprint}
+        return None
+
+
+def _format_time(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).isoformat() if epoch else None
+
+
+def summary(index, only_new=False, limit=20):
+    entries = index.new_signatures() if only_new else index.signatures
+    items = []
+    for digest, entry in sorted(entries.items(), key=lambda item: -item[1]['last_seen'])[:limit]:
+        item = dict(entry, signature=digest, new=digest in index.new_signatures())
+        for key in ('first_seen', 'last_seen', 'acknowledged_at'):
+            item[key] = _format_time(item[key])
+        items.append(item)
+    loop = None
+    try:
+        with open(LOOP_FILE, encoding='utf-8') as f:
+            loop = json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+    return {'reports': len(index.files), 'signatures': len(index.signatures),
+            'new': len(index.new_signatures()), 'crash_loop': loop, 'items': items}
+
+
+def guard(index, now=None):
+    """起動前の確認。クラッシュループなら状態ファイルを書いて True"""
+    fingerprint = config_fingerprint()
+    index.refresh(fingerprint)
+    loop = index.crash_loop(fingerprint, now)
+    if loop is None:
+        try:
+            os.remove(LOOP_FILE)
+        except FileNotFoundError:
+            pass
+        return False
+    loop['blocked_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    agent_common.atomic_write_json(LOOP_FILE, loop)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='クラッシュレポートの索引とクラッシュループの検出')
+    parser.add_argument('--dir', default=CRASH_DIR)
+    parser.add_argument('--index', default=INDEX_FILE)
+    sub = parser.add_subparsers(dest='command', required=True)
+    show = sub.add_parser('summary', help='シグネチャごとの一覧（新しい順）')
+    show.add_argument('--new', action='store_true', help='未確認のものだけ')
+    show.add_argument('--limit', type=int, default=20)
+    parse_command = sub.add_parser('parse', help='レポート1件を解析して表示')
+    parse_command.add_argument('file')
+    ack = sub.add_parser('ack', help='シグネチャを確認済みにする（クラッシュループの停止も解除）')
+    ack.add_argument('signature', help="シグネチャ、または 'all'")
+    sub.add_parser('guard', help=f'起動前の確認（クラッシュループなら終了コード {GUARD_EXIT_CODE}）')
+    args = parser.parse_args(argv)
+
+    if args.command == 'parse':
+        with open(args.file, encoding='utf-8', errors='replace') as f:
+            print(json.dumps(parse(f.read(), os.path.basename(args.file)), ensure_ascii=False, indent=2))
+        return 0
+
+    index = CrashIndex(args.dir, args.index)
+    if args.command == 'guard':
+        if guard(index):
+            with open(LOOP_FILE, encoding='utf-8') as f:
+                print(f'Crash loop detected, not starting: {f.read()}', file=sys.stderr)
+            return GUARD_EXIT_CODE
+        return 0
+
+    index.refresh()
+    if args.command == 'ack':
+        try:
+            acknowledged = index.acknowledge(args.signature)
+        except KeyError:
+            print(json.dumps({'error': f'unknown signature: {args.signature}'}))
+            return 1
+        try:
+            os.remove(LOOP_FILE)
+        except FileNotFoundError:
+            pass
+        print(json.dumps({'acknowledged': acknowledged}))
+        return 0
+
+    print(json.dumps(summary(index, args.new, args.limit), ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
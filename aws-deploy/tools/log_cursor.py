@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import re
+import sys
+
+import agent_common
+import mclog
+
+# カーソル方式でログの差分を読み出すツール（get_logs Lambda から SSM 経由で呼ばれる）
+#
+# カーソルは "<inode>:<offset>" 形式の文字列。前回の応答の next_cursor をそのまま渡すと
+# それ以降に追記された行だけが返る。inode が変わっていればローテーションとみなして先頭から読む。
+# SSM の標準出力は約24KBで切り捨てられるため、出力が max_output を超える手前で打ち切り、
+# more=true と続きのカーソルを返す（クライアントはそのカーソルで再度呼べばよい）。
+
+LOG_FILE = os.path.join(agent_common.SERVER_DIR, 'logs', 'latest.log')
+MAX_OUTPUT = 20000
+TAIL_CHUNK = 64 * 1024
+
+
+def parse_cursor(cursor):
+    """"<inode>:<offset>" を (inode, offset) に変換。不正な値は ValueError"""
+    inode, _, offset = cursor.partition(':')
+    return int(inode), int(offset)
+
+
+def format_cursor(inode, offset):
+    return f'{inode}:{offset}'
+
+
+def tail_offset(f, size, lines):
+    """末尾から lines 行分さかのぼった位置のオフセットを返す"""
+    if lines <= 0:
+        return size
+    position = size
+    found = 0
+    # 最終行が改行で終わっている場合、その改行は数えない
+    skip_last = True
+    while position > 0:
+        read_size = min(TAIL_CHUNK, position)
+        position -= read_size
+        f.seek(position)
+        chunk = f.read(read_size)
+        end = len(chunk)
+        while True:
+            index = chunk.rfind(b'\n', 0, end)
+            if index < 0:
+                break
+            if skip_last and position + index == size - 1:
+                skip_last = False
+                end = index
+                continue
+            skip_last = False
+            found += 1
+            if found == lines:
+                return position + index + 1
+            end = index
+    return 0
+
+
+class LineFilter:
+    """レベル・正規表現による絞り込み。スタックトレースなどの継続行は直前のレコードに従う"""
+
+    def __init__(self, level=None, pattern=None):
+        self.min_level = mclog.LEVELS.index(level.upper()) if level else None
+        self.pattern = re.compile(pattern) if pattern else None
+        self._last_matched = True
+
+    def match(self, line, record):
+        if record is None:
+            return self._last_matched
+        matched = True
+        if self.min_level is not None:
+            matched = record.level in mclog.LEVELS and mclog.LEVELS.index(record.level) >= self.min_level
+        if matched and self.pattern is not None:
+            matched = self.pattern.search(line) is not None
+        self._last_matched = matched
+        return matched
+
+
+def compact(line, record):
+    """[時刻, レベル, メッセージ] の短い形式（スレッド名・ロガー名を省く）"""
+    if record is None:
+        return ['', '', line]
+    timestamp = record.timestamp.strftime('%H:%M:%S') if record.timestamp else ''
+    return [timestamp, record.level, record.message]
+
+
+def read(path, cursor=None, lines=50, level=None, pattern=None, compact_output=False,
+         max_output=MAX_OUTPUT):
+    """
+    cursor 以降（cursor がなければ末尾 lines 行）を読み、応答用の dict を返す
+    読み出すのは改行で終わっている行まで。書きかけの最終行は次回に回す
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {'exists': False, 'lines': [], 'cursor': cursor, 'next_cursor': cursor,
+                'rotated': False, 'more': False}
+
+    rotated = False
+    with open(path, 'rb') as f:
+        if cursor:
+            inode, offset = parse_cursor(cursor)
+            if inode != st.st_ino or offset > st.st_size:
+                rotated = True
+                offset = 0
+        else:
+            offset = tail_offset(f, st.st_size, lines)
+
+        line_filter = LineFilter(level, pattern)
+        output = []
+        budget = max_output
+        position = offset
+        more = False
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            line = mclog.decode(raw).rstrip('\r\n')
+            record = mclog.parse_line(line)
+            if line_filter.match(line, record):
+                item = compact(line, record) if compact_output else line
+                cost = len(json.dumps(item, ensure_ascii=False)) + 1
+                if cost > budget and output:
+                    more = True
+                    break
+                budget -= cost
+                output.append(item)
+            position += len(raw)
+
+    return {
+        'exists': True,
+        'lines': output,
+        'cursor': cursor,
+        'next_cursor': format_cursor(st.st_ino, position),
+        'rotated': rotated,
+        'more': more,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ログをカーソル方式で差分取得する')
+    parser.add_argument('--log', default=LOG_FILE)
+    parser.add_argument('--cursor', help='前回の next_cursor（未指定なら末尾 --lines 行）')
+    parser.add_argument('--lines', type=int, default=50)
+    parser.add_argument('--level', choices=mclog.LEVELS, type=str.upper, help='この重要度以上のみ')
+    parser.add_argument('--grep', help='行に対する正規表現')
+    parser.add_argument('--compact', action='store_true', help='[時刻, レベル, メッセージ] 形式で返す')
+    parser.add_argument('--max-output', type=int, default=MAX_OUTPUT)
+    args = parser.parse_args(argv)
+
+    try:
+        result = read(args.log, args.cursor, args.lines, args.level, args.grep,
+                      args.compact, args.max_output)
+    except (ValueError, re.error) as e:
+        print(f'invalid argument: {e}', file=sys.stderr)
+        return 2
+
+    print(json.dumps(result, ensure_ascii=False, separators=(',', ':')))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
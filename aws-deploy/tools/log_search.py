@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import gzip
+import json
+import os
+import re
+import sys
+
+import agent_common
+import mclog
+
+# ローテーション済みログ（logs/YYYY-MM-DD-N.log.gz, debug-N.log.gz）の検索ツール
+#
+# gzipは展開しながら1行ずつ読む（ファイル全体をメモリに展開しない）。
+# ファイルごとに索引（時刻の範囲・レベル別件数・出入りしたプレイヤー・時刻のチェックポイント）を
+# LOG_DIR/.log-index.json に保存しておき、検索条件に合うはずのないファイルは開かずに飛ばす。
+# 索引はファイルのサイズと更新時刻が変わったときだけ作り直す。
+#
+# 例:
+#   log_search.py --player BIBITIKI
+#   log_search.py --since 2026-02-15T18:00 --until 2026-02-15T19:00 --level WARN
+#   log_search.py --grep "Can't keep up" --json
+
+LOG_DIR = os.path.join(agent_common.SERVER_DIR, 'logs')
+INDEX_NAME = '.log-index.json'
+INDEX_VERSION = 1
+# この行数ごとに (時刻, 展開後のバイト位置) を記録し、時刻指定の検索で読み飛ばしに使う
+CHECKPOINT_LINES = 1000
+
+LOG_FILE_PATTERN = re.compile(r'\.log(\.gz)?$')
+FILE_DATE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+
+def open_log(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def file_date(path):
+    """Vanilla形式（日付なし）の行に使う日付。ファイル名になければ更新日"""
+    match = FILE_DATE.search(os.path.basename(path))
+    if match:
+        return datetime.date(*(int(part) for part in match.groups()))
+    return datetime.date.fromtimestamp(os.path.getmtime(path))
+
+
+def iter_records(path, start_offset=0):
+    """
+    (展開後のバイト位置, LogRecord) を順に返す
+    スタックトレースなどの継続行は直前のレコードの message に連結する
+    """
+    default_date = file_date(path)
+    pending = None
+    pending_offset = 0
+    with open_log(path) as f:
+        if start_offset:
+            f.seek(start_offset)
+        offset = start_offset
+        for raw in f:
+            line = mclog.decode(raw).rstrip('\r\n')
+            record = mclog.parse_line(line, default_date)
+            if record is None:
+                if pending is not None and line:
+                    pending = pending._replace(message=pending.message + '\n' + line)
+            else:
+                if pending is not None:
+                    yield pending_offset, pending
+                pending = record
+                pending_offset = offset
+            offset += len(raw)
+    if pending is not None:
+        yield pending_offset, pending
+
+
+def build_file_index(path):
+    """1ファイル分の索引を作る"""
+    st = os.stat(path)
+    entry = {
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'start': None,
+        'end': None,
+        'records': 0,
+        'levels': {},
+        'players': [],
+        'checkpoints': [],
+    }
+    players = set()
+    for offset, record in iter_records(path):
+        timestamp = record.timestamp.isoformat() if record.timestamp else None
+        if timestamp:
+            if entry['start'] is None:
+                entry['start'] = timestamp
+            entry['end'] = timestamp
+            if entry['records'] % CHECKPOINT_LINES == 0:
+                entry['checkpoints'].append([timestamp, offset])
+        entry['records'] += 1
+        entry['levels'][record.level] = entry['levels'].get(record.level, 0) + 1
+        match = mclog.JOINED.match(record.message) or mclog.LEFT.match(record.message)
+        if match:
+            players.add(match.group(1))
+    entry['players'] = sorted(players)
+    return entry
+
+
+class LogIndex:
+    """ログディレクトリの索引（JSONファイルに永続化）"""
+
+    def __init__(self, log_dir, index_path=None):
+        self.log_dir = log_dir
+        self.index_path = index_path or os.path.join(log_dir, INDEX_NAME)
+        self.files = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION:
+            self.files = data.get('files', {})
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            agent_common.atomic_write_json(self.index_path, {'version': INDEX_VERSION, 'files': self.files})
+        except OSError as e:
+            # 読み取り専用のディレクトリでも検索自体はできるようにする
+            print(f'Index not saved: {e}', file=sys.stderr)
+        self.dirty = False
+
+    def log_files(self):
+        names = [name for name in os.listdir(self.log_dir) if LOG_FILE_PATTERN.search(name)]
+        return [os.path.join(self.log_dir, name) for name in sorted(names)]
+
+    def entry(self, path, rebuild=False):
+        """索引を返す。ファイルが変わっていれば作り直す"""
+        name = os.path.basename(path)
+        st = os.stat(path)
+        entry = self.files.get(name)
+        if rebuild or entry is None or entry['size'] != st.st_size or entry['mtime'] != st.st_mtime:
+            entry = build_file_index(path)
+            self.files[name] = entry
+            self.dirty = True
+        return entry
+
+    def refresh(self, rebuild=False):
+        """全ファイルの索引を更新し、消えたファイルの索引を捨てる"""
+        paths = self.log_files()
+        names = {os.path.basename(path) for path in paths}
+        for name in list(self.files):
+            if name not in names:
+                del self.files[name]
+                self.dirty = True
+        return [(path, self.entry(path, rebuild)) for path in paths]
+
+
+class Query:
+    """検索条件。索引だけで判定できる条件（時刻・レベル・プレイヤー）はファイル単位の絞り込みにも使う"""
+
+    def __init__(self, since=None, until=None, level=None, player=None, pattern=None):
+        self.since = since
+        self.until = until
+        self.min_level = mclog.LEVELS.index(level) if level else None
+        self.player = player
+        self.pattern = re.compile(pattern) if pattern else None
+
+    def may_match(self, entry):
+        if entry['records'] == 0:
+            return False
+        if self.since and entry['end'] and entry['end'] < self.since.isoformat():
+            return False
+        if self.until and entry['start'] and entry['start'] > self.until.isoformat():
+            return False
+        if self.min_level is not None:
+            levels = mclog.LEVELS[self.min_level:]
+            if not any(entry['levels'].get(level) for level in levels):
+                return False
+        if self.player and self.player not in entry['players']:
+            return False
+        return True
+
+    def start_offset(self, entry):
+        """since より前のチェックポイントまで読み飛ばせる"""
+        offset = 0
+        if self.since:
+            since = self.since.isoformat()
+            for timestamp, checkpoint in entry['checkpoints']:
+                if timestamp > since:
+                    break
+                offset = checkpoint
+        return offset
+
+    def matches(self, record):
+        if record.timestamp is not None:
+            if self.since and record.timestamp < self.since:
+                return False
+            if self.until and record.timestamp > self.until:
+                return False
+        if self.min_level is not None:
+            if record.level not in mclog.LEVELS or mclog.LEVELS.index(record.level) < self.min_level:
+                return False
+        if self.player and self.player not in record.message:
+            return False
+        if self.pattern and not self.pattern.search(record.message):
+            return False
+        return True
+
+    def past_until(self, record):
+        return self.until is not None and record.timestamp is not None and record.timestamp > self.until
+
+
+def search(index, query, limit=None, rebuild=False):
+    """
+    条件に合うレコードを順に返す（dict）
+    統計（読んだファイル数・飛ばしたファイル数）は index.stats に入る
+    """
+    index.stats = {'files_scanned': 0, 'files_skipped': 0}
+    found = 0
+    entries = index.refresh(rebuild)
+    index.save()
+    for path, entry in sorted(entries, key=lambda item: item[1]['start'] or ''):
+        if not query.may_match(entry):
+            index.stats['files_skipped'] += 1
+            continue
+        index.stats['files_scanned'] += 1
+        for _, record in iter_records(path, query.start_offset(entry)):
+            if query.past_until(record):
+                break
+            if not query.matches(record):
+                continue
+            yield {
+                'file': os.path.basename(path),
+                'time': record.timestamp.isoformat() if record.timestamp else None,
+                'thread': record.thread,
+                'level': record.level,
+                'message': record.message,
+            }
+            found += 1
+            if limit and found >= limit:
+                return
+
+
+def _parse_time(value):
+    return datetime.datetime.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ローテーション済みログの検索')
+    parser.add_argument('--dir', default=LOG_DIR, help='ログディレクトリ')
+    parser.add_argument('--index', help=f'索引ファイル（デフォルト: <dir>/{INDEX_NAME}）')
+    parser.add_argument('--since', type=_parse_time, help='開始時刻（例: 2026-02-15T18:00）')
+    parser.add_argument('--until', type=_parse_time, help='終了時刻')
+    parser.add_argument('--level', choices=mclog.LEVELS, type=str.upper, help='この重要度以上のみ')
+    parser.add_argument('--player', help='プレイヤー名')
+    parser.add_argument('--grep', help='メッセージに対する正規表現')
+    parser.add_argument('--limit', type=int, default=0, help='最大件数（0なら無制限）')
+    parser.add_argument('--json', action='store_true', help='1件1行のJSONで出力')
+    parser.add_argument('--max-output', type=int, default=0,
+                        help='結果を1つのJSONにまとめ、この文字数を超える手前で打ち切る（SSM経由の呼び出し用）')
+    parser.add_argument('--reindex', action='store_true', help='索引を作り直す')
+    parser.add_argument('--stats', action='store_true', help='索引の内容を表示して終了')
+    args = parser.parse_args(argv)
+
+    try:
+        query = Query(args.since, args.until, args.level, args.player, args.grep)
+    except re.error as e:
+        print(f'invalid pattern: {e}', file=sys.stderr)
+        return 2
+
+    index = LogIndex(args.dir, args.index)
+
+    if args.stats:
+        entries = index.refresh(args.reindex)
+        index.save()
+        summary = {
+            os.path.basename(path): {key: value for key, value in entry.items() if key != 'checkpoints'}
+            for path, entry in entries
+        }
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return 0
+
+    results = search(index, query, args.limit, args.reindex)
+
+    if args.max_output:
+        matches = []
+        budget = args.max_output
+        truncated = False
+        for item in results:
+            cost = len(json.dumps(item, ensure_ascii=False)) + 1
+            if cost > budget:
+                truncated = True
+                break
+            budget -= cost
+            matches.append(item)
+        print(json.dumps({'matches': matches, 'truncated': truncated, **index.stats},
+                         ensure_ascii=False, separators=(',', ':')))
+        return 0
+
+    for item in results:
+        if args.json:
+            print(json.dumps(item, ensure_ascii=False))
+        else:
+            print(f"{item['file']} {item['time']} [{item['thread']}/{item['level']}] {item['message']}")
+    print(f"-- files scanned: {index.stats['files_scanned']}, skipped: {index.stats['files_skipped']}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
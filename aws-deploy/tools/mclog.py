@@ -0,0 +1,144 @@
+import datetime
+import os
+import re
+from collections import namedtuple
+
+# Minecraft / Forge のログ行を解析する共通モジュール（インスタンス上のツールで共有）
+#
+# Forge:   [15Feb2026 18:27:10.861] [Server thread/INFO] [net.minecraft.server.MinecraftServer/]: BIBITIKI joined the game
+# Vanilla: [18:27:10] [Server thread/INFO]: BIBITIKI joined the game
+# Forgeの月はロケール依存（日本語Windowsでは "152月2026" のように出力される）
+
+LogRecord = namedtuple('LogRecord', ['timestamp', 'thread', 'level', 'logger', 'message', 'raw'])
+
+FORGE_LINE = re.compile(
+    r'^\[(\d{1,2})([^\d\]]*\d*[^\d\]]*?)(\d{4}) (\d{2}):(\d{2}):(\d{2})\.(\d{3})\] '
+    r'\[([^\]]+)/([A-Z]+)\] \[([^\]]*)\]: ?(.*)$'
+)
+VANILLA_LINE = re.compile(r'^\[(\d{2}):(\d{2}):(\d{2})\] \[([^\]]+)/([A-Z]+)\]: ?(.*)$')
+
+MONTHS = {name: i + 1 for i, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+)}
+
+# 重要度（低い順）
+LEVELS = ['TRACE', 'DEBUG', 'INFO', 'WARN', 'ERROR', 'FATAL']
+
+DONE = re.compile(r'^Done \(([\d.]+)s\)!')
+JOINED = re.compile(r'^(\S+) joined the game')
+LEFT = re.compile(r'^(\S+) left the game')
+
+# 起動フェーズ（メッセージの先頭一致で判定、出現順）
+STARTUP_PHASES = [
+    ('launching', re.compile(r'^ModLauncher running')),
+    ('loading_mods', re.compile(r"^Launching target '")),
+    ('starting_server', re.compile(r'^Starting minecraft server version')),
+    ('preparing_level', re.compile(r'^Preparing level')),
+    ('preparing_spawn', re.compile(r'^Preparing start region')),
+    ('ready', DONE),
+]
+STOPPING = re.compile(r'^Stopping (the )?server')
+
+
+def _parse_month(text):
+    text = text.strip()
+    digits = re.match(r'\d+', text)
+    if digits:
+        return int(digits.group())
+    return MONTHS.get(text[:3].lower())
+
+
+def parse_line(line, default_date=None):
+    """
+    1行を LogRecord に変換する。ログ形式でない行（スタックトレースなど）は None
+    Vanilla形式は日付を含まないため default_date（datetime.date）で補う
+    """
+    line = line.rstrip('\r\n')
+    match = FORGE_LINE.match(line)
+    if match:
+        month = _parse_month(match.group(2))
+        try:
+            timestamp = datetime.datetime(
+                int(match.group(3)), month or 1, int(match.group(1)),
+                int(match.group(4)), int(match.group(5)), int(match.group(6)),
+                int(match.group(7)) * 1000
+            )
+        except (TypeError, ValueError):
+            timestamp = None
+        return LogRecord(timestamp, match.group(8), match.group(9), match.group(10), match.group(11), line)
+
+    match = VANILLA_LINE.match(line)
+    if match:
+        date = default_date or datetime.date.today()
+        timestamp = datetime.datetime(
+            date.year, date.month, date.day,
+            int(match.group(1)), int(match.group(2)), int(match.group(3))
+        )
+        return LogRecord(timestamp, match.group(4), match.group(5), '', match.group(6), line)
+    return None
+
+
+def decode(raw):
+    """ログのバイト列を文字列にする（Windows由来のShift-JISが混ざっても落ちないように）"""
+    return raw.decode('utf-8', errors='replace')
+
+
+def startup_phase(message):
+    """起動フェーズの開始を示すメッセージならフェーズ名を返す"""
+    for name, pattern in STARTUP_PHASES:
+        if pattern.match(message):
+            return name
+    return None
+
+
+class LogFollower:
+    """
+    ログファイルを末尾から追いかける（オフセット方式）
+    inode が変わった・サイズが縮んだ場合はローテーションとみなして先頭から読み直す
+    """
+
+    def __init__(self, path, from_start=False):
+        self.path = path
+        self.inode = None
+        self.offset = 0
+        self._partial = b''
+        self._from_start = from_start
+        self.rotated = False
+
+    def _stat(self):
+        try:
+            return os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+    def read_lines(self, max_bytes=4 * 1024 * 1024):
+        """前回からの追記分を行単位で返す（行の途中までしか書かれていない部分は次回に回す）"""
+        st = self._stat()
+        if st is None:
+            return []
+
+        self.rotated = False
+        if self.inode is None:
+            self.inode = st.st_ino
+            self.offset = 0 if self._from_start else st.st_size
+        elif st.st_ino != self.inode or st.st_size < self.offset:
+            self.inode = st.st_ino
+            self.offset = 0
+            self._partial = b''
+            self.rotated = True
+
+        if st.st_size == self.offset:
+            return []
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(max_bytes)
+        self.offset += len(data)
+
+        data = self._partial + data
+        lines = data.split(b'\n')
+        self._partial = lines.pop()
+        return [decode(line) for line in lines]
+
+    def state(self):
+        return {'path': self.path, 'inode': self.inode, 'offset': self.offset - len(self._partial)}
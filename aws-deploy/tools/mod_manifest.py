@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+import uuid
+import zipfile
+
+# MODマニフェスト（内容アドレス方式）
+#
+# マニフェストは jar ごとに name / sha256 / size / mod_id / mod_version / side を持つJSON。
+# jar本体は S3 の mods/objects/<sha256>.jar に置き、マニフェストは
+#   mods/manifest.json             … 現在のマニフェスト
+#   mods/manifests/<version>.json  … 過去のマニフェスト（ロールバック用）
+# に保存する。インスタンス側（mod_sync.py）は適用済みのマニフェストとの差分だけを処理する。
+#
+# Lambda（mod_upload.py）とインスタンス上のツールの両方から使うため、標準ライブラリのみに依存する。
+
+OBJECTS_PREFIX = 'mods/objects/'
+MANIFEST_KEY = 'mods/manifest.json'
+MANIFESTS_PREFIX = 'mods/manifests/'
+
+TABLE = re.compile(r'^\s*\[\[\s*([A-Za-z0-9_.\-]+)\s*\]\]')
+KEY_VALUE = re.compile(r'''^\s*([A-Za-z0-9_\-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^#\s]+))''')
+
+
+def object_key(sha256):
+    return f'{OBJECTS_PREFIX}{sha256}.jar'
+
+
+def manifest_version_key(version):
+    return f'{MANIFESTS_PREFIX}{version}.json'
+
+
+def parse_mods_toml(text):
+    """
+    mods.toml から [[mods]] と [[dependencies.<modId>]] のキーを取り出す
+    （必要なのは文字列・真偽値のキーだけなので、簡易的な行単位の解析で足りる）
+    """
+    mods = []
+    dependencies = {}
+    current = None
+    in_multiline = False
+    for line in text.splitlines():
+        if line.count("'''") % 2 == 1 or line.count('"""') % 2 == 1:
+            in_multiline = not in_multiline
+            continue
+        if in_multiline:
+            continue
+        match = TABLE.match(line)
+        if match:
+            name = match.group(1)
+            current = {}
+            if name == 'mods':
+                mods.append(current)
+            elif name.startswith('dependencies.'):
+                dependencies.setdefault(name.split('.', 1)[1], []).append(current)
+            continue
+        match = KEY_VALUE.match(line)
+        if match and current is not None:
+            value = next(group for group in match.groups()[1:] if group is not None)
+            current[match.group(1)] = value
+    return mods, dependencies
+
+
+def _manifest_version(archive):
+    try:
+        text = archive.read('META-INF/MANIFEST.MF').decode('utf-8', errors='replace')
+    except KeyError:
+        return None
+    match = re.search(r'^Implementation-Version:\s*(\S+)', text, re.M)
+    return match.group(1) if match else None
+
+
+def mod_side(mod, dependencies):
+    """
+    サーバーに必要なMODか（'both'）、クライアント専用か（'client'）
+    clientSideOnly=true、または minecraft/forge への依存がすべて side="CLIENT" ならクライアント専用
+    """
+    if str(mod.get('clientSideOnly', '')).lower() == 'true':
+        return 'client'
+    sides = [
+        dep.get('side', 'BOTH').upper()
+        for dep in dependencies.get(mod.get('modId'), [])
+        if dep.get('modId') in ('minecraft', 'forge', 'neoforge')
+    ]
+    if sides and all(side == 'CLIENT' for side in sides):
+        return 'client'
+    return 'both'
+
+
+def read_mod_info(fileobj):
+    """jar（パスまたはシーク可能なファイルオブジェクト）から mod_id / mod_version / side を読む"""
+    try:
+        with zipfile.ZipFile(fileobj) as archive:
+            try:
+                text = archive.read('META-INF/mods.toml').decode('utf-8', errors='replace')
+            except KeyError:
+                return {'mod_id': None, 'mod_version': None, 'side': 'both'}
+            mods, dependencies = parse_mods_toml(text)
+            if not mods:
+                return {'mod_id': None, 'mod_version': None, 'side': 'both'}
+            mod = mods[0]
+            version = mod.get('version')
+            if version is None or version.startswith('${'):
+                version = _manifest_version(archive)
+            return {'mod_id': mod.get('modId'), 'mod_version': version, 'side': mod_side(mod, dependencies)}
+    except zipfile.BadZipFile:
+        return {'mod_id': None, 'mod_version': None, 'side': 'both'}
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_entry(name, sha256, size, info):
+    entry = {'name': name, 'sha256': sha256, 'size': size}
+    entry.update(info)
+    return entry
+
+
+def entry_for_file(path):
+    return build_entry(os.path.basename(path), sha256_file(path), os.path.getsize(path), read_mod_info(path))
+
+
+def new_manifest(mods, previous=None):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        'version': f"{now.strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:6]}",
+        'created_at': now.isoformat(),
+        'previous': previous,
+        'mods': sorted(mods, key=lambda entry: entry['name'].lower()),
+    }
+
+
+def build_manifest(mods_dir, previous=None):
+    """ディレクトリ内の jar からマニフェストを作る"""
+    paths = [os.path.join(mods_dir, name) for name in os.listdir(mods_dir) if name.endswith('.jar')]
+    return new_manifest([entry_for_file(path) for path in paths], previous)
+
+
+def merge_entries(manifest, entries):
+    """
+    現在のマニフェストに新しい jar を追加する
+    同じファイル名、または同じ mod_id（別バージョンの jar）の既存エントリは置き換える
+    """
+    names = {entry['name'] for entry in entries}
+    mod_ids = {entry['mod_id'] for entry in entries if entry.get('mod_id')}
+    kept = [
+        entry for entry in (manifest or {}).get('mods', [])
+        if entry['name'] not in names and not (entry.get('mod_id') and entry['mod_id'] in mod_ids)
+    ]
+    return new_manifest(kept + list(entries), (manifest or {}).get('version'))
+
+
+def remove_entries(manifest, names):
+    names = set(names)
+    kept = [entry for entry in manifest.get('mods', []) if entry['name'] not in names]
+    return new_manifest(kept, manifest.get('version'))
+
+
+def diff(installed, target):
+    """
+    適用済みマニフェスト（installed）から target への差分
+    restart_required はサーバーに読み込まれる jar（side != 'client'）の集合が変わる場合のみ True
+    """
+    old = {entry['name']: entry for entry in (installed or {}).get('mods', [])}
+    new = {entry['name']: entry for entry in (target or {}).get('mods', [])}
+
+    added = [new[name] for name in sorted(new) if name not in old]
+    removed = [old[name] for name in sorted(old) if name not in new]
+    changed = [new[name] for name in sorted(new) if name in old and old[name]['sha256'] != new[name]['sha256']]
+
+    def server_set(mods):
+        return {(entry['name'], entry['sha256']) for entry in mods.values() if entry.get('side') != 'client'}
+
+    return {
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+        'restart_required': server_set(old) != server_set(new),
+    }
+
+
+def summarize_diff(result):
+    return {
+        'added': [entry['name'] for entry in result['added']],
+        'removed': [entry['name'] for entry in result['removed']],
+        'changed': [entry['name'] for entry in result['changed']],
+        'restart_required': result['restart_required'],
+    }
+
+
+def load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MODマニフェストの作成・差分表示')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='ディレクトリ内の jar からマニフェストを作る')
+    build.add_argument('mods_dir')
+    compare = sub.add_parser('diff', help='2つのマニフェストの差分を表示')
+    compare.add_argument('installed')
+    compare.add_argument('target')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        result = build_manifest(args.mods_dir)
+    else:
+        result = summarize_diff(diff(load(args.installed), load(args.target)))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
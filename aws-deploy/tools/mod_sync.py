@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import agent_common
+import mod_manifest
+
+# MODの差分同期（update_config / upload_mods の Lambda から SSM 経由で呼ばれる）
+#
+# S3 の mods/manifest.json と、このインスタンスに適用済みのマニフェストを比較し、
+# 変わった jar だけを内容アドレス方式のキャッシュ（/minecraft/mod-cache/<sha256>.jar）に並列で取得する。
+# mods ディレクトリにはキャッシュからハードリンクを張るだけなので、ロールバックもダウンロードなしで済む。
+# サーバーに読み込まれる jar が変わらない場合（クライアント専用MODだけの変更など）は再起動しない。
+#
+# 初回（適用済みのマニフェストが無い）は、既存の mods ディレクトリの jar を S3 に取り込んだ
+# ベースのマニフェストを公開し、そこに S3 のマニフェストの jar を重ねたものを適用する。
+# 署名付きURLで1つだけアップロードした直後の初回同期で、既存のMODパックが消えないようにするため。
+# ベースのマニフェストが previous になるので、初回の変更もロールバックできる。
+
+MODS_DIR = os.path.join(agent_common.SERVER_DIR, 'mods')
+CACHE_DIR = os.environ.get('MOD_CACHE_DIR', '/minecraft/mod-cache')
+INSTALLED_FILE = os.path.join(agent_common.STATUS_DIR, 'mods-manifest.json')
+PREVIOUS_FILE = os.path.join(agent_common.STATUS_DIR, 'mods-manifest.prev.json')
+DEFAULT_BUCKET = os.environ.get('MODS_BUCKET', 'minecraft-server-mods-temp')
+PARALLEL = 4
+
+
+def cache_path(sha256):
+    return os.path.join(CACHE_DIR, f'{sha256}.jar')
+
+
+def load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def fetch_manifest(bucket, version=None):
+    key = mod_manifest.manifest_version_key(version) if version else mod_manifest.MANIFEST_KEY
+    return json.loads(agent_common.aws_cli(['s3', 'cp', f's3://{bucket}/{key}', '-']))
+
+
+def installed_manifest():
+    """
+    適用済みのマニフェスト。初回は mods ディレクトリの jar から作り、
+    既にある jar（とそのsha256）を「適用済み」とみなして差分だけを取得する
+    """
+    manifest = load_json(INSTALLED_FILE)
+    if manifest is None and os.path.isdir(MODS_DIR):
+        manifest = mod_manifest.build_manifest(MODS_DIR)
+        for entry in manifest['mods']:
+            _store_in_cache(os.path.join(MODS_DIR, entry['name']), entry['sha256'])
+    return manifest
+
+
+def publish_manifest(bucket, manifest):
+    """バージョン付きで保存してから現在のマニフェストとして公開する（mod_upload.publish_manifest と同じ）"""
+    body = json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+    for key in (mod_manifest.manifest_version_key(manifest['version']), mod_manifest.MANIFEST_KEY):
+        agent_common.aws_cli(['s3', 'cp', '-', f's3://{bucket}/{key}', '--content-type', 'application/json'],
+                             input_data=body)
+
+
+def _upload_object(bucket, entry):
+    """jar を内容アドレスのキーに置く（既にあれば何もしない）"""
+    key = mod_manifest.object_key(entry['sha256'])
+    try:
+        agent_common.aws_cli(['s3api', 'head-object', '--bucket', bucket, '--key', key])
+        return
+    except RuntimeError:
+        pass
+    agent_common.aws_cli(['s3', 'cp', cache_path(entry['sha256']), f's3://{bucket}/{key}',
+                          '--content-type', 'application/java-archive', '--only-show-errors'], timeout=600)
+
+
+def bootstrap(target, bucket, publish=True):
+    """
+    初回の同期: mods ディレクトリの既存の jar を残すマニフェストを作る
+    target にある jar（同じ名前・同じ mod_id）は target を優先する。publish=True なら S3 に取り込んで公開する
+    """
+    installed = installed_manifest()
+    if not installed or not installed['mods']:
+        return target
+    base = mod_manifest.new_manifest(installed['mods'])
+    merged = mod_manifest.merge_entries(base, target.get('mods', []))
+    if publish:
+        for entry in base['mods']:
+            _upload_object(bucket, entry)
+        publish_manifest(bucket, base)
+        publish_manifest(bucket, merged)
+    return merged
+
+
+def _store_in_cache(path, sha256):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    target = cache_path(sha256)
+    if not os.path.exists(target):
+        try:
+            os.link(path, target)
+        except OSError:
+            subprocess.run(['cp', '-p', path, target], check=True)
+
+
+def download(bucket, entry):
+    """キャッシュにない jar を取得し、sha256を検証してからキャッシュに入れる"""
+    target = cache_path(entry['sha256'])
+    if os.path.exists(target):
+        return entry['name'], 'cached'
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix='.download-', suffix='.jar')
+    os.close(fd)
+    try:
+        agent_common.aws_cli(
+            ['s3', 'cp', f"s3://{bucket}/{mod_manifest.object_key(entry['sha256'])}", tmp_path, '--only-show-errors'],
+            timeout=600
+        )
+        actual = mod_manifest.sha256_file(tmp_path)
+        if actual != entry['sha256']:
+            raise RuntimeError(f"{entry['name']}: sha256 mismatch ({actual})")
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return entry['name'], 'downloaded'
+
+
+def place(entry):
+    """キャッシュから mods ディレクトリへ（ハードリンク、できなければコピー）"""
+    target = os.path.join(MODS_DIR, entry['name'])
+    tmp_target = target + '.tmp'
+    if os.path.exists(tmp_target):
+        os.unlink(tmp_target)
+    try:
+        os.link(cache_path(entry['sha256']), tmp_target)
+    except OSError:
+        subprocess.run(['cp', '-p', cache_path(entry['sha256']), tmp_target], check=True)
+    os.replace(tmp_target, target)
+
+
+def apply(target, bucket, parallel=PARALLEL, dry_run=False):
+    installed = installed_manifest()
+    changes = mod_manifest.diff(installed, target)
+    summary = mod_manifest.summarize_diff(changes)
+    summary['version'] = target.get('version')
+
+    server_entries = [entry for entry in changes['added'] + changes['changed'] if entry.get('side') != 'client']
+    if dry_run:
+        summary['to_download'] = [entry['name'] for entry in server_entries
+                                  if not os.path.exists(cache_path(entry['sha256']))]
+        return summary
+
+    # 停止する前にダウンロードを済ませておく（停止時間を短くするため）。キャッシュ済みなら何もしない
+    if server_entries:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            summary['downloads'] = dict(executor.map(lambda entry: download(bucket, entry), server_entries))
+
+    restart = changes['restart_required']
+    if restart:
+        subprocess.run(['systemctl', 'stop', 'minecraft'], check=True)
+    try:
+        os.makedirs(MODS_DIR, exist_ok=True)
+        # クライアント専用MODはサーバーの mods ディレクトリに置かない
+        for entry in changes['removed'] + [entry for entry in changes['changed'] if entry.get('side') == 'client']:
+            path = os.path.join(MODS_DIR, entry['name'])
+            if os.path.exists(path):
+                os.unlink(path)
+        for entry in server_entries:
+            place(entry)
+    finally:
+        if restart:
+            subprocess.run(['systemctl', 'start', 'minecraft'], check=True)
+
+    if installed is not None and installed.get('version') != target.get('version'):
+        agent_common.atomic_write_json(PREVIOUS_FILE, installed)
+    agent_common.atomic_write_json(INSTALLED_FILE, target)
+    summary['restarted'] = restart
+    return summary
+
+
+def prune():
+    """適用済み・1つ前のマニフェストから参照されていないキャッシュを削除"""
+    keep = set()
+    for manifest in (load_json(INSTALLED_FILE), load_json(PREVIOUS_FILE)):
+        keep.update(entry['sha256'] for entry in (manifest or {}).get('mods', []))
+    removed = []
+    for name in os.listdir(CACHE_DIR) if os.path.isdir(CACHE_DIR) else []:
+        if name.endswith('.jar') and name[:-4] not in keep:
+            os.unlink(os.path.join(CACHE_DIR, name))
+            removed.append(name)
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MODの差分同期')
+    parser.add_argument('--bucket', default=DEFAULT_BUCKET)
+    parser.add_argument('--manifest-version', help='適用するマニフェストのバージョン（未指定なら現在のもの）')
+    parser.add_argument('--rollback', action='store_true',
+                        help='1つ前に適用していたマニフェストに戻す（キャッシュにあればダウンロードなし）')
+    parser.add_argument('--parallel', type=int, default=PARALLEL)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--prune', action='store_true', help='不要になったキャッシュを削除')
+    args = parser.parse_args(argv)
+
+    if args.rollback:
+        target = load_json(PREVIOUS_FILE)
+        if target is None:
+            print(json.dumps({'error': 'no previous manifest'}))
+            return 1
+        summary = apply(target, args.bucket, args.parallel, args.dry_run)
+    else:
+        target = fetch_manifest(args.bucket, args.manifest_version)
+        if not os.path.exists(INSTALLED_FILE):
+            target = bootstrap(target, args.bucket, publish=not args.dry_run)
+        summary = apply(target, args.bucket, args.parallel, args.dry_run)
+
+    if args.prune and not args.dry_run:
+        summary['pruned'] = prune()
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+import gzip
+import json
+import struct
+import sys
+import zlib
+
+# NBT の遅延読み込み（level.dat / playerdata / チャンク）
+#
+# 木全体を作らず、指定したパス（例: Data.SpawnX, Pos[1], Inventory）の値だけを取り出す。
+# 要求されていないタグは長さだけ読んで読み飛ばし、数値の配列・リストはまとめて1回のシークで飛ばす。
+# すべてのパスが見つかった時点で読むのをやめる。
+#
+# パスの書き方: 複合タグの名前を . でつなぎ、リストの要素は [n]（例: Data.Player.Inventory[0].id）
+
+TAG_END = 0
+TAG_BYTE = 1
+TAG_SHORT = 2
+TAG_INT = 3
+TAG_LONG = 4
+TAG_FLOAT = 5
+TAG_DOUBLE = 6
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
+
+SCALARS = {
+    TAG_BYTE: struct.Struct('>b'),
+    TAG_SHORT: struct.Struct('>h'),
+    TAG_INT: struct.Struct('>i'),
+    TAG_LONG: struct.Struct('>q'),
+    TAG_FLOAT: struct.Struct('>f'),
+    TAG_DOUBLE: struct.Struct('>d'),
+}
+ARRAYS = {TAG_BYTE_ARRAY: 'b', TAG_INT_ARRAY: 'i', TAG_LONG_ARRAY: 'q'}
+ARRAY_ITEM_SIZE = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_LONG_ARRAY: 8}
+# 固定長の型の大きさ（型番号で引く。可変長は 0）
+FIXED_SIZE = (0, 1, 2, 4, 8, 4, 8)
+U16 = struct.Struct('>H')
+I32 = struct.Struct('>i')
+
+
+class NBTError(Exception):
+    """NBT の形式が不正"""
+
+
+def decompress(raw):
+    """gzip / zlib / 無圧縮 を先頭のバイトで判別して展開する"""
+    if raw[:2] == b'\x1f\x8b':
+        return gzip.decompress(raw)
+    if raw[:1] == b'\x78':
+        return zlib.decompress(raw)
+    return raw
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return decompress(f.read())
+
+
+def parse_path(path):
+    """'Data.Player.Pos[1]' → ['Data', 'Player', 'Pos', 1]"""
+    keys = []
+    for part in path.split('.'):
+        name, _, rest = part.partition('[')
+        if name:
+            keys.append(name)
+        while rest:
+            number, _, rest = rest.partition(']')
+            keys.append(int(number))
+            rest = rest[1:] if rest.startswith('[') else rest
+    return keys
+
+
+def _build_tree(paths):
+    """
+    パスを木にする。葉のノードは {None: 元のパス}
+    あるパスが別のパスの値に含まれる場合（Data と Data.Time）は短い方だけを読み、
+    長い方は derived（(パス, 短い方のパス, 残りのキー)）として後から取り出す
+    """
+    tree = {}
+    derived = []
+    for path in sorted(paths, key=lambda path: len(parse_path(path))):
+        keys = parse_path(path)
+        node = tree
+        for depth, key in enumerate(keys):
+            if None in node:
+                derived.append((path, node[None], keys[depth:]))
+                break
+            node = node.setdefault(key, {})
+        else:
+            if None in node:
+                derived.append((path, node[None], []))
+            else:
+                node[None] = path
+    return tree, derived
+
+
+def _count_leaves(node):
+    if None in node:
+        return 1
+    return sum(_count_leaves(child) for child in node.values())
+
+
+class _Done(Exception):
+    pass
+
+
+class Reader:
+    def __init__(self, data):
+        self.data = data
+
+    def _string(self, pos):
+        (length,) = U16.unpack_from(self.data, pos)
+        end = pos + 2 + length
+        return self.data[pos + 2:end].decode('utf-8', errors='replace'), end
+
+    def skip(self, tag, pos):
+        """
+        tag 型の値を読み飛ばした位置
+        読み飛ばしが処理時間の大半を占めるため、再帰せずに1つのループで処理する
+        """
+        data = self.data
+        fixed = FIXED_SIZE
+        u16 = U16.unpack_from
+        i32 = I32.unpack_from
+        # 読みかけの複合タグ（None）とリスト（[要素の型, 残りの要素数]）
+        stack = []
+        while True:
+            size = fixed[tag] if tag < len(fixed) else 0
+            if size:
+                pos += size
+            elif tag == TAG_STRING:
+                pos += 2 + u16(data, pos)[0]
+            elif tag in ARRAY_ITEM_SIZE:
+                pos += 4 + i32(data, pos)[0] * ARRAY_ITEM_SIZE[tag]
+            elif tag == TAG_LIST:
+                item, count = data[pos], i32(data, pos + 1)[0]
+                pos += 5
+                if item < len(fixed) and fixed[item]:
+                    pos += count * fixed[item]
+                elif count > 0:
+                    stack.append([item, count])
+            elif tag == TAG_COMPOUND:
+                stack.append(None)
+            else:
+                raise NBTError(f'unknown tag type {tag} at {pos}')
+
+            while stack:
+                top = stack[-1]
+                if top is None:
+                    tag = data[pos]
+                    # 複合タグの中の数値・文字列はここでまとめて飛ばす
+                    while tag and (tag < 7 or tag == TAG_STRING):
+                        pos += 3 + u16(data, pos + 1)[0]
+                        pos += fixed[tag] if tag < 7 else 2 + u16(data, pos)[0]
+                        tag = data[pos]
+                    if tag == TAG_END:
+                        pos += 1
+                        stack.pop()
+                        continue
+                    pos += 3 + u16(data, pos + 1)[0]
+                    break
+                if top[1] == 0:
+                    stack.pop()
+                    continue
+                top[1] -= 1
+                tag = top[0]
+                break
+            else:
+                return pos
+
+    def value(self, tag, pos):
+        """tag 型の値を Python の値にする: (値, 次の位置)"""
+        if tag in SCALARS:
+            return SCALARS[tag].unpack_from(self.data, pos)[0], pos + SCALARS[tag].size
+        if tag == TAG_STRING:
+            return self._string(pos)
+        if tag in ARRAYS:
+            (count,) = I32.unpack_from(self.data, pos)
+            values = struct.unpack_from(f'>{count}{ARRAYS[tag]}', self.data, pos + 4)
+            return list(values), pos + 4 + count * ARRAY_ITEM_SIZE[tag]
+        if tag == TAG_LIST:
+            item, count = self.data[pos], I32.unpack_from(self.data, pos + 1)[0]
+            pos += 5
+            if item in SCALARS:
+                scalar = SCALARS[item]
+                values = struct.unpack_from(f'>{count}{scalar.format[1:]}', self.data, pos)
+                return list(values), pos + count * scalar.size
+            values = []
+            for _ in range(count):
+                value, pos = self.value(item, pos)
+                values.append(value)
+            return values, pos
+        if tag == TAG_COMPOUND:
+            result = {}
+            while True:
+                child = self.data[pos]
+                if child == TAG_END:
+                    return result, pos + 1
+                name, pos = self._string(pos + 1)
+                result[name], pos = self.value(child, pos)
+        raise NBTError(f'unknown tag type {tag} at {pos}')
+
+    def root(self):
+        """ルートタグ: (型, 名前, 値の位置)"""
+        if not self.data:
+            raise NBTError('empty data')
+        tag = self.data[0]
+        if tag != TAG_COMPOUND:
+            raise NBTError(f'root tag is {tag}, not a compound')
+        name, pos = self._string(1)
+        return tag, name, pos
+
+    def select(self, paths):
+        """指定したパスの値だけを読む: {パス: 値}（存在しないパスは含めない）"""
+        tree, derived = _build_tree(paths)
+        self.found = {}
+        self.remaining = _count_leaves(tree)
+        tag, _, pos = self.root()
+        try:
+            self._select(tag, pos, tree)
+        except _Done:
+            pass
+        for path, parent, keys in derived:
+            if parent in self.found:
+                value = self.found[parent]
+                try:
+                    for key in keys:
+                        value = value[key]
+                except (KeyError, IndexError, TypeError):
+                    continue
+                self.found[path] = value
+        return self.found
+
+    def _take(self, node, tag, pos):
+        """node に対応する値を取り出し、次の位置を返す"""
+        if None in node:
+            self.found[node[None]], pos = self.value(tag, pos)
+            self.remaining -= 1
+            if self.remaining == 0:
+                raise _Done()
+            return pos
+        return self._select(tag, pos, node)
+
+    def _select(self, tag, pos, node):
+        if tag == TAG_COMPOUND:
+            while True:
+                child = self.data[pos]
+                if child == TAG_END:
+                    return pos + 1
+                (length,) = U16.unpack_from(self.data, pos + 1)
+                name = self.data[pos + 3:pos + 3 + length].decode('utf-8', errors='replace')
+                pos += 3 + length
+                sub = node.get(name)
+                if sub is not None:
+                    pos = self._take(sub, child, pos)
+                elif child < 7:
+                    pos += FIXED_SIZE[child]
+                else:
+                    pos = self.skip(child, pos)
+        if tag == TAG_LIST:
+            item, count = self.data[pos], I32.unpack_from(self.data, pos + 1)[0]
+            pos += 5
+            indexes = sorted(key for key in node if isinstance(key, int) and key < count)
+            if item in SCALARS:
+                # 数値のリストは要素の位置を計算で求める
+                size = SCALARS[item].size
+                for index in indexes:
+                    self._take(node[index], item, pos + index * size)
+                return pos + count * size
+            for index in range(count):
+                pos = self._take(node[index], item, pos) if index in node else self.skip(item, pos)
+            return pos
+        return self.skip(tag, pos)
+
+    def parse(self):
+        """木全体を読む（比較・デバッグ用）"""
+        tag, _, pos = self.root()
+        return self.value(tag, pos)[0]
+
+
+def get(data, *paths):
+    return Reader(data).select(paths)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print('usage: nbt.py FILE [PATH ...]  (例: nbt.py world/level.dat Data.LevelName Data.SpawnX)', file=sys.stderr)
+        return 2
+    data = load(argv[0])
+    result = get(data, *argv[1:]) if argv[1:] else Reader(data).parse()
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
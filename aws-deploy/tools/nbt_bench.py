@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import time
+
+import nbt
+import world_info
+
+# nbt.py のマイクロベンチマーク
+# level.dat とプレイヤーデータについて、木全体を読む場合と world_info が使うタグだけを読む場合を比べる。
+# 展開（gzip）は両方に共通なので別に計測する。
+#
+# 使い方（リポジトリのルートで）:
+#   python3 aws-deploy/tools/nbt_bench.py world
+
+
+def _per_call(repeat, func):
+    """repeat 回の平均（マイクロ秒）"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((time.perf_counter() - started) / repeat * 1e6, 1)
+
+
+def bench_file(path, fields, repeat):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = nbt.decompress(raw)
+    full = _per_call(repeat, lambda: nbt.Reader(data).parse())
+    lazy = _per_call(repeat, lambda: nbt.get(data, *fields))
+    return {
+        'file': os.path.basename(path),
+        'compressed_bytes': len(raw),
+        'nbt_bytes': len(data),
+        'decompress_us': _per_call(repeat, lambda: nbt.decompress(raw)),
+        'full_parse_us': full,
+        'lazy_get_us': lazy,
+        'speedup': round(full / lazy, 1) if lazy else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='NBTの全体読み込みと遅延読み込みの比較')
+    parser.add_argument('world', help='ワールドディレクトリ（例: リポジトリの world/）')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--players', type=int, default=100, help='プレイヤーデータをこの人数分読む場合の見積もり')
+    args = parser.parse_args(argv)
+
+    playerdata = os.path.join(args.world, 'playerdata')
+    player_files = sorted(
+        os.path.join(playerdata, name) for name in os.listdir(playerdata) if name.endswith('.dat')
+    ) if os.path.isdir(playerdata) else []
+    player_fields = list(world_info.PLAYER_FIELDS.values())
+
+    results = {'level': bench_file(os.path.join(args.world, 'level.dat'),
+                                   list(world_info.LEVEL_FIELDS.values()), args.repeat)}
+    results['players'] = [bench_file(path, player_fields, args.repeat) for path in player_files]
+    if results['players']:
+        first = results['players'][0]
+        results[f'estimate_{args.players}_players_ms'] = {
+            'full_parse': round((first['decompress_us'] + first['full_parse_us']) * args.players / 1000, 1),
+            'lazy_get': round((first['decompress_us'] + first['lazy_get_us']) * args.players / 1000, 1),
+        }
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# サーバー停止中に受け付けた server.properties の変更（次回起動時に反映する）
+#
+# 1件の変更ごとに config/<instance-id>/pending/log/<version>.json を「存在しなければ作成」
+# （If-None-Match: *）で追記する。同じ version を別の書き手が先に作っていれば次の version で
+# やり直すので、同時に変更しても上書きで消えることはなく、読み込み→書き戻しも要らない。
+#
+# 起動時は base.json（反映済みの version）より新しいログを version 順にまとめて1回で反映し、
+# base.json を ETag 付きの条件付き書き込み（If-Match）で進めてから反映済みのログを消す。
+# 最新のログ1件は消さずに残し、古い version を見ていた書き手が同じ番号を再利用しないようにする。
+# 一覧と base.json の読み込みの間にまとめが入ると base より古い番号で作成できてしまうので、
+# 追記した後に base.json を読み直し、反映済みの番号だったら消して base より新しい番号でやり直す。
+# 以前の形式（config/<instance-id>/server.properties.updates）が残っていれば最初にまとめて取り込む。
+#
+# Lambda（update_config.py、boto3 クライアント）とインスタンス上のツール（aws CLI）の両方から使うため、
+# 標準ライブラリのみに依存する。MemoryObjectStore はローカル検証用の S3 の代替。
+
+MAX_ATTEMPTS = 8
+VERSION_WIDTH = 10
+
+
+class PreconditionFailed(Exception):
+    """条件付き書き込みの条件が満たされなかった（他の書き手が先に書いた）"""
+
+
+class ConflictError(Exception):
+    """再試行しても書き込めなかった"""
+
+
+def _prefix(instance_id):
+    return f'config/{instance_id}/'
+
+
+class MemoryObjectStore:
+    """S3 の条件付き書き込みを真似たローカル代替（スレッドセーフ）"""
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def get(self, key):
+        """(本文, ETag)。無ければ None"""
+        with self._lock:
+            return self._objects.get(key)
+
+    def put(self, key, body, if_match=None, if_none_match=False):
+        with self._lock:
+            current = self._objects.get(key)
+            if if_none_match and current is not None:
+                raise PreconditionFailed(key)
+            if if_match is not None and (current is None or current[1] != if_match):
+                raise PreconditionFailed(key)
+            self._counter += 1
+            etag = f'"{self._counter}"'
+            self._objects[key] = (body, etag)
+            return etag
+
+    def list(self, prefix):
+        with self._lock:
+            return sorted(key for key in self._objects if key.startswith(prefix))
+
+    def delete(self, key):
+        with self._lock:
+            self._objects.pop(key, None)
+
+
+class BotoObjectStore:
+    """boto3 の S3 クライアントを使う実装（Lambda 用）"""
+
+    def __init__(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+
+    def _precondition(self, error):
+        code = error.response.get('Error', {}).get('Code')
+        return code in ('PreconditionFailed', 'ConditionalRequestConflict')
+
+    def get(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response['Body'].read().decode('utf-8'), response['ETag']
+
+    def put(self, key, body, if_match=None, if_none_match=False):
+        options = {}
+        if if_match is not None:
+            options['IfMatch'] = if_match
+        if if_none_match:
+            options['IfNoneMatch'] = '*'
+        try:
+            response = self.client.put_object(
+                Bucket=self.bucket, Key=key, Body=body.encode('utf-8'), ContentType='application/json', **options
+            )
+        except self.client.exceptions.ClientError as e:
+            if self._precondition(e):
+                raise PreconditionFailed(key)
+            raise
+        return response['ETag']
+
+    def list(self, prefix):
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(item['Key'] for item in page.get('Contents', []))
+        return sorted(keys)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+class CliObjectStore:
+    """aws CLI（s3api）を使う実装（インスタンス用）"""
+
+    def __init__(self, bucket):
+        import agent_common
+
+        self.aws_cli = agent_common.aws_cli
+        self.bucket = bucket
+
+    def get(self, key):
+        with tempfile.NamedTemporaryFile() as f:
+            try:
+                meta = json.loads(self.aws_cli(['s3api', 'get-object', '--bucket', self.bucket, '--key', key, f.name]))
+            except RuntimeError as e:
+                if 'NoSuchKey' in str(e) or 'Not Found' in str(e):
+                    return None
+                raise
+            return f.read().decode('utf-8'), meta['ETag']
+
+    def put(self, key, body, if_match=None, if_none_match=False):
+        args = ['s3api', 'put-object', '--bucket', self.bucket, '--key', key, '--content-type', 'application/json']
+        if if_match is not None:
+            args += ['--if-match', if_match]
+        if if_none_match:
+            args += ['--if-none-match', '*']
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.json') as f:
+            f.write(body)
+            f.flush()
+            try:
+                return json.loads(self.aws_cli(args + ['--body', f.name]))['ETag']
+            except RuntimeError as e:
+                if 'PreconditionFailed' in str(e) or 'ConditionalRequestConflict' in str(e):
+                    raise PreconditionFailed(key)
+                raise
+
+    def list(self, prefix):
+        output = self.aws_cli([
+            's3api', 'list-objects-v2', '--bucket', self.bucket, '--prefix', prefix,
+            '--query', 'Contents[].Key', '--output', 'json'
+        ])
+        return sorted(json.loads(output) or [])
+
+    def delete(self, key):
+        self.aws_cli(['s3api', 'delete-object', '--bucket', self.bucket, '--key', key])
+
+
+class ChangeLog:
+    """インスタンス1台分の変更ログ"""
+
+    def __init__(self, store, instance_id, sleep=time.sleep):
+        self.store = store
+        self.sleep = sleep
+        self.log_prefix = f'{_prefix(instance_id)}pending/log/'
+        self.base_key = f'{_prefix(instance_id)}pending/base.json'
+        self.legacy_key = f'{_prefix(instance_id)}server.properties.updates'
+
+    def _entry_key(self, version):
+        return f'{self.log_prefix}{version:0{VERSION_WIDTH}d}.json'
+
+    def _versions(self):
+        """ログの version の一覧（昇順）"""
+        versions = []
+        for key in self.store.list(self.log_prefix):
+            name = key[len(self.log_prefix):]
+            if name.endswith('.json') and name[:-5].isdigit():
+                versions.append(int(name[:-5]))
+        return sorted(versions)
+
+    def _load_base(self):
+        """(base, ETag)。まだ無ければ ETag は None"""
+        found = self.store.get(self.base_key)
+        if found is None:
+            return {'version': 0, 'properties': {}}, None
+        body, etag = found
+        return json.loads(body), etag
+
+    def _next_version(self):
+        versions = self._versions()
+        base_version = self._load_base()[0]['version']
+        return max(versions[-1] if versions else 0, base_version) + 1
+
+    def append(self, properties, author=None):
+        """変更を1件追記して version を返す"""
+        body = json.dumps({
+            'properties': properties,
+            'author': author,
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }, ensure_ascii=False)
+        version = self._next_version()
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                self.store.put(self._entry_key(version), body, if_none_match=True)
+            except PreconditionFailed:
+                # 他の書き手が先に書いた。一覧を取り直して次の番号を試す（書き手同士がぶつからないよう少しずらす）
+                self.sleep(random.uniform(0, 0.05 * (attempt + 1)))
+                version = self._next_version()
+                continue
+            base_version = self._load_base()[0]['version']
+            if version > base_version:
+                return version
+            # 書いている間にまとめが base を進めていた（この番号は反映済み扱いで読まれない）
+            self.store.delete(self._entry_key(version))
+            version = base_version + 1
+        raise ConflictError(f'{MAX_ATTEMPTS}回再試行しても変更を追記できませんでした')
+
+    def pending(self):
+        """未反映の変更をまとめたもの {'version', 'properties', 'entries'}"""
+        base, _ = self._load_base()
+        return self._merge(base, self._versions())
+
+    def _merge(self, base, versions):
+        properties = dict(base['properties'])
+        legacy = self.store.get(self.legacy_key)
+        if legacy is not None:
+            # 以前の形式は新しいログより前の変更として扱う
+            properties = {**json.loads(legacy[0]), **properties}
+        newer = [version for version in versions if version > base['version']]
+        for version in newer:
+            found = self.store.get(self._entry_key(version))
+            if found is not None:
+                properties.update(json.loads(found[0])['properties'])
+        return {
+            'version': newer[-1] if newer else base['version'],
+            'properties': properties,
+            'entries': len(newer) + (legacy is not None),
+        }
+
+    def compact(self, apply=None):
+        """
+        未反映の変更をまとめる。apply が指定されていればまとめた変更を渡して反映し、base を空にする
+        （apply が失敗した場合は何も進めない）。反映・まとめた変更を返す
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            base, etag = self._load_base()
+            versions = self._versions()
+            merged = self._merge(base, versions)
+            if merged['entries'] == 0 and (apply is None or not base['properties']):
+                return {}
+            if apply is not None and merged['properties']:
+                apply(merged['properties'])
+            new_base = json.dumps({
+                'version': merged['version'],
+                'properties': {} if apply is not None else merged['properties'],
+                'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }, ensure_ascii=False)
+            try:
+                if etag is None:
+                    self.store.put(self.base_key, new_base, if_none_match=True)
+                else:
+                    self.store.put(self.base_key, new_base, if_match=etag)
+            except PreconditionFailed:
+                # 別の起動処理が先に進めた。読み直してやり直す（反映は同じ値なので何度行っても同じ）
+                self.sleep(random.uniform(0, 0.05 * (attempt + 1)))
+                continue
+            # 最新の1件は番号の再利用を防ぐために残す
+            for version in versions[:-1]:
+                if version <= merged['version']:
+                    self.store.delete(self._entry_key(version))
+            if self.store.get(self.legacy_key) is not None:
+                self.store.delete(self.legacy_key)
+            return merged['properties']
+        raise ConflictError(f'{MAX_ATTEMPTS}回再試行しても変更をまとめられませんでした')
+
+
+def apply_to_properties(path, properties):
+    """まとめた変更を server.properties に1回で書き込む（不正な値は読み飛ばす）"""
+    import server_properties
+
+    updates = {}
+    for name, value in properties.items():
+        try:
+            updates[name] = server_properties.normalize(name, value)
+        except server_properties.PropertyError as e:
+            print(f'Skipping pending property: {e}')
+    return server_properties.apply(path, updates) if updates else {}
+
+
+def main(argv=None):
+    import agent_common
+
+    parser = argparse.ArgumentParser(description='停止中に受け付けた server.properties の変更')
+    parser.add_argument('--bucket', default=os.environ.get('MODS_BUCKET', 'minecraft-server-mods-temp'))
+    parser.add_argument('--instance-id')
+    parser.add_argument('--file', default=os.path.join(agent_common.SERVER_DIR, 'server.properties'))
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('show', help='未反映の変更')
+    sub.add_parser('apply', help='未反映の変更をまとめて server.properties に反映する（起動前に実行）')
+    args = parser.parse_args(argv)
+
+    log = ChangeLog(CliObjectStore(args.bucket), args.instance_id or agent_common.instance_id())
+    if args.command == 'show':
+        print(json.dumps(log.pending(), ensure_ascii=False))
+        return 0
+
+    changed = {}
+    log.compact(apply=lambda properties: changed.update(apply_to_properties(args.file, properties)))
+    print(json.dumps({'changed': changed}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
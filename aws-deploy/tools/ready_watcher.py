@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import gzip
+import json
+import os
+import sys
+import time
+
+import agent_common
+import mclog
+
+# Minecraft起動完了の監視エージェント
+# logs/latest.log を差分だけ読み進め、起動フェーズと "Done (Xs)!" を検出したら
+# /minecraft/status/ready.json に書き出し、設定されていればコールバックURLを叩く。
+# Lambda側はこのファイル（またはコールバック）を見るだけでよく、ログ全体をgrepする必要がない。
+
+LOG_FILE = os.path.join(agent_common.SERVER_DIR, 'logs', 'latest.log')
+STATUS_FILE = os.path.join(agent_common.STATUS_DIR, 'ready.json')
+POLL_INTERVAL = float(os.environ.get('READY_POLL_INTERVAL', '0.5'))
+# これより古い latest.log は前回起動時のものとみなし、ローテーションを待つ
+STALE_LOG_SLACK = 5
+
+
+class ReadyTracker:
+    """ログレコードから起動状態を組み立てる"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.status = 'starting'
+        self.phase = None
+        self.phases = {}
+        self.first_timestamp = None
+        self.done_seconds = None
+        self.boot_seconds = None
+        self.ready_at = None
+
+    def feed(self, record):
+        """状態が変化した場合のみイベント名（フェーズ名 / 'stopping'）を返す"""
+        if record.timestamp is not None and self.first_timestamp is None:
+            self.first_timestamp = record.timestamp
+
+        if self.status == 'ready' and mclog.STOPPING.match(record.message):
+            self.status = 'stopping'
+            return 'stopping'
+
+        phase = mclog.startup_phase(record.message)
+        if phase is None or phase in self.phases:
+            return None
+
+        self.phase = phase
+        self.phases[phase] = record.timestamp.isoformat() if record.timestamp else None
+        if phase == 'ready':
+            self.status = 'ready'
+            self.done_seconds = float(mclog.DONE.match(record.message).group(1))
+            self.ready_at = self.phases[phase]
+            if record.timestamp and self.first_timestamp:
+                self.boot_seconds = round((record.timestamp - self.first_timestamp).total_seconds(), 3)
+        return phase
+
+    def phase_durations(self):
+        """各フェーズの所要時間（次のフェーズ開始まで）"""
+        names = [name for name, _ in mclog.STARTUP_PHASES if self.phases.get(name)]
+        durations = {}
+        for current, following in zip(names, names[1:]):
+            start = datetime.datetime.fromisoformat(self.phases[current])
+            end = datetime.datetime.fromisoformat(self.phases[following])
+            durations[current] = round((end - start).total_seconds(), 3)
+        return durations
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'ready': self.status == 'ready',
+            'phase': self.phase,
+            'phases': self.phases,
+            'phase_durations': self.phase_durations(),
+            'done_seconds': self.done_seconds,
+            'boot_seconds': self.boot_seconds,
+            'ready_at': self.ready_at,
+            'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+
+
+class Publisher:
+    """状態ファイルの書き出しと、起動完了時のコールバック"""
+
+    def __init__(self, status_file, callback_url=None):
+        self.status_file = status_file
+        self.callback_url = callback_url
+
+    def publish(self, tracker, event):
+        data = tracker.to_dict()
+        data['event'] = event
+        agent_common.atomic_write_json(self.status_file, data)
+        print(f'[ready-watcher] {event}: {json.dumps(data, ensure_ascii=False)}', flush=True)
+
+        if event == 'ready' and self.callback_url:
+            try:
+                agent_common.http_get(self.callback_url)
+            except Exception as e:
+                print(f'[ready-watcher] callback failed: {e}', flush=True)
+
+
+def _log_is_stale(path, started_at):
+    try:
+        return os.stat(path).st_mtime < started_at - STALE_LOG_SLACK
+    except FileNotFoundError:
+        return False
+
+
+def watch(log_file, publisher, poll_interval=POLL_INTERVAL):
+    """ログを追いかけ続ける（systemdサービスとして常駐）"""
+    started_at = time.time()
+    tracker = ReadyTracker()
+    follower = mclog.LogFollower(log_file, from_start=not _log_is_stale(log_file, started_at))
+    publisher.publish(tracker, 'watching')
+
+    while True:
+        lines = follower.read_lines()
+        if follower.rotated:
+            # Minecraftの再起動で latest.log が作り直された
+            tracker.reset()
+            publisher.publish(tracker, 'rotated')
+        for line in lines:
+            record = mclog.parse_line(line)
+            if record is None:
+                continue
+            event = tracker.feed(record)
+            if event is not None:
+                publisher.publish(tracker, event)
+        if not lines:
+            time.sleep(poll_interval)
+
+
+def analyze(path):
+    """既存のログ（.log / .log.gz）から起動フェーズを集計して返す"""
+    opener = gzip.open if path.endswith('.gz') else open
+    tracker = ReadyTracker()
+    with opener(path, 'rb') as f:
+        for raw in f:
+            record = mclog.parse_line(mclog.decode(raw))
+            if record is not None:
+                tracker.feed(record)
+    return tracker.to_dict()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Minecraft起動完了の監視エージェント')
+    parser.add_argument('--log', default=LOG_FILE)
+    parser.add_argument('--status-file', default=STATUS_FILE)
+    parser.add_argument('--callback-url', default=os.environ.get('READY_CALLBACK_URL'),
+                        help='起動完了時にGETするURL（未指定ならParameter Storeから取得）')
+    parser.add_argument('--analyze', metavar='LOG', help='既存ログを解析して結果を表示して終了')
+    args = parser.parse_args(argv)
+
+    if args.analyze:
+        print(json.dumps(analyze(args.analyze), ensure_ascii=False, indent=2))
+        return 0
+
+    callback_url = args.callback_url
+    if callback_url is None:
+        try:
+            callback_url = agent_common.get_parameter(
+                f'/minecraft/{agent_common.instance_id()}/ready_callback_url'
+            )
+        except Exception as e:
+            print(f'[ready-watcher] callback URL lookup failed: {e}', flush=True)
+
+    watch(args.log, Publisher(args.status_file, callback_url))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
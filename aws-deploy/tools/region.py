@@ -0,0 +1,187 @@
+import gzip
+import mmap
+import os
+import re
+import struct
+import zlib
+
+# Anvil リージョンファイル（*.mca）の読み書き
+#
+# 先頭 8KiB がヘッダー:
+#   0x0000-0x0FFF  位置テーブル 1024件 × 4バイト（3バイト: 4KiBセクター単位のオフセット, 1バイト: セクター数）
+#   0x1000-0x1FFF  タイムスタンプ 1024件 × 4バイト（最終保存時刻、エポック秒）
+# チャンク本体は オフセット位置から「長さ(4バイト, BE) + 圧縮形式(1バイト) + データ」。
+# 圧縮形式に 128 が立っている場合、データは外部ファイル c.<x>.<z>.mcc にある。
+
+SECTOR_SIZE = 4096
+HEADER_SIZE = 2 * SECTOR_SIZE
+CHUNK_COUNT = 1024
+
+COMPRESSION_GZIP = 1
+COMPRESSION_ZLIB = 2
+COMPRESSION_NONE = 3
+COMPRESSION_LZ4 = 4
+EXTERNAL_FLAG = 128
+
+REGION_NAME = re.compile(r'^r\.(-?\d+)\.(-?\d+)\.mca$')
+
+
+class RegionError(Exception):
+    """リージョンファイルの形式が不正"""
+
+
+def region_coords(path):
+    """r.<x>.<z>.mca のリージョン座標。形式が違えば None"""
+    match = REGION_NAME.match(os.path.basename(path))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def chunk_coords(region_x, region_z, index):
+    """ヘッダーのインデックスからワールドのチャンク座標へ"""
+    return region_x * 32 + index % 32, region_z * 32 + index // 32
+
+
+def parse_header(header):
+    """
+    ヘッダー（8KiB）を [(index, sector_offset, sector_count, timestamp), ...] にする
+    未生成のチャンク（位置が0）は含めない
+    """
+    if len(header) < HEADER_SIZE:
+        raise RegionError(f'header too short ({len(header)} bytes)')
+    locations = struct.unpack_from('>1024I', header, 0)
+    timestamps = struct.unpack_from('>1024I', header, SECTOR_SIZE)
+    entries = []
+    for index in range(CHUNK_COUNT):
+        location = locations[index]
+        if location == 0:
+            continue
+        entries.append((index, location >> 8, location & 0xFF, timestamps[index]))
+    return entries
+
+
+def read_header(f):
+    f.seek(0)
+    header = f.read(HEADER_SIZE)
+    if not header:
+        return []
+    return parse_header(header)
+
+
+def read_chunk(f, sector_offset, sector_count):
+    """
+    チャンクのバイト列（長さ・圧縮形式を含む、パディングなし）を返す
+    書き込み途中などで長さが不正な場合は RegionError
+    """
+    f.seek(sector_offset * SECTOR_SIZE)
+    prefix = f.read(5)
+    if len(prefix) < 5:
+        raise RegionError(f'chunk at sector {sector_offset} is truncated')
+    length, compression = struct.unpack('>IB', prefix)
+    if length == 0 or length + 4 > sector_count * SECTOR_SIZE:
+        raise RegionError(f'chunk at sector {sector_offset} has invalid length {length}')
+    data = f.read(length - 1)
+    if len(data) < length - 1:
+        raise RegionError(f'chunk at sector {sector_offset} is truncated')
+    return prefix + data
+
+
+def chunk_compression(chunk):
+    return chunk[4]
+
+
+def decompress_chunk(compression, data):
+    """チャンクのNBT（非圧縮のバイト列）"""
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    if compression == COMPRESSION_GZIP:
+        return gzip.decompress(data)
+    if compression == COMPRESSION_NONE:
+        return bytes(data)
+    raise RegionError(f'unsupported compression type {compression}')
+
+
+class RegionFile:
+    """
+    mmap で開いたリージョンファイル
+    ヘッダーとチャンクはファイルからコピーせずに参照し、NBTは要求されたときだけ展開する
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.map = None
+        if self.size >= HEADER_SIZE:
+            with open(path, 'rb') as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def entries(self):
+        """[(index, sector_offset, sector_count, timestamp), ...]（未生成のリージョンは空）"""
+        return parse_header(self.map) if self.map is not None else []
+
+    def chunk_header(self, sector_offset):
+        """(長さ, 圧縮形式)。範囲外なら RegionError"""
+        position = sector_offset * SECTOR_SIZE
+        if position + 5 > self.size:
+            raise RegionError(f'chunk at sector {sector_offset} is outside the file')
+        return struct.unpack_from('>IB', self.map, position)
+
+    def chunk_nbt(self, index, sector_offset):
+        """チャンクのNBTを展開して返す（外部ファイル c.<x>.<z>.mcc にも対応）"""
+        length, compression = self.chunk_header(sector_offset)
+        if compression & EXTERNAL_FLAG:
+            coords = region_coords(self.path)
+            if coords is None:
+                raise RegionError(f'{self.path}: cannot locate external chunk')
+            x, z = chunk_coords(coords[0], coords[1], index)
+            with open(os.path.join(os.path.dirname(self.path), f'c.{x}.{z}.mcc'), 'rb') as f:
+                return decompress_chunk(compression & ~EXTERNAL_FLAG, f.read())
+        start = sector_offset * SECTOR_SIZE + 5
+        if length == 0 or start + length - 1 > self.size:
+            raise RegionError(f'chunk at sector {sector_offset} has invalid length {length}')
+        with memoryview(self.map)[start:start + length - 1] as data:
+            return decompress_chunk(compression, data)
+
+
+def write_region(path, chunks, size=None):
+    """
+    チャンクを元の位置に書き戻してリージョンファイルを作る
+    chunks: [(index, sector_offset, sector_count, timestamp, data), ...]
+    size: 元のファイルサイズ（指定すれば同じ長さにそろえる）
+    """
+    locations = [0] * CHUNK_COUNT
+    timestamps = [0] * CHUNK_COUNT
+    end = HEADER_SIZE
+    tmp_path = path + '.tmp'
+    if size == 0 and not chunks:
+        # まだ何も保存されていないリージョン（0バイトのファイル）はそのまま
+        open(tmp_path, 'wb').close()
+        os.replace(tmp_path, path)
+        return
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * HEADER_SIZE)
+        for index, sector_offset, sector_count, timestamp, data in chunks:
+            if sector_offset < 2 or len(data) > sector_count * SECTOR_SIZE:
+                raise RegionError(f'chunk {index} does not fit at sector {sector_offset}')
+            locations[index] = (sector_offset << 8) | sector_count
+            timestamps[index] = timestamp
+            f.seek(sector_offset * SECTOR_SIZE)
+            f.write(data)
+            f.write(b'\0' * (sector_count * SECTOR_SIZE - len(data)))
+            end = max(end, (sector_offset + sector_count) * SECTOR_SIZE)
+        if size is not None and size > end:
+            f.truncate(size)
+        f.seek(0)
+        f.write(struct.pack('>1024I', *locations))
+        f.write(struct.pack('>1024I', *timestamps))
+    os.replace(tmp_path, path)
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import agent_common
+import mclog
+import ready_watcher
+
+# ログから取り出すサーバーの健全性（ラグ）指標
+#
+# 次の3つのログを差分だけ読み進め（mclog.LogFollower）、1分ごとのバケットに集計する。
+#   logs/latest.log … "Can't keep up! ... Running Xms or Y ticks behind"、ウォッチドッグ（1tickが長すぎる）、起動フェーズ
+#   logs/debug.log  … FML の "Attempting to inject @EventBusSubscriber ... for <modid>" からMODごとの構築時間
+#   logs/gc.log     … JVM の GC ログ（-Xlog:gc:file=...:time,level,tags）の停止時間
+# サーバーの起動ごとに「実行（run）」を作り、起動時の server.properties の主要な値と MOD の一覧を記録する。
+# 設定（view-distance など）を変えた前後で、実行ごとのラグを比べられる。
+#
+# 履歴は /minecraft/status/health.json（直近 RETENTION_DAYS 日のバケットと直近 MAX_RUNS 回の実行）。
+# 読んだ位置も保存するので、常駐プロセスが再起動しても二重に数えない。
+
+LOG_DIR = os.path.join(agent_common.SERVER_DIR, 'logs')
+PROPERTIES_FILE = os.path.join(agent_common.SERVER_DIR, 'server.properties')
+MODS_DIR = os.path.join(agent_common.SERVER_DIR, 'mods')
+HISTORY_FILE = os.path.join(agent_common.STATUS_DIR, 'health.json')
+RETENTION_DAYS = 14
+MAX_RUNS = 50
+POLL_INTERVAL = 1.0
+SAVE_INTERVAL = 30
+
+# 比較に使う server.properties の値
+TRACKED_PROPERTIES = ('view-distance', 'simulation-distance', 'max-players', 'max-tick-time', 'difficulty',
+                      'entity-broadcast-range-percentage', 'sync-chunk-writes')
+
+CANT_KEEP_UP = re.compile(r"^Can't keep up! Is the server overloaded\? Running (\d+)ms or (\d+) ticks behind")
+WATCHDOG = re.compile(r'^A single server tick took ([\d.]+) seconds')
+MOD_CONSTRUCT = re.compile(r'^Attempting to inject @EventBusSubscriber classes into the eventbus for (\S+)')
+# [2026-02-15T18:27:10.123+0900][info][gc] GC(12) Pause Young (Normal) (G1 Evacuation Pause) 512M->128M(2048M) 12.345ms
+GC_LINE = re.compile(r'^\[([^\]]+)\]\[\w+\]\[gc[^\]]*\] GC\(\d+\) (Pause [^\d]*?) .*?([\d.]+)ms\s*$')
+
+# バケットの列
+BUCKET_FIELDS = ('lag_events', 'ticks_behind', 'ticks_behind_max', 'ms_behind_max', 'watchdog',
+                 'gc_pauses', 'gc_pause_ms', 'gc_pause_ms_max')
+TOTAL_FIELDS = ('lag_events', 'ticks_behind', 'watchdog', 'gc_pauses', 'gc_pause_ms')
+
+
+def _epoch(timestamp):
+    """ログの時刻（インスタンスのローカル時刻、naive）をエポック秒に"""
+    return time.mktime(timestamp.timetuple()) + timestamp.microsecond / 1e6
+
+
+def _gc_epoch(text):
+    """JVM の時刻（2026-02-15T18:27:10.123+0900）をエポック秒に"""
+    text = re.sub(r'([+-]\d{2})(\d{2})$', r'\1:\2', text)
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+def _format_time(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).isoformat()
+
+
+def read_properties(path=PROPERTIES_FILE):
+    properties = {}
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith(('#', '!')) or '=' not in line:
+                    continue
+                key, _, value = line.partition('=')
+                properties[key.strip()] = value.strip()
+    except FileNotFoundError:
+        pass
+    return properties
+
+
+def config_snapshot(properties_file=PROPERTIES_FILE, mods_dir=MODS_DIR):
+    """起動時の設定（比較に使う値と MOD の一覧）とそのハッシュ"""
+    properties = read_properties(properties_file)
+    try:
+        mods = sorted(name for name in os.listdir(mods_dir) if name.endswith('.jar'))
+    except FileNotFoundError:
+        mods = []
+    config = {
+        'properties': {key: properties[key] for key in TRACKED_PROPERTIES if key in properties},
+        'mods': mods,
+    }
+    digest = hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return config, digest
+
+
+class History:
+    """health.json の読み書き（バケットは {分の先頭のエポック秒: [BUCKET_FIELDS の値]}）"""
+
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self.buckets = {}
+        self.runs = []
+        self.cursors = {}
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return self
+        self.buckets = {int(minute): values for minute, values in data.get('buckets', {}).items()}
+        self.runs = data.get('runs', [])
+        self.cursors = data.get('cursors', {})
+        return self
+
+    def save(self, now=None):
+        now = time.time() if now is None else now
+        cutoff = now - RETENTION_DAYS * 86400
+        self.buckets = {minute: values for minute, values in self.buckets.items() if minute >= cutoff}
+        self.runs = self.runs[-MAX_RUNS:]
+        agent_common.atomic_write_json(self.path, {
+            'buckets': {str(minute): values for minute, values in sorted(self.buckets.items())},
+            'runs': self.runs,
+            'cursors': self.cursors,
+        })
+
+    def bucket(self, at):
+        minute = int(at // 60 * 60)
+        values = self.buckets.get(minute)
+        if values is None:
+            values = self.buckets[minute] = [0] * len(BUCKET_FIELDS)
+        return values
+
+
+class Collector:
+    """ログレコードを履歴に反映する"""
+
+    def __init__(self, history, snapshot=config_snapshot):
+        self.history = history
+        self.snapshot = snapshot
+        self.tracker = ready_watcher.ReadyTracker()
+        self.run = history.runs[-1] if history.runs else None
+        # スレッドごとの構築中の MOD: (modid, 開始時刻)
+        self.constructing = {}
+        self.dirty = False
+
+    def _start_run(self, at):
+        config, digest = self.snapshot()
+        self.tracker.reset()
+        self.constructing = {}
+        self.run = {
+            'started_at': at,
+            'last_seen': at,
+            'ready_at': None,
+            'boot_seconds': None,
+            'phase_durations': {},
+            'mods': {},
+            'config': config,
+            'config_hash': digest,
+        }
+        self.run.update({field: 0 for field in TOTAL_FIELDS})
+        self.run['ticks_behind_max'] = 0
+        self.history.runs.append(self.run)
+
+    def _add(self, at, **values):
+        bucket = self.history.bucket(at)
+        for field, value in values.items():
+            index = BUCKET_FIELDS.index(field)
+            if field.endswith('_max'):
+                bucket[index] = max(bucket[index], value)
+            else:
+                bucket[index] += value
+        if self.run is not None:
+            for field in TOTAL_FIELDS:
+                self.run[field] += values.get(field, 0)
+            self.run['ticks_behind_max'] = max(self.run['ticks_behind_max'], values.get('ticks_behind_max', 0))
+        self.dirty = True
+
+    def feed_server(self, record):
+        if record.timestamp is None:
+            return
+        at = _epoch(record.timestamp)
+        message = record.message
+        phase = mclog.startup_phase(message)
+        # ログのローテーション後の最初の行、または起動の最初のフェーズで新しい実行にする
+        if self.run is None or (phase == 'launching' and self.tracker.phases):
+            self._start_run(at)
+        self.run['last_seen'] = at
+
+        if self.tracker.feed(record) == phase and phase is not None:
+            self.run['phase_durations'] = self.tracker.phase_durations()
+            if phase == 'ready':
+                self.run['ready_at'] = at
+                self.run['boot_seconds'] = self.tracker.boot_seconds
+            self.dirty = True
+            return
+
+        match = CANT_KEEP_UP.match(message)
+        if match:
+            ms, ticks = int(match.group(1)), int(match.group(2))
+            self._add(at, lag_events=1, ticks_behind=ticks, ticks_behind_max=ticks, ms_behind_max=ms)
+            return
+        match = WATCHDOG.match(message)
+        if match:
+            self._add(at, watchdog=1, ms_behind_max=int(float(match.group(1)) * 1000))
+
+    def rotated(self):
+        """latest.log が作り直された（サーバーの再起動）"""
+        self.run = None
+
+    def feed_debug(self, record):
+        """debug.log: MOD ごとの構築時間（同じスレッドで次の MOD が始まるまで、またはそのスレッドの最後の行まで）"""
+        if record.timestamp is None or self.run is None:
+            return
+        at = _epoch(record.timestamp)
+        if at < self.run['started_at'] - 1:
+            return
+        match = MOD_CONSTRUCT.match(record.message)
+        current = self.constructing.get(record.thread)
+        if current is not None:
+            modid, started = current
+            self.run['mods'][modid] = round(at - started, 3)
+            self.dirty = True
+        if match:
+            self.constructing[record.thread] = (match.group(1), at)
+
+    def feed_gc(self, line):
+        match = GC_LINE.match(line)
+        if not match:
+            return
+        at = _gc_epoch(match.group(1))
+        if at is None:
+            return
+        pause = float(match.group(3))
+        self._add(at, gc_pauses=1, gc_pause_ms=pause, gc_pause_ms_max=pause)
+
+
+def _restore_cursor(follower, cursor):
+    """保存した位置が同じファイル（inode）のものなら、そこから読み進める"""
+    if not cursor:
+        return False
+    try:
+        st = os.stat(follower.path)
+    except FileNotFoundError:
+        return False
+    if st.st_ino != cursor.get('inode') or st.st_size < cursor.get('offset', 0):
+        return False
+    follower.inode = cursor['inode']
+    follower.offset = cursor['offset']
+    return True
+
+
+def collect(log_dir=LOG_DIR, history_file=HISTORY_FILE, poll_interval=POLL_INTERVAL, once=False):
+    """ログを追いかけて履歴を更新し続ける（once=True なら今ある分だけ読んで終わる）"""
+    history = History(history_file).load()
+    collector = Collector(history)
+    followers = {
+        'server': mclog.LogFollower(os.path.join(log_dir, 'latest.log'), from_start=True),
+        'debug': mclog.LogFollower(os.path.join(log_dir, 'debug.log'), from_start=True),
+        'gc': mclog.LogFollower(os.path.join(log_dir, 'gc.log'), from_start=True),
+    }
+    for name, follower in followers.items():
+        if not _restore_cursor(follower, history.cursors.get(name)) and name == 'server':
+            # 前回とは別の latest.log（止まっている間に再起動した）
+            collector.rotated()
+    saved_at = time.monotonic()
+
+    while True:
+        read = 0
+        # latest.log を先に読み、実行（run）が決まってから debug.log の MOD を割り当てる
+        for name, follower in followers.items():
+            lines = follower.read_lines()
+            read += len(lines)
+            if name == 'server' and follower.rotated:
+                collector.rotated()
+            for line in lines:
+                if name == 'gc':
+                    collector.feed_gc(line)
+                    continue
+                record = mclog.parse_line(line)
+                if record is None:
+                    continue
+                if name == 'server':
+                    collector.feed_server(record)
+                else:
+                    collector.feed_debug(record)
+            if lines or follower.rotated:
+                history.cursors[name] = follower.state()
+                collector.dirty = True
+
+        if collector.dirty and (once or time.monotonic() - saved_at >= SAVE_INTERVAL):
+            history.save()
+            collector.dirty = False
+            saved_at = time.monotonic()
+        if once and not read:
+            return history
+        if not read:
+            time.sleep(poll_interval)
+
+
+def window(history, since, until):
+    """[since, until) の集計"""
+    totals = [0] * len(BUCKET_FIELDS)
+    for minute, values in history.buckets.items():
+        if since <= minute < until:
+            for index, field in enumerate(BUCKET_FIELDS):
+                if field.endswith('_max'):
+                    totals[index] = max(totals[index], values[index])
+                else:
+                    totals[index] += values[index]
+    result = dict(zip(BUCKET_FIELDS, totals))
+    minutes = max(1.0, (until - since) / 60)
+    result['minutes'] = round(minutes, 1)
+    result['lag_events_per_minute'] = round(result['lag_events'] / minutes, 3)
+    result['gc_pause_ms'] = round(result['gc_pause_ms'], 1)
+    return result
+
+
+def series(history, since, until):
+    """[since, until) の1分ごとの値（何も起きなかった分は含めない）"""
+    return [
+        dict(zip(BUCKET_FIELDS, values), time=_format_time(minute))
+        for minute, values in sorted(history.buckets.items())
+        if since <= minute < until
+    ]
+
+
+def _run_summary(run):
+    uptime_hours = max(1 / 60, (run['last_seen'] - run['started_at']) / 3600)
+    return {
+        'started_at': _format_time(run['started_at']),
+        'uptime_hours': round(uptime_hours, 2),
+        'boot_seconds': run['boot_seconds'],
+        'config_hash': run['config_hash'],
+        'lag_events': run['lag_events'],
+        'lag_events_per_hour': round(run['lag_events'] / uptime_hours, 2),
+        'ticks_behind_max': run['ticks_behind_max'],
+        'watchdog': run['watchdog'],
+        'gc_pauses_per_hour': round(run['gc_pauses'] / uptime_hours, 2),
+    }
+
+
+def compare_configs(history):
+    """
+    設定（config_hash）ごとの集計を、その設定で最後に動いた順に返す
+    changed は1つ前の設定から変わった値（MOD は追加・削除）
+    """
+    groups = {}
+    for run in history.runs:
+        group = groups.get(run['config_hash'])
+        if group is None:
+            group = groups[run['config_hash']] = {'config': run['config'], 'runs': [], 'last_seen': 0}
+        group['runs'].append(run)
+        group['last_seen'] = max(group['last_seen'], run['last_seen'])
+
+    result = []
+    previous = None
+    for digest, group in sorted(groups.items(), key=lambda item: item[1]['last_seen']):
+        runs = group['runs']
+        hours = sum(max(1 / 60, (run['last_seen'] - run['started_at']) / 3600) for run in runs)
+        lag_events = sum(run['lag_events'] for run in runs)
+        boots = [run['boot_seconds'] for run in runs if run['boot_seconds'] is not None]
+        entry = {
+            'config_hash': digest,
+            'properties': group['config']['properties'],
+            'runs': len(runs),
+            'uptime_hours': round(hours, 2),
+            'lag_events_per_hour': round(lag_events / hours, 2),
+            'ticks_behind_per_event': round(sum(run['ticks_behind'] for run in runs) / lag_events, 1)
+            if lag_events else 0,
+            'watchdog': sum(run['watchdog'] for run in runs),
+            'gc_pause_ms_per_hour': round(sum(run['gc_pause_ms'] for run in runs) / hours, 1),
+            'average_boot_seconds': round(sum(boots) / len(boots), 1) if boots else None,
+        }
+        if previous is not None:
+            before, after = previous['config'], group['config']
+            changed = {
+                key: [before['properties'].get(key), after['properties'].get(key)]
+                for key in sorted(set(before['properties']) | set(after['properties']))
+                if before['properties'].get(key) != after['properties'].get(key)
+            }
+            added = sorted(set(after['mods']) - set(before['mods']))
+            removed = sorted(set(before['mods']) - set(after['mods']))
+            if added or removed:
+                changed['mods'] = {'added': added, 'removed': removed}
+            entry['changed'] = changed
+        result.append(entry)
+        previous = group
+    return result
+
+
+def _fit_series(result, max_output):
+    """出力が max_output 文字を超える場合は、1分ごとの値を古いものから省く"""
+    result['series_truncated'] = False
+    size = len(json.dumps(result, ensure_ascii=False))
+    series_entries = result['series']
+    dropped = 0
+    while size > max_output and dropped < len(series_entries):
+        size -= len(json.dumps(series_entries[dropped], ensure_ascii=False)) + 2
+        dropped += 1
+    result['series'] = series_entries[dropped:]
+    result['series_truncated'] = dropped > 0
+
+
+def summary(history, minutes=60, now=None, top_mods=10, max_output=None):
+    """ステータスAPI用の要約（max_output を指定すると、超える分の1分ごとの値を古いものから省く）"""
+    now = time.time() if now is None else now
+    current = history.runs[-1] if history.runs else None
+    result = {
+        'last_hour': window(history, now - 3600, now),
+        'last_day': window(history, now - 86400, now),
+        'series': series(history, now - minutes * 60, now),
+        'current_run': None,
+        'configs': compare_configs(history),
+    }
+    if current is not None:
+        run = _run_summary(current)
+        run['ready_at'] = _format_time(current['ready_at']) if current['ready_at'] else None
+        run['phase_durations'] = current['phase_durations']
+        run['slowest_mods'] = sorted(current['mods'].items(), key=lambda item: -item[1])[:top_mods]
+        run['properties'] = current['config']['properties']
+        result['current_run'] = run
+    if max_output is not None:
+        _fit_series(result, max_output)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ログから取り出すサーバーの健全性（ラグ）指標')
+    parser.add_argument('--logs', default=LOG_DIR)
+    parser.add_argument('--file', default=HISTORY_FILE)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('collect', help='ログを追いかけて履歴を更新し続ける（systemdサービス）')
+    sub.add_parser('scan', help='今あるログを読んで履歴を更新して終わる')
+    show = sub.add_parser('summary', help='直近の指標・実行ごとの比較')
+    show.add_argument('--minutes', type=int, default=60, help='1分ごとの値を返す範囲')
+    show.add_argument('--scan', action='store_true', help='先に今あるログを読む')
+    show.add_argument('--max-output', type=int, help='出力の上限（文字数。超える分の1分ごとの値を古いものから省く）')
+    sub.add_parser('runs', help='実行（起動）ごとの指標')
+    args = parser.parse_args(argv)
+
+    if args.command == 'collect':
+        collect(args.logs, args.file)
+        return 0
+    if args.command == 'scan' or getattr(args, 'scan', False):
+        history = collect(args.logs, args.file, once=True)
+    else:
+        history = History(args.file).load()
+
+    if args.command == 'runs':
+        print(json.dumps([_run_summary(run) for run in history.runs], ensure_ascii=False))
+    elif args.command == 'summary':
+        print(json.dumps(summary(history, args.minutes, max_output=args.max_output), ensure_ascii=False))
+    else:
+        print(json.dumps({'runs': len(history.runs), 'buckets': len(history.buckets)}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
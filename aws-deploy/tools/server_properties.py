@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# server.properties の読み書き（java.util.Properties 形式）
+#
+# コメント・空行・行の順番はそのまま残し、変更したキーの行だけを書き換える（無いキーは末尾に追加）。
+# 書き込みは一時ファイル + rename で行い、サーバーが書きかけのファイルを読むことはない。
+# API から変更できるプロパティは PROPERTY_SPECS で型と範囲を検査する。
+# RUNTIME_COMMANDS にあるプロパティは RCON のコマンドで実行中のサーバーにも反映できる（再起動不要）。
+#
+# Lambda（update_config.py）とインスタンス上のツールの両方から使うため、標準ライブラリのみに依存する。
+
+# プロパティ名 → (型, 値の範囲)
+PROPERTY_SPECS = {
+    'enable-command-block': ('bool', None),
+    'difficulty': ('enum', ('peaceful', 'easy', 'normal', 'hard')),
+    'gamemode': ('enum', ('survival', 'creative', 'adventure', 'spectator')),
+    'max-players': ('int', (1, 1000)),
+    'pvp': ('bool', None),
+    'view-distance': ('int', (3, 32)),
+    'simulation-distance': ('int', (3, 32)),
+}
+
+# 実行中のサーバーに RCON で反映するコマンド
+RUNTIME_COMMANDS = {
+    'difficulty': 'difficulty {value}',
+    'gamemode': 'defaultgamemode {value}',
+}
+
+_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'f': '\f'}
+_SEPARATORS = '=: \t\f'
+
+
+class PropertyError(ValueError):
+    """更新できないプロパティ・不正な値"""
+
+
+def _unescape(text):
+    result = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char != '\\' or i + 1 == len(text):
+            result.append(char)
+            i += 1
+            continue
+        char = text[i + 1]
+        if char == 'u' and i + 6 <= len(text):
+            try:
+                result.append(chr(int(text[i + 2:i + 6], 16)))
+                i += 6
+                continue
+            except ValueError:
+                pass
+        result.append(_ESCAPES.get(char, char))
+        i += 2
+    return ''.join(result)
+
+
+def _escape(text, is_key=False):
+    result = []
+    for index, char in enumerate(text):
+        if char == ' ' and (is_key or index == 0):
+            result.append('\\ ')
+        elif char in '\\=:#!':
+            result.append('\\' + char)
+        elif char in '\t\n\r\f':
+            result.append('\\' + {'\t': 't', '\n': 'n', '\r': 'r', '\f': 'f'}[char])
+        elif ord(char) < 0x20 or ord(char) > 0x7e:
+            result.append(f'\\u{ord(char):04x}')
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+def _ends_with_continuation(line):
+    count = len(line) - len(line.rstrip('\\'))
+    return count % 2 == 1
+
+
+def _split_logical(logical):
+    """論理行を (キー, 値) に分ける"""
+    text = logical.lstrip(' \t\f')
+    i = 0
+    while i < len(text) and text[i] not in _SEPARATORS:
+        i += 2 if text[i] == '\\' else 1
+    key = text[:i]
+    rest = text[i:].lstrip(' \t\f')
+    if rest[:1] in ('=', ':'):
+        rest = rest[1:].lstrip(' \t\f')
+    return _unescape(key), _unescape(rest)
+
+
+class Properties:
+    """行を保持したままキーを読み書きする server.properties"""
+
+    def __init__(self, text=''):
+        # 各要素は [元の行のリスト, キー（コメント・空行は None）]
+        self.entries = []
+        self.values = {}
+        lines = text.splitlines()
+        i = 0
+        while i < len(lines):
+            raw = [lines[i]]
+            stripped = lines[i].lstrip(' \t\f')
+            if not stripped or stripped[0] in '#!':
+                self.entries.append([raw, None])
+                i += 1
+                continue
+            logical = lines[i]
+            while _ends_with_continuation(logical) and i + 1 < len(lines):
+                i += 1
+                raw.append(lines[i])
+                logical = logical[:-1] + lines[i].lstrip(' \t\f')
+            i += 1
+            key, value = _split_logical(logical)
+            self.entries.append([raw, key])
+            self.values[key] = value
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                return cls(f.read())
+        except FileNotFoundError:
+            return cls()
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        """値を変えた場合のみ True"""
+        if self.values.get(key) == value:
+            return False
+        line = f'{_escape(key, is_key=True)}={_escape(value)}'
+        matched = False
+        for entry in self.entries:
+            if entry[1] == key:
+                if matched:
+                    # 重複した行は後ろのものが有効になるので消しておく
+                    entry[0], entry[1] = [], None
+                else:
+                    entry[0] = [line]
+                    matched = True
+        if not matched:
+            self.entries.append([[line], key])
+        self.values[key] = value
+        return True
+
+    def dumps(self):
+        return ''.join(line + '\n' for raw, _ in self.entries for line in raw)
+
+    def save(self, path):
+        """一時ファイルに書いてから rename する（権限は元のファイルに合わせる）"""
+        directory = os.path.dirname(path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.properties')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.dumps())
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                stat = os.stat(path)
+                os.chmod(tmp_path, stat.st_mode & 0o7777)
+                if hasattr(os, 'chown'):
+                    os.chown(tmp_path, stat.st_uid, stat.st_gid)
+            except FileNotFoundError:
+                os.chmod(tmp_path, 0o644)
+            except PermissionError:
+                pass
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+def normalize(name, value):
+    """API から受け取った値を検査して server.properties に書く文字列にする"""
+    spec = PROPERTY_SPECS.get(name)
+    if spec is None:
+        raise PropertyError(f'プロパティ {name} は更新できません')
+    kind, allowed = spec
+    text = str(value).strip()
+    if isinstance(value, bool):
+        text = 'true' if value else 'false'
+    if kind == 'bool':
+        if text.lower() not in ('true', 'false'):
+            raise PropertyError(f'{name} は true / false で指定してください')
+        return text.lower()
+    if kind == 'int':
+        try:
+            number = int(text)
+        except ValueError:
+            raise PropertyError(f'{name} は整数で指定してください')
+        low, high = allowed
+        if not low <= number <= high:
+            raise PropertyError(f'{name} は{low}〜{high}の範囲で指定してください')
+        return str(number)
+    # 旧形式の数値（difficulty=2 など）も受け付ける
+    if text.isdigit() and int(text) < len(allowed):
+        return allowed[int(text)]
+    if text.lower() not in allowed:
+        raise PropertyError(f'{name} は {" / ".join(allowed)} のいずれかで指定してください')
+    return text.lower()
+
+
+def validate(updates):
+    """{名前: 値} をまとめて検査する。1つでも不正なら PropertyError（何も変更しない）"""
+    if not isinstance(updates, dict) or not updates:
+        raise PropertyError('更新するプロパティを指定してください')
+    return {name: normalize(name, value) for name, value in updates.items()}
+
+
+def runtime_commands(updates):
+    """すべて RCON で反映できるならそのコマンドの一覧、1つでもできなければ None"""
+    if any(name not in RUNTIME_COMMANDS for name in updates):
+        return None
+    return [RUNTIME_COMMANDS[name].format(value=value) for name, value in updates.items()]
+
+
+def apply(path, updates):
+    """検査してから書き込む。{名前: [変更前, 変更後]}（変わったものだけ）を返す"""
+    updates = validate(updates)
+    properties = Properties.load(path)
+    changed = {}
+    for name, value in updates.items():
+        previous = properties.get(name)
+        if properties.set(name, value):
+            changed[name] = [previous, value]
+    if changed:
+        properties.save(path)
+    return changed
+
+
+def main(argv=None):
+    import agent_common
+
+    parser = argparse.ArgumentParser(description='server.properties の一括更新')
+    parser.add_argument('--file', default=os.path.join(agent_common.SERVER_DIR, 'server.properties'))
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('show', help='API から変更できるプロパティの現在の値')
+    apply_command = sub.add_parser('apply', help='まとめて検査して書き込む')
+    apply_command.add_argument('--updates', required=True, help='{"名前": "値", ...} のJSON')
+    apply_command.add_argument('--restart', action='store_true', help='変更があればサーバーを1回だけ再起動する')
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        properties = Properties.load(args.file)
+        print(json.dumps({name: properties.get(name) for name in PROPERTY_SPECS}, ensure_ascii=False))
+        return 0
+
+    try:
+        changed = apply(args.file, json.loads(args.updates))
+    except (PropertyError, ValueError) as e:
+        print(json.dumps({'error': str(e)}, ensure_ascii=False))
+        return 2
+    restarted = False
+    if changed and args.restart:
+        subprocess.run(['systemctl', 'restart', 'minecraft.service'], check=True)
+        restarted = True
+    print(json.dumps({'changed': changed, 'restarted': restarted}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+import argparse
+import array
+import datetime
+import fcntl
+import json
+import os
+import re
+import struct
+import sys
+import time
+
+import agent_common
+import log_search
+import mclog
+
+# プレイヤーのセッション履歴（いつ誰が何分遊んだか）
+#
+# ログの join / left（と停止・ログの終わり）から (プレイヤー, 開始, 終了) のセッションを作り、
+# 追記専用の列指向ファイルに保存する。
+#   sessions.bin   … セグメントの連結。各セグメントは MAGIC, 件数, 開始時刻の列, 終了時刻の列, プレイヤー番号の列
+#   sessions.json  … プレイヤー番号 → 名前・UUID（usercache.json から）、取り込み済みのログファイル
+# 稼働中のセッションは auto_shutdown.py が退出のたびに追記し、過去ログ（logs/*.log.gz）は ingest で取り込む。
+# 同じプレイヤー・同じ開始時刻のセッションは1回だけ保存する。
+
+HISTORY_FILE = os.path.join(agent_common.STATUS_DIR, 'sessions.bin')
+LOG_DIR = os.path.join(agent_common.SERVER_DIR, 'logs')
+USERCACHE_FILE = os.path.join(agent_common.SERVER_DIR, 'usercache.json')
+MAGIC = b'MCSS'
+SEGMENT_HEADER = struct.Struct('<4sI')
+# 時刻を表示する時差（時間）。プレイヤーは日本にいるため JST
+UTC_OFFSET = float(os.environ.get('SESSION_UTC_OFFSET', '9'))
+SESSION_LOG = re.compile(r'^(\d{4}-\d{2}-\d{2})-(\d+)\.log\.gz$')
+
+
+def epoch(timestamp):
+    """ログの時刻（インスタンスのローカル時刻、naive）をエポック秒に"""
+    return int(time.mktime(timestamp.timetuple()))
+
+
+class SessionStore:
+    def __init__(self, path=HISTORY_FILE, usercache_file=USERCACHE_FILE):
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + '.json'
+        self.usercache_file = usercache_file
+        self.load()
+
+    def __len__(self):
+        return len(self.start)
+
+    def load(self):
+        self.start = array.array('I')
+        self.end = array.array('I')
+        self.player = array.array('H')
+        self.players = []
+        self.files = {}
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.players = meta.get('players', [])
+            self.files = meta.get('files', {})
+        except (FileNotFoundError, ValueError):
+            pass
+        self._ids = {entry['name']: number for number, entry in enumerate(self.players)}
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        pos = 0
+        while pos + SEGMENT_HEADER.size <= len(data):
+            magic, count = SEGMENT_HEADER.unpack_from(data, pos)
+            end = pos + SEGMENT_HEADER.size + count * 10
+            if magic != MAGIC or end > len(data):
+                # 書きかけのセグメント（追記中の停止など）は無視する
+                break
+            pos += SEGMENT_HEADER.size
+            for column, size in ((self.start, 4), (self.end, 4), (self.player, 2)):
+                column.frombytes(data[pos:pos + count * size])
+                pos += count * size
+        if sys.byteorder != 'little':
+            for column in (self.start, self.end, self.player):
+                column.byteswap()
+        self._keys = set(zip(self.player, self.start))
+
+    def _save_meta(self):
+        agent_common.atomic_write_json(self.meta_path, {'players': self.players, 'files': self.files})
+
+    def _player_id(self, name, uuids):
+        number = self._ids.get(name)
+        if number is None:
+            number = self._ids[name] = len(self.players)
+            self.players.append({'name': name, 'uuid': uuids.get(name)})
+        elif self.players[number]['uuid'] is None and uuids.get(name):
+            self.players[number]['uuid'] = uuids[name]
+        return number
+
+    def usercache(self):
+        try:
+            with open(self.usercache_file, 'r', encoding='utf-8') as f:
+                return {entry['name']: entry['uuid'] for entry in json.load(f)}
+        except (FileNotFoundError, ValueError, KeyError):
+            return {}
+
+    def _open_locked(self):
+        """
+        sessions.bin を追記モードで開いて排他ロックを取る
+        compact() が置き換えた後の古いファイルをロックしていたら開き直す（古い方への追記は失われるため）
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        while True:
+            f = open(self.path, 'ab')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def append(self, sessions, files=None):
+        """
+        sessions: [(名前, 開始エポック秒, 終了エポック秒), ...] を1セグメントとして追記する
+        既に保存済みのセッション（同じプレイヤー・開始時刻）は除く。追記した件数を返す
+        """
+        with self._open_locked() as f:
+            try:
+                # 他のプロセスが追記しているかもしれないので、ロックを取ってから読み直す
+                self.load()
+                uuids = self.usercache()
+                start, end, player = array.array('I'), array.array('I'), array.array('H')
+                for name, started, ended in sorted(sessions, key=lambda session: session[1]):
+                    number = self._player_id(name, uuids)
+                    if (number, started) in self._keys or ended < started:
+                        continue
+                    self._keys.add((number, started))
+                    start.append(started)
+                    end.append(ended)
+                    player.append(number)
+                if files:
+                    self.files.update(files)
+                self._save_meta()
+                if start:
+                    columns = (start, end, player)
+                    if sys.byteorder != 'little':
+                        columns = [array.array(column.typecode, column) for column in columns]
+                        for column in columns:
+                            column.byteswap()
+                    f.write(SEGMENT_HEADER.pack(MAGIC, len(start)) + b''.join(c.tobytes() for c in columns))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self.start.extend(start)
+                    self.end.extend(end)
+                    self.player.extend(player)
+                return len(start)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def compact(self):
+        """
+        全セグメントを開始時刻順の1セグメントにまとめる
+        append() と同じロックを取ってから読み直すので、同時に追記されたセグメントも失わない
+        """
+        with self._open_locked() as f:
+            try:
+                self.load()
+                order = sorted(range(len(self)), key=self.start.__getitem__)
+                columns = [array.array(column.typecode, (column[i] for i in order))
+                           for column in (self.start, self.end, self.player)]
+                if sys.byteorder != 'little':
+                    for column in columns:
+                        column.byteswap()
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'wb') as tmp:
+                    tmp.write(SEGMENT_HEADER.pack(MAGIC, len(order)) + b''.join(c.tobytes() for c in columns))
+                    tmp.flush()
+                    os.fsync(tmp.fileno())
+                os.replace(tmp_path, self.path)
+                # rename をディスクに残すためディレクトリも同期する
+                directory = os.open(os.path.dirname(self.path) or '.', os.O_RDONLY)
+                try:
+                    os.fsync(directory)
+                finally:
+                    os.close(directory)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        self.load()
+
+    # ---- 問い合わせ ----
+
+    def _overlapping(self, since, until):
+        """[since, until) に重なるセッションの (開始, 終了, プレイヤー) を範囲内に切り詰めて返す"""
+        start, end, player = self.start, self.end, self.player
+        for i in range(len(start)):
+            s, e = start[i], end[i]
+            if e > since and s < until:
+                yield max(s, since), min(e, until), player[i]
+
+    def name(self, number):
+        return self.players[number]['name'] if number < len(self.players) else str(number)
+
+    def sessions(self, since, until):
+        """範囲に重なるセッションの一覧（エポック秒。lambda/prewarm.py のタイムラインに使える）"""
+        return [
+            {'name': self.name(p), 'start': s, 'end': e}
+            for s, e, p in sorted(self._overlapping(since, until))
+        ]
+
+    def playtime(self, since, until):
+        seconds = {}
+        counts = {}
+        for s, e, p in self._overlapping(since, until):
+            seconds[p] = seconds.get(p, 0) + (e - s)
+            counts[p] = counts.get(p, 0) + 1
+        return [
+            {'name': self.name(p), 'uuid': self.players[p]['uuid'], 'seconds': seconds[p],
+             'hours': round(seconds[p] / 3600, 2), 'sessions': counts[p]}
+            for p in sorted(seconds, key=lambda p: -seconds[p])
+        ]
+
+    def concurrent(self, since, until, step):
+        """step 秒ごとの最大同時接続数"""
+        events = []
+        for s, e, _ in self._overlapping(since, until):
+            events.append((s, 1))
+            events.append((e, -1))
+        events.sort()
+        buckets = [0] * max(1, -(-(until - since) // step))
+        current = 0
+        i = 0
+        for bucket in range(len(buckets)):
+            bucket_end = since + (bucket + 1) * step
+            peak = current
+            while i < len(events) and events[i][0] < bucket_end:
+                current += events[i][1]
+                peak = max(peak, current)
+                i += 1
+            buckets[bucket] = peak
+        return [
+            {'time': _format_time(since + bucket * step), 'players': count}
+            for bucket, count in enumerate(buckets)
+        ]
+
+    def peak_hours(self, since, until, utc_offset=UTC_OFFSET):
+        """時刻（0〜23時）ごとの平均同時接続数"""
+        offset = int(utc_offset * 3600)
+        seconds = [0] * 24
+        for s, e, _ in self._overlapping(since, until):
+            position = s
+            while position < e:
+                hour_end = (position + offset) // 3600 * 3600 + 3600 - offset
+                chunk_end = min(e, hour_end)
+                seconds[(position + offset) // 3600 % 24] += chunk_end - position
+                position = chunk_end
+        days = max(1.0, (until - since) / 86400)
+        return [
+            {'hour': hour, 'average_players': round(seconds[hour] / 3600 / days, 3),
+             'player_hours': round(seconds[hour] / 3600, 2)}
+            for hour in range(24)
+        ]
+
+
+def _format_time(epoch, utc_offset=UTC_OFFSET):
+    tz = datetime.timezone(datetime.timedelta(hours=utc_offset))
+    return datetime.datetime.fromtimestamp(epoch, tz).isoformat()
+
+
+def sessions_from_records(records, close_at_end=True):
+    """
+    LogRecord の列からセッションを作る
+    停止メッセージ・ログの終わりで残っているセッションは最後の時刻で閉じる（close_at_end=False なら稼働中として除く）
+    """
+    sessions = []
+    online = {}
+    last = None
+    for record in records:
+        if record.timestamp is None:
+            continue
+        last = record.timestamp
+        match = mclog.JOINED.match(record.message)
+        if match:
+            online.setdefault(match.group(1), record.timestamp)
+            continue
+        match = mclog.LEFT.match(record.message)
+        if match:
+            started = online.pop(match.group(1), None)
+            if started is not None:
+                sessions.append((match.group(1), epoch(started), epoch(record.timestamp)))
+            continue
+        if mclog.STOPPING.match(record.message):
+            sessions.extend((name, epoch(started), epoch(record.timestamp)) for name, started in online.items())
+            online = {}
+    if close_at_end and last is not None:
+        sessions.extend((name, epoch(started), epoch(last)) for name, started in online.items())
+    return sessions
+
+
+def session_logs(log_dir):
+    """セッションを含むログ（<日付>-<n>.log.gz を古い順、最後に latest.log）。debug ログは同じ行を含むので除く"""
+    names = []
+    for name in os.listdir(log_dir) if os.path.isdir(log_dir) else []:
+        match = SESSION_LOG.match(name)
+        if match:
+            names.append((match.group(1), int(match.group(2)), name))
+    paths = [os.path.join(log_dir, name) for _, _, name in sorted(names)]
+    latest = os.path.join(log_dir, 'latest.log')
+    if os.path.exists(latest):
+        paths.append(latest)
+    return paths
+
+
+def ingest(store, log_dir=LOG_DIR):
+    """まだ取り込んでいない過去ログと latest.log（終了済みのセッションのみ）を取り込む"""
+    sessions = []
+    files = {}
+    scanned = 0
+    for path in session_logs(log_dir):
+        name = os.path.basename(path)
+        live = name == 'latest.log'
+        size = os.path.getsize(path)
+        if not live and store.files.get(name) == size:
+            continue
+        scanned += 1
+        records = (record for _, record in log_search.iter_records(path))
+        sessions.extend(sessions_from_records(records, close_at_end=not live))
+        if not live:
+            files[name] = size
+    added = store.append(sessions, files)
+    return {'files_scanned': scanned, 'sessions_found': len(sessions), 'sessions_added': added,
+            'sessions_total': len(store)}
+
+
+def _window(args):
+    until = int(time.time()) if args.until is None else int(_parse_time(args.until))
+    since = until - int(args.days * 86400) if args.since is None else int(_parse_time(args.since))
+    return since, until
+
+
+def _parse_time(value):
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=UTC_OFFSET)))
+    return moment.timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='プレイヤーのセッション履歴')
+    parser.add_argument('--file', default=HISTORY_FILE)
+    parser.add_argument('--logs', default=LOG_DIR)
+    parser.add_argument('--usercache', default=USERCACHE_FILE)
+    parser.add_argument('--ingest', action='store_true', help='問い合わせの前に未取り込みのログを取り込む')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('ingest', help='過去ログ・latest.log からセッションを取り込む')
+    sub.add_parser('compact', help='セグメントを1つにまとめる')
+    for name, help_text in (('playtime', 'プレイヤーごとのプレイ時間'),
+                            ('concurrent', '時間帯ごとの最大同時接続数'),
+                            ('peak-hours', '時刻ごとの平均同時接続数'),
+                            ('sessions', 'セッションの一覧')):
+        query = sub.add_parser(name, help=help_text)
+        query.add_argument('--days', type=float, default=7)
+        query.add_argument('--since', help='開始時刻（ISO 8601、時差なしはJST）')
+        query.add_argument('--until')
+        if name == 'concurrent':
+            query.add_argument('--step', type=int, default=3600, help='集計の間隔（秒）')
+    args = parser.parse_args(argv)
+
+    store = SessionStore(args.file, args.usercache)
+    if args.command == 'ingest' or args.ingest:
+        result = ingest(store, args.logs)
+        if args.command == 'ingest':
+            print(json.dumps(result))
+            return 0
+
+    if args.command == 'compact':
+        store.compact()
+        print(json.dumps({'sessions': len(store)}))
+        return 0
+
+    since, until = _window(args)
+    if args.command == 'playtime':
+        result = store.playtime(since, until)
+    elif args.command == 'concurrent':
+        result = store.concurrent(since, until, args.step)
+    elif args.command == 'sessions':
+        result = store.sessions(since, until)
+    else:
+        result = store.peak_hours(since, until)
+    print(json.dumps({'since': _format_time(since), 'until': _format_time(until), args.command.replace('-', '_'): result},
+                     ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
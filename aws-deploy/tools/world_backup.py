@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+import argparse
+import base64
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import agent_common
+import blockpack
+import region
+
+# チャンク単位の差分ワールドバックアップ
+#
+# リージョンファイル（*.mca）はヘッダーの位置・タイムスタンプを前回のスナップショットと比べ、
+# 変わったチャンクだけを読み出して保存する。保存先は内容アドレス方式（sha256）で、
+# 1回のバックアップで新しく必要になったチャンク・ファイルは1つのパックファイルにまとめる。
+#
+# 保存先（ローカルディレクトリ または s3://bucket/prefix）の構成:
+#   packs/<snapshot>.pack          … そのスナップショットで新しく保存したデータ（ブロック圧縮、blockpack.py）
+#   snapshots/<snapshot>.json.gz   … マニフェスト（全ファイル・全チャンクの sha256 と格納場所、パックのブロック表）
+# マニフェストだけで任意のスナップショットを元の配置どおりに復元できる。
+# パックは圧縮しながらマルチパートで並列にアップロードし、復元時は必要なブロックだけを Range 取得する。
+#
+# サーバーが書き込み中のチャンク（長さが不正など）は少し待ってヘッダーから読み直す。それでも読めず、
+# 前回の内容も無いチャンクはマニフェストの missing_chunks に記録して incomplete とし、終了コード 3 で終わる。
+
+WORLD_DIR = os.path.join(agent_common.SERVER_DIR, 'world')
+STATE_FILE = os.path.join(agent_common.STATUS_DIR, 'world-backup-last.json.gz')
+DEFAULT_STORE = os.environ.get('WORLD_BACKUP_STORE', 's3://minecraft-server-mods-temp/world-backups')
+SKIP_FILES = {'session.lock'}
+MANIFEST_VERSION = 2
+# 書き込み中のチャンクを読み直す回数と間隔（秒）
+TORN_RETRIES = 3
+TORN_RETRY_DELAY = 0.5
+INCOMPLETE_EXIT = 3
+
+
+# ---- 保存先 ----
+
+class LocalStore:
+    def __init__(self, root):
+        self.root = root
+        self.url = os.path.abspath(root)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put_file(self, key, local_path):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(local_path, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def put_bytes(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def get_bytes(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def get_file(self, key, local_path):
+        shutil.copyfile(self._path(key), local_path)
+
+    def get_range(self, key, start, end):
+        with open(self._path(key), 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def open_upload(self, key):
+        return LocalUpload(self._path(key))
+
+    def list(self, prefix):
+        directory = self._path(prefix.rstrip('/'))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f"{prefix.rstrip('/')}/{name}" for name in os.listdir(directory) if not name.endswith('.tmp'))
+
+    def delete(self, key):
+        os.unlink(self._path(key))
+
+
+class S3Store:
+    """aws CLI 経由（インスタンスには boto3 がないため）"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        bucket_and_prefix = self.url[len('s3://'):]
+        self.bucket, _, self.prefix = bucket_and_prefix.partition('/')
+
+    def _uri(self, key):
+        return f'{self.url}/{key}'
+
+    def _key(self, key):
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def put_file(self, key, local_path):
+        agent_common.aws_cli(['s3', 'cp', local_path, self._uri(key), '--only-show-errors'], timeout=3600)
+
+    def put_bytes(self, key, data):
+        agent_common.aws_cli(['s3', 'cp', '-', self._uri(key), '--only-show-errors'], input_data=data, timeout=600)
+
+    def get_bytes(self, key):
+        return agent_common.aws_cli(['s3', 'cp', self._uri(key), '-'], timeout=600, binary=True)
+
+    def get_file(self, key, local_path):
+        agent_common.aws_cli(['s3', 'cp', self._uri(key), local_path, '--only-show-errors'], timeout=3600)
+
+    def get_range(self, key, start, end):
+        with tempfile.TemporaryDirectory(prefix='world-range-') as tmp:
+            path = os.path.join(tmp, 'body')
+            agent_common.aws_cli([
+                's3api', 'get-object', '--bucket', self.bucket, '--key', self._key(key),
+                '--range', f'bytes={start}-{end - 1}', path
+            ], timeout=600)
+            with open(path, 'rb') as f:
+                return f.read()
+
+    def open_upload(self, key):
+        return S3Upload(self.bucket, self._key(key))
+
+    def list(self, prefix):
+        output = agent_common.aws_cli([
+            's3api', 'list-objects-v2', '--bucket', self.bucket, '--prefix', self._key(prefix),
+            '--query', 'Contents[].Key', '--output', 'json'
+        ], timeout=120)
+        keys = json.loads(output) or []
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        return sorted(key[strip:] for key in keys)
+
+    def delete(self, key):
+        agent_common.aws_cli(['s3', 'rm', self._uri(key), '--only-show-errors'])
+
+
+class LocalUpload:
+    """パートをオフセット位置に書き込み、complete() で置き換える"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.fd = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    def put_part(self, number, offset, data):
+        os.pwrite(self.fd, data, offset)
+
+    def complete(self):
+        os.close(self.fd)
+        os.replace(self.path + '.tmp', self.path)
+
+    def abort(self):
+        os.close(self.fd)
+        os.unlink(self.path + '.tmp')
+
+
+class S3Upload:
+    """S3 マルチパートアップロード（パートは Content-MD5 付きで送り、S3 側で検証させる）"""
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        output = agent_common.aws_cli([
+            's3api', 'create-multipart-upload', '--bucket', bucket, '--key', key, '--output', 'json'
+        ])
+        self.upload_id = json.loads(output)['UploadId']
+        self.parts = {}
+
+    def put_part(self, number, offset, data):
+        fd, path = tempfile.mkstemp(prefix='world-part-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            output = agent_common.aws_cli([
+                's3api', 'upload-part', '--bucket', self.bucket, '--key', self.key,
+                '--upload-id', self.upload_id, '--part-number', str(number), '--body', path,
+                '--content-md5', base64.b64encode(hashlib.md5(data).digest()).decode('ascii'),
+                '--output', 'json'
+            ], timeout=900)
+        finally:
+            os.unlink(path)
+        self.parts[number] = json.loads(output)['ETag']
+
+    def complete(self):
+        parts = [{'PartNumber': number, 'ETag': self.parts[number]} for number in sorted(self.parts)]
+        agent_common.aws_cli([
+            's3api', 'complete-multipart-upload', '--bucket', self.bucket, '--key', self.key,
+            '--upload-id', self.upload_id, '--multipart-upload', json.dumps({'Parts': parts})
+        ], timeout=300)
+
+    def abort(self):
+        agent_common.aws_cli([
+            's3api', 'abort-multipart-upload', '--bucket', self.bucket, '--key', self.key,
+            '--upload-id', self.upload_id
+        ])
+
+
+def open_store(url):
+    return S3Store(url) if url.startswith('s3://') else LocalStore(url)
+
+
+def snapshot_key(snapshot_id):
+    return f'snapshots/{snapshot_id}.json.gz'
+
+
+def pack_key(pack_id):
+    return f'packs/{pack_id}.pack'
+
+
+def list_snapshots(store):
+    return [key[len('snapshots/'):-len('.json.gz')] for key in store.list('snapshots/') if key.endswith('.json.gz')]
+
+
+def load_snapshot(store, snapshot_id):
+    return json.loads(gzip.decompress(store.get_bytes(snapshot_key(snapshot_id))))
+
+
+def encode_manifest(manifest):
+    return gzip.compress(json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
+
+
+# ---- バックアップ ----
+
+class PackWriter:
+    """新しいデータを1つのパックに連結していく（同じ内容は1回だけ）。圧縮・アップロードは並行して進む"""
+
+    def __init__(self, store, pack_id, workers=1, level=blockpack.COMPRESS_LEVEL):
+        self.pack_id = pack_id
+        self.writer = blockpack.BlockPackWriter(store.open_upload(pack_key(pack_id)), workers=workers, level=level)
+        self.locations = {}
+
+    @property
+    def offset(self):
+        return self.writer.offset
+
+    def add(self, sha256, data):
+        if sha256 not in self.locations:
+            self.locations[sha256] = [self.pack_id, self.writer.add(data), len(data)]
+        return self.locations[sha256]
+
+    def close(self):
+        """パックを完成させてブロック表を返す（新しいデータがなければ None）"""
+        return self.writer.table() if self.writer.close() else None
+
+    def discard(self):
+        self.writer.abort()
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _is_region(rel_path):
+    return rel_path.endswith('.mca') and region.region_coords(rel_path) is not None
+
+
+def _walk(world_dir):
+    for root, dirs, files in os.walk(world_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name in SKIP_FILES:
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, world_dir).replace(os.sep, '/'), path
+
+
+class BackupRun:
+    def __init__(self, store, world_dir, previous, workers=1, level=blockpack.COMPRESS_LEVEL, sleep=time.sleep):
+        self.store = store
+        self.sleep = sleep
+        self.world_dir = world_dir
+        self.previous = previous or {'files': {}, 'regions': {}, 'blobs': {}}
+        now = datetime.datetime.now(datetime.timezone.utc)
+        # 同じ秒に続けて実行しても別のIDになるようミリ秒まで含める
+        self.snapshot_id = f"{now.strftime('%Y%m%dT%H%M%S')}{now.microsecond // 1000:03d}Z"
+        self.pack = PackWriter(store, self.snapshot_id, workers, level)
+        self.blobs = {}
+        self.stats = {
+            'files': 0, 'files_changed': 0,
+            'regions': 0, 'regions_unchanged': 0,
+            'chunks': 0, 'chunks_read': 0, 'chunks_stored': 0,
+            'bytes_read': 0, 'bytes_stored': 0, 'bytes_uploaded': 0, 'torn_chunks': 0,
+        }
+        self.missing_chunks = []
+
+    def _store_blob(self, sha256, data):
+        """既知の内容なら前回の格納場所を使い、新しい内容だけパックに追加する"""
+        location = self.previous['blobs'].get(sha256) or self.blobs.get(sha256)
+        if location is None:
+            location = self.pack.add(sha256, data)
+            self.stats['bytes_stored'] += len(data)
+        self.blobs[sha256] = location
+        return location
+
+    def _reuse(self, sha256):
+        self.blobs[sha256] = self.previous['blobs'][sha256]
+
+    def backup_file(self, rel_path, path, st):
+        self.stats['files'] += 1
+        previous = self.previous['files'].get(rel_path)
+        if previous and previous['size'] == st.st_size and previous['mtime'] == st.st_mtime \
+                and previous['sha256'] in self.previous['blobs']:
+            self._reuse(previous['sha256'])
+            return previous
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.stats['files_changed'] += 1
+        self.stats['bytes_read'] += len(data)
+        sha256 = _sha256(data)
+        self._store_blob(sha256, data)
+        return {'sha256': sha256, 'size': len(data), 'mtime': st.st_mtime}
+
+    def _read_chunk_retrying(self, f, index, location):
+        """
+        書き込み中で読めないチャンクは少し待ってから、ヘッダーの位置を読み直してもう一度読む
+        (データ, 位置) を返す。チャンクが消えていれば (None, None)、読めなければ RegionError
+        """
+        for attempt in range(TORN_RETRIES + 1):
+            try:
+                return region.read_chunk(f, location[0], location[1]), location
+            except region.RegionError:
+                if attempt == TORN_RETRIES:
+                    raise
+            self.sleep(TORN_RETRY_DELAY * (attempt + 1))
+            entry = next((entry for entry in region.read_header(f) if entry[0] == index), None)
+            if entry is None:
+                return None, None
+            location = entry[1:]
+
+    def backup_region(self, rel_path, path, st):
+        self.stats['regions'] += 1
+        previous = self.previous['regions'].get(rel_path)
+        if previous and previous['size'] == st.st_size and previous['mtime'] == st.st_mtime \
+                and all(chunk[4] in self.previous['blobs'] for chunk in previous['chunks']):
+            # ファイル自体が変わっていなければヘッダーも読まない
+            self.stats['regions_unchanged'] += 1
+            self.stats['chunks'] += len(previous['chunks'])
+            for chunk in previous['chunks']:
+                self._reuse(chunk[4])
+            return previous
+
+        known = {chunk[0]: chunk for chunk in (previous or {}).get('chunks', [])}
+        chunks = []
+        missing_before = len(self.missing_chunks)
+        with open(path, 'rb') as f:
+            for index, sector_offset, sector_count, timestamp in region.read_header(f):
+                self.stats['chunks'] += 1
+                old = known.get(index)
+                if old and old[1:4] == [sector_offset, sector_count, timestamp] and old[4] in self.previous['blobs']:
+                    # 位置とタイムスタンプが同じチャンクは読まない
+                    self._reuse(old[4])
+                    chunks.append(old)
+                    continue
+                try:
+                    data, location = self._read_chunk_retrying(f, index, (sector_offset, sector_count, timestamp))
+                except region.RegionError as e:
+                    # 読み直しても書き込み中のまま。前回の内容があればそれを使い、無ければ欠けたことを記録する
+                    self.stats['torn_chunks'] += 1
+                    print(f'[world-backup] {rel_path} chunk {index}: {e}', file=sys.stderr)
+                    if old and old[4] in self.previous['blobs']:
+                        self._reuse(old[4])
+                        chunks.append(old)
+                    else:
+                        self.missing_chunks.append([rel_path, index])
+                    continue
+                if data is None:
+                    continue
+                sector_offset, sector_count, timestamp = location
+                self.stats['chunks_read'] += 1
+                self.stats['bytes_read'] += len(data)
+                sha256 = _sha256(data)
+                if sha256 not in self.previous['blobs'] and sha256 not in self.blobs:
+                    self.stats['chunks_stored'] += 1
+                self._store_blob(sha256, data)
+                chunks.append([index, sector_offset, sector_count, timestamp, sha256])
+        # 欠けたチャンクがあるリージョンは、ファイルが変わっていなくても次回すべてのヘッダーを読み直す
+        mtime = st.st_mtime if len(self.missing_chunks) == missing_before else None
+        return {'size': st.st_size, 'mtime': mtime, 'chunks': chunks}
+
+    def run(self):
+        started = time.monotonic()
+        files = {}
+        regions = {}
+        try:
+            for rel_path, path in _walk(self.world_dir):
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if _is_region(rel_path):
+                    regions[rel_path] = self.backup_region(rel_path, path, st)
+                else:
+                    files[rel_path] = self.backup_file(rel_path, path, st)
+            table = self.pack.close()
+            self.stats['bytes_uploaded'] = self.pack.writer.stored_bytes
+            self.stats['seconds'] = round(time.monotonic() - started, 3)
+
+            # 参照しているパックのブロック表を引き継ぐ（フォーマット1のパックは無圧縮なので表がない）
+            packs = {}
+            previous_packs = self.previous.get('packs', {})
+            for location in self.blobs.values():
+                if location[0] in previous_packs:
+                    packs[location[0]] = previous_packs[location[0]]
+            if table is not None:
+                packs[self.snapshot_id] = table
+
+            manifest = {
+                'format': MANIFEST_VERSION,
+                'id': self.snapshot_id,
+                'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'parent': self.previous.get('id'),
+                'world': self.world_dir,
+                'files': files,
+                'regions': regions,
+                'blobs': self.blobs,
+                'packs': packs,
+                'stats': self.stats,
+                'incomplete': bool(self.missing_chunks),
+                'missing_chunks': self.missing_chunks,
+            }
+            self.store.put_bytes(snapshot_key(self.snapshot_id), encode_manifest(manifest))
+            return manifest
+        finally:
+            self.pack.discard()
+
+
+def load_previous(store, state_file=STATE_FILE):
+    """
+    前回のスナップショット。ローカルに控えがあればそれを使い、なければ保存先の最新を読む
+    （別の保存先の控えは使わない）
+    """
+    try:
+        with gzip.open(state_file, 'rb') as f:
+            state = json.load(f)
+        if state.get('store') == store.url:
+            return state['manifest']
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        pass
+    snapshots = list_snapshots(store)
+    return load_snapshot(store, snapshots[-1]) if snapshots else None
+
+
+def save_state(store, manifest, state_file=STATE_FILE):
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    tmp_path = state_file + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump({'store': store.url, 'manifest': manifest}, f, separators=(',', ':'))
+    os.replace(tmp_path, state_file)
+
+
+def backup(store, world_dir=WORLD_DIR, state_file=STATE_FILE, full=False, workers=None,
+           level=blockpack.COMPRESS_LEVEL):
+    previous = None if full else load_previous(store, state_file)
+    manifest = BackupRun(store, world_dir, previous, workers or os.cpu_count() or 1, level).run()
+    save_state(store, manifest, state_file)
+    return manifest
+
+
+# ---- 復元 ----
+
+class PackReader:
+    """パックのうち必要なブロックだけを Range 取得して読む"""
+
+    def __init__(self, store, tables, fetch_size=blockpack.FETCH_SIZE):
+        self.store = store
+        self.tables = tables
+        self.fetch_size = fetch_size
+        self.readers = {}
+
+    def read(self, location, sha256):
+        pack_id, offset, length = location
+        reader = self.readers.get(pack_id)
+        if reader is None:
+            key = pack_key(pack_id)
+            reader = self.readers[pack_id] = blockpack.BlockPackReader(
+                lambda start, end: self.store.get_range(key, start, end), self.tables.get(pack_id), self.fetch_size
+            )
+        data = reader.read(offset, length)
+        if _sha256(data) != sha256:
+            raise RuntimeError(f'checksum mismatch in pack {pack_id} at {offset}')
+        return data
+
+    def stats(self):
+        return {
+            'packs': len(self.readers),
+            'requests': sum(reader.requests for reader in self.readers.values()),
+            'bytes_fetched': sum(reader.fetched_bytes for reader in self.readers.values()),
+        }
+
+
+def _selected(rel_path, paths):
+    return not paths or any(rel_path == path or rel_path.startswith(path.rstrip('/') + '/') for path in paths)
+
+
+def restore(store, snapshot_id, dest_dir, paths=None):
+    """
+    スナップショットを dest_dir に復元する（既存の内容は上書き）
+    paths を指定すると、そのファイル・ディレクトリ（ワールドからの相対パス）だけを復元する
+    """
+    manifest = load_snapshot(store, snapshot_id)
+    blobs = manifest['blobs']
+    # 一部だけの復元では先読みしない（必要なブロックだけを取得する）
+    reader = PackReader(store, manifest.get('packs', {}), 0 if paths else blockpack.FETCH_SIZE)
+    restored = 0
+    for rel_path, entry in manifest['files'].items():
+        if not _selected(rel_path, paths):
+            continue
+        path = os.path.join(dest_dir, *rel_path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(reader.read(blobs[entry['sha256']], entry['sha256']))
+        os.utime(path, (entry['mtime'], entry['mtime']))
+        restored += 1
+    for rel_path, entry in manifest['regions'].items():
+        if not _selected(rel_path, paths):
+            continue
+        path = os.path.join(dest_dir, *rel_path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        chunks = [
+            (index, sector_offset, sector_count, timestamp, reader.read(blobs[sha256], sha256))
+            for index, sector_offset, sector_count, timestamp, sha256 in entry['chunks']
+        ]
+        region.write_region(path, chunks, entry['size'])
+        os.utime(path, (entry['mtime'], entry['mtime']))
+        restored += 1
+    return {'id': manifest['id'], 'restored': restored, **reader.stats()}
+
+
+def prune(store, keep):
+    """新しい方から keep 個のスナップショットを残し、どこからも参照されないパックを削除する"""
+    snapshots = list_snapshots(store)
+    if keep < 1 or len(snapshots) <= keep:
+        return {'deleted_snapshots': [], 'deleted_packs': []}
+    kept, dropped = snapshots[-keep:], snapshots[:-keep]
+    referenced = set()
+    for snapshot_id in kept:
+        referenced.update(location[0] for location in load_snapshot(store, snapshot_id)['blobs'].values())
+    for snapshot_id in dropped:
+        store.delete(snapshot_key(snapshot_id))
+    deleted_packs = []
+    for key in store.list('packs/'):
+        pack_id = key[len('packs/'):-len('.pack')]
+        if pack_id not in referenced:
+            store.delete(key)
+            deleted_packs.append(pack_id)
+    return {'deleted_snapshots': dropped, 'deleted_packs': deleted_packs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='チャンク単位の差分ワールドバックアップ')
+    parser.add_argument('--store', default=DEFAULT_STORE, help='保存先（ディレクトリ または s3://bucket/prefix）')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('backup')
+    run.add_argument('--world', default=WORLD_DIR)
+    run.add_argument('--state-file', default=STATE_FILE)
+    run.add_argument('--full', action='store_true', help='前回のスナップショットを使わずに全チャンクを読む')
+    run.add_argument('--workers', type=int, help='圧縮スレッド数（既定: CPUコア数）')
+    run.add_argument('--level', type=int, default=blockpack.COMPRESS_LEVEL, help='zlib の圧縮レベル（0-9）')
+    sub.add_parser('list')
+    rest = sub.add_parser('restore')
+    rest.add_argument('snapshot', help="スナップショットID（'latest' で最新）")
+    rest.add_argument('dest')
+    rest.add_argument('--path', action='append', help='復元するファイル・ディレクトリ（例: region/r.0.0.mca、複数指定可）')
+    cleanup = sub.add_parser('prune')
+    cleanup.add_argument('--keep', type=int, required=True)
+    args = parser.parse_args(argv)
+
+    store = open_store(args.store)
+
+    if args.command == 'backup':
+        manifest = backup(store, args.world, args.state_file, args.full, args.workers, args.level)
+        print(json.dumps({'id': manifest['id'], 'parent': manifest['parent'], **manifest['stats'],
+                          'incomplete': manifest['incomplete'], 'missing_chunks': manifest['missing_chunks']}))
+        if manifest['incomplete']:
+            print(f"[world-backup] {len(manifest['missing_chunks'])} chunk(s) could not be read; snapshot is incomplete",
+                  file=sys.stderr)
+            return INCOMPLETE_EXIT
+    elif args.command == 'list':
+        for snapshot_id in list_snapshots(store):
+            print(snapshot_id)
+    elif args.command == 'restore':
+        snapshot_id = args.snapshot
+        if snapshot_id == 'latest':
+            snapshot_id = list_snapshots(store)[-1]
+        print(json.dumps(restore(store, snapshot_id, args.dest, args.path)))
+    elif args.command == 'prune':
+        print(json.dumps(prune(store, args.keep)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
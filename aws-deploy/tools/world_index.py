@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+import argparse
+import array
+import json
+import os
+import struct
+import sys
+import time
+
+import agent_common
+import region
+
+# ワールドの統計インデックス（リージョンファイルの中身の一覧）
+#
+# 全リージョンファイル（region / entities / poi）のヘッダーを mmap で読み、チャンクごとに
+#   リージョン番号, チャンク座標 x/z, セクター位置, サイズ, 圧縮形式, 最終更新時刻
+# を列ごとの array に詰めて1ファイルに保存する。2回目以降はサイズ・更新時刻が変わったリージョンだけを読み直す。
+# 「N日間更新されていないチャンク」「大きいリージョン」などの問い合わせは、保存済みのインデックスだけで答える。
+#
+# ファイル形式: MAGIC, メタデータ長(4バイト), メタデータ(JSON), 各列の array（COLUMNS の順）
+
+WORLD_DIR = os.path.join(agent_common.SERVER_DIR, 'world')
+INDEX_FILE = os.path.join(agent_common.STATUS_DIR, 'world-index.bin')
+MAGIC = b'MCWI\x01'
+KINDS = ('region', 'entities', 'poi')
+COLUMNS = (
+    ('region', 'i'),
+    ('x', 'i'),
+    ('z', 'i'),
+    ('sector', 'I'),
+    ('size', 'I'),
+    ('compression', 'B'),
+    ('mtime', 'I'),
+)
+DIMENSIONS = {'': 'minecraft:overworld', 'DIM-1': 'minecraft:the_nether', 'DIM1': 'minecraft:the_end'}
+
+
+def dimension_of(rel_dir):
+    """リージョンのディレクトリ（ワールドからの相対パス、kind を除く）からディメンション名"""
+    if rel_dir in DIMENSIONS:
+        return DIMENSIONS[rel_dir]
+    parts = rel_dir.split('/')
+    if len(parts) == 3 and parts[0] == 'dimensions':
+        return f'{parts[1]}:{parts[2]}'
+    return rel_dir
+
+
+def find_regions(world_dir):
+    """[(ワールドからの相対パス, ディメンション, kind), ...]"""
+    found = []
+    for root, dirs, files in os.walk(world_dir):
+        dirs.sort()
+        kind = os.path.basename(root)
+        if kind not in KINDS:
+            continue
+        rel_dir = os.path.relpath(os.path.dirname(root), world_dir).replace(os.sep, '/')
+        dimension = dimension_of('' if rel_dir == '.' else rel_dir)
+        for name in sorted(files):
+            if region.region_coords(name) is not None:
+                rel_path = os.path.relpath(os.path.join(root, name), world_dir).replace(os.sep, '/')
+                found.append((rel_path, dimension, kind))
+    return found
+
+
+class WorldIndex:
+    def __init__(self, world_dir):
+        self.world_dir = world_dir
+        self.regions = []
+        self.columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+        self.built_at = None
+
+    def __len__(self):
+        return len(self.columns['region'])
+
+    # ---- 保存・読み込み ----
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path}: not a world index')
+            (length,) = struct.unpack('>I', f.read(4))
+            meta = json.loads(f.read(length))
+            index = cls(meta['world'])
+            index.regions = meta['regions']
+            index.built_at = meta['built_at']
+            for name, typecode in COLUMNS:
+                column = index.columns[name]
+                column.frombytes(f.read(meta['rows'] * column.itemsize))
+        return index
+
+    def save(self, path):
+        meta = json.dumps({
+            'world': self.world_dir,
+            'built_at': self.built_at,
+            'rows': len(self),
+            'regions': self.regions,
+        }, separators=(',', ':')).encode('utf-8')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('>I', len(meta)))
+            f.write(meta)
+            for name, _ in COLUMNS:
+                self.columns[name].tofile(f)
+        os.replace(tmp_path, path)
+
+    # ---- 構築 ----
+
+    def refresh(self):
+        """サイズ・更新時刻が変わったリージョンだけを読み直す。読み直したリージョン数を返す"""
+        previous = {entry['path']: entry for entry in self.regions}
+        old_columns = self.columns
+        self.regions = []
+        self.columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+        rebuilt = 0
+        for rel_path, dimension, kind in find_regions(self.world_dir):
+            path = os.path.join(self.world_dir, *rel_path.split('/'))
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entry = previous.get(rel_path)
+            if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+                self._copy_rows(entry, old_columns)
+            else:
+                entry = self._read_region(rel_path, dimension, kind, path, st)
+                rebuilt += 1
+            self.regions.append(entry)
+        self.built_at = time.time()
+        return rebuilt
+
+    def _copy_rows(self, entry, old_columns):
+        start, count = entry['start'], entry['count']
+        entry['start'] = len(self)
+        number = len(self.regions)
+        for name, typecode in COLUMNS:
+            if name == 'region':
+                self.columns[name].extend(array.array(typecode, [number]) * count)
+            else:
+                self.columns[name].extend(old_columns[name][start:start + count])
+
+    def _read_region(self, rel_path, dimension, kind, path, st):
+        region_x, region_z = region.region_coords(path)
+        number = len(self.regions)
+        start = len(self)
+        columns = self.columns
+        chunk_bytes = 0
+        oldest = newest = None
+        with region.RegionFile(path) as region_file:
+            for index, sector_offset, sector_count, timestamp in region_file.entries():
+                try:
+                    length, compression = region_file.chunk_header(sector_offset)
+                except region.RegionError:
+                    length, compression = 0, 0
+                if compression & region.EXTERNAL_FLAG:
+                    x, z = region.chunk_coords(region_x, region_z, index)
+                    external = os.path.join(os.path.dirname(path), f'c.{x}.{z}.mcc')
+                    length = os.path.getsize(external) if os.path.exists(external) else 0
+                x, z = region.chunk_coords(region_x, region_z, index)
+                columns['region'].append(number)
+                columns['x'].append(x)
+                columns['z'].append(z)
+                columns['sector'].append(sector_offset)
+                columns['size'].append(length)
+                columns['compression'].append(compression)
+                columns['mtime'].append(timestamp)
+                chunk_bytes += length
+                oldest = timestamp if oldest is None else min(oldest, timestamp)
+                newest = timestamp if newest is None else max(newest, timestamp)
+        return {
+            'path': rel_path,
+            'dimension': dimension,
+            'kind': kind,
+            'x': region_x,
+            'z': region_z,
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'start': start,
+            'count': len(self) - start,
+            'chunk_bytes': chunk_bytes,
+            'oldest': oldest,
+            'newest': newest,
+        }
+
+    # ---- 問い合わせ ----
+
+    def select(self, kind='region', dimension=None):
+        return [
+            (number, entry) for number, entry in enumerate(self.regions)
+            if entry['kind'] == kind and (dimension is None or entry['dimension'] == dimension)
+        ]
+
+    def row(self, i):
+        entry = self.regions[self.columns['region'][i]]
+        return {
+            'dimension': entry['dimension'],
+            'region': entry['path'],
+            'x': self.columns['x'][i],
+            'z': self.columns['z'][i],
+            'sector': self.columns['sector'][i],
+            'size': self.columns['size'][i],
+            'compression': self.columns['compression'][i],
+            'last_modified': self.columns['mtime'][i],
+        }
+
+    def summary(self, kind='region'):
+        dimensions = {}
+        for _, entry in self.select(kind):
+            stats = dimensions.setdefault(entry['dimension'], {'regions': 0, 'chunks': 0, 'file_bytes': 0, 'chunk_bytes': 0})
+            stats['regions'] += 1
+            stats['chunks'] += entry['count']
+            stats['file_bytes'] += entry['size']
+            stats['chunk_bytes'] += entry['chunk_bytes']
+        return dimensions
+
+    def largest_regions(self, top=10, by='size', kind='region', dimension=None):
+        key = {'size': 'size', 'chunks': 'count', 'chunk_bytes': 'chunk_bytes'}[by]
+        entries = sorted((entry for _, entry in self.select(kind, dimension)), key=lambda entry: -entry[key])
+        return [
+            {k: entry[k] for k in ('path', 'dimension', 'size', 'count', 'chunk_bytes', 'oldest', 'newest')}
+            for entry in entries[:top]
+        ]
+
+    def stale_chunks(self, days, kind='region', dimension=None, now=None):
+        """最終更新が days 日より前のチャンクの行番号（リージョン単位の最新時刻で読み飛ばす）"""
+        cutoff = (now or time.time()) - days * 86400
+        mtime = self.columns['mtime']
+        rows = []
+        for _, entry in self.select(kind, dimension):
+            if entry['oldest'] is None or entry['oldest'] >= cutoff:
+                continue
+            start = entry['start']
+            if entry['newest'] < cutoff:
+                rows.extend(range(start, start + entry['count']))
+                continue
+            rows.extend(i for i in range(start, start + entry['count']) if mtime[i] < cutoff)
+        return rows
+
+    def find_chunk(self, x, z, kind='region', dimension='minecraft:overworld'):
+        region_x, region_z = x >> 5, z >> 5
+        for _, entry in self.select(kind, dimension):
+            if entry['x'] == region_x and entry['z'] == region_z:
+                xs, zs = self.columns['x'], self.columns['z']
+                for i in range(entry['start'], entry['start'] + entry['count']):
+                    if xs[i] == x and zs[i] == z:
+                        return i
+        return None
+
+
+def open_index(world_dir, index_file, refresh=True):
+    """保存済みのインデックスを読み、refresh なら変わったリージョンだけ更新して保存する"""
+    index = None
+    try:
+        index = WorldIndex.load(index_file)
+    except (FileNotFoundError, ValueError, KeyError, struct.error):
+        pass
+    if index is None or os.path.abspath(index.world_dir) != os.path.abspath(world_dir):
+        index = WorldIndex(world_dir)
+        refresh = True
+    if refresh and index.refresh():
+        index.save(index_file)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='リージョンファイルの統計インデックス')
+    parser.add_argument('--world', default=WORLD_DIR)
+    parser.add_argument('--index', default=INDEX_FILE, help='インデックスの保存先')
+    parser.add_argument('--no-refresh', action='store_true', help='保存済みのインデックスをそのまま使う')
+    parser.add_argument('--kind', choices=KINDS, default='region')
+    parser.add_argument('--dimension', help='例: minecraft:overworld, minecraft:the_nether, mmorpg:dungeon')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='インデックスを作成・更新')
+    sub.add_parser('summary', help='ディメンションごとのリージョン数・チャンク数・サイズ')
+    largest = sub.add_parser('largest', help='大きいリージョン')
+    largest.add_argument('--top', type=int, default=10)
+    largest.add_argument('--by', choices=('size', 'chunks', 'chunk_bytes'), default='size')
+    stale = sub.add_parser('stale', help='N日間更新されていないチャンク')
+    stale.add_argument('--days', type=float, required=True)
+    stale.add_argument('--limit', type=int, default=100, help='一覧に出す件数（件数と合計サイズは全件）')
+    chunk = sub.add_parser('chunk', help='チャンク1つの情報')
+    chunk.add_argument('x', type=int)
+    chunk.add_argument('z', type=int)
+    chunk.add_argument('--nbt', action='store_true', help='NBTを展開してサイズを表示')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    index = open_index(args.world, args.index, refresh=args.command == 'build' or not args.no_refresh)
+    loaded = time.perf_counter()
+
+    if args.command == 'build':
+        result = {'regions': len(index.regions), 'chunks': len(index), 'index': args.index}
+    elif args.command == 'summary':
+        result = index.summary(args.kind)
+    elif args.command == 'largest':
+        result = index.largest_regions(args.top, args.by, args.kind, args.dimension)
+    elif args.command == 'stale':
+        rows = index.stale_chunks(args.days, args.kind, args.dimension)
+        result = {
+            'chunks': len(rows),
+            'bytes': sum(index.columns['size'][i] for i in rows),
+            'list': [index.row(i) for i in rows[:args.limit]],
+        }
+    else:
+        i = index.find_chunk(args.x, args.z, args.kind, args.dimension or 'minecraft:overworld')
+        result = index.row(i) if i is not None else None
+        if result and args.nbt:
+            with region.RegionFile(os.path.join(index.world_dir, *result['region'].split('/'))) as region_file:
+                result['nbt_bytes'] = len(region_file.chunk_nbt((result['z'] & 31) * 32 + (result['x'] & 31),
+                                                                result['sector']))
+
+    finished = time.perf_counter()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f'[world-index] load {1000 * (loaded - started):.1f} ms, query {1000 * (finished - loaded):.1f} ms',
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
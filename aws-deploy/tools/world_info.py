@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import os
+import sys
+
+import agent_common
+import nbt
+
+# ワールドとプレイヤーの情報（level.dat / playerdata/<uuid>.dat）
+# 必要なタグだけを nbt.get で読むため、プレイヤーが多くても軽い。
+# status_server の ?detail=world から SSM 経由で呼ばれる。
+
+WORLD_DIR = os.path.join(agent_common.SERVER_DIR, 'world')
+USERCACHE_FILE = os.path.join(agent_common.SERVER_DIR, 'usercache.json')
+
+LEVEL_FIELDS = {
+    'name': 'Data.LevelName',
+    'version': 'Data.Version.Name',
+    'time': 'Data.Time',
+    'day_time': 'Data.DayTime',
+    'spawn_x': 'Data.SpawnX',
+    'spawn_y': 'Data.SpawnY',
+    'spawn_z': 'Data.SpawnZ',
+    'seed': 'Data.WorldGenSettings.seed',
+    'game_type': 'Data.GameType',
+    'difficulty': 'Data.Difficulty',
+    'hardcore': 'Data.hardcore',
+    'raining': 'Data.raining',
+    'thundering': 'Data.thundering',
+    'last_played': 'Data.LastPlayed',
+}
+PLAYER_FIELDS = {
+    'pos': 'Pos',
+    'dimension': 'Dimension',
+    'health': 'Health',
+    'food': 'foodLevel',
+    'xp_level': 'XpLevel',
+    'game_type': 'playerGameType',
+}
+INVENTORY_PATH = 'Inventory'
+
+
+def _pick(values, fields):
+    return {key: values.get(path) for key, path in fields.items()}
+
+
+def level_info(world_dir):
+    info = _pick(nbt.get(nbt.load(os.path.join(world_dir, 'level.dat')), *LEVEL_FIELDS.values()), LEVEL_FIELDS)
+    if info['day_time'] is not None:
+        info['day'] = info['day_time'] // 24000
+    if info['seed'] is not None:
+        # 64ビット整数は JavaScript の数値で表せないため文字列にする
+        info['seed'] = str(info['seed'])
+    return info
+
+
+def player_names(usercache_file=USERCACHE_FILE):
+    try:
+        with open(usercache_file, 'r', encoding='utf-8') as f:
+            return {entry['uuid']: entry['name'] for entry in json.load(f)}
+    except (FileNotFoundError, ValueError, KeyError):
+        return {}
+
+
+def player_info(path, names, inventory=False):
+    fields = list(PLAYER_FIELDS.values()) + ([INVENTORY_PATH] if inventory else [])
+    values = nbt.get(nbt.load(path), *fields)
+    uuid = os.path.basename(path)[:-len('.dat')]
+    info = {'uuid': uuid, 'name': names.get(uuid)}
+    info.update(_pick(values, PLAYER_FIELDS))
+    info['last_seen'] = datetime.datetime.fromtimestamp(
+        os.path.getmtime(path), datetime.timezone.utc
+    ).isoformat()
+    if inventory:
+        info['inventory'] = [
+            {'slot': item.get('Slot'), 'id': item.get('id'), 'count': item.get('Count')}
+            for item in values.get(INVENTORY_PATH, [])
+        ]
+    return info
+
+
+def world_info(world_dir=WORLD_DIR, usercache_file=USERCACHE_FILE, inventory=False):
+    playerdata = os.path.join(world_dir, 'playerdata')
+    names = player_names(usercache_file)
+    players = []
+    for name in sorted(os.listdir(playerdata)) if os.path.isdir(playerdata) else []:
+        if not name.endswith('.dat'):
+            continue
+        try:
+            players.append(player_info(os.path.join(playerdata, name), names, inventory))
+        except (OSError, ValueError, nbt.NBTError) as e:
+            print(f'[world-info] {name}: {e}', file=sys.stderr)
+    return {'level': level_info(world_dir), 'players': players}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='level.dat とプレイヤーデータの要約')
+    parser.add_argument('--world', default=WORLD_DIR)
+    parser.add_argument('--usercache', default=USERCACHE_FILE)
+    parser.add_argument('--inventory', action='store_true', help='プレイヤーの持ち物も含める')
+    args = parser.parse_args(argv)
+    print(json.dumps(world_info(args.world, args.usercache, args.inventory), ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# MODファイルを署名付きURL（S3マルチパートアップロード）でアップロードするスクリプト
+# ファイル本体はS3に直接送るため、API Gateway / Lambda のペイロード上限を受けない
+# 使い方: .\upload-mods-presigned.ps1 -ApiUrl https://xxxxxxxxxx.execute-api.ap-northeast-1.amazonaws.com/prod
+# 必要: PowerShell 7 以降（パートの並列アップロードに ForEach-Object -Parallel を使用）
+
+param(
+    [Parameter(Mandatory = $true)]
+    [string]$ApiUrl,
+    [string]$ModsFolder = "..\mods",
+    [int]$Parallel = 4
+)
+
+if ($PSVersionTable.PSVersion.Major -lt 7) {
+    Write-Host "エラー: PowerShell 7 以降が必要です（pwsh で実行してください）" -ForegroundColor Red
+    exit 1
+}
+
+Write-Host "=== Minecraft MODアップロード（署名付きURL） ===" -ForegroundColor Cyan
+Write-Host ""
+
+if (-not (Test-Path $ModsFolder)) {
+    Write-Host "エラー: MODフォルダが見つかりません: $ModsFolder" -ForegroundColor Red
+    exit 1
+}
+
+$modFiles = Get-ChildItem -Path $ModsFolder -Filter "*.jar"
+if ($modFiles.Count -eq 0) {
+    Write-Host "エラー: MODファイル(.jar)が見つかりません" -ForegroundColor Red
+    exit 1
+}
+
+# 1. SHA-256を計算してアップロードURLを取得
+Write-Host "チェックサムを計算中..." -ForegroundColor Yellow
+$files = foreach ($mod in $modFiles) {
+    @{
+        name   = $mod.Name
+        size   = $mod.Length
+        sha256 = (Get-FileHash -Path $mod.FullName -Algorithm SHA256).Hash.ToLower()
+    }
+}
+
+$configUrl = "$ApiUrl/config?action=upload_mods"
+$init = Invoke-RestMethod -Method Post -Uri "$configUrl&step=init" -ContentType "application/json" `
+    -Body (@{ files = @($files) } | ConvertTo-Json -Depth 5) -SkipHttpErrorCheck
+
+if (-not $init.success) {
+    Write-Host "エラー: $($init.message)" -ForegroundColor Red
+    exit 1
+}
+Write-Host $init.message -ForegroundColor Green
+foreach ($upload in $init.uploads | Where-Object { $_.exists }) {
+    Write-Host "  - $($upload.name): 同じ内容のファイルがS3にあるためスキップ" -ForegroundColor Gray
+}
+
+# 2. パートを並列にアップロード（ETag を控えておく。内容はサーバー側で結合後に SHA-256 で検証される）
+$paths = @{}
+foreach ($mod in $modFiles) { $paths[$mod.Name] = $mod.FullName }
+
+$jobs = foreach ($upload in $init.uploads) {
+    foreach ($part in $upload.parts) {
+        [pscustomobject]@{
+            Name       = $upload.name
+            Path       = $paths[$upload.name]
+            PartNumber = $part.part_number
+            Offset     = $part.offset
+            Length     = $part.length
+            Url        = $part.url
+        }
+    }
+}
+
+Write-Host "$($jobs.Count)個のパートをアップロード中（並列数: $Parallel）..." -ForegroundColor Yellow
+
+$results = $jobs | ForEach-Object -ThrottleLimit $Parallel -Parallel {
+    $job = $_
+    $buffer = New-Object byte[] $job.Length
+    $stream = [System.IO.File]::OpenRead($job.Path)
+    try {
+        $stream.Seek($job.Offset, [System.IO.SeekOrigin]::Begin) | Out-Null
+        $read = 0
+        while ($read -lt $job.Length) {
+            $read += $stream.Read($buffer, $read, $job.Length - $read)
+        }
+    } finally {
+        $stream.Dispose()
+    }
+
+    $md5 = [System.BitConverter]::ToString(
+        [System.Security.Cryptography.MD5]::Create().ComputeHash($buffer)
+    ).Replace("-", "").ToLower()
+
+    for ($attempt = 1; $attempt -le 3; $attempt++) {
+        try {
+            $response = Invoke-WebRequest -Method Put -Uri $job.Url -Body $buffer -UseBasicParsing
+            $etag = ($response.Headers["ETag"] | Select-Object -First 1).Trim('"')
+            if ($etag -ne $md5) { throw "ETag mismatch ($etag != $md5)" }
+            break
+        } catch {
+            if ($attempt -eq 3) { throw "$($job.Name) part $($job.PartNumber): $_" }
+            Start-Sleep -Seconds $attempt
+        }
+    }
+
+    [pscustomobject]@{ Name = $job.Name; PartNumber = $job.PartNumber; ETag = $etag }
+}
+
+if ($results.Count -ne $jobs.Count) {
+    Write-Host "エラー: 一部のパートのアップロードに失敗しました。アップロードを中止します" -ForegroundColor Red
+    $abort = @{
+        session_id = $init.session_id
+        uploads    = @($init.uploads | ForEach-Object { @{ name = $_.name; sha256 = $_.sha256; upload_id = $_.upload_id } })
+    }
+    Invoke-RestMethod -Method Post -Uri "$configUrl&step=abort" -ContentType "application/json" `
+        -Body ($abort | ConvertTo-Json -Depth 5) | Out-Null
+    exit 1
+}
+
+# 3. 結合してサーバーに反映
+$complete = @{
+    session_id = $init.session_id
+    uploads    = @(foreach ($upload in $init.uploads) {
+        @{
+            name      = $upload.name
+            size      = $upload.size
+            sha256    = $upload.sha256
+            upload_id = $upload.upload_id
+            parts     = @($results | Where-Object { $_.Name -eq $upload.name } | Sort-Object PartNumber | ForEach-Object {
+                @{ part_number = $_.PartNumber; etag = $_.ETag }
+            })
+        }
+    })
+}
+
+$done = Invoke-RestMethod -Method Post -Uri "$configUrl&step=complete" -ContentType "application/json" `
+    -Body ($complete | ConvertTo-Json -Depth 6) -SkipHttpErrorCheck
+
+if (-not $done.success) {
+    Write-Host "エラー: $($done.message)" -ForegroundColor Red
+    exit 1
+}
+
+Write-Host $done.message -ForegroundColor Green
+Write-Host "マニフェスト: $($done.manifest_version)" -ForegroundColor Gray
+Write-Host "  追加: $($done.changes.added -join ', ')" -ForegroundColor Gray
+Write-Host "  変更: $($done.changes.changed -join ', ')" -ForegroundColor Gray
+if ($done.changes.restart_required) {
+    Write-Host "サーバーを再起動して反映します" -ForegroundColor Yellow
+} else {
+    Write-Host "サーバーに影響する変更はないため、再起動しません" -ForegroundColor Yellow
+}
+if ($done.command_id) { Write-Host "コマンドID: $($done.command_id)" -ForegroundColor Gray }
+Write-Host "元に戻す場合: Invoke-RestMethod -Method Post -Uri `"$configUrl&step=rollback`"" -ForegroundColor Gray
@@ -0,0 +1,26 @@
+# インスタンス上で動くPythonツール（aws-deploy/tools）をS3にアップロードするスクリプト
+# インスタンス側は各サービスの起動前に minecraft-tools-sync.sh で s3://<bucket>/tools/ を同期する
+# 使い方: .\upload-tools.ps1
+
+param(
+    [string]$Region = "ap-northeast-1",
+    [string]$S3Bucket = "minecraft-server-mods-temp",
+    [string]$ToolsFolder = "$PSScriptRoot\tools"
+)
+
+Write-Host "=== ツールのアップロード ===" -ForegroundColor Cyan
+
+if (-not (Test-Path $ToolsFolder)) {
+    Write-Host "エラー: ツールフォルダが見つかりません: $ToolsFolder" -ForegroundColor Red
+    exit 1
+}
+
+aws s3 sync $ToolsFolder "s3://$S3Bucket/tools/" --region $Region --delete --exclude "__pycache__/*" --exclude "*.pyc"
+
+if ($LASTEXITCODE -ne 0) {
+    Write-Host "エラー: アップロードに失敗しました" -ForegroundColor Red
+    exit 1
+}
+
+Write-Host "アップロード完了: s3://$S3Bucket/tools/" -ForegroundColor Green
+Write-Host "次回のMinecraft起動時（またはエージェント再起動時）に反映されます" -ForegroundColor Yellow
@@ -24,7 +24,14 @@ cd /minecraft/server
 cat > /minecraft/launch.sh << 'EOF'
 #!/bin/bash
 cd /minecraft/server
-java -Xmx$${minecraft_memory}M -Xms$${minecraft_memory}M -jar server.jar nogui
+# 同じ原因のクラッシュを繰り返している場合は起動しない（終了コード78、systemdは再起動しない）
+if [ -f /minecraft/tools/crash_index.py ]; then
+  python3 /minecraft/tools/crash_index.py guard || { [ $? -eq 78 ] && exit 78; }
+fi
+# GC停止時間は logs/gc.log に出力（/minecraft/tools/server_health.py が集計）
+java -Xmx$${minecraft_memory}M -Xms$${minecraft_memory}M \
+  -Xlog:gc:file=/minecraft/server/logs/gc.log:time,level,tags:filecount=3,filesize=10m \
+  -jar server.jar nogui
 EOF
 
 chmod +x /minecraft/launch.sh
@@ -34,14 +41,19 @@ cat > /etc/systemd/system/minecraft.service << 'EOF'
 [Unit]
 Description=Minecraft Server
 After=network.target
+StartLimitIntervalSec=900
+StartLimitBurst=5
 
 [Service]
 Type=simple
 User=root
 WorkingDirectory=/minecraft/server
+ExecStartPre=-/usr/local/bin/minecraft-rcon-setup.sh
+ExecStartPre=-/usr/bin/python3 /minecraft/tools/pending_config.py --bucket ${s3_bucket} apply
 ExecStart=/minecraft/launch.sh
 Restart=on-failure
 RestartSec=10
+RestartPreventExitStatus=78
 
 [Install]
 WantedBy=multi-user.target
@@ -54,7 +66,59 @@ AUTOSHUTDOWN
 
 chmod +x /usr/local/bin/minecraft-autoshutdown.sh
 
+# Create RCON setup script (applies the password from SSM Parameter Store before each start)
+cat > /usr/local/bin/minecraft-rcon-setup.sh << 'RCONSETUP'
+${rcon_setup_script}
+RCONSETUP
+
+chmod +x /usr/local/bin/minecraft-rcon-setup.sh
+
+# Create tools sync script (aws-deploy/tools is uploaded to S3 by upload-tools.ps1)
+mkdir -p /minecraft/tools /minecraft/status
+cat > /usr/local/bin/minecraft-tools-sync.sh << 'TOOLSSYNC'
+#!/bin/bash
+aws s3 sync s3://${s3_bucket}/tools/ /minecraft/tools/ --delete --only-show-errors || true
+TOOLSSYNC
+
+chmod +x /usr/local/bin/minecraft-tools-sync.sh
+
+# Create readiness watcher service (follows latest.log and writes /minecraft/status/ready.json)
+cat > /etc/systemd/system/minecraft-ready-watcher.service << 'EOF'
+[Unit]
+Description=Minecraft Readiness Watcher
+After=network-online.target
+Before=minecraft.service
+
+[Service]
+Type=simple
+ExecStartPre=-/usr/local/bin/minecraft-tools-sync.sh
+ExecStart=/usr/bin/python3 /minecraft/tools/ready_watcher.py
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+# Create health collector service (tick lag / GC pauses / startup timings -> /minecraft/status/health.json)
+cat > /etc/systemd/system/minecraft-health.service << 'EOF'
+[Unit]
+Description=Minecraft Server Health Collector
+After=network-online.target
+
+[Service]
+Type=simple
+ExecStartPre=-/usr/local/bin/minecraft-tools-sync.sh
+ExecStart=/usr/bin/python3 /minecraft/tools/server_health.py collect
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 # Create auto-shutdown service with Discord webhook
+# (follows latest.log with /minecraft/tools/auto_shutdown.py; falls back to the shell script if tools are not synced)
 cat > /etc/systemd/system/minecraft-autoshutdown.service << 'EOF'
 [Unit]
 Description=Minecraft Auto Shutdown Monitor
@@ -63,8 +127,10 @@ After=minecraft.service
 [Service]
 Type=simple
 Environment="DISCORD_WEBHOOK_URL=${discord_webhook_url}"
-ExecStart=/usr/local/bin/minecraft-autoshutdown.sh
+ExecStartPre=-/usr/local/bin/minecraft-tools-sync.sh
+ExecStart=/bin/sh -c 'if [ -f /minecraft/tools/auto_shutdown.py ]; then exec /usr/bin/python3 /minecraft/tools/auto_shutdown.py; else exec /usr/local/bin/minecraft-autoshutdown.sh; fi'
 Restart=always
+RestartSec=5
 
 [Install]
 WantedBy=multi-user.target
@@ -74,5 +140,7 @@ EOF
 systemctl daemon-reload
 systemctl enable minecraft.service
 systemctl enable minecraft-autoshutdown.service
+systemctl enable minecraft-ready-watcher.service
+systemctl enable minecraft-health.service
 
 echo "=== Minecraft Server Setup Completed ==="